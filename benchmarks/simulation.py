@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This file is part of Torii-USB.
+#
+
+'''
+Simulated bulk throughput benchmarks for Torii-USB.
+
+This script drives back-to-back bulk IN and OUT transfers against a device with a pair of stream
+endpoints, using the packet-level helpers from :class:`torii_usb.test.usb2.USBDeviceTest` and
+high-speed host inter-packet timing. For each configuration it reports the bytes moved per
+microframe, the ratio of transactions that were NAK'd, and the device's turnaround time in cycles.
+
+Usage:
+
+	python benchmarks/simulation.py --output simulation.json
+	python benchmarks/simulation.py --only in_default out_default --baseline previous.json
+
+Numbers are in terms of the 60MHz UTMI clock, so a microframe is 7500 cycles. SOF packets and other
+traffic aren't simulated, so results can slightly exceed the 6656 bytes (thirteen 512-byte packets)
+per microframe that the USB 2.0 specification budgets for bulk transfers; they're best used to
+compare configurations against each other.
+
+:class:`USBDevice` always runs UTMI-connected devices at full speed; so while our host follows
+high-speed timing, speed-dependent device behavior -- such as NYET handshakes -- isn't exercised here.
+'''
+
+import json
+import sys
+from argparse                  import ArgumentParser
+from pathlib                   import Path
+
+from torii.hdl                 import Elaboratable, Module, Mux, Signal
+
+from usb_construct.types       import USBDirection, USBPacketID
+
+from torii_usb.test.usb2       import USBDeviceTest
+from torii_usb.usb2            import USBDevice, USBStreamInEndpoint, USBStreamOutEndpoint
+
+# The number of UTMI cycles in a single high-speed microframe.
+CYCLES_PER_MICROFRAME = 7500
+
+class ThroughputDevice(Elaboratable):
+	''' A USB device with a single pair of bulk stream endpoints, fed and drained at configurable rates.
+
+	Attributes
+	----------
+	bus: UTMIInterface
+		The UTMI bus our device is connected to.
+	connect: Signal(), input
+		Passed through to our device.
+	cycles: Signal(32), output
+		A free-running count of ``usb`` domain cycles; used for timing measurements.
+	bytes_received: Signal(32), output
+		The number of bytes taken from our OUT endpoint's stream.
+
+	Parameters
+	----------
+	bus: UTMIInterface
+		The UTMI bus to connect our device to.
+	max_packet_size: int
+		The maximum packet size for both of our endpoints.
+	buffer_count: int
+		The number of packets our IN endpoint can buffer.
+	buffer_size: int | None
+		The size of our OUT endpoint's buffer; or None to use its default.
+	source_interval: int
+		The number of cycles between each byte offered to our IN endpoint.
+	sink_interval: int
+		The number of cycles between each byte accepted from our OUT endpoint.
+	'''
+
+	def __init__(
+		self, *, bus, max_packet_size = 512, buffer_count = 2, buffer_size = None, source_interval = 1,
+		sink_interval = 1
+	):
+		self._max_packet_size = max_packet_size
+		self._buffer_count    = buffer_count
+		self._buffer_size     = buffer_size
+		self._source_interval = source_interval
+		self._sink_interval   = sink_interval
+
+		#
+		# I/O port
+		#
+		self.bus            = bus
+		self.connect        = Signal()
+		self.cycles         = Signal(32)
+		self.bytes_received = Signal(32)
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.device = device = USBDevice(bus = self.bus, handle_clocking = False)
+		m.d.comb += device.connect.eq(self.connect)
+		m.d.usb  += self.cycles.eq(self.cycles + 1)
+
+		in_endpoint = USBStreamInEndpoint(
+			endpoint_number = 1, max_packet_size = self._max_packet_size, buffer_count = self._buffer_count
+		)
+		device.add_endpoint(in_endpoint, endpoint_number = 1, direction = USBDirection.IN)
+
+		out_endpoint = USBStreamOutEndpoint(
+			endpoint_number = 1, max_packet_size = self._max_packet_size, buffer_size = self._buffer_size
+		)
+		device.add_endpoint(out_endpoint, endpoint_number = 1, direction = USBDirection.OUT)
+
+		#
+		# Data source: offer an incrementing byte every `source_interval` cycles, and hold it until it's taken.
+		#
+		source       = in_endpoint.stream
+		source_timer = Signal(range(self._source_interval + 1))
+
+		m.d.usb += source_timer.eq(Mux(source_timer == self._source_interval - 1, 0, source_timer + 1))
+
+		with m.If(source.valid & source.ready):
+			m.d.usb += [
+				source.valid.eq(0),
+				source.data.eq(source.data + 1),
+			]
+
+		with m.If(source_timer == 0):
+			m.d.usb += source.valid.eq(1)
+
+		#
+		# Data sink: accept a byte every `sink_interval` cycles.
+		#
+		sink       = out_endpoint.stream
+		sink_timer = Signal(range(self._sink_interval + 1))
+
+		m.d.usb  += sink_timer.eq(Mux(sink_timer == self._sink_interval - 1, 0, sink_timer + 1))
+		m.d.comb += sink.ready.eq(sink_timer == 0)
+
+		with m.If(sink.valid & sink.ready):
+			m.d.usb += self.bytes_received.eq(self.bytes_received + 1)
+
+		return m
+
+class ThroughputBenchmark(USBDeviceTest):
+	''' Drives bulk transfers against a :class:`ThroughputDevice`, recording link statistics as it goes. '''
+
+	FRAGMENT_UNDER_TEST = ThroughputDevice
+
+	# Bulk transfers are expected to be NAK'd whenever our device can't keep up;
+	# so allow far more than the control-request helpers do.
+	MAX_NAKS = 10000
+
+	# High-speed hosts must leave at least 88 bit times between packets; which is 11 cycles at 60MHz.
+	HOST_INTERPACKET_DELAY = 11
+
+	# UTMI hides each packet's SYNC (32 bits) and EOP (8 bits), but they still take up time on the bus.
+	PACKET_FRAMING_CYCLES = 5
+
+	def __init__(self, parameters, *, host_delay = None):
+		super().__init__()
+
+		self.FRAGMENT_ARGUMENTS = parameters
+		if host_delay is not None:
+			self.HOST_INTERPACKET_DELAY = host_delay
+
+		self.done         = False
+		self.transactions = 0
+		self.naks         = 0
+		self.nyets        = 0
+		self.pings        = 0
+		self.turnarounds  = []
+
+	def initialize_signals(self):
+		# Keep our device from resetting.
+		yield self.utmi.line_state.eq(0b01)
+
+		# Have our USB device connected.
+		yield self.dut.connect.eq(1)
+
+		# Pretend our PHY is always ready to accept data.
+		yield self.utmi.tx_ready.eq(1)
+
+	def interpacket_delay(self):
+		''' Waits for the host's inter-packet delay, rather than the shortened one used in tests. '''
+		yield from self.advance_cycles(self.HOST_INTERPACKET_DELAY)
+
+	def start_packet(self, *, set_rx_valid = True):
+		''' Starts a UTMI packet receive, after the time our PHY would spend on framing. '''
+		yield from self.advance_cycles(self.PACKET_FRAMING_CYCLES)
+		yield from super().start_packet(set_rx_valid = set_rx_valid)
+
+	def receive_packet(self, as_bytes = True, timeout = 1000):
+		''' Receives a packet from our device, followed by the time our PHY would spend on framing. '''
+		data = yield from super().receive_packet(as_bytes = as_bytes, timeout = timeout)
+		yield from self.advance_cycles(self.PACKET_FRAMING_CYCLES)
+		return data
+
+	def monitor_turnaround(self):
+		''' Records the number of cycles between the end of each host packet and the start of our response. '''
+
+		packet_ended  = None
+		was_receiving = False
+		was_sending   = False
+
+		while not self.done:
+			receiving = yield self.utmi.rx_active
+			sending   = yield self.utmi.tx_valid
+			cycle     = yield self.dut.cycles
+
+			# Note the point at which the host finishes each packet...
+			if was_receiving and not receiving:
+				packet_ended = cycle
+
+			# ... and measure from there to the start of any response.
+			if sending and not was_sending and packet_ended is not None:
+				self.turnarounds.append(cycle - packet_ended)
+				packet_ended = None
+
+			was_receiving = receiving
+			was_sending   = sending
+			yield
+
+	def bulk_in(self, length, max_packet_size):
+		''' Reads at least ``length`` bytes from our IN endpoint; returning the bytes read and cycles taken. '''
+
+		data     = []
+		data_pid = USBPacketID.DATA0
+
+		# Give our source time to fill the endpoint's buffers; so we measure steady-state throughput,
+		# rather than the time it takes to produce the first packet.
+		buffer_count    = self.FRAGMENT_ARGUMENTS.get('buffer_count', 2)
+		source_interval = self.FRAGMENT_ARGUMENTS.get('source_interval', 1)
+		yield from self.advance_cycles(buffer_count * max_packet_size * source_interval)
+
+		start = yield self.dut.cycles
+
+		while len(data) < length:
+			pid, packet = yield from self.in_transaction(endpoint = 1, data_pid = data_pid)
+			self.transactions += 1
+
+			if pid == USBPacketID.NAK:
+				self.naks += 1
+				self.assertLess(self.naks, self.MAX_NAKS)
+				continue
+
+			self.assertNotEqual(pid, USBPacketID.STALL, 'IN endpoint stalled')
+			self.assertEqual(len(packet), max_packet_size)
+
+			data.extend(packet)
+			data_pid = USBPacketID.DATA1 if (data_pid == USBPacketID.DATA0) else USBPacketID.DATA0
+
+		end = yield self.dut.cycles
+
+		# Our source produces a simple count; so make sure nothing was dropped or repeated on the way.
+		self.assertEqual(data, [i & 0xFF for i in range(len(data))], 'IN data was corrupted')
+		return len(data), end - start
+
+	def bulk_out(self, length, max_packet_size):
+		''' Writes ``length`` bytes to our OUT endpoint; returning the bytes written and cycles taken. '''
+
+		to_send     = [i & 0xFF for i in range(length)]
+		data_pid    = USBPacketID.DATA0
+		should_ping = False
+		start       = yield self.dut.cycles
+
+		while to_send:
+
+			# Like a high-speed host, once we've been NAK'd or NYET'd we'll PING until the endpoint has room,
+			# rather than sending data it may not accept [USB 2.0: 8.5.1].
+			while should_ping:
+				handshake = yield from self.ping_transaction(endpoint = 1)
+				self.transactions += 1
+				self.pings        += 1
+
+				should_ping = (handshake == USBPacketID.NAK)
+				if should_ping:
+					self.naks += 1
+					self.assertLess(self.naks, self.MAX_NAKS)
+
+			handshake = yield from self.out_transaction(
+				*to_send[:max_packet_size], endpoint = 1, data_pid = data_pid
+			)
+			self.transactions += 1
+
+			if handshake == USBPacketID.NAK:
+				self.naks += 1
+				self.assertLess(self.naks, self.MAX_NAKS)
+				should_ping = True
+				continue
+
+			if handshake == USBPacketID.NYET:
+				self.nyets += 1
+				should_ping = True
+			else:
+				self.assertEqual(handshake, USBPacketID.ACK)
+
+			to_send  = to_send[max_packet_size:]
+			data_pid = USBPacketID.DATA1 if (data_pid == USBPacketID.DATA0) else USBPacketID.DATA0
+
+		end = yield self.dut.cycles
+
+		# Let our sink drain, so we know everything we sent actually arrived.
+		timeout = length * self.FRAGMENT_ARGUMENTS.get('sink_interval', 1) + CYCLES_PER_MICROFRAME
+		while (yield self.dut.bytes_received) < length:
+			timeout -= 1
+			self.assertGreater(timeout, 0, 'OUT data never reached our sink')
+			yield
+
+		self.assertEqual((yield self.dut.bytes_received), length)
+		return length, end - start
+
+	def measure(self, direction, length, *, name = None):
+		''' Runs a single transfer in the given direction; and returns its statistics. '''
+
+		max_packet_size = self.FRAGMENT_ARGUMENTS.get('max_packet_size', 512)
+		transfer        = self.bulk_in if direction == 'in' else self.bulk_out
+		outcome         = {}
+
+		def host():
+			yield from self.initialize_signals()
+			outcome['bytes'], outcome['cycles'] = yield from transfer(length, max_packet_size)
+			self.done = True
+
+		self.sim.add_sync_process(host, domain = 'usb')
+		self.sim.add_sync_process(self.monitor_turnaround, domain = 'usb')
+		self.simulate(vcd_suffix = name)
+
+		microframes = outcome['cycles'] / CYCLES_PER_MICROFRAME
+
+		return {
+			'bytes':                outcome['bytes'],
+			'cycles':               outcome['cycles'],
+			'bytes_per_microframe': outcome['bytes'] / microframes,
+			'bytes_per_second':     outcome['bytes'] / (outcome['cycles'] / self.USB_CLOCK_FREQUENCY),
+			'transactions':         self.transactions,
+			'naks':                 self.naks,
+			'nak_ratio':            self.naks / self.transactions,
+			'nyets':                self.nyets,
+			'pings':                self.pings,
+			'turnaround': {
+				'min':  min(self.turnarounds),
+				'mean': sum(self.turnarounds) / len(self.turnarounds),
+				'max':  max(self.turnarounds),
+			},
+		}
+
+# The set of benchmarks to run; each of which is a (name, direction, device parameters) tuple.
+BENCHMARKS = [
+	('in_default',         'in',  {}),
+	('in_buffer_count_4',  'in',  {'buffer_count': 4}),
+	('in_mps_64',          'in',  {'max_packet_size': 64}),
+	('in_slow_source',     'in',  {'source_interval': 2}),
+	('out_default',        'out', {}),
+	('out_buffer_2048',    'out', {'buffer_size': 2048}),
+	('out_mps_64',         'out', {'max_packet_size': 64}),
+	('out_slow_sink',      'out', {'sink_interval': 2}),
+]
+
+def compare(results, baseline, *, threshold):
+	''' Prints any throughput or latency changes beyond a given threshold between two sets of results. '''
+
+	baseline_results = {result['name']: result for result in baseline['results']}
+	regressions = 0
+
+	for result in results['results']:
+		previous = baseline_results.get(result['name'])
+		if previous is None:
+			continue
+
+		metrics = (
+			('bytes/microframe', result['bytes_per_microframe'], previous['bytes_per_microframe'], False),
+			('mean turnaround', result['turnaround']['mean'], previous['turnaround']['mean'], True),
+		)
+
+		for what, new, old, lower_is_better in metrics:
+			if old == 0:
+				continue
+
+			delta = (new - old) / old
+			if abs(delta) < threshold:
+				continue
+
+			worse = (delta > 0) if lower_is_better else (delta < 0)
+			regressions += worse
+
+			marker = 'REGRESSED' if worse else 'improved'
+			print(f'{result["name"]}: {what} {old:g} -> {new:g} ({delta:+.1%}, {marker})')
+
+	return regressions
+
+def main():
+	parser = ArgumentParser(description = 'Simulated bulk throughput benchmarks for Torii-USB.')
+	parser.add_argument('--output', type = Path, help = 'File to write JSON results to; or stdout if not given.')
+	parser.add_argument('--only', nargs = '+', metavar = 'NAME', help = 'Only run the named benchmarks.')
+	parser.add_argument('--list', action = 'store_true', help = 'List the available benchmarks and exit.')
+	parser.add_argument('--length', type = int, default = 16384, help = 'Number of bytes to move per benchmark.')
+	parser.add_argument(
+		'--host-delay', type = int, default = ThroughputBenchmark.HOST_INTERPACKET_DELAY,
+		help = 'Cycles the host waits between packets.'
+	)
+	parser.add_argument('--baseline', type = Path, help = 'Previous results to compare against.')
+	parser.add_argument(
+		'--threshold', type = float, default = 0.02, help = 'Minimum relative change to report against a baseline.'
+	)
+	args = parser.parse_args()
+
+	benchmarks = BENCHMARKS
+	if args.only:
+		benchmarks = [benchmark for benchmark in benchmarks if benchmark[0] in args.only]
+
+	if args.list:
+		for name, direction, parameters in benchmarks:
+			print(f'{name}: {direction} {parameters}')
+		return 0
+
+	results = {
+		'length':     args.length,
+		'host_delay': args.host_delay,
+		'results':    [],
+	}
+
+	for name, direction, parameters in benchmarks:
+		print(f'Running {name}...', file = sys.stderr)
+
+		benchmark = ThroughputBenchmark(parameters.copy(), host_delay = args.host_delay)
+		benchmark.setUp()
+
+		result = {'name': name, 'direction': direction, 'parameters': parameters}
+		result.update(benchmark.measure(direction, args.length, name = name))
+		results['results'].append(result)
+
+		print(
+			f'  {result["bytes_per_microframe"]:.1f} bytes/microframe, '
+			f'NAK ratio {result["nak_ratio"]:.2f}, turnaround {result["turnaround"]["mean"]:.1f} cycles',
+			file = sys.stderr
+		)
+
+	output = json.dumps(results, indent = '\t')
+	if args.output:
+		args.output.write_text(output)
+	else:
+		print(output)
+
+	if args.baseline:
+		regressions = compare(results, json.loads(args.baseline.read_text()), threshold = args.threshold)
+		return 1 if regressions else 0
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
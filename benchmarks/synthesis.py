@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This file is part of Torii-USB.
+#
+
+'''
+Synthesis resource and Fmax benchmarks for Torii-USB.
+
+This script elaborates a matrix of reference designs; from stock devices with various PHY connections,
+endpoint counts and buffer sizes, down to individual building blocks. Each design is run through an
+open-source synthesis flow (Yosys, and nextpnr for place-and-route), and the resulting LUT, FF and BRAM
+counts -- along with each clock domain's estimated Fmax -- are emitted as JSON.
+
+Usage:
+
+	python benchmarks/synthesis.py --family ice40 --output ice40.json
+	python benchmarks/synthesis.py --family ecp5 --only device_ulpi_bulk15 --baseline previous.json
+
+Results are only comparable between runs that used the same tool versions, device, and seed;
+all of which are recorded in the output.
+'''
+
+import json
+import shutil
+import subprocess
+import sys
+from argparse                      import ArgumentParser
+from pathlib                       import Path
+from tempfile                      import TemporaryDirectory
+
+from torii.back                    import rtlil
+from torii.hdl                     import ClockDomain, Elaboratable, Module, Record, Signal
+from torii.hdl.rec                 import Direction
+
+from usb_construct.emitters        import DeviceDescriptorCollection
+from usb_construct.types           import USBDirection, USBTransferType
+
+from torii_usb.interface.pipe      import PIPEInterface
+from torii_usb.interface.utmi      import UTMIInterface
+from torii_usb.memory              import TransactionalizedFIFO
+from torii_usb.usb.devices.acm     import USBSerialDevice
+from torii_usb.usb.usb2.descriptor import GetDescriptorHandlerBlock
+from torii_usb.usb.usb2.multiport  import USBMultiPortDevice
+from torii_usb.usb.usb2.packet     import USBDataPacketCRC, USBDataPacketReceiver
+from torii_usb.usb2                import USBDevice, USBStreamInEndpoint, USBStreamOutEndpoint
+from torii_usb.usb3                import USBSuperSpeedDevice
+
+#
+# Target devices, and the Yosys cells we count as each resource.
+#
+FAMILIES = {
+	'ice40': {
+		'synth':    'synth_ice40',
+		'pnr':      'nextpnr-ice40',
+		'device':   ['--hx8k', '--package', 'ct256'],
+		'pnr_args': ['--pcf-allow-unconstrained'],
+		'lut':      {'SB_LUT4': 1},
+		'ff':       ('SB_DFF',),
+		'bram':     {'SB_RAM40_4K': 1},
+	},
+	'ecp5': {
+		'synth':    'synth_ecp5',
+		'pnr':      'nextpnr-ecp5',
+		'device':   ['--85k', '--package', 'CABGA381'],
+		'pnr_args': ['--lpf-allow-unconstrained'],
+		'lut':      {'LUT4': 1, 'CCU2C': 2, 'TRELLIS_DPR16X4': 4},
+		'ff':       ('TRELLIS_FF',),
+		'bram':     {'DP16KD': 1},
+	},
+}
+
+#
+# Design helpers.
+#
+
+def _ulpi_bus():
+	''' Creates a record that looks like a ULPI PHY connection. '''
+	return Record([
+		('data', [('i', 8, Direction.FANIN), ('o', 8, Direction.FANOUT), ('oe', 1, Direction.FANOUT)]),
+		('clk',  [('i', 1, Direction.FANIN)]),
+		('dir',  [('i', 1, Direction.FANIN)]),
+		('nxt',  [('i', 1, Direction.FANIN)]),
+		('stp',  [('o', 1, Direction.FANOUT)]),
+		('rst',  [('o', 1, Direction.FANOUT)]),
+	], name = 'ulpi')
+
+def _raw_usb_bus():
+	''' Creates a record that looks like a set of raw USB data lines. '''
+	return Record([
+		('d_p',    [('i', 1, Direction.FANIN), ('o', 1, Direction.FANOUT), ('oe', 1, Direction.FANOUT)]),
+		('d_n',    [('i', 1, Direction.FANIN), ('o', 1, Direction.FANOUT), ('oe', 1, Direction.FANOUT)]),
+		('pullup', [('o', 1, Direction.FANOUT)]),
+	], name = 'usb')
+
+BUSES = {
+	'utmi':         UTMIInterface,
+	'ulpi':         _ulpi_bus,
+	'gateware_phy': _raw_usb_bus,
+}
+
+def _signals_of(obj, *, depth = 3):
+	''' Collects every signal reachable through the public attributes of an object. '''
+
+	if isinstance(obj, Signal):
+		return [obj]
+
+	if isinstance(obj, Record):
+		return [signal for field in obj.fields.values() for signal in _signals_of(field, depth = depth)]
+
+	if isinstance(obj, (list, tuple)):
+		return [signal for item in obj for signal in _signals_of(item, depth = depth)]
+
+	if depth == 0 or not hasattr(obj, '__dict__'):
+		return []
+
+	signals = []
+	for name, value in vars(obj).items():
+		if not name.startswith('_'):
+			signals.extend(_signals_of(value, depth = depth - 1))
+
+	return signals
+
+def _descriptors(*, bulk_endpoints = 0, max_packet_size = 512):
+	''' Creates a minimal descriptor collection for our device benchmarks. '''
+	descriptors = DeviceDescriptorCollection()
+
+	with descriptors.DeviceDescriptor() as d:
+		d.idVendor           = 0x1209
+		d.idProduct          = 0x0001
+		d.iManufacturer      = 'Torii-USB'
+		d.iProduct           = 'Benchmark'
+		d.iSerialNumber      = 'bench'
+		d.bNumConfigurations = 1
+
+	with descriptors.ConfigurationDescriptor() as c:
+		with c.InterfaceDescriptor() as i:
+			i.bInterfaceNumber = 0
+
+			for number in range(1, bulk_endpoints + 1):
+				for direction in (0x80, 0x00):
+					with i.EndpointDescriptor() as e:
+						e.bEndpointAddress = direction | number
+						e.bmAttributes     = USBTransferType.BULK
+						e.wMaxPacketSize   = max_packet_size
+
+	return descriptors
+
+class DeviceBenchmark(Elaboratable):
+	''' Wraps a USBDevice with a set of bulk stream endpoints, for synthesis.
+
+	All of our endpoints' streams are driven from, or folded down to, a handful of signals; so our
+	benchmarks don't need an unrealistic number of I/O pins, and nothing is optimized away.
+
+	Attributes
+	----------
+	bus: Record
+		The USB bus connection.
+	connect: Signal(), input
+		Passed through to our device.
+	checksum: Signal(8), output
+		Folded version of all data received from the host.
+	'''
+
+	def __init__(self, *, bus, bulk_endpoints, buffer_size = None, indexed_endpoint_mux = False):
+		self._bulk_endpoints       = bulk_endpoints
+		self._buffer_size          = buffer_size
+		self._indexed_endpoint_mux = indexed_endpoint_mux
+
+		#
+		# I/O port
+		#
+		self.bus      = bus
+		self.connect  = Signal()
+		self.checksum = Signal(8)
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.device = device = USBDevice(
+			bus = self.bus, handle_clocking = False, indexed_endpoint_mux = self._indexed_endpoint_mux
+		)
+		device.add_standard_control_endpoint(_descriptors(bulk_endpoints = self._bulk_endpoints))
+		m.d.comb += device.connect.eq(self.connect)
+
+		# Generate a simple stream of data for our IN endpoints...
+		counter = Signal(8)
+		m.d.usb += counter.eq(counter + 1)
+
+		# ... and fold down all of the data we receive.
+		checksum = self.checksum
+
+		for number in range(1, self._bulk_endpoints + 1):
+			in_endpoint = USBStreamInEndpoint(endpoint_number = number, max_packet_size = 512)
+			device.add_endpoint(in_endpoint, endpoint_number = number, direction = USBDirection.IN)
+
+			out_endpoint = USBStreamOutEndpoint(
+				endpoint_number = number, max_packet_size = 512, buffer_size = self._buffer_size
+			)
+			device.add_endpoint(out_endpoint, endpoint_number = number, direction = USBDirection.OUT)
+
+			m.d.comb += [
+				in_endpoint.stream.valid.eq(1),
+				in_endpoint.stream.data.eq(counter + number),
+				in_endpoint.stream.last.eq(counter == 0),
+
+				out_endpoint.stream.ready.eq(1),
+			]
+			checksum = checksum ^ (out_endpoint.stream.data & out_endpoint.stream.valid.replicate(8))
+
+		m.d.usb += self.checksum.eq(checksum)
+
+		return m
+
+class SerialBenchmark(Elaboratable):
+	''' Wraps a USBSerialDevice for synthesis; looping its received data back to the host. '''
+
+	def __init__(self, *, bus):
+		#
+		# I/O port
+		#
+		self.bus     = bus
+		self.connect = Signal()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Our serial device drives its own clock from its PHY; so we'll provide the domain for it.
+		m.domains.usb = ClockDomain()
+
+		m.submodules.serial = serial = USBSerialDevice(bus = self.bus, idVendor = 0x1209, idProduct = 0x0001)
+		m.d.comb += [
+			serial.connect.eq(self.connect),
+			serial.tx.stream_eq(serial.rx),
+		]
+
+		return m
+
+class MultiPortBenchmark(Elaboratable):
+	''' Builds a set of UTMI-connected devices with standard control endpoints, for synthesis.
+
+	Attributes
+	----------
+	buses: list[UTMIInterface]
+		The USB bus connection for each port.
+	connect: Signal(), input
+		Passed through to each of our ports.
+	'''
+
+	def __init__(self, *, ports, shared):
+		self._shared = shared
+
+		#
+		# I/O port
+		#
+		self.buses   = [UTMIInterface() for _ in range(ports)]
+		self.connect = Signal()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Either share our request handling between every port...
+		if self._shared:
+			m.submodules.device = device = USBMultiPortDevice(
+				buses = self.buses, descriptors = _descriptors(), handle_clocking = False
+			)
+			ports = device.ports
+
+		# ... or give each port a complete device of its own.
+		else:
+			ports = []
+			for index, bus in enumerate(self.buses):
+				port = USBDevice(bus = bus, handle_clocking = False)
+				port.add_standard_control_endpoint(_descriptors())
+
+				m.submodules[f'port_{index}'] = port
+				ports.append(port)
+
+		for port in ports:
+			m.d.comb += port.connect.eq(self.connect)
+
+		return m
+
+#
+# Benchmark matrix.
+#
+
+def _device_benchmark(bus, *, bulk_endpoints = 0, buffer_size = None, indexed_endpoint_mux = False):
+	def build():
+		design = DeviceBenchmark(
+			bus = BUSES[bus](), bulk_endpoints = bulk_endpoints, buffer_size = buffer_size,
+			indexed_endpoint_mux = indexed_endpoint_mux
+		)
+		return design, _signals_of(design)
+	return build
+
+def _multiport_benchmark(ports, *, shared):
+	def build():
+		design = MultiPortBenchmark(ports = ports, shared = shared)
+		return design, _signals_of(design)
+	return build
+
+def _serial_benchmark(bus):
+	def build():
+		design = SerialBenchmark(bus = BUSES[bus]())
+		return design, _signals_of(design)
+	return build
+
+class BenchmarkPIPE(PIPEInterface):
+	''' PIPE interface whose signals are brought straight out to our top level. '''
+
+	def elaborate(self, platform):
+		return Module()
+
+def _superspeed_benchmark():
+	def build():
+		phy    = BenchmarkPIPE(width = 4)
+		design = USBSuperSpeedDevice(phy = phy, sync_frequency = 125e6)
+		design.add_standard_control_endpoint(_descriptors())
+		return design, _signals_of(phy, depth = 1)
+	return build
+
+def _module_benchmark(factory):
+	def build():
+		design = factory()
+		return design, _signals_of(design)
+	return build
+
+# Each benchmark is described by its name, the parameters it was built with, the families it
+# can be built for, and a function that returns the design and its top-level ports.
+BENCHMARKS = [
+	*(
+		(f'device_{bus}', {'bus': bus}, ('ice40', 'ecp5'), _device_benchmark(bus))
+		for bus in BUSES
+	),
+	*(
+		(
+			f'device_ulpi_bulk{count}', {'bus': 'ulpi', 'bulk_endpoints': count},
+			('ice40', 'ecp5'), _device_benchmark('ulpi', bulk_endpoints = count)
+		)
+		for count in (1, 4, 15)
+	),
+	(
+		'device_ulpi_bulk15_indexed', {'bus': 'ulpi', 'bulk_endpoints': 15, 'indexed_endpoint_mux': True},
+		('ice40', 'ecp5'), _device_benchmark('ulpi', bulk_endpoints = 15, indexed_endpoint_mux = True)
+	),
+	*(
+		(
+			f'device_ulpi_bulk1_buffer{size}', {'bus': 'ulpi', 'bulk_endpoints': 1, 'buffer_size': size},
+			('ice40', 'ecp5'), _device_benchmark('ulpi', bulk_endpoints = 1, buffer_size = size)
+		)
+		for size in (1024, 4096)
+	),
+	*(
+		(
+			f'{"multiport" if shared else "separate"}_utmi{ports}', {'ports': ports, 'shared': shared},
+			('ice40', 'ecp5'), _multiport_benchmark(ports, shared = shared)
+		)
+		for ports in (2, 4) for shared in (True, False)
+	),
+	*(
+		(f'serial_{bus}', {'bus': bus}, ('ice40', 'ecp5'), _serial_benchmark(bus))
+		for bus in ('utmi', 'ulpi')
+	),
+	('superspeed_device', {'phy': 'pipe', 'width': 4}, ('ecp5',), _superspeed_benchmark()),
+	(
+		'data_packet_receiver', {}, ('ice40', 'ecp5'),
+		_module_benchmark(lambda: USBDataPacketReceiver(utmi = UTMIInterface()))
+	),
+	*(
+		(
+			f'transactionalized_fifo_{depth}', {'width': 8, 'depth': depth}, ('ice40', 'ecp5'),
+			_module_benchmark(lambda depth = depth: TransactionalizedFIFO(width = 8, depth = depth))
+		)
+		for depth in (64, 512, 2048)
+	),
+	*(
+		(
+			f'data_crc_{width}b{"_pipelined" if pipelined else ""}',
+			{'bytes_per_cycle': width, 'pipelined': pipelined}, ('ice40', 'ecp5'),
+			_module_benchmark(lambda width = width, pipelined = pipelined: USBDataPacketCRC(
+				bytes_per_cycle = width, pipelined = pipelined
+			))
+		)
+		for width, pipelined in ((1, False), (2, False), (4, False), (4, True))
+	),
+	(
+		'get_descriptor_handler', {}, ('ice40', 'ecp5'),
+		_module_benchmark(lambda: GetDescriptorHandlerBlock(_descriptors(bulk_endpoints = 4)))
+	),
+	(
+		'get_descriptor_handler_compact', {'compact': True}, ('ice40', 'ecp5'),
+		_module_benchmark(lambda: GetDescriptorHandlerBlock(_descriptors(bulk_endpoints = 4), compact = True))
+	),
+]
+
+#
+# Synthesis flow.
+#
+
+def _tool_version(tool):
+	''' Returns the version string reported by a given tool. '''
+	result = subprocess.run([tool, '--version'], capture_output = True, text = True)
+	return result.stdout.strip().splitlines()[0] if result.stdout else 'unknown'
+
+def _count_cells(cells, weights):
+	''' Counts the cells matching a given set of weighted cell types. '''
+	return sum(count * weights.get(cell, 0) for cell, count in cells.items())
+
+def run_benchmark(name, build, *, family, frequency, seed, work_dir):
+	''' Synthesizes and places a single benchmark design; returning its resources and timing. '''
+	config = FAMILIES[family]
+
+	design, ports = build()
+	(work_dir / f'{name}.il').write_text(rtlil.convert(design, name = 'top', ports = ports))
+
+	subprocess.run([
+		'yosys', '-q', '-p', '; '.join((
+			f'read_rtlil {name}.il',
+			f'{config["synth"]} -top top -json {name}.json',
+			f'tee -q -o {name}.stat.json stat -json',
+		))
+	], cwd = work_dir, check = True, capture_output = True)
+
+	subprocess.run([
+		config['pnr'], *config['device'], *config['pnr_args'],
+		'--json', f'{name}.json', '--report', f'{name}.report.json',
+		'--freq', str(frequency), '--seed', str(seed),
+	], cwd = work_dir, check = True, capture_output = True)
+
+	stat   = json.loads((work_dir / f'{name}.stat.json').read_text())
+	report = json.loads((work_dir / f'{name}.report.json').read_text())
+
+	cells = stat['design']['num_cells_by_type']
+	ff_count = sum(count for cell, count in cells.items() if cell.startswith(config['ff']))
+
+	return {
+		'resources': {
+			'lut':   _count_cells(cells, config['lut']),
+			'ff':    ff_count,
+			'bram':  _count_cells(cells, config['bram']),
+			'cells': cells,
+		},
+		'utilization': report.get('utilization', {}),
+		'fmax': {
+			clock: {'achieved': timing['achieved'], 'constraint': timing['constraint']}
+			for clock, timing in report.get('fmax', {}).items()
+		},
+	}
+
+def compare(results, baseline, *, threshold):
+	''' Prints any resource or timing changes beyond a given threshold between two sets of results. '''
+
+	baseline_results = {result['name']: result for result in baseline['results'] if result['status'] == 'ok'}
+	regressions = 0
+
+	for result in results['results']:
+		previous = baseline_results.get(result['name'])
+		if result['status'] != 'ok' or previous is None:
+			continue
+
+		changes = [
+			(resource, previous['resources'][resource], result['resources'][resource], True)
+			for resource in ('lut', 'ff', 'bram')
+		]
+		changes.extend(
+			(f'fmax[{clock}]', previous['fmax'][clock]['achieved'], timing['achieved'], False)
+			for clock, timing in result['fmax'].items() if clock in previous['fmax']
+		)
+
+		for what, old, new, lower_is_better in changes:
+			if old == new:
+				continue
+
+			delta = (new - old) / old if old else float('inf')
+			if abs(delta) < threshold:
+				continue
+
+			worse = (delta > 0) if lower_is_better else (delta < 0)
+			regressions += worse
+
+			marker = 'REGRESSED' if worse else 'improved'
+			print(f'{result["name"]}: {what} {old:g} -> {new:g} ({delta:+.1%}, {marker})')
+
+	return regressions
+
+def main():
+	parser = ArgumentParser(description = 'Synthesis resource and Fmax benchmarks for Torii-USB.')
+	parser.add_argument('--family', choices = FAMILIES.keys(), default = 'ice40', help = 'The FPGA family to target.')
+	parser.add_argument('--output', type = Path, help = 'File to write JSON results to; or stdout if not given.')
+	parser.add_argument('--only', nargs = '+', metavar = 'NAME', help = 'Only run the named benchmarks.')
+	parser.add_argument('--list', action = 'store_true', help = 'List the available benchmarks and exit.')
+	parser.add_argument('--frequency', type = float, default = 60, help = 'Target clock frequency, in MHz.')
+	parser.add_argument('--seed', type = int, default = 1, help = 'Placement seed.')
+	parser.add_argument('--keep', type = Path, help = 'Directory to keep intermediate files in.')
+	parser.add_argument('--baseline', type = Path, help = 'Previous results to compare against.')
+	parser.add_argument(
+		'--threshold', type = float, default = 0.02, help = 'Minimum relative change to report against a baseline.'
+	)
+	args = parser.parse_args()
+
+	benchmarks = [benchmark for benchmark in BENCHMARKS if args.family in benchmark[2]]
+	if args.only:
+		benchmarks = [benchmark for benchmark in benchmarks if benchmark[0] in args.only]
+
+	if args.list:
+		for name, parameters, _, _ in benchmarks:
+			print(f'{name}: {parameters}')
+		return 0
+
+	config = FAMILIES[args.family]
+	for tool in ('yosys', config['pnr']):
+		if shutil.which(tool) is None:
+			print(f'{tool} was not found; it is required to run these benchmarks', file = sys.stderr)
+			return 1
+
+	results = {
+		'family':    args.family,
+		'device':    ' '.join(config['device']),
+		'frequency': args.frequency,
+		'seed':      args.seed,
+		'tools':     {tool: _tool_version(tool) for tool in ('yosys', config['pnr'])},
+		'results':   [],
+	}
+
+	with TemporaryDirectory(prefix = 'torii-usb-bench-') as temp_dir:
+		work_dir = args.keep or Path(temp_dir)
+		work_dir.mkdir(parents = True, exist_ok = True)
+
+		for name, parameters, _, build in benchmarks:
+			print(f'Running {name}...', file = sys.stderr)
+			result = {'name': name, 'parameters': parameters}
+
+			try:
+				result.update(run_benchmark(
+					name, build, family = args.family, frequency = args.frequency, seed = args.seed,
+					work_dir = work_dir
+				))
+				result['status'] = 'ok'
+			except subprocess.CalledProcessError as error:
+				result['status'] = 'failed'
+				result['error']  = (error.stderr or b'').decode(errors = 'replace')[-2000:]
+			except Exception as error:
+				# A design that fails to elaborate shouldn't stop the rest of the run
+				result['status'] = 'failed'
+				result['error']  = f'{type(error).__name__}: {error}'
+
+			results['results'].append(result)
+
+	output = json.dumps(results, indent = '\t')
+	if args.output:
+		args.output.write_text(output)
+	else:
+		print(output)
+
+	if args.baseline:
+		regressions = compare(results, json.loads(args.baseline.read_text()), threshold = args.threshold)
+		return 1 if regressions else 0
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
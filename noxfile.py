@@ -224,11 +224,40 @@ def lint(session: Session) -> None:
 
 	session.run(
 		'flake8', '--config', str((CNTRB_DIR / '.flake8').resolve()),
-		'./torii_usb', './tests', './examples', './docs'
+		'./torii_usb', './tests', './examples', './docs', './benchmarks'
 	)
-	session.run('ruff', 'check', './torii_usb', './tests', './examples', './docs')
+	session.run('ruff', 'check', './torii_usb', './tests', './examples', './docs', './benchmarks')
 
 
+@nox.session(name = 'bench-synthesis', reuse_venv = True)
+def bench_synthesis(session: Session) -> None:
+	OUTPUT_DIR = BUILD_DIR / 'benchmarks'
+	OUTPUT_DIR.mkdir(parents = True, exist_ok = True)
+
+	# XXX(aki): We need to test against the in-dev version of Torii as it has fixes we need
+	session.install('git+https://codeberg.org/shrine-maiden-heavy-industries/torii-hdl.git')
+	session.install('--pre', '-e', '.')
+
+	# Any extra arguments are passed on, e.g. `nox -s bench-synthesis -- --family ecp5`
+	session.run(
+		'python', str(ROOT_DIR / 'benchmarks' / 'synthesis.py'),
+		'--output', str(OUTPUT_DIR / 'synthesis.json'), *session.posargs
+	)
+
+@nox.session(name = 'bench-simulation', reuse_venv = True)
+def bench_simulation(session: Session) -> None:
+	OUTPUT_DIR = BUILD_DIR / 'benchmarks'
+	OUTPUT_DIR.mkdir(parents = True, exist_ok = True)
+
+	# XXX(aki): We need to test against the in-dev version of Torii as it has fixes we need
+	session.install('git+https://codeberg.org/shrine-maiden-heavy-industries/torii-hdl.git')
+	session.install('--pre', '-e', '.')
+
+	session.run(
+		'python', str(ROOT_DIR / 'benchmarks' / 'simulation.py'),
+		'--output', str(OUTPUT_DIR / 'simulation.json'), *session.posargs
+	)
+
 @nox.session(reuse_venv = True)
 def dist(session: Session) -> None:
 	session.install('build')
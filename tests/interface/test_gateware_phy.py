@@ -0,0 +1,91 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.hdl                                 import Signal
+
+from torii_usb.interface.gateware_phy.receiver import RxClockDataRecovery, RxDDRClockDataRecovery
+from torii_usb.test                            import ToriiUSBGatewareTestCase
+
+# The (D+, D-) values of each line state; matching the line states our clock recovery reports.
+LINE_STATES = {'J': (0, 1), 'K': (1, 0), 'SE0': (0, 0)}
+
+class RxClockDataRecoveryTest(ToriiUSBGatewareTestCase):
+	''' Checks our clock recovery against a stream of bits, four samples per bit. '''
+
+	SYNC_CLOCK_FREQUENCY = None
+	IO_CLOCK_FREQUENCY   = 48e6
+
+	SAMPLES_PER_CYCLE = 1
+
+	# A packet-like sequence of line states, with a variety of run lengths.
+	BITS = ['J'] * 4 + ['K', 'J'] * 3 + ['K', 'K', 'J', 'K', 'K', 'K', 'J', 'J', 'SE0', 'SE0', 'J', 'J']
+
+	def instantiate_dut(self):
+		self.usbp = Signal(self.SAMPLES_PER_CYCLE)
+		self.usbn = Signal(self.SAMPLES_PER_CYCLE)
+		return RxClockDataRecovery(self.usbp, self.usbn)
+
+	def setUp(self):
+		super().setUp()
+		self.sim.add_clock(1 / self.IO_CLOCK_FREQUENCY, domain = 'usb_io')
+
+	def _recover(self, samples):
+		''' Feeds our clock recovery the given (D+, D-) samples; and returns the line states it recovers. '''
+
+		recovered = []
+
+		def process():
+			cycles = len(samples) // self.SAMPLES_PER_CYCLE
+			for cycle in range(cycles + 8):
+				chunk = samples[cycle * self.SAMPLES_PER_CYCLE:(cycle + 1) * self.SAMPLES_PER_CYCLE]
+				if len(chunk) == self.SAMPLES_PER_CYCLE:
+					yield self.usbp.eq(sum(d_p << i for i, (d_p, _) in enumerate(chunk)))
+					yield self.usbn.eq(sum(d_n << i for i, (_, d_n) in enumerate(chunk)))
+				yield
+
+				if (yield self.dut.line_state_valid):
+					states = {
+						'J':   (yield self.dut.line_state_dj),
+						'K':   (yield self.dut.line_state_dk),
+						'SE0': (yield self.dut.line_state_se0),
+					}
+					recovered.extend(name for name, active in states.items() if active)
+
+		self.sim.add_sync_process(process, domain = 'usb_io')
+		self.simulate()
+
+		return recovered
+
+	def _samples(self, *, offset, stretched_bit = None, stretch = 0):
+		''' Converts our bits to samples; optionally lengthening or shortening one bit, to emulate clock drift. '''
+		samples = [LINE_STATES['J']] * offset
+		for index, bit in enumerate(self.BITS):
+			samples += [LINE_STATES[bit]] * (4 + (stretch if index == stretched_bit else 0))
+		return samples + [LINE_STATES['J']] * 8
+
+	def _assert_recovered(self, recovered):
+		# Our initial idle may be partially recovered; but everything from our first K on should be exact.
+		expected = self.BITS[self.BITS.index('K'):]
+		self.assertIn('K', recovered)
+		recovered = recovered[recovered.index('K'):][:len(expected)]
+		self.assertEqual(recovered, expected)
+
+	def test_recovery(self):
+		for offset in range(4):
+			with self.subTest(offset = offset):
+				self.setUp()
+				self._assert_recovered(self._recover(self._samples(offset = offset)))
+
+	def test_drift(self):
+		for stretch in (-1, 1):
+			with self.subTest(stretch = stretch):
+				self.setUp()
+				self._assert_recovered(self._recover(self._samples(offset = 1, stretched_bit = 9, stretch = stretch)))
+
+class RxDDRClockDataRecoveryTest(RxClockDataRecoveryTest):
+	IO_CLOCK_FREQUENCY = 24e6
+	SAMPLES_PER_CYCLE  = 2
+
+	def instantiate_dut(self):
+		self.usbp = Signal(self.SAMPLES_PER_CYCLE)
+		self.usbn = Signal(self.SAMPLES_PER_CYCLE)
+		return RxDDRClockDataRecovery(self.usbp, self.usbn)
@@ -156,6 +156,49 @@ class TestULPIRegisters(ToriiUSBGatewareTestCase):
 		self.assertEqual((yield self.dut.ulpi_stop), 0)
 		self.assertEqual((yield self.dut.busy), 0)
 
+	@usb_domain_test_case
+	def test_back_to_back_writes(self):
+		''' Validates that a pending request is started as soon as the previous write completes. '''
+
+		# Have the PHY accept everything immediately, and queue up a write.
+		yield self.dut.ulpi_next.eq(1)
+		yield self.dut.address.eq(0x04)
+		yield self.dut.write_data.eq(0x12)
+		yield self.dut.write_request.eq(1)
+		yield
+
+		# Once our request has been accepted, we're free to present our next one.
+		self.assertEqual((yield self.dut.ready), 1)
+		yield
+		yield self.dut.address.eq(0x0A)
+		yield self.dut.write_data.eq(0x34)
+		self.assertEqual((yield self.dut.ready), 0)
+
+		# Our first write should go out as usual...
+		yield
+		self.assertEqual((yield self.dut.ulpi_data_out), 0b10000100)
+		yield
+		self.assertEqual((yield self.dut.ulpi_data_out), 0x12)
+		yield
+		self.assertEqual((yield self.dut.ulpi_stop), 1)
+		self.assertEqual((yield self.dut.ready), 1)
+		yield
+		yield self.dut.write_request.eq(0)
+
+		# ... and be followed immediately by our second, without the bus ever going idle.
+		self.assertEqual((yield self.dut.done), 1)
+		self.assertEqual((yield self.dut.ulpi_out_req), 1)
+		self.assertEqual((yield self.dut.ulpi_data_out), 0b10001010)
+		yield
+		self.assertEqual((yield self.dut.ulpi_data_out), 0x34)
+		yield
+		self.assertEqual((yield self.dut.ulpi_stop), 1)
+		yield
+
+		# Once that's complete, we should go idle.
+		self.assertEqual((yield self.dut.done), 1)
+		self.assertEqual((yield self.dut.busy), 0)
+
 class ULPIRxEventDecoderTest(ToriiUSBGatewareTestCase):
 
 	USB_CLOCK_FREQUENCY = 60e6
@@ -238,6 +281,30 @@ class ControlTranslatorTest(ToriiUSBGatewareTestCase):
 		yield dut.use_external_vbus_indicator.eq(0)
 		yield dut.bus_idle.eq(1)
 
+	def capture_writes(self, *, timeout = 64):
+		''' Accepts every register write made on the bus, until the bus goes idle; returning each write made. '''
+
+		window = self.reg_window
+		writes = []
+		recent = []
+
+		yield window.ulpi_next.eq(1)
+		yield from self.wait_until(window.busy, timeout = timeout)
+
+		while (yield window.busy):
+			recent.append((yield window.ulpi_data_out))
+
+			# Each write ends with a single cycle of STP; the command and data precede it.
+			if (yield window.ulpi_stop):
+				command, data = recent[-3:-1]
+				self.assertEqual(command & 0b11000000, ULPIRegisterWindow.COMMAND_REG_WRITE)
+				writes.append((command & 0b00111111, data))
+
+			yield
+
+		yield window.ulpi_next.eq(0)
+		return writes
+
 	@usb_domain_test_case
 	def test_multiwrite_behavior(self):
 
@@ -253,31 +320,47 @@ class ControlTranslatorTest(ToriiUSBGatewareTestCase):
 		yield
 		yield
 
-		# Once we've changed these, we should start trying to apply
-		# our new value to the function control register.
-		self.assertEqual((yield self.reg_window.address),      0x04)
-		self.assertEqual((yield self.reg_window.write_data),   0b01011001)
+		# Once we've changed these, we should write the function control register,
+		# followed by the OTG control register.
+		writes = yield from self.capture_writes()
+		self.assertEqual(writes, [(0x04, 0b01011001), (0x0A, 0b00000000)])
 
-		# which should occur until the data and address are accepted.
-		yield self.reg_window.ulpi_next.eq(1)
-		yield from self.wait_until(self.reg_window.done, timeout = 10)
-		yield
+		# After which we shouldn't be trying to write anything at all.
 		yield
+		self.assertEqual((yield self.reg_window.write_request), 0)
+		self.assertEqual((yield self.dut.busy), 0)
 
-		# We should then experience a write to the function control register.
-		self.assertEqual((yield self.reg_window.address),      0x0A)
-		self.assertEqual((yield self.reg_window.write_data),   0b00000000)
+	@usb_domain_test_case
+	def test_write_coalescing(self):
+		yield from self.advance_cycles(10)
 
-		# Wait for that action to complete..
-		yield self.reg_window.ulpi_next.eq(1)
-		yield from self.wait_until(self.reg_window.done, timeout = 10)
-		yield
-		yield
+		# Start a write to the function control register; and then stall it on the bus.
+		yield self.dut.suspend.eq(1)
+		yield from self.wait_until(self.reg_window.busy, timeout = 10)
 
-		# After which we shouldn't be trying to write anything at all.
-		self.assertEqual((yield self.reg_window.address),       0)
-		self.assertEqual((yield self.reg_window.write_data),    0)
-		self.assertEqual((yield self.reg_window.write_request), 0)
+		# Changes that are undone before they can be written shouldn't be written at all...
+		yield self.dut.dp_pulldown.eq(0)
+		yield from self.advance_cycles(3)
+		yield self.dut.dp_pulldown.eq(1)
+
+		# ... and repeated changes to a single register should result in one write of its final value.
+		for op_mode in (0b01, 0b10, 0b11):
+			yield self.dut.op_mode.eq(op_mode)
+			yield from self.advance_cycles(3)
+
+		writes = yield from self.capture_writes()
+		self.assertEqual(writes, [(0x04, 0b00000001), (0x04, 0b00011001)])
+
+		# Holding off the bus should keep us from starting any further writes.
+		yield self.dut.bus_idle.eq(0)
+		yield self.dut.xcvr_select.eq(0)
+		yield from self.advance_cycles(10)
+		self.assertEqual((yield self.reg_window.busy), 0)
+		self.assertEqual((yield self.dut.busy), 0)
+
+		yield self.dut.bus_idle.eq(1)
+		writes = yield from self.capture_writes()
+		self.assertEqual(writes, [(0x04, 0b00011000)])
 
 class ULPITransmitTranslatorTest(ToriiUSBGatewareTestCase):
 	USB_CLOCK_FREQUENCY = 60e6
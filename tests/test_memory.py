@@ -1,6 +1,6 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
-from torii_usb.memory import TransactionalizedFIFO
+from torii_usb.memory import AsyncTransactionalizedFIFO, TransactionalizedFIFO
 from torii_usb.test   import ToriiUSBGatewareTestCase, sync_test_case
 
 class TransactionalizedFIFOTest(ToriiUSBGatewareTestCase):
@@ -121,3 +121,107 @@ class TransactionalizedFIFOTest(ToriiUSBGatewareTestCase):
 		self.assertEqual((yield dut.empty),            1)
 		self.assertEqual((yield dut.full),             0)
 		self.assertEqual((yield dut.space_available),  16)
+
+class AsyncTransactionalizedFIFOTest(ToriiUSBGatewareTestCase):
+	FRAGMENT_UNDER_TEST = AsyncTransactionalizedFIFO
+	FRAGMENT_ARGUMENTS = {'width': 8, 'depth': 16, 'w_domain': 'usb', 'r_domain': 'sync'}
+
+	SYNC_CLOCK_FREQUENCY = 100e6
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	def _read_bytes(self, count):
+		''' Reads a set of bytes from the FIFO's read side; and commits them. '''
+		dut      = self.dut
+		received = []
+
+		while len(received) < count:
+			if (yield dut.empty):
+				yield
+			else:
+				received.append((yield dut.read_data))
+				yield from self.pulse(dut.read_en)
+
+		yield from self.pulse(dut.read_commit)
+		return received
+
+	def test_cross_domain_transfer(self):
+		dut = self.dut
+		received = []
+
+		def write_process():
+			# Data that is written but never committed should never reach the other side.
+			yield dut.write_en.eq(1)
+			for i in range(4):
+				yield dut.write_data.eq(0xf0 + i)
+				yield
+			yield dut.write_en.eq(0)
+			yield from self.advance_cycles(10)
+			self.assertEqual((yield dut.empty),           1)
+			self.assertEqual((yield dut.space_available), 12)
+
+			# Discarding it should give us our space back...
+			yield from self.pulse(dut.write_discard)
+			self.assertEqual((yield dut.space_available), 16)
+
+			# ... and committed data should make it to the read side intact.
+			yield dut.write_en.eq(1)
+			for i in range(16):
+				yield dut.write_data.eq(i)
+				yield
+			yield dut.write_en.eq(0)
+			yield
+			self.assertEqual((yield dut.full), 1)
+			yield from self.pulse(dut.write_commit)
+
+			# Once the reader commits its reads, our space should come back.
+			yield from self.wait_until(dut.space_available == 16, timeout = 100)
+			self.assertEqual((yield dut.full), 0)
+
+		def read_process():
+			yield from self.wait_until(~dut.empty, timeout = 200)
+			received.extend((yield from self._read_bytes(16)))
+
+			yield from self.advance_cycles(10)
+			self.assertEqual((yield dut.empty), 1)
+
+		self.sim.add_sync_process(write_process, domain = 'usb')
+		self.sim.add_sync_process(read_process,  domain = 'sync')
+		self.simulate(vcd_suffix = 'cross_domain_transfer')
+
+		self.assertEqual(received, list(range(16)))
+
+	def test_read_discard(self):
+		dut = self.dut
+		received = []
+
+		def write_process():
+			yield dut.write_en.eq(1)
+			for i in range(8):
+				yield dut.write_data.eq(i)
+				yield
+			yield dut.write_en.eq(0)
+			yield from self.pulse(dut.write_commit)
+
+			# Discarded reads should not free any space...
+			yield from self.advance_cycles(40)
+			self.assertEqual((yield dut.space_available), 8)
+
+			# ... but committed ones should.
+			yield from self.wait_until(dut.space_available == 16, timeout = 200)
+
+		def read_process():
+			yield from self.wait_until(~dut.empty, timeout = 200)
+
+			yield dut.read_en.eq(1)
+			yield from self.advance_cycles(4)
+			yield dut.read_en.eq(0)
+			yield from self.pulse(dut.read_discard)
+			yield from self.advance_cycles(100)
+
+			received.extend((yield from self._read_bytes(8)))
+
+		self.sim.add_sync_process(write_process, domain = 'usb')
+		self.sim.add_sync_process(read_process,  domain = 'sync')
+		self.simulate(vcd_suffix = 'read_discard')
+
+		self.assertEqual(received, list(range(8)))
@@ -0,0 +1,195 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii_usb.test                           import ToriiUSBGatewareTestCase, usb_domain_test_case
+from torii_usb.usb.usb2.endpoints.isochronous import USBIsochronousOutEndpoint, USBIsochronousStreamInEndpoint
+
+DATA0, DATA1, DATA2, MDATA = range(4)
+
+class USBIsochronousOutEndpointTest(ToriiUSBGatewareTestCase):
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	FRAGMENT_UNDER_TEST = USBIsochronousOutEndpoint
+	FRAGMENT_ARGUMENTS = {
+		'endpoint_number': 1,
+		'max_packet_size': 4,
+		'transactions_per_microframe': 3,
+	}
+	dut: USBIsochronousOutEndpoint
+
+	def initialize_signals(self):
+		yield self.dut.interface.tokenizer.endpoint.eq(1)
+		yield self.dut.interface.tokenizer.is_out.eq(1)
+
+	def send_packet(self, packet: list[int], *, pid: int, valid = True):
+		interface = self.dut.interface
+
+		yield interface.rx_pid_toggle.eq(pid)
+
+		yield interface.rx.valid.eq(1)
+		for byte in packet:
+			yield interface.rx.data.eq(byte)
+			yield interface.rx.next.eq(1)
+			yield
+		yield interface.rx.next.eq(0)
+		yield interface.rx.valid.eq(0)
+		yield
+
+		yield from self.pulse(interface.rx_complete if valid else interface.rx_invalid)
+
+	def start_of_frame(self):
+		yield from self.pulse(self.dut.interface.tokenizer.new_frame)
+
+	def receive_frame(self):
+		stream = self.dut.stream
+		data   = []
+
+		yield stream.ready.eq(1)
+		yield
+		while (yield stream.valid):
+			self.assertEqual((yield stream.first), len(data) == 0)
+			data.append((yield stream.data))
+			is_last = (yield stream.last)
+			yield
+			if is_last:
+				break
+		yield stream.ready.eq(0)
+		return data
+
+	@usb_domain_test_case
+	def test_high_bandwidth_frame(self):
+		dut = self.dut
+
+		# A three-transaction microframe should be passed through in its entirety...
+		yield from self.start_of_frame()
+		yield from self.send_packet([0x01, 0x02, 0x03, 0x04], pid = MDATA)
+		yield from self.send_packet([0x05, 0x06, 0x07, 0x08], pid = MDATA)
+		self.assertEqual((yield dut.stream.valid), 0)
+		yield from self.send_packet([0x09, 0x0a], pid = DATA2)
+
+		# ... and be reported as complete.
+		self.assertEqual((yield dut.frame_complete), 1)
+		self.assertEqual((yield dut.frame_lost), 0)
+		self.assertEqual((yield dut.frame_short), 0)
+		self.assertEqual((yield dut.bytes_in_frame), 10)
+
+		data = yield from self.receive_frame()
+		self.assertEqual(data, list(range(1, 11)))
+
+		# A two-transaction microframe ends in DATA1.
+		yield from self.start_of_frame()
+		yield from self.send_packet([0x11, 0x12, 0x13], pid = MDATA)
+		yield from self.send_packet([0x14], pid = DATA1)
+		self.assertEqual((yield dut.frame_complete), 1)
+		self.assertEqual((yield dut.frame_short), 1)
+
+		data = yield from self.receive_frame()
+		self.assertEqual(data, [0x11, 0x12, 0x13, 0x14])
+
+	@usb_domain_test_case
+	def test_lost_frames(self):
+		dut = self.dut
+
+		# If we miss a transaction, the whole microframe should be dropped.
+		yield from self.start_of_frame()
+		yield from self.send_packet([0x01, 0x02, 0x03, 0x04], pid = MDATA)
+		yield from self.send_packet([0x05, 0x06], pid = DATA2)
+		self.assertEqual((yield dut.frame_lost), 1)
+		self.assertEqual((yield dut.frame_complete), 0)
+
+		# The same applies for CRC errors, and for microframes that are never finished.
+		yield from self.start_of_frame()
+		yield from self.send_packet([0x01, 0x02, 0x03, 0x04], pid = MDATA)
+		yield from self.send_packet([0x05, 0x06, 0x07, 0x08], pid = MDATA, valid = False)
+		self.assertEqual((yield dut.frame_lost), 1)
+		yield from self.send_packet([0x09], pid = DATA2)
+		self.assertEqual((yield dut.frame_complete), 0)
+
+		yield from self.start_of_frame()
+		yield from self.send_packet([0x01, 0x02, 0x03, 0x04], pid = MDATA)
+		yield from self.start_of_frame()
+		self.assertEqual((yield dut.frame_lost), 1)
+
+		# None of that data should have made it to our stream...
+		self.assertEqual((yield dut.stream.valid), 0)
+
+		# ... but we should still receive subsequent microframes.
+		yield from self.send_packet([0xaa, 0xbb], pid = DATA0)
+		self.assertEqual((yield dut.frame_complete), 1)
+		data = yield from self.receive_frame()
+		self.assertEqual(data, [0xaa, 0xbb])
+
+class USBIsochronousStreamInEndpointTest(ToriiUSBGatewareTestCase):
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	FRAGMENT_UNDER_TEST = USBIsochronousStreamInEndpoint
+	FRAGMENT_ARGUMENTS = {
+		'endpoint_number': 1,
+		'max_packet_size': 4,
+		'transactions_per_microframe': 2,
+	}
+	dut: USBIsochronousStreamInEndpoint
+
+	def initialize_signals(self):
+		yield self.dut.interface.tokenizer.endpoint.eq(1)
+		yield self.dut.interface.tokenizer.is_in.eq(1)
+		yield self.dut.interface.tx.ready.eq(1)
+
+	def queue_data(self, data: list[int]):
+		stream = self.dut.stream
+
+		yield stream.valid.eq(1)
+		for byte in data:
+			yield stream.data.eq(byte)
+			yield
+		yield stream.valid.eq(0)
+		yield
+
+	def request_packet(self):
+		tx     = self.dut.interface.tx
+		packet = []
+
+		yield from self.pulse(self.dut.interface.tokenizer.ready_for_response)
+		pid = (yield self.dut.interface.tx_pid_toggle)
+		while (yield tx.valid):
+			if (yield tx.first) or packet:
+				packet.append((yield tx.data))
+			yield
+		yield
+		return pid, packet
+
+	@usb_domain_test_case
+	def test_stream_transmission(self):
+		dut = self.dut
+
+		# Queue up more than a microframe's worth of data...
+		yield from self.queue_data(list(range(10)))
+
+		# ... at the start of our microframe, we should schedule a full microframe...
+		yield from self.pulse(dut.interface.tokenizer.new_frame)
+		self.assertEqual((yield dut.bytes_in_frame), 8)
+
+		# ... which should be sent as two transactions: DATA1, then DATA0.
+		self.assertEqual((yield from self.request_packet()), (1, [0, 1, 2, 3]))
+		self.assertEqual((yield from self.request_packet()), (0, [4, 5, 6, 7]))
+
+		# Our next microframe should contain what's left.
+		yield from self.pulse(dut.interface.tokenizer.new_frame)
+		self.assertEqual((yield dut.bytes_in_frame), 2)
+		self.assertEqual((yield from self.request_packet()), (0, [8, 9]))
+		self.assertEqual((yield dut.underrun_count), 0)
+
+		# If we have no data at all, we should send a ZLP, and count an underrun.
+		yield from self.pulse(dut.interface.tokenizer.new_frame)
+		self.assertEqual((yield dut.bytes_in_frame), 0)
+		self.assertEqual((yield from self.request_packet()), (0, []))
+		self.assertEqual((yield dut.underrun_count), 1)
+
+	@usb_domain_test_case
+	def test_overrun(self):
+		dut = self.dut
+
+		# Our buffer holds two microframes of data; anything beyond that should be counted as dropped.
+		yield from self.queue_data(list(range(20)))
+		self.assertEqual((yield dut.overrun_count), 4)
@@ -3,8 +3,9 @@
 from random                              import randint
 from torii.sim                           import Settle
 
+from torii_usb.usb.usb2                  import USBSpeed
 from torii_usb.usb.usb2.endpoints.stream import (
-	USBMultibyteStreamInEndpoint
+	USBMultibyteStreamInEndpoint, USBMultibyteStreamOutEndpoint, USBStreamOutEndpoint
 )
 from torii_usb.test                      import ToriiUSBGatewareTestCase, usb_domain_test_case
 
@@ -178,3 +179,180 @@ class USBMultibyteStreamInEndpointTest(ToriiUSBGatewareTestCase):
 		self.sim.add_sync_process(queue_data, domain = 'usb')
 		self.sim.add_sync_process(consume_data, domain = 'usb')
 		self.simulate(vcd_suffix = self.test_long_packet.__name__)
+
+class USBStreamOutEndpointTest(ToriiUSBGatewareTestCase):
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	FRAGMENT_UNDER_TEST = USBStreamOutEndpoint
+	FRAGMENT_ARGUMENTS = {
+		'endpoint_number': 1,
+		'max_packet_size': 8,
+	}
+	dut: USBStreamOutEndpoint
+
+	def handshakes(self):
+		handshakes_out = self.dut.interface.handshakes_out
+		return ((yield handshakes_out.ack), (yield handshakes_out.nak), (yield handshakes_out.nyet))
+
+	def send_packet(self, packet: list[int], *, pid = 0):
+		interface = self.dut.interface
+
+		# Target our endpoint with an OUT token...
+		yield interface.tokenizer.endpoint.eq(1)
+		yield interface.tokenizer.is_out.eq(1)
+		yield interface.rx_pid_toggle.eq(pid)
+
+		# ... send our packet's data one byte per cycle...
+		yield interface.rx.valid.eq(1)
+		for byte in packet:
+			yield interface.rx.data.eq(byte)
+			yield interface.rx.next.eq(1)
+			yield
+		yield interface.rx.next.eq(0)
+		yield interface.rx.valid.eq(0)
+
+		# ... mark it as having been received correctly...
+		yield from self.pulse(interface.rx_complete)
+		yield from self.advance_cycles(2)
+
+		# ... and capture the handshake our endpoint responds with.
+		yield interface.rx_ready_for_response.eq(1)
+		yield Settle()
+		handshakes = yield from self.handshakes()
+		yield
+		yield interface.rx_ready_for_response.eq(0)
+		yield interface.tokenizer.is_out.eq(0)
+		yield
+
+		return handshakes
+
+	def send_ping(self):
+		tokenizer = self.dut.interface.tokenizer
+
+		yield tokenizer.endpoint.eq(1)
+		yield tokenizer.is_ping.eq(1)
+		yield tokenizer.ready_for_response.eq(1)
+		yield Settle()
+		handshakes = yield from self.handshakes()
+		yield
+		yield tokenizer.is_ping.eq(0)
+		yield tokenizer.ready_for_response.eq(0)
+		yield
+
+		return handshakes
+
+	def drain(self):
+		yield self.dut.stream.ready.eq(1)
+		yield from self.advance_cycles(20)
+		yield self.dut.stream.ready.eq(0)
+		yield
+
+	@usb_domain_test_case
+	def test_nyet_when_full(self):
+		# A packet that leaves us without room for another should be NYET'd...
+		handshakes = yield from self.send_packet([0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88])
+		self.assertEqual(handshakes, (0, 0, 1))
+
+		# ... and we should NAK any PINGs until we've made room.
+		handshakes = yield from self.send_ping()
+		self.assertEqual(handshakes, (0, 1, 0))
+
+		yield from self.drain()
+		handshakes = yield from self.send_ping()
+		self.assertEqual(handshakes, (1, 0, 0))
+
+		# A packet that still leaves room for another should be ACK'd as normal.
+		handshakes = yield from self.send_packet([0x11, 0x22, 0x33], pid = 1)
+		self.assertEqual(handshakes, (1, 0, 0))
+
+	@usb_domain_test_case
+	def test_full_speed_ack(self):
+		# NYET only exists at high speed; so at full speed we should always ACK an accepted packet.
+		yield self.dut.interface.speed.eq(USBSpeed.FULL)
+
+		handshakes = yield from self.send_packet([0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88])
+		self.assertEqual(handshakes, (1, 0, 0))
+
+		# We should still NAK PINGs while we're out of room, however.
+		handshakes = yield from self.send_ping()
+		self.assertEqual(handshakes, (0, 1, 0))
+
+class USBMultibyteStreamOutEndpointTest(ToriiUSBGatewareTestCase):
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	FRAGMENT_UNDER_TEST = USBMultibyteStreamOutEndpoint
+	FRAGMENT_ARGUMENTS = {
+		'byte_width': 4,
+		'endpoint_number': 1,
+		'max_packet_size': 8,
+	}
+	dut: USBMultibyteStreamOutEndpoint
+
+	def send_packet(self, packet: list[int], *, pid = 0):
+		interface = self.dut.interface
+
+		# Target our endpoint with an OUT token...
+		yield interface.tokenizer.endpoint.eq(1)
+		yield interface.tokenizer.is_out.eq(1)
+		yield interface.rx_pid_toggle.eq(pid)
+
+		# ... send our packet's data one byte per cycle...
+		yield interface.rx.valid.eq(1)
+		for byte in packet:
+			yield interface.rx.data.eq(byte)
+			yield interface.rx.next.eq(1)
+			yield
+		yield interface.rx.next.eq(0)
+		yield interface.rx.valid.eq(0)
+
+		# ... and mark it as having been received correctly.
+		yield from self.pulse(interface.rx_complete)
+		yield from self.advance_cycles(2)
+		yield from self.pulse(interface.rx_ready_for_response)
+
+	def receive_words(self, count: int):
+		stream = self.dut.stream
+		words  = []
+
+		yield stream.ready.eq(1)
+		while len(words) < count:
+			yield
+			if (yield stream.valid):
+				words.append((
+					(yield stream.data), (yield stream.valid), (yield stream.first), (yield stream.last)
+				))
+		yield stream.ready.eq(0)
+		return words
+
+	@usb_domain_test_case
+	def test_full_packet(self):
+		# Send a full-length packet; which should not end our transfer.
+		yield from self.send_packet([0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88])
+		words = yield from self.receive_words(2)
+		self.assertEqual(words, [
+			(0x44332211, 0b1111, 1, 0),
+			(0x88776655, 0b1111, 0, 0),
+		])
+
+	@usb_domain_test_case
+	def test_short_packet(self):
+		# Send a short packet, ending our transfer on a partial word.
+		yield from self.send_packet([0x11, 0x22, 0x33, 0x44, 0x55, 0x66])
+		words = yield from self.receive_words(2)
+		self.assertEqual(words, [
+			(0x44332211, 0b1111, 1, 0),
+			(0x00006655, 0b0011, 0, 1),
+		])
+
+		# The next transfer should start with a new first word.
+		yield from self.send_packet([0xaa, 0xbb], pid = 1)
+		words = yield from self.receive_words(1)
+		self.assertEqual(words, [
+			(0x0000bbaa, 0b0011, 1, 1),
+		])
+
+		# We shouldn't have any further data.
+		yield
+		self.assertEqual((yield self.dut.stream.valid), 0)
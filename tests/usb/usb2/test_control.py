@@ -0,0 +1,181 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.hdl import Module, Signal
+from torii.sim import Settle
+
+from usb_construct.types import USBRequestRecipient, USBRequestType
+
+from torii_usb.test                import usb_domain_test_case
+from torii_usb.test.usb2           import USBDeviceTest
+from torii_usb.usb.request         import SetupPacket
+from torii_usb.usb.request.control import ControlRequestHandler, ControlStreamReceiver, ControlStreamTransmitter
+from torii_usb.usb.usb2            import USBPacketID
+from torii_usb.usb.usb2.device     import USBDevice
+
+class StreamingRequestHandler(ControlRequestHandler):
+	''' Vendor request handler that streams its data stages; sending a counting pattern, and receiving to a sink. '''
+
+	REQUEST_NUMBER = 0x10
+
+	def __init__(self):
+		super().__init__()
+
+		self.transmitter = ControlStreamTransmitter()
+		self.receiver    = ControlStreamReceiver()
+
+		self.source_enable = Signal(reset = 1)
+
+	def elaborate(self, platform):
+		m = Module()
+		interface = self.interface
+		setup     = interface.setup
+
+		m.submodules.transmitter = transmitter = self.transmitter
+		m.submodules.receiver    = self.receiver
+
+		# Send a count that starts over with each request.
+		count = Signal(8)
+		m.d.comb += [
+			transmitter.stream.valid.eq(self.source_enable),
+			transmitter.stream.data.eq(count),
+		]
+		with m.If(~transmitter.active):
+			m.d.usb += count.eq(0)
+		with m.Elif(transmitter.stream.valid & transmitter.stream.ready):
+			m.d.usb += count.eq(count + 1)
+
+		with m.FSM(domain = 'usb'):
+			with m.State('IDLE'):
+				with m.If(setup.received & self.handler_condition(setup)):
+					with m.If(setup.is_in_request):
+						m.next = 'SEND'
+					with m.Else():
+						m.next = 'RECEIVE'
+
+			with m.State('SEND'):
+				self.handle_stream_in_request(m, transmitter)
+
+			with m.State('RECEIVE'):
+				self.handle_stream_out_request(m, self.receiver)
+
+		return m
+
+	def handler_condition(self, setup: SetupPacket):
+		return (
+			(setup.type == USBRequestType.VENDOR) &
+			(setup.recipient == USBRequestRecipient.DEVICE) &
+			(setup.request == self.REQUEST_NUMBER)
+		)
+
+class ControlStreamTest(USBDeviceTest):
+	''' :meta private: '''
+
+	FRAGMENT_UNDER_TEST = USBDevice
+	FRAGMENT_ARGUMENTS = {'handle_clocking': False}
+
+	def initialize_signals(self):
+
+		# Keep our device from resetting.
+		yield self.utmi.line_state.eq(0b01)
+
+		# Have our USB device connected.
+		yield self.dut.connect.eq(1)
+
+		# Pretend our PHY is always ready to accept data,
+		# so we can move forward quickly.
+		yield self.utmi.tx_ready.eq(1)
+
+	def provision_dut(self, dut):
+		self.handler = StreamingRequestHandler()
+
+		control_endpoint = dut.add_control_endpoint()
+		control_endpoint.add_request_handler(self.handler)
+
+	def drain(self, count):
+		''' Reads the given number of bytes out of our receiver; returning them along with their first/last flags. '''
+
+		stream = self.handler.receiver.stream
+		data   = []
+
+		yield stream.ready.eq(1)
+		while len(data) < count:
+			yield Settle()
+			if (yield stream.valid):
+				data.append(((yield stream.data), (yield stream.first), (yield stream.last)))
+			yield
+
+		yield stream.ready.eq(0)
+		return data
+
+	@usb_domain_test_case
+	def test_stream_in(self):
+		# Read a data stage that ends in a short packet; and one that's an exact number of packets long,
+		# which should end in a ZLP. Our DATA PIDs are checked as we go.
+		for length in (200, 128):
+			handshake, data = yield from self.control_request_in(
+				0xc0, StreamingRequestHandler.REQUEST_NUMBER, length = length
+			)
+			self.assertEqual(handshake, USBPacketID.ACK)
+			self.assertEqual(data, [i & 0xff for i in range(length)])
+
+	@usb_domain_test_case
+	def test_stream_in_not_ready(self):
+		yield self.handler.source_enable.eq(0)
+
+		yield from self.setup_transaction(0xc0, StreamingRequestHandler.REQUEST_NUMBER, length = 16)
+		yield from self.control_interphase_delay()
+
+		# We should NAK until our source has data for us...
+		handshake, _ = yield from self.in_transaction()
+		self.assertEqual(handshake, USBPacketID.NAK)
+
+		# ... and then send it.
+		yield self.handler.source_enable.eq(1)
+		yield from self.advance_cycles(32)
+
+		handshake, data = yield from self.in_transaction(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.DATA1)
+		self.assertEqual(data, list(range(16)))
+
+		handshake = yield from self.out_transaction(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+	@usb_domain_test_case
+	def test_stream_out(self):
+		payload = [(i * 7) & 0xff for i in range(150)]
+
+		yield from self.setup_transaction(0x40, StreamingRequestHandler.REQUEST_NUMBER, length = len(payload))
+		yield from self.control_interphase_delay()
+
+		# Our first packet should be accepted...
+		handshake = yield from self.out_transaction(*payload[0:64], data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+		# ... and if the host re-sends it, having missed our ACK, it should be ACK'd but ignored.
+		handshake = yield from self.out_transaction(*payload[0:64], data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+		handshake = yield from self.out_transaction(*payload[64:128], data_pid = USBPacketID.DATA0)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+		# Our buffer is now full; so our next packet should be NAK'd until we've made room.
+		handshake = yield from self.out_transaction(*payload[128:], data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.NAK)
+
+		received = yield from self.drain(128)
+
+		handshake = yield from self.out_transaction(*payload[128:], data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+		# Our status stage shouldn't complete until all of our data has been consumed.
+		handshake, _ = yield from self.in_transaction()
+		self.assertEqual(handshake, USBPacketID.NAK)
+
+		received += yield from self.drain(len(payload) - 128)
+		self.assertEqual([byte for byte, _, _ in received], payload)
+		self.assertEqual([index for index, (_, first, _) in enumerate(received) if first], [0])
+		self.assertEqual([index for index, (_, _, last) in enumerate(received) if last], [len(payload) - 1])
+
+		handshake, data = yield from self.in_transaction(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.DATA1)
+		self.assertEqual(data, [])
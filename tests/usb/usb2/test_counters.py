@@ -0,0 +1,156 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from usb_construct.types                 import USBDirection
+
+from torii_usb.test                      import usb_domain_test_case
+from torii_usb.test.contrib              import usb_packet
+from torii_usb.test.usb2                 import USBDeviceTest
+from torii_usb.usb.usb2                  import USBPacketID
+from torii_usb.usb.usb2.counters         import USBPerformanceCounters
+from torii_usb.usb.usb2.device           import USBDevice
+from torii_usb.usb.usb2.endpoints.stream import USBStreamInEndpoint, USBStreamOutEndpoint
+
+class PerformanceCounterTest(USBDeviceTest):
+	''' :meta private: '''
+
+	FRAGMENT_UNDER_TEST = USBDevice
+	FRAGMENT_ARGUMENTS = {'handle_clocking': False}
+
+	REQUEST_NUMBER = 0x42
+
+	def initialize_signals(self):
+
+		# Keep our device from resetting.
+		yield self.utmi.line_state.eq(0b01)
+
+		# Have our USB device connected.
+		yield self.dut.connect.eq(1)
+
+		# Pretend our PHY is always ready to accept data,
+		# so we can move forward quickly.
+		yield self.utmi.tx_ready.eq(1)
+
+		# Always accept data from our OUT endpoint, and never have any for our IN endpoint.
+		yield self.out_endpoint.stream.ready.eq(1)
+
+	def provision_dut(self, dut):
+		control_endpoint = dut.add_control_endpoint()
+		dut.add_performance_counters(control_endpoint, request_number = self.REQUEST_NUMBER)
+
+		self.in_endpoint  = USBStreamInEndpoint(endpoint_number = 1, max_packet_size = 64)
+		self.out_endpoint = USBStreamOutEndpoint(endpoint_number = 1, max_packet_size = 64)
+		dut.add_endpoint(self.in_endpoint, endpoint_number = 1, direction = USBDirection.IN)
+		dut.add_endpoint(self.out_endpoint, endpoint_number = 1, direction = USBDirection.OUT)
+
+	def read_counters(self, *, clear = True):
+		''' Reads the device's counters; returning a dictionary of device and per-endpoint values. '''
+
+		length = self.dut.performance_counters.snapshot_length
+		handshake, data = yield from self.control_request_in(
+			0xc0, self.REQUEST_NUMBER, value = 0 if clear else 1, length = length
+		)
+		self.assertEqual(handshake, USBPacketID.ACK)
+		self.assertEqual(len(data), length)
+
+		values = [int.from_bytes(data[i:i + 4], byteorder = 'little') for i in range(0, length, 4)]
+		names  = USBPerformanceCounters.ENDPOINT_COUNTERS
+		count  = len(names)
+
+		return {
+			'sofs':      values[0],
+			'resets':    values[1],
+			'control':   dict(zip(names, values[2:2 + count])),
+			'ep1_in':    dict(zip(names, values[2 + count:2 + count * 2])),
+			'ep1_out':   dict(zip(names, values[2 + count * 2:])),
+		}
+
+	@usb_domain_test_case
+	def test_counters(self):
+		# Our snapshot spans more than one control packet, so this also exercises a multi-packet readout.
+		self.assertGreater(self.dut.performance_counters.snapshot_length, self.max_packet_size_ep0)
+
+		# Send a couple of SOFs...
+		for frame in range(2):
+			yield from self.provide_bits(usb_packet.sof_packet(frame))
+			yield from self.interpacket_delay()
+
+		# ... ask our IN endpoint for data it doesn't have...
+		for _ in range(3):
+			handshake, _ = yield from self.in_transaction(endpoint = 1)
+			self.assertEqual(handshake, USBPacketID.NAK)
+
+		# ... and send our OUT endpoint a packet; and then send it again, as if our ACK was lost.
+		for _ in range(2):
+			handshake = yield from self.out_transaction(1, 2, 3, 4, endpoint = 1, data_pid = USBPacketID.DATA0)
+			self.assertEqual(handshake, USBPacketID.ACK)
+
+		counters = yield from self.read_counters()
+		self.assertEqual(counters['sofs'], 2)
+		self.assertEqual(counters['resets'], 0)
+
+		self.assertEqual(counters['ep1_in']['tokens'], 3)
+		self.assertEqual(counters['ep1_in']['naks'], 3)
+		self.assertEqual(counters['ep1_in']['bytes'], 0)
+
+		self.assertEqual(counters['ep1_out']['tokens'], 2)
+		self.assertEqual(counters['ep1_out']['acks'], 2)
+		self.assertEqual(counters['ep1_out']['bytes'], 8)
+		self.assertEqual(counters['ep1_out']['crc_errors'], 0)
+		self.assertEqual(counters['ep1_out']['toggle_mismatches'], 1)
+
+		# Our counters are captured as soon as our request's SETUP is received; before it's even been ACK'd.
+		self.assertEqual(counters['control']['tokens'], 1)
+		self.assertEqual(counters['control']['bytes'], 8)
+		self.assertEqual(counters['control']['acks'], 0)
+
+		# Reading back without clearing should reflect only the previous read's remaining traffic...
+		counters = yield from self.read_counters(clear = False)
+		self.assertEqual(counters['sofs'], 0)
+		self.assertEqual(counters['ep1_in']['tokens'], 0)
+		self.assertEqual(counters['ep1_out']['acks'], 0)
+		self.assertGreater(counters['control']['bytes'], self.max_packet_size_ep0)
+
+		# ... and leave it in place for the next read.
+		previous = counters['control']['bytes']
+		counters = yield from self.read_counters()
+		self.assertGreater(counters['control']['bytes'], previous)
+
+	@usb_domain_test_case
+	def test_unsupported_requests(self):
+		# OUT requests and unknown wValues should both be stalled.
+		handshake, _ = yield from self.control_request_in(0xc0, self.REQUEST_NUMBER, value = 2, length = 8)
+		self.assertEqual(handshake, USBPacketID.STALL)
+
+		handshake = yield from self.control_request_out(0x40, self.REQUEST_NUMBER)
+		self.assertEqual(handshake, USBPacketID.STALL)
+
+	@usb_domain_test_case
+	def test_unacknowledged_packet(self):
+		length = self.dut.performance_counters.snapshot_length
+
+		yield from self.setup_transaction(0xc0, self.REQUEST_NUMBER, 0, 0, length)
+		yield from self.control_interphase_delay()
+
+		# Read our first packet, but don't acknowledge it; as though the host didn't receive it intact...
+		yield from self.send_token(USBPacketID.IN)
+		pid, *first, _, _ = yield from self.receive_packet()
+		self.assertEqual(pid, USBPacketID.DATA1.byte())
+		yield from self.interpacket_delay()
+
+		# ... and we should send the same packet again when it's asked for.
+		pid, data = yield from self.in_transaction(data_pid = USBPacketID.DATA1)
+		self.assertEqual(data, first)
+
+		# The rest of our snapshot should then follow on from it.
+		pid, rest = yield from self.in_transaction(data_pid = USBPacketID.DATA0)
+		data.extend(rest)
+		self.assertEqual(len(data), length)
+
+		yield from self.control_interphase_delay()
+		self.assertEqual((yield from self.out_transaction(data_pid = USBPacketID.DATA1)), USBPacketID.ACK)
+
+		values = [int.from_bytes(data[i:i + 4], byteorder = 'little') for i in range(0, length, 4)]
+		count  = len(USBPerformanceCounters.ENDPOINT_COUNTERS)
+		self.assertEqual(values[0:2], [0, 0])
+		self.assertEqual(values[2:4], [1, 0])
+		self.assertEqual(values[2 + count:], [0] * count * 2)
@@ -0,0 +1,110 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from unittest                  import TestCase
+
+from torii.hdl                 import Module, Signal
+from torii.sim                 import Settle, Simulator
+
+from torii_usb.test            import ToriiUSBGatewareTestCase, usb_domain_test_case
+from torii_usb.usb.usb2.crc    import usb_crc5
+from torii_usb.usb.usb2.packet import DataCRCInterface, USBDataPacketCRC
+
+def reference_crc(data, *, width, polynomial, bit_count = None):
+	''' Bit-serial USB CRC; returning the CRC in the form it's transmitted in. '''
+
+	mask     = (1 << width) - 1
+	register = mask
+	for bit in range(len(data) * 8 if bit_count is None else bit_count):
+		feedback = ((register >> (width - 1)) ^ (data[bit // 8] >> (bit % 8))) & 1
+		register = (register << 1) & mask
+		if feedback:
+			register ^= polynomial
+
+	return int(f'{register:0{width}b}'[::-1], 2) ^ mask
+
+class USBDataPacketCRCTest(ToriiUSBGatewareTestCase):
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	BYTES_PER_CYCLE = 1
+	PIPELINED       = False
+
+	def instantiate_dut(self):
+		self.interface = DataCRCInterface()
+
+		dut = USBDataPacketCRC(bytes_per_cycle = self.BYTES_PER_CYCLE, pipelined = self.PIPELINED)
+		dut.add_interface(self.interface)
+		return dut
+
+	def _compute_crc(self, data, *, valid, data_signal):
+		''' Feeds our CRC each chunk of the given data in turn; and returns the resulting CRC. '''
+
+		yield from self.pulse(self.interface.start, step_after = False)
+
+		for position in range(0, len(data), self.BYTES_PER_CYCLE):
+			chunk = data[position:position + self.BYTES_PER_CYCLE]
+			yield data_signal.eq(int.from_bytes(chunk, byteorder = 'little'))
+			yield valid.eq((1 << len(chunk)) - 1)
+			yield
+
+		yield valid.eq(0)
+		yield from self.advance_cycles(2 if self.PIPELINED else 1)
+		yield Settle()
+
+		return (yield self.interface.crc)
+
+	@usb_domain_test_case
+	def test_crc(self):
+		dut = self.dut
+
+		# Try packets that do and don't fill our final cycle; including the empty packet.
+		for length in (0, 1, 2, 3, 4, 7, 64):
+			data     = [(i * 37 + length) & 0xff for i in range(length)]
+			expected = reference_crc(data, width = 16, polynomial = 0x8005)
+
+			crc = yield from self._compute_crc(data, valid = dut.rx_valid, data_signal = dut.rx_data)
+			self.assertEqual(crc, expected, f'bad rx CRC for a {length}-byte packet')
+
+			crc = yield from self._compute_crc(data, valid = dut.tx_valid, data_signal = dut.tx_data)
+			self.assertEqual(crc, expected, f'bad tx CRC for a {length}-byte packet')
+
+	@usb_domain_test_case
+	def test_known_packet(self):
+		# The CRC over a packet's data and its own CRC leaves a known residual.
+		data = [0x00, 0x01, 0x02, 0x03]
+		crc  = reference_crc(data, width = 16, polynomial = 0x8005)
+		data = [*data, crc & 0xff, crc >> 8]
+
+		# With the CRC included, our final output should be the residual 0x800d, inverted and bit-reversed.
+		result = yield from self._compute_crc(data, valid = self.dut.rx_valid, data_signal = self.dut.rx_data)
+		self.assertEqual(result, 0x4ffe)
+
+class USBDataPacketCRC2BTest(USBDataPacketCRCTest):
+	BYTES_PER_CYCLE = 2
+
+class USBDataPacketCRC4BTest(USBDataPacketCRCTest):
+	BYTES_PER_CYCLE = 4
+
+class USBDataPacketCRCPipelinedTest(USBDataPacketCRCTest):
+	BYTES_PER_CYCLE = 4
+	PIPELINED       = True
+
+class USBCRC5Test(TestCase):
+	def test_crc5(self):
+		token = Signal(11)
+		crc   = Signal(5)
+
+		m = Module()
+		m.d.comb += crc.eq(usb_crc5(token))
+
+		def process():
+			for value in range(0, 1 << 11, 7):
+				yield token.eq(value)
+				yield Settle()
+
+				data = value.to_bytes(2, byteorder = 'little')
+				self.assertEqual((yield crc), reference_crc(data, width = 5, polynomial = 0b101, bit_count = 11))
+
+		sim = Simulator(m)
+		sim.add_process(process)
+		sim.run()
@@ -2,7 +2,7 @@
 
 from torii_usb.test                import USBGatewareTestCase, usb_domain_test_case
 from torii_usb.usb.usb2.descriptor import (
-	DeviceDescriptorCollection, GetDescriptorHandlerBlock, StandardDescriptorNumbers
+	DescriptorROMLayout, DeviceDescriptorCollection, GetDescriptorHandlerBlock, StandardDescriptorNumbers
 )
 
 class GetDescriptorHandlerBlockTest(USBGatewareTestCase):
@@ -165,3 +165,95 @@ class GetDescriptorHandlerBlockTest(USBGatewareTestCase):
 
 		# Index after last used type
 		yield from self._test_stall(0x42, 0, 0, 64)
+
+class GetDescriptorHandlerBlockCompactTest(GetDescriptorHandlerBlockTest):
+	descriptors = DeviceDescriptorCollection()
+	for type_number, index, raw_descriptor in GetDescriptorHandlerBlockTest.descriptors:
+		descriptors.add_descriptor(raw_descriptor, index = index, descriptor_type = type_number)
+
+	# Leave a gap in our string indexes; and add a string that repeats another, and one that's contained in another.
+	descriptors.add_descriptor(b'\x06\x03P\x00r\x00', index = 8)
+	descriptors.add_descriptor(b'\x06\x03P\x00r\x00', index = 9)
+	descriptors.add_descriptor(b't\x00', index = 10, descriptor_type = StandardDescriptorNumbers.STRING)
+
+	FRAGMENT_ARGUMENTS = {'descriptor_collection': descriptors, 'compact': True}
+
+	def test_rom_size(self):
+		base_descriptors = GetDescriptorHandlerBlockTest.descriptors
+
+		# Our packed layout should always be smaller than our aligned one...
+		aligned = DescriptorROMLayout(base_descriptors).rom_size_report()
+		compact = DescriptorROMLayout(base_descriptors, compact = True).rom_size_report()
+		self.assertLess(compact['rom_bytes'], aligned['rom_bytes'])
+		self.assertEqual(compact['descriptor_bytes'], aligned['descriptor_bytes'])
+
+		# ... and our repeated and contained descriptors shouldn't take up any more data space. We should only need
+		# one copy of our new string, and table entries for our new indexes.
+		report = self.dut.rom_size_report()
+		self.assertEqual(report['descriptor_bytes'], compact['descriptor_bytes'] + 14)
+		self.assertLessEqual(report['rom_bytes'], compact['rom_bytes'] + 6 + 7 * DescriptorROMLayout.ELEMENT_SIZE)
+		self.assertEqual(report['block_rams'], 2)
+
+		# Our non-consecutive indexes should only be supported by our compact layout.
+		with self.assertRaises(ValueError):
+			DescriptorROMLayout(self.descriptors).generate_rom_content()
+
+	@usb_domain_test_case
+	def test_unavailable_index_in_gap(self):
+		yield from self._test_stall(StandardDescriptorNumbers.STRING, 5, 0, 64)
+		yield from self._test_stall(StandardDescriptorNumbers.STRING, 5, 0, 0)
+
+class GetDescriptorHandlerBlockWritableTest(GetDescriptorHandlerBlockTest):
+	FRAGMENT_ARGUMENTS = {'descriptor_collection': GetDescriptorHandlerBlockTest.descriptors, 'writable': True}
+
+	def _write_bytes(self, address, data):
+		''' Patches our descriptor memory, a byte at a time. '''
+
+		write = self.dut.descriptor_write
+		for offset, byte in enumerate(data):
+			yield write.address.eq(address + offset)
+			yield write.data.eq(byte)
+			yield write.write.eq(1)
+			yield
+
+		yield write.write.eq(0)
+		yield
+
+	@usb_domain_test_case
+	def test_patch_descriptor(self):
+		string_type = StandardDescriptorNumbers.STRING
+		serial      = self.descriptors.get_descriptor_bytes(string_type, 3)
+		location    = self.dut.descriptor_location(string_type, 3)
+		self.assertEqual(location.length, len(serial))
+
+		# Patch a few characters in the middle of our serial number; leaving its neighbours intact...
+		patched = bytearray(serial)
+		patched[4:10] = 'Xy12Z9'.encode('utf-16-le')[:6]
+		yield from self._write_bytes(location.data_address + 4, patched[4:10])
+		yield from self._test_descriptor(string_type, 3, bytes(patched), 0, len(patched))
+		yield from self._test_descriptor(string_type, 3, bytes(patched), 64, len(patched))
+
+		# ... and then shorten it, by rewriting both its bLength and the length in its table entry.
+		shortened = bytes([8]) + bytes(patched[1:8])
+		yield from self._write_bytes(location.data_address, shortened[0:1])
+		yield from self._write_bytes(location.entry_address, len(shortened).to_bytes(2, byteorder = 'big'))
+		yield from self._test_descriptor(string_type, 3, shortened, 0, 255)
+
+		# Our other descriptors should be untouched.
+		device = self.descriptors.get_descriptor_bytes(StandardDescriptorNumbers.DEVICE)
+		yield from self._test_descriptor(StandardDescriptorNumbers.DEVICE, 0, device, 0, len(device))
+
+	def test_descriptor_location(self):
+		# Our locations should come straight from our layout; which can be computed without any gateware.
+		layout = DescriptorROMLayout(self.descriptors)
+		self.assertEqual(
+			self.dut.descriptor_location(StandardDescriptorNumbers.STRING, 3),
+			layout.descriptor_location(StandardDescriptorNumbers.STRING, 3)
+		)
+
+		with self.assertRaises(ValueError):
+			self.dut.descriptor_location(StandardDescriptorNumbers.STRING, 42)
+		with self.assertRaises(ValueError):
+			self.dut.descriptor_location(0x42)
+		with self.assertRaises(ValueError):
+			GetDescriptorHandlerBlock(self.descriptors, compact = True, writable = True)
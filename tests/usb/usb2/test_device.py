@@ -1,12 +1,14 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
-from usb_construct.types           import DescriptorTypes
+from usb_construct.emitters.descriptors.microsoft import PlatformDescriptorCollection, SetHeaderDescriptorEmitter
+from usb_construct.types                          import DescriptorTypes
+from usb_construct.types.descriptors.microsoft    import MicrosoftRequests
 
-from torii_usb.test                import usb_domain_test_case
-from torii_usb.test.usb2           import USBDeviceTest
-from torii_usb.usb.usb2            import USBPacketID
-from torii_usb.usb.usb2.descriptor import DeviceDescriptorCollection
-from torii_usb.usb.usb2.device     import USBDevice
+from torii_usb.test                               import usb_domain_test_case
+from torii_usb.test.usb2                          import USBDeviceTest
+from torii_usb.usb.usb2                           import USBPacketID
+from torii_usb.usb.usb2.descriptor                import DeviceDescriptorCollection
+from torii_usb.usb.usb2.device                    import USBDevice
 
 class FullDeviceTest(USBDeviceTest):
 	''' :meta private: '''
@@ -132,6 +134,11 @@ class FullDeviceTest(USBDeviceTest):
 		self.assertEqual(handshake, USBPacketID.ACK)
 		self.assertEqual(configuration, [1], 'device did not accept configuration!')
 
+class IndexedEndpointDeviceTest(FullDeviceTest):
+	''' :meta private: '''
+
+	FRAGMENT_ARGUMENTS = {'handle_clocking': False, 'indexed_endpoint_mux': True, 'pipelined_endpoint_mux': True}
+
 class LongDescriptorTest(USBDeviceTest):
 	''' :meta private: '''
 
@@ -208,3 +215,94 @@ class LongDescriptorTest(USBDeviceTest):
 			self.assertEqual(handshake, USBPacketID.ACK)
 			self.assertEqual(bytes(data), descriptor[0:request_length])
 			self.assertEqual(len(data), request_length)
+
+class WindowsDescriptorTest(USBDeviceTest):
+	''' :meta private: '''
+
+	FRAGMENT_UNDER_TEST = USBDevice
+	FRAGMENT_ARGUMENTS = {'handle_clocking': False}
+
+	AVOID_BLOCKRAM = False
+
+	def initialize_signals(self):
+
+		# Keep our device from resetting.
+		yield self.utmi.line_state.eq(0b01)
+
+		# Have our USB device connected.
+		yield self.dut.connect.eq(1)
+
+		# Pretend our PHY is always ready to accept data,
+		# so we can move forward quickly.
+		yield self.utmi.tx_ready.eq(1)
+
+	def provision_dut(self, dut):
+		self.descriptors = descriptors = DeviceDescriptorCollection()
+
+		with descriptors.DeviceDescriptor() as d:
+			d.idVendor           = 0x16d0
+			d.idProduct          = 0xf3b
+			d.bNumConfigurations = 1
+
+		with descriptors.ConfigurationDescriptor() as c:
+			with c.InterfaceDescriptor() as i:
+				i.bInterfaceNumber = 0
+
+		# Create two descriptor sets; one short, and one that spans several packets.
+		self.windows_descriptors = PlatformDescriptorCollection()
+		for vendor_code, function_count in ((1, 1), (2, 4)):
+			descriptor_set = SetHeaderDescriptorEmitter()
+			with descriptor_set.SubsetHeaderConfiguration() as configuration:
+				configuration.bConfigurationValue = 1
+
+				for interface in range(function_count):
+					with configuration.SubsetHeaderFunction() as function:
+						function.bFirstInterface = interface
+						with function.FeatureCompatibleID() as compatible_id:
+							compatible_id.CompatibleID    = 'WINUSB'
+							compatible_id.SubCompatibleID = ''
+
+			self.windows_descriptors.add_descriptor(descriptor_set, vendor_code = vendor_code)
+
+		dut.add_standard_control_endpoint(
+			descriptors, windows_descriptors = self.windows_descriptors, avoid_blockram = self.AVOID_BLOCKRAM
+		)
+
+	def get_descriptor_set(self, vendor_code, *, value = 0, length = 255):
+		''' Requests a Microsoft OS 2.0 descriptor set. '''
+		return (yield from self.control_request_in(
+			0xc0, vendor_code, value = value, index = MicrosoftRequests.GET_DESCRIPTOR_SET, length = length
+		))
+
+	@usb_domain_test_case
+	def test_descriptor_sets(self):
+		for vendor_code, descriptor_set in self.windows_descriptors.descriptors.items():
+			self.assertGreater(len(descriptor_set), 0)
+
+			handshake, data = yield from self.get_descriptor_set(vendor_code, length = len(descriptor_set))
+			self.assertEqual(handshake, USBPacketID.ACK)
+			self.assertEqual(bytes(data), bytes(descriptor_set))
+
+		# Our standard descriptors should still be readable from our shared store...
+		handshake, data = yield from self.get_descriptor(DescriptorTypes.DEVICE, length = 18)
+		self.assertEqual(handshake, USBPacketID.ACK)
+		self.assertEqual(bytes(data), self.descriptors.get_descriptor_bytes(DescriptorTypes.DEVICE))
+
+		# ... but our descriptor sets shouldn't be readable as standard descriptors.
+		handshake, _ = yield from self.get_descriptor(0, index = 0, length = 10)
+		self.assertEqual(handshake, USBPacketID.STALL)
+
+	@usb_domain_test_case
+	def test_invalid_descriptor_set_requests(self):
+		# Unknown vendor codes should be stalled...
+		handshake, _ = yield from self.get_descriptor_set(3)
+		self.assertEqual(handshake, USBPacketID.STALL)
+
+		# ... as should requests with a non-zero wValue.
+		handshake, _ = yield from self.get_descriptor_set(1, value = 1)
+		self.assertEqual(handshake, USBPacketID.STALL)
+
+class WindowsDescriptorDistributedTest(WindowsDescriptorTest):
+	''' :meta private: '''
+
+	AVOID_BLOCKRAM = True
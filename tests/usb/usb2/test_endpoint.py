@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from unittest                    import TestCase
+
+from torii.sim                   import Settle
+
+from usb_construct.types         import USBDirection
+
+from torii_usb.test              import ToriiUSBGatewareTestCase, usb_domain_test_case
+from torii_usb.usb.usb2.endpoint import EndpointInterface, USBIndexedEndpointMultiplexer
+
+class USBIndexedEndpointMultiplexerTest(ToriiUSBGatewareTestCase):
+	SYNC_CLOCK_FREQUENCY = None
+
+	PIPELINED = False
+
+	def instantiate_dut(self):
+		dut = USBIndexedEndpointMultiplexer(pipelined = self.PIPELINED)
+
+		# Create a control endpoint, which handles both directions; and a pair of endpoints that share a number.
+		self.control = EndpointInterface()
+		self.in_ep   = EndpointInterface()
+		self.out_ep  = EndpointInterface()
+
+		dut.add_interface(self.control, endpoint_number = 0)
+		dut.add_interface(self.in_ep,   endpoint_number = 1, direction = USBDirection.IN)
+		dut.add_interface(self.out_ep,  endpoint_number = 1, direction = USBDirection.OUT)
+
+		return dut
+
+	def initialize_signals(self):
+		# Have each of our interfaces drive a distinct value, so we can tell which is selected.
+		for value, interface in enumerate((self.control, self.in_ep, self.out_ep), start = 1):
+			yield interface.tx.valid.eq(1)
+			yield interface.tx.data.eq(value)
+			yield interface.tx_pid_toggle.eq(value)
+
+		yield self.out_ep.handshakes_out.ack.eq(1)
+
+	def _select(self, endpoint, is_in):
+		yield self.dut.shared.tokenizer.endpoint.eq(endpoint)
+		yield self.dut.shared.tokenizer.is_in.eq(is_in)
+
+		# If our selection is registered, it'll take effect after a cycle; otherwise, it's immediate.
+		if self.PIPELINED:
+			yield from self.advance_cycles(2)
+		else:
+			yield Settle()
+
+	def test_selection(self):
+		# Our non-pipelined multiplexer is purely combinational; so we'll drive it without a clock.
+		def process():
+			yield from self.initialize_signals()
+			yield from self.check_selection()
+
+		self.sim.add_process(process)
+		self.simulate(vcd_suffix = 'selection')
+
+	def check_selection(self):
+		shared = self.dut.shared
+
+		# Both directions of our control endpoint should select our control interface...
+		for is_in in (0, 1):
+			yield from self._select(0, is_in)
+			self.assertEqual((yield shared.tx.data),      1)
+			self.assertEqual((yield shared.tx_pid_toggle), 1)
+			self.assertEqual((yield shared.handshakes_out.ack), 0)
+
+		# ... while endpoint 1 should select by direction.
+		yield from self._select(1, 1)
+		self.assertEqual((yield shared.tx.data),      2)
+		self.assertEqual((yield shared.tx_pid_toggle), 2)
+		self.assertEqual((yield shared.handshakes_out.ack), 0)
+
+		yield from self._select(1, 0)
+		self.assertEqual((yield shared.tx.data),      3)
+		self.assertEqual((yield shared.handshakes_out.ack), 1)
+
+		# Endpoints without an interface shouldn't select anything.
+		yield from self._select(5, 1)
+		self.assertEqual((yield shared.tx.valid),     0)
+		self.assertEqual((yield shared.tx.data),      0)
+
+class USBPipelinedIndexedEndpointMultiplexerTest(USBIndexedEndpointMultiplexerTest):
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	PIPELINED = True
+
+	@usb_domain_test_case
+	def test_selection(self):
+		yield from self.check_selection()
+
+class USBIndexedEndpointMultiplexerConfigurationTest(TestCase):
+
+	def test_requires_endpoint_number(self):
+		mux = USBIndexedEndpointMultiplexer()
+		with self.assertRaises(ValueError):
+			mux.add_interface(EndpointInterface())
+
+	def test_rejects_duplicate_endpoints(self):
+		mux = USBIndexedEndpointMultiplexer()
+		mux.add_interface(EndpointInterface(), endpoint_number = 0)
+		mux.add_interface(EndpointInterface(), endpoint_number = 0, direction = USBDirection.IN)
+		with self.assertRaises(ValueError):
+			mux.elaborate(None)
@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from usb_construct.types           import DescriptorTypes, USBStandardRequests
+
+from torii_usb.interface.utmi      import UTMIInterface
+from torii_usb.test                import usb_domain_test_case
+from torii_usb.test.usb2           import USBDeviceTest
+from torii_usb.usb.usb2            import USBPacketID
+from torii_usb.usb.usb2.descriptor import DeviceDescriptorCollection
+from torii_usb.usb.usb2.multiport  import USBMultiPortDevice
+
+class MultiPortDeviceTest(USBDeviceTest):
+	''' :meta private: '''
+
+	PORT_COUNT = 3
+
+	def instantiate_dut(self):
+		self.buses     = [UTMIInterface() for _ in range(self.PORT_COUNT)]
+		self.addresses = [0] * self.PORT_COUNT
+		self.port      = 0
+
+		self.utmi                = self.buses[0]
+		self.address             = 0
+		self.max_packet_size_ep0 = 64
+
+		self.descriptors = descriptors = DeviceDescriptorCollection()
+
+		with descriptors.DeviceDescriptor() as d:
+			d.idVendor           = 0x16d0
+			d.idProduct          = 0xf3b
+
+			d.iManufacturer      = 'Torii-USB'
+			d.iProduct           = 'Test Device'
+
+			d.bNumConfigurations = 1
+
+		with descriptors.ConfigurationDescriptor() as c:
+			with c.InterfaceDescriptor() as i:
+				i.bInterfaceNumber = 0
+
+		return USBMultiPortDevice(buses = self.buses, descriptors = descriptors, handle_clocking = False)
+
+	def initialize_signals(self):
+		for bus, device in zip(self.buses, self.dut.ports):
+
+			# Keep our devices from resetting, have them connected,
+			# and pretend our PHYs are always ready to accept data.
+			yield bus.line_state.eq(0b01)
+			yield bus.tx_ready.eq(1)
+			yield device.connect.eq(1)
+
+	def use_port(self, port):
+		''' Directs all of our subsequent traffic to the given port. '''
+
+		self.addresses[self.port] = self.address
+
+		self.port    = port
+		self.utmi    = self.buses[port]
+		self.address = self.addresses[port]
+
+	@usb_domain_test_case
+	def test_independent_ports(self):
+		device_descriptor = self.descriptors.get_descriptor_bytes(DescriptorTypes.DEVICE)
+
+		# Each port should enumerate as its own device; with its own address...
+		for port in range(self.PORT_COUNT):
+			self.use_port(port)
+
+			handshake, data = yield from self.get_descriptor(DescriptorTypes.DEVICE, length = 18)
+			self.assertEqual(handshake, USBPacketID.ACK)
+			self.assertEqual(bytes(data), device_descriptor)
+
+			self.assertEqual((yield from self.set_address(0x10 + port)), USBPacketID.DATA1)
+
+		for port in range(self.PORT_COUNT):
+			self.use_port(port)
+
+			handshake, data = yield from self.get_descriptor(DescriptorTypes.DEVICE, length = 18)
+			self.assertEqual(handshake, USBPacketID.ACK)
+			self.assertEqual(bytes(data), device_descriptor)
+
+		# ... and its own configuration.
+		self.use_port(1)
+		self.assertEqual((yield from self.set_configuration(1)), USBPacketID.DATA1)
+
+		for port, configuration in ((0, 0), (1, 1), (2, 0)):
+			self.use_port(port)
+
+			handshake, data = yield from self.get_configuration()
+			self.assertEqual(handshake, USBPacketID.ACK)
+			self.assertEqual(data, [configuration])
+
+	@usb_domain_test_case
+	def test_contention(self):
+		device_descriptor = self.descriptors.get_descriptor_bytes(DescriptorTypes.DEVICE)
+
+		# Start a request on each of our first two ports; the first will be granted our shared handler...
+		for port in (0, 1):
+			self.use_port(port)
+			yield from self.setup_transaction(0x80, USBStandardRequests.GET_DESCRIPTOR, value = 0x0100, length = 18)
+			yield from self.control_interphase_delay()
+
+		# ... so the second should be NAK'd while the first is outstanding.
+		for _ in range(3):
+			handshake, _ = yield from self.in_transaction()
+			self.assertEqual(handshake, USBPacketID.NAK)
+
+		# Once the first request completes...
+		self.use_port(0)
+		handshake, data = yield from self.in_transfer(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.DATA1)
+		self.assertEqual(bytes(data), device_descriptor)
+
+		handshake = yield from self.out_transaction(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+		# ... the second should be able to continue.
+		self.use_port(1)
+		yield from self.advance_cycles(self.PORT_COUNT + 2)
+
+		handshake, data = yield from self.in_transfer(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.DATA1)
+		self.assertEqual(bytes(data), device_descriptor)
+
+		handshake = yield from self.out_transaction(data_pid = USBPacketID.DATA1)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+	@usb_domain_test_case
+	def test_abandoned_request(self):
+		# Start a request on our first port, and then abandon it for a new one...
+		self.use_port(0)
+		yield from self.setup_transaction(0x80, USBStandardRequests.GET_DESCRIPTOR, value = 0x0200, length = 9)
+		yield from self.control_interphase_delay()
+
+		handshake, data = yield from self.get_descriptor(DescriptorTypes.DEVICE, length = 8)
+		self.assertEqual(handshake, USBPacketID.ACK)
+		self.assertEqual(bytes(data), self.descriptors.get_descriptor_bytes(DescriptorTypes.DEVICE)[0:8])
+
+		# ... which shouldn't stop our other ports from being served.
+		self.use_port(2)
+		handshake, data = yield from self.get_descriptor(DescriptorTypes.DEVICE, length = 8)
+		self.assertEqual(handshake, USBPacketID.ACK)
+
+		# Requests for missing descriptors should be stalled; again without holding up the other ports.
+		self.use_port(1)
+		handshake, _ = yield from self.get_descriptor(0x42, length = 8)
+		self.assertEqual(handshake, USBPacketID.STALL)
+
+		self.use_port(0)
+		handshake, data = yield from self.get_descriptor(DescriptorTypes.DEVICE, length = 8)
+		self.assertEqual(handshake, USBPacketID.ACK)
@@ -4,7 +4,7 @@ from torii.hdl                 import Record, Signal
 from torii.sim                 import Settle
 
 from torii_usb.test            import ToriiUSBGatewareTestCase, usb_domain_test_case
-from torii_usb.usb.usb2        import USBSpeed
+from torii_usb.usb.usb2        import USBPacketID, USBSpeed
 from torii_usb.usb.usb2.packet import (
 	InterpacketTimerInterface, USBDataPacketDeserializer, USBDataPacketGenerator, USBDataPacketReceiver,
 	USBHandshakeDetector, USBHandshakeGenerator, USBInterpacketTimer, USBTokenDetector
@@ -479,6 +479,23 @@ class USBHandshakeGeneratorTest(ToriiUSBGatewareTestCase):
 		yield
 		self.assertEqual((yield dut.tx.valid), 0)
 
+	@usb_domain_test_case
+	def test_nyet_generation(self):
+		dut = self.dut
+
+		# When we request a NYET...
+		yield dut.issue_nyet.eq(1)
+		yield
+		yield dut.issue_nyet.eq(0)
+
+		# ... we should see a NYET packet on our data lines...
+		yield
+		self.assertEqual((yield dut.tx.data), USBHandshakeGenerator._PACKET_NYET)
+		self.assertEqual((yield dut.tx.valid), 1)
+
+		# ... which should carry the NYET PID.
+		self.assertEqual(USBHandshakeGenerator._PACKET_NYET, USBPacketID.NYET.byte())
+
 class USBInterpacketTimerTest(ToriiUSBGatewareTestCase):
 	SYNC_CLOCK_FREQUENCY = None
 	USB_CLOCK_FREQUENCY = 60e6
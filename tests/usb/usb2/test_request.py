@@ -1,8 +1,10 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
-from torii_usb.usb.usb2.request import USBSetupDecoder
+from torii.sim                 import Settle
+
+from torii_usb.usb.usb2.request import RequestHandlerInterface, USBRequestHandlerMultiplexer, USBSetupDecoder
 from torii_usb.usb.usb2         import USBSpeed
-from torii_usb.test             import usb_domain_test_case
+from torii_usb.test             import USBGatewareTestCase, usb_domain_test_case
 
 from .test_packet               import USBPacketizerTest
 
@@ -105,3 +107,69 @@ class USBSetupDecoderTest(USBPacketizerTest):
 		# This shouldn't count as a valid setup packet.
 		yield
 		self.assertEqual((yield dut.packet.received), 0)
+
+class USBRequestHandlerMultiplexerTest(USBGatewareTestCase):
+	def instantiate_dut(self):
+		dut = USBRequestHandlerMultiplexer()
+
+		# Create two handlers that claim different request numbers, and one that's always connected.
+		self.handlers = [RequestHandlerInterface() for _ in range(3)]
+		dut.add_interface(self.handlers[0], condition = lambda setup: setup.request == 1)
+		dut.add_interface(self.handlers[1], condition = lambda setup: setup.request == 2)
+		dut.add_interface(self.handlers[2])
+
+		return dut
+
+	def receive_setup(self, request):
+		''' Presents a new SETUP packet with the given request number to our multiplexer. '''
+		yield self.dut.shared.setup.request.eq(request)
+		yield from self.pulse(self.dut.shared.setup.received)
+
+	@usb_domain_test_case
+	def test_selection(self):
+		dut    = self.dut
+		shared = dut.shared
+		first, second, always = self.handlers
+
+		# Have each of our handlers try to transmit at once; with the conditioned ones ACK'ing, and the other stalling.
+		for value, handler in enumerate(self.handlers, start = 0xa0):
+			yield handler.tx.valid.eq(1)
+			yield handler.tx.data.eq(value)
+		yield first.handshakes_out.ack.eq(1)
+		yield second.handshakes_out.ack.eq(1)
+		yield always.handshakes_out.stall.eq(1)
+
+		# Before we've seen a request, only our unconditioned handler should be connected.
+		yield Settle()
+		self.assertEqual((yield dut.unhandled), 1)
+		self.assertEqual((yield shared.tx.data), 0xa2)
+		self.assertEqual((yield shared.handshakes_out.ack), 0)
+		self.assertEqual((yield shared.handshakes_out.stall), 1)
+		yield always.tx.valid.eq(0)
+
+		# Once our second handler is selected, only it should be connected...
+		yield from self.receive_setup(2)
+		yield shared.tx.ready.eq(1)
+		yield Settle()
+		self.assertEqual((yield dut.unhandled), 0)
+		self.assertEqual((yield shared.tx.data), 0xa1)
+		self.assertEqual((yield shared.handshakes_out.ack), 1)
+		self.assertEqual((yield first.tx.ready), 0)
+		self.assertEqual((yield second.tx.ready), 1)
+
+		# ... including for any address changes it requests.
+		yield first.address_changed.eq(1)
+		yield first.new_address.eq(12)
+		yield second.address_changed.eq(1)
+		yield second.new_address.eq(34)
+		yield Settle()
+		self.assertEqual((yield shared.address_changed), 1)
+		self.assertEqual((yield shared.new_address), 34)
+
+		# A request no handler claims should leave only our unconditioned handler connected.
+		yield from self.receive_setup(3)
+		yield Settle()
+		self.assertEqual((yield dut.unhandled), 1)
+		self.assertEqual((yield shared.tx.valid), 0)
+		self.assertEqual((yield shared.address_changed), 0)
+		self.assertEqual((yield shared.handshakes_out.ack), 0)
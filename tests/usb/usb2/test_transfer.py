@@ -274,3 +274,168 @@ class USBInTransferManagerTest(ToriiUSBGatewareTestCase):
 
 		# ... with the correct DATA PID.
 		self.assertEqual((yield dut.data_pid), 1)
+
+class USBInTransferManagerMultiBufferTest(ToriiUSBGatewareTestCase):
+	FRAGMENT_UNDER_TEST = USBInTransferManager
+	FRAGMENT_ARGUMENTS  = {'max_packet_size': 4, 'buffer_count': 4}
+
+	SYNC_CLOCK_FREQUENCY = None
+	USB_CLOCK_FREQUENCY = 60e6
+
+	def initialize_signals(self):
+
+		# By default, pretend our transmitter is always accepting data...
+		yield self.dut.packet_stream.ready.eq(1)
+
+		# And pretend that our host is always tagreting our endpoint.
+		yield self.dut.active.eq(1)
+		yield self.dut.tokenizer.is_in.eq(1)
+
+	@usb_domain_test_case
+	def test_queued_packets(self):
+		dut = self.dut
+
+		packet_stream   = dut.packet_stream
+		transfer_stream = dut.transfer_stream
+
+		packets = [
+			[0x11, 0x22, 0x33, 0x44],
+			[0x55, 0x66, 0x77, 0x88],
+			[0x99, 0xAA, 0xBB, 0xCC],
+			[0xDD, 0xEE, 0xFF, 0x00],
+		]
+
+		# We should be able to fill all four of our buffers without the host taking any data...
+		yield transfer_stream.valid.eq(1)
+		for packet in packets:
+			for value in packet:
+				self.assertEqual((yield transfer_stream.ready), 1)
+				yield transfer_stream.data.eq(value)
+				yield
+		yield transfer_stream.valid.eq(0)
+
+		# ... after which we should no longer be accepting data.
+		yield
+		self.assertEqual((yield transfer_stream.ready), 0)
+
+		# Each IN token should now be answered with our packets in order, with alternating PIDs.
+		for index, packet in enumerate(packets):
+			yield from self.pulse(dut.tokenizer.ready_for_response)
+			self.assertEqual((yield dut.data_pid), index % 2)
+
+			for value in packet:
+				self.assertEqual((yield packet_stream.valid), 1)
+				self.assertEqual((yield packet_stream.data), value)
+				yield
+			self.assertEqual((yield packet_stream.valid), 0)
+
+			yield from self.pulse(dut.handshakes_in.ack)
+
+			# Once our first packet is ACK'd, we should have room for more data.
+			self.assertEqual((yield transfer_stream.ready), 1)
+
+		# Once we've sent everything, we should NAK any further IN tokens.
+		yield from self.pulse(dut.tokenizer.ready_for_response, step_after = False)
+		self.assertEqual((yield dut.handshakes_out.nak), 1)
+
+class USBInTransferManagerCrossDomainTest(ToriiUSBGatewareTestCase):
+	FRAGMENT_UNDER_TEST = USBInTransferManager
+	FRAGMENT_ARGUMENTS  = {'max_packet_size': 8, 'stream_domain': 'sync'}
+
+	SYNC_CLOCK_FREQUENCY = 100e6
+	USB_CLOCK_FREQUENCY  = 60e6
+
+	def _receive_packet(self):
+		''' Issues an IN token, and captures the packet emitted in response. '''
+		dut    = self.dut
+		packet = []
+
+		yield from self.pulse(dut.tokenizer.ready_for_response)
+		while (yield dut.packet_stream.valid):
+			packet.append((yield dut.packet_stream.data))
+			yield
+
+		return packet
+
+	def _setup_usb_side(self):
+		yield self.dut.packet_stream.ready.eq(1)
+		yield self.dut.active.eq(1)
+		yield self.dut.tokenizer.is_in.eq(1)
+
+	def test_cross_domain_transfer(self):
+		dut = self.dut
+		packets = []
+
+		def stream_process():
+			transfer_stream = dut.transfer_stream
+
+			# Send a transfer that spans a full packet and a short one.
+			yield transfer_stream.valid.eq(1)
+			for value in range(12):
+				yield transfer_stream.data.eq(value)
+				yield transfer_stream.last.eq(value == 11)
+				yield
+				while not (yield transfer_stream.ready):
+					yield
+			yield transfer_stream.valid.eq(0)
+			yield transfer_stream.last.eq(0)
+
+		def usb_process():
+			yield from self._setup_usb_side()
+
+			# Our packets should only become visible once they've crossed into our domain...
+			yield from self.wait_until(dut.data_pid == 0, timeout = 100)
+			packets.append((yield from self._receive_packet()))
+			yield from self.pulse(dut.handshakes_in.ack)
+
+			# ... and once we ACK the first, the short packet should follow with the opposite PID.
+			yield from self.wait_until(dut.data_pid == 1, timeout = 100)
+			packets.append((yield from self._receive_packet()))
+			yield from self.pulse(dut.handshakes_in.ack)
+
+		self.sim.add_sync_process(stream_process, domain = 'sync')
+		self.sim.add_sync_process(usb_process,    domain = 'usb')
+		self.simulate(vcd_suffix = 'cross_domain_transfer')
+
+		self.assertEqual(packets, [list(range(8)), list(range(8, 12))])
+
+	def test_cross_domain_discard(self):
+		dut = self.dut
+
+		def stream_process():
+			transfer_stream = dut.transfer_stream
+
+			# Fill and commit a packet...
+			yield transfer_stream.valid.eq(1)
+			for value in range(8):
+				yield transfer_stream.data.eq(value)
+				yield
+			yield transfer_stream.valid.eq(0)
+
+			# ... and then discard it, holding our discard for a few USB cycles.
+			yield from self.advance_cycles(20)
+			yield dut.discard.eq(1)
+			yield from self.advance_cycles(10)
+			yield dut.discard.eq(0)
+
+			# We should then be able to fill both of our slots.
+			yield from self.advance_cycles(20)
+			self.assertEqual((yield transfer_stream.ready), 1)
+
+		def usb_process():
+			yield from self._setup_usb_side()
+
+			# Wait until our packet is ready to send...
+			yield from self.wait_until(dut.data_pid == 0, timeout = 100)
+
+			# ... and then until it's been discarded.
+			yield from self.wait_until(dut.data_pid == 1, timeout = 100)
+			yield from self.advance_cycles(10)
+
+			# Once it's gone, any IN tokens should be NAK'd.
+			yield from self.pulse(dut.tokenizer.ready_for_response, step_after = False)
+			self.assertEqual((yield dut.handshakes_out.nak), 1)
+
+		self.sim.add_sync_process(stream_process, domain = 'sync')
+		self.sim.add_sync_process(usb_process,    domain = 'usb')
+		self.simulate(vcd_suffix = 'cross_domain_discard')
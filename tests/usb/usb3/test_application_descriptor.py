@@ -0,0 +1,95 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from usb_construct.emitters.descriptors        import DeviceDescriptorCollection
+from usb_construct.types.descriptors.standard  import StandardDescriptorNumbers
+
+from torii_usb.test                            import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.application.descriptor import GetDescriptorHandlerBlock
+
+class GetDescriptorHandlerBlockTest(USBSSGatewareTestCase):
+	''' :meta private: '''
+
+	descriptors = DeviceDescriptorCollection()
+
+	with descriptors.DeviceDescriptor() as d:
+		d.bcdUSB             = 3.20
+		d.idVendor           = 0x1234
+		d.idProduct          = 0x4567
+		d.iManufacturer      = 'Manufacturer'
+		d.iProduct           = 'Product'
+		d.iSerialNumber      = '1234'
+		d.bNumConfigurations = 1
+
+		with descriptors.ConfigurationDescriptor() as c:
+			c.bmAttributes = 0xC0
+			c.bMaxPower    = 50
+
+			with c.InterfaceDescriptor() as i:
+				i.bInterfaceNumber = 0
+
+				with i.EndpointDescriptor(add_default_superspeed = True) as e:
+					e.bEndpointAddress = 0x81
+					e.wMaxPacketSize   = 1024
+
+	FRAGMENT_UNDER_TEST = GetDescriptorHandlerBlock
+	FRAGMENT_ARGUMENTS  = {'descriptor_collection': descriptors}
+
+	def read_descriptor(self, type_number, index, max_length, *, delay_ready = 0):
+		''' Requests a descriptor; returning the bytes sent, and the length reported alongside them. '''
+
+		dut = self.dut
+
+		yield dut.value.eq(type_number << 8 | index)
+		yield dut.length.eq(max_length)
+		yield dut.tx.ready.eq(0)
+		yield from self.pulse(dut.start)
+
+		data   = []
+		length = None
+
+		for cycle in range(256):
+			yield dut.tx.ready.eq(cycle >= delay_ready)
+			valid = yield dut.tx.valid
+
+			if valid and (yield dut.tx.ready):
+				self.assertEqual((yield dut.tx.first), 1 if not data else 0)
+
+				length = yield dut.tx_length
+				word   = (yield dut.tx.data).to_bytes(4, byteorder = 'little')
+				data.extend(word[:bin(valid).count('1')])
+
+				if (yield dut.tx.last):
+					yield
+					break
+
+			self.assertEqual((yield dut.stall), 0)
+			yield
+
+		self.assertEqual((yield dut.tx.valid), 0)
+		return bytes(data), length
+
+	@ss_domain_test_case
+	def test_all_descriptors(self):
+		for type_number, index, raw_descriptor in self.descriptors:
+			requests = ((len(raw_descriptor), 0), (0xffff, 3), (len(raw_descriptor) - 1, 0), (6, 1))
+
+			for max_length, delay in requests:
+				expected     = raw_descriptor[:max_length]
+				data, length = yield from self.read_descriptor(type_number, index, max_length, delay_ready = delay)
+				self.assertEqual(data, expected)
+				self.assertEqual(length, len(expected))
+
+	@ss_domain_test_case
+	def test_zero_length(self):
+		data, _ = yield from self.read_descriptor(StandardDescriptorNumbers.DEVICE, 0, 0)
+		self.assertEqual(data, b'')
+
+	@ss_domain_test_case
+	def test_unavailable_descriptor(self):
+		for type_number, index in ((StandardDescriptorNumbers.STRING, 100), (0x10, 0), (0x42, 0)):
+			yield self.dut.value.eq(type_number << 8 | index)
+			yield self.dut.tx.ready.eq(1)
+			yield from self.pulse(self.dut.start, step_after = False)
+
+			yield from self.wait_until(self.dut.stall, timeout = 10)
+			self.assertEqual((yield self.dut.tx.valid), 0)
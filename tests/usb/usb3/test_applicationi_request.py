@@ -1,9 +1,16 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
-from usb_construct.types                    import USBRequestRecipient, USBRequestType
+from torii.hdl                              import Elaboratable, Module
+from torii.sim                              import Settle
+
+from usb_construct.emitters.descriptors     import DeviceDescriptorCollection
+from usb_construct.types                    import USBRequestRecipient, USBRequestType, USBStandardRequests
 
 from torii_usb.test                         import USBSSGatewareTestCase, ss_domain_test_case
-from torii_usb.usb.usb3.application.request import SuperSpeedSetupDecoder
+from torii_usb.usb.usb3.application.request import (
+	SuperSpeedRequestHandlerInterface, SuperSpeedRequestHandlerMultiplexer, SuperSpeedSetupDecoder
+)
+from torii_usb.usb.usb3.request.standard    import StandardRequestHandler
 
 class SuperSpeedSetupDecoderTest(USBSSGatewareTestCase):
 	FRAGMENT_UNDER_TEST = SuperSpeedSetupDecoder
@@ -42,3 +49,102 @@ class SuperSpeedSetupDecoderTest(USBSSGatewareTestCase):
 		self.assertEqual((yield setup.value),         0x2211)
 		self.assertEqual((yield setup.index),         0x3344)
 		self.assertEqual((yield setup.length),        4)
+
+class CompetingRequestHandlersFixture(Elaboratable):
+	''' Multiplexes a :class:`StandardRequestHandler` with a handler that tries to answer every request. '''
+
+	def __init__(self, descriptors):
+		self.handler = StandardRequestHandler(descriptors)
+		self.greedy  = SuperSpeedRequestHandlerInterface()
+		self.mux     = SuperSpeedRequestHandlerMultiplexer()
+
+		self.mux.add_interface(self.handler.interface, condition = self.handler.handler_condition)
+		self.mux.add_interface(self.greedy, condition = lambda setup: setup.type == USBRequestType.VENDOR)
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.handler = self.handler
+		m.submodules.mux     = self.mux
+
+		return m
+
+class SuperSpeedRequestHandlerMultiplexerTest(USBSSGatewareTestCase):
+	descriptors = DeviceDescriptorCollection()
+
+	with descriptors.DeviceDescriptor() as d:
+		d.bcdUSB             = 3.20
+		d.idVendor           = 0x1234
+		d.idProduct          = 0x4567
+		d.bNumConfigurations = 1
+
+		with descriptors.ConfigurationDescriptor() as c:
+			with c.InterfaceDescriptor() as i:
+				i.bInterfaceNumber = 0
+
+	FRAGMENT_UNDER_TEST = CompetingRequestHandlersFixture
+	FRAGMENT_ARGUMENTS  = {'descriptors': descriptors}
+
+	def receive_setup(self, request_type, recipient, request):
+		''' Presents a new SETUP packet to our multiplexer. '''
+		setup = self.dut.mux.shared.setup
+
+		yield setup.type.eq(request_type)
+		yield setup.recipient.eq(recipient)
+		yield setup.request.eq(request)
+		yield from self.pulse(setup.received)
+
+	@ss_domain_test_case
+	def test_competing_handlers(self):
+		mux    = self.dut.mux
+		shared = mux.shared
+		greedy = self.dut.greedy
+
+		# Have our greedy handler try to answer everything, with both a data packet and an ACK.
+		yield greedy.tx.valid.eq(0b1111)
+		yield greedy.tx.data.eq(0xdeadbeef)
+		yield greedy.handshakes_out.send_ack.eq(1)
+		yield greedy.handshakes_out.next_sequence.eq(7)
+		yield shared.tx.ready.eq(1)
+		yield shared.active_config.eq(3)
+
+		# A standard device request belongs to our standard request handler; so only its response should
+		# reach our endpoint, even though our greedy handler is also transmitting.
+		yield from self.receive_setup(
+			USBRequestType.STANDARD, USBRequestRecipient.DEVICE, USBStandardRequests.GET_CONFIGURATION
+		)
+		self.assertEqual((yield mux.unhandled), 0)
+		self.assertEqual((yield shared.tx.valid), 0)
+		self.assertEqual((yield shared.handshakes_out.send_ack), 0)
+
+		yield from self.pulse(shared.data_requested, step_after = False)
+		yield Settle()
+		self.assertEqual((yield shared.tx.valid), 0b0001)
+		self.assertEqual((yield shared.tx.data), 3)
+		self.assertEqual((yield greedy.tx.ready), 0)
+
+		yield shared.status_requested.eq(1)
+		yield Settle()
+		self.assertEqual((yield shared.handshakes_out.send_ack), 1)
+		self.assertEqual((yield shared.handshakes_out.next_sequence), 1)
+		self.assertEqual((yield greedy.handshakes_out.ready), 0)
+		yield
+		yield shared.status_requested.eq(0)
+
+		# A vendor request belongs to our greedy handler instead.
+		yield from self.receive_setup(USBRequestType.VENDOR, USBRequestRecipient.DEVICE, 0x42)
+		yield Settle()
+		self.assertEqual((yield mux.unhandled), 0)
+		self.assertEqual((yield shared.tx.valid), 0b1111)
+		self.assertEqual((yield shared.tx.data), 0xdeadbeef)
+		self.assertEqual((yield greedy.tx.ready), 1)
+		self.assertEqual((yield shared.handshakes_out.next_sequence), 7)
+
+		# A standard request for an interface is claimed by neither; so nothing should reach our endpoint.
+		yield from self.receive_setup(
+			USBRequestType.STANDARD, USBRequestRecipient.INTERFACE, USBStandardRequests.GET_STATUS
+		)
+		yield Settle()
+		self.assertEqual((yield mux.unhandled), 1)
+		self.assertEqual((yield shared.tx.valid), 0)
+		self.assertEqual((yield shared.handshakes_out.send_ack), 0)
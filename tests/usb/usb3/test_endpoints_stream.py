@@ -0,0 +1,383 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.sim                           import Settle
+
+from usb_construct.types                 import USBDirection
+
+from torii_usb.test                      import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.endpoints.stream import SuperSpeedStreamInEndpoint, SuperSpeedStreamOutEndpoint
+
+class SuperSpeedStreamInEndpointTest(USBSSGatewareTestCase):
+	''' :meta private: '''
+
+	FRAGMENT_UNDER_TEST = SuperSpeedStreamInEndpoint
+	FRAGMENT_ARGUMENTS  = {'endpoint_number': 1, 'max_packet_size': 16, 'max_burst': 4}
+
+	def initialize_signals(self):
+		yield self.dut.interface.tx.ready.eq(1)
+
+	def send_data(self, data, *, last = True):
+		''' Provides the endpoint's stream with the given bytes; a word at a time. '''
+
+		stream = self.dut.stream
+
+		for position in range(0, len(data), 4):
+			word = data[position:position + 4]
+
+			yield stream.data.eq(int.from_bytes(bytes(word), byteorder = 'little'))
+			yield stream.valid.eq((1 << len(word)) - 1)
+			yield stream.last.eq(last and (position + 4 >= len(data)))
+			yield Settle()
+
+			while not (yield stream.ready):
+				yield
+				yield Settle()
+			yield
+
+		yield stream.valid.eq(0)
+		yield stream.last.eq(0)
+		yield
+
+	def ack(self, sequence, packets, *, retry = False):
+		''' Sends the endpoint an ACK transaction packet; as the host would. '''
+
+		handshakes_in = self.dut.interface.handshakes_in
+
+		yield handshakes_in.endpoint_number.eq(1)
+		yield handshakes_in.direction.eq(USBDirection.IN)
+		yield handshakes_in.next_sequence.eq(sequence)
+		yield handshakes_in.number_of_packets.eq(packets)
+		yield handshakes_in.retry_required.eq(retry)
+		yield from self.pulse(handshakes_in.ack_received, step_after = False)
+
+	def collect(self, cycles = 64):
+		''' Gathers everything the endpoint sends over the given number of cycles.
+
+		Data packets are returned as ``(sequence, end_of_burst, data)``; and NRDY / ERDY transaction
+		packets as ``('NRDY',)`` and ``('ERDY', number_of_packets)``.
+		'''
+
+		interface      = self.dut.interface
+		handshakes_out = interface.handshakes_out
+		sent           = []
+		data           = []
+
+		for _ in range(cycles):
+			yield Settle()
+
+			valid = yield interface.tx.valid
+			if valid and (yield interface.tx.ready):
+				word = (yield interface.tx.data).to_bytes(4, byteorder = 'little')
+				data.extend(word[:bin(valid).count('1')])
+
+				if (yield interface.tx.last):
+					sent.append(((yield interface.tx_sequence_number), (yield interface.tx_end_of_burst), data))
+					data = []
+
+			if (yield interface.tx_zlp):
+				sent.append(((yield interface.tx_sequence_number), (yield interface.tx_end_of_burst), []))
+
+			# Complete any transaction packets immediately.
+			nrdy = yield handshakes_out.send_nrdy
+			erdy = yield handshakes_out.send_erdy
+			yield handshakes_out.done.eq(nrdy | erdy)
+
+			if nrdy:
+				sent.append(('NRDY',))
+			if erdy:
+				sent.append(('ERDY', (yield handshakes_out.number_of_packets)))
+
+			yield
+
+		yield handshakes_out.done.eq(0)
+		return sent
+
+	@ss_domain_test_case
+	def test_burst(self):
+		payload = list(range(56))
+
+		# Buffer three full packets and a short one...
+		yield from self.send_data(payload)
+
+		# ... and ask for two of them, which should be sent without waiting for an acknowledgement.
+		# The second ends the burst, since it's all the host has asked for.
+		yield from self.ack(0, 2)
+		self.assertEqual((yield from self.collect()), [
+			(0, 0, payload[0:16]),
+			(1, 1, payload[16:32]),
+		])
+
+		# Acknowledging the first shouldn't start anything new; as our burst is still in flight.
+		yield from self.ack(1, 1)
+		self.assertEqual((yield from self.collect()), [])
+
+		# Once the burst is acknowledged, the host can ask for more; which should end on the short packet.
+		yield from self.ack(2, 4)
+		self.assertEqual((yield from self.collect()), [
+			(2, 0, payload[32:48]),
+			(3, 1, payload[48:56]),
+		])
+
+		# Finally, if the host has nothing left to acknowledge, and asks for more, we should tell it we're not ready.
+		yield from self.ack(4, 4)
+		self.assertEqual((yield from self.collect()), [('NRDY',)])
+
+	@ss_domain_test_case
+	def test_retry(self):
+		payload = list(range(48))
+		yield from self.send_data(payload, last = False)
+
+		yield from self.ack(0, 4)
+		self.assertEqual((yield from self.collect()), [
+			(0, 0, payload[0:16]),
+			(1, 0, payload[16:32]),
+			(2, 1, payload[32:48]),
+		])
+
+		# If the host receives our first packet, but then has to ask for the second again, we should re-send
+		# everything from the second packet on.
+		yield from self.ack(1, 4, retry = True)
+		self.assertEqual((yield from self.collect()), [
+			(1, 0, payload[16:32]),
+			(2, 1, payload[32:48]),
+		])
+
+	@ss_domain_test_case
+	def test_buffer_fills_during_burst(self):
+		payload = list(range(160))
+
+		# Our endpoint should hold one more packet than it can send in a burst...
+		yield from self.send_data(payload[0:80], last = False)
+		self.assertEqual((yield self.dut.stream.ready), 0)
+
+		yield from self.ack(0, 4)
+		self.assertEqual([packet[0:2] for packet in (yield from self.collect())], [(0, 0), (1, 0), (2, 0), (3, 1)])
+
+		# ... and each acknowledgement should free up a buffer for more data.
+		yield from self.ack(2, 4)
+		yield from self.send_data(payload[80:112], last = False)
+
+		yield from self.ack(4, 4)
+		self.assertEqual((yield from self.collect()), [
+			(4, 0, payload[64:80]),
+			(5, 0, payload[80:96]),
+			(6, 1, payload[96:112]),
+		])
+
+	@ss_domain_test_case
+	def test_zlp_generation(self):
+		payload = list(range(32))
+
+		# A transfer that ends on a full packet should be followed by a ZLP.
+		yield from self.send_data(payload)
+
+		yield from self.ack(0, 4)
+		self.assertEqual((yield from self.collect()), [
+			(0, 0, payload[0:16]),
+			(1, 0, payload[16:32]),
+			(2, 1, []),
+		])
+
+	@ss_domain_test_case
+	def test_not_ready(self):
+		# If the host polls us before we have data, we should tell it we're not ready...
+		yield from self.ack(0, 4)
+		self.assertEqual((yield from self.collect()), [('NRDY',)])
+
+		# ... and let it know once we are.
+		yield from self.send_data(list(range(40)))
+		self.assertEqual((yield from self.collect()), [('ERDY', 3)])
+
+		yield from self.ack(0, 3)
+		self.assertEqual([packet[0:2] for packet in (yield from self.collect())], [(0, 0), (1, 0), (2, 1)])
+
+class SuperSpeedStreamOutEndpointTest(USBSSGatewareTestCase):
+	''' :meta private: '''
+
+	FRAGMENT_UNDER_TEST = SuperSpeedStreamOutEndpoint
+	FRAGMENT_ARGUMENTS  = {'endpoint_number': 1, 'max_packet_size': 16, 'max_burst': 2}
+
+	def initialize_signals(self):
+		yield self.dut.interface.handshakes_out.ready.eq(1)
+
+	def send_packet(self, sequence, data, *, good = True, endpoint_number = 1):
+		''' Sends the endpoint a data packet; as the host would. Returns any handshakes the endpoint generates. '''
+
+		interface = self.dut.interface
+		rx        = interface.rx
+
+		yield interface.rx_header.endpoint_number.eq(endpoint_number)
+		yield interface.rx_header.direction.eq(USBDirection.OUT)
+		yield interface.rx_header.data_sequence.eq(sequence)
+		yield interface.rx_header.data_length.eq(len(data))
+
+		for position in range(0, len(data), 4):
+			word = data[position:position + 4]
+
+			yield rx.data.eq(int.from_bytes(bytes(word), byteorder = 'little'))
+			yield rx.valid.eq((1 << len(word)) - 1)
+			yield rx.first.eq(position == 0)
+			yield rx.last.eq(position + 4 >= len(data))
+			yield
+
+		yield rx.valid.eq(0)
+		yield rx.first.eq(0)
+		yield rx.last.eq(0)
+
+		yield from self.pulse(interface.rx_complete if good else interface.rx_invalid, step_after = False)
+		return (yield from self.handshakes())
+
+	def handshakes(self, cycles = 8):
+		''' Gathers the handshakes the endpoint sends over the given number of cycles.
+
+		ACKs are returned as ``('ACK', next_sequence, number_of_packets, retry)``; NRDYs as ``('NRDY',)``,
+		and ERDYs as ``('ERDY', number_of_packets)``.
+		'''
+
+		handshakes_out = self.dut.interface.handshakes_out
+		sent           = []
+
+		for _ in range(cycles):
+			yield Settle()
+
+			self.assertEqual((yield handshakes_out.endpoint_number), 1)
+			self.assertEqual((yield handshakes_out.direction), USBDirection.OUT)
+
+			packets = yield handshakes_out.number_of_packets
+			if (yield handshakes_out.send_ack):
+				sent.append(
+					('ACK', (yield handshakes_out.next_sequence), packets, (yield handshakes_out.retry_required))
+				)
+			if (yield handshakes_out.send_nrdy):
+				sent.append(('NRDY',))
+			if (yield handshakes_out.send_erdy):
+				sent.append(('ERDY', packets))
+
+			yield
+
+		return sent
+
+	def drain(self, cycles = 32):
+		''' Reads everything out of the endpoint's stream; returning its bytes, and the positions of any first/last. '''
+
+		stream = self.dut.stream
+		data   = []
+		firsts = []
+		lasts  = []
+
+		yield stream.ready.eq(1)
+
+		for _ in range(cycles):
+			yield Settle()
+
+			# Words that end a transfer are present even if they carry no bytes.
+			valid = yield stream.valid
+			if valid or (yield stream.last):
+				if (yield stream.first):
+					firsts.append(len(data))
+
+				word = (yield stream.data).to_bytes(4, byteorder = 'little')
+				data.extend(word[:bin(valid).count('1')])
+
+				if (yield stream.last):
+					lasts.append(len(data) - 1)
+
+			yield
+
+		yield stream.ready.eq(0)
+		return data, firsts, lasts
+
+	@ss_domain_test_case
+	def test_burst(self):
+		payload = list(range(40))
+
+		# Each packet we receive should be acknowledged; advertising how many more we have room for.
+		self.assertEqual((yield from self.send_packet(0, payload[0:16])), [('ACK', 1, 2, 0)])
+		self.assertEqual((yield from self.send_packet(1, payload[16:32])), [('ACK', 2, 1, 0)])
+
+		# Once we've drained our buffers, our data should come out as a single transfer...
+		self.assertEqual((yield from self.drain()), (payload[0:32], [0], []))
+
+		# ... which should end on the short packet that follows it.
+		self.assertEqual((yield from self.send_packet(2, payload[32:40])), [('ACK', 3, 2, 0)])
+		self.assertEqual((yield from self.drain()), (payload[32:40], [], [7]))
+
+		# A ZLP should end the transfer without taking up a buffer; so the next packet starts a new transfer.
+		self.assertEqual((yield from self.send_packet(3, payload[0:16])), [('ACK', 4, 2, 0)])
+		self.assertEqual((yield from self.send_packet(4, [])), [('ACK', 5, 2, 0)])
+		self.assertEqual((yield from self.send_packet(5, payload[16:20])), [('ACK', 6, 1, 0)])
+		self.assertEqual((yield from self.drain()), (payload[0:20], [0, 16], [15, 19]))
+
+	@ss_domain_test_case
+	def test_exact_multiple_transfer(self):
+		payload = list(range(32))
+
+		# A transfer that's an exact multiple of our packet size is ended by a ZLP...
+		self.assertEqual((yield from self.send_packet(0, payload[0:16])), [('ACK', 1, 2, 0)])
+		self.assertEqual((yield from self.send_packet(1, payload[16:32])), [('ACK', 2, 1, 0)])
+		self.assertEqual((yield from self.send_packet(2, [])), [('ACK', 3, 1, 0)])
+
+		# ... which should mark the end of the transfer after its final byte, with an empty word.
+		self.assertEqual((yield from self.drain()), (payload, [0], [31]))
+
+		# A transfer that's just a ZLP should both start and end with that empty word.
+		self.assertEqual((yield from self.send_packet(3, [])), [('ACK', 4, 2, 0)])
+		self.assertEqual((yield from self.drain()), ([], [0], [-1]))
+
+		# Besides the word waiting on our stream, we can only hold one more ZLP; so a third has to wait.
+		self.assertEqual((yield from self.send_packet(4, [])), [('ACK', 5, 2, 0)])
+		self.assertEqual((yield from self.send_packet(5, [])), [('ACK', 6, 2, 0)])
+		self.assertEqual((yield from self.send_packet(6, [])), [('NRDY',)])
+
+		yield self.dut.interface.handshakes_out.ready.eq(0)
+		self.assertEqual((yield from self.drain()), ([], [0, 0], [-1, -1]))
+
+		yield self.dut.interface.handshakes_out.ready.eq(1)
+		self.assertEqual((yield from self.handshakes()), [('ERDY', 2)])
+		self.assertEqual((yield from self.send_packet(6, [])), [('ACK', 7, 2, 0)])
+		self.assertEqual((yield from self.drain()), ([], [0], [-1]))
+
+	@ss_domain_test_case
+	def test_retry(self):
+		payload = list(range(48))
+
+		self.assertEqual((yield from self.send_packet(0, payload[0:16])), [('ACK', 1, 2, 0)])
+
+		# If a packet's corrupted, we should ask the host to re-send it...
+		self.assertEqual((yield from self.send_packet(1, payload[16:32], good = False)), [('ACK', 1, 2, 1)])
+
+		# ... and quietly ignore anything it had already sent after it.
+		self.assertEqual((yield from self.send_packet(2, payload[32:48])), [])
+
+		# Packets with the wrong sequence number should also be retried.
+		self.assertEqual((yield from self.send_packet(1, payload[16:32])), [('ACK', 2, 1, 0)])
+		self.assertEqual((yield from self.send_packet(3, payload[32:48])), [('ACK', 2, 1, 1)])
+
+		# Only the packets we accepted should make it through.
+		self.assertEqual((yield from self.drain()), (payload[0:32], [0], []))
+
+	@ss_domain_test_case
+	def test_not_ready(self):
+		payload = list(range(64))
+
+		# Once our buffers are full, we should tell the host we have no room...
+		yield from self.send_packet(0, payload[0:16])
+		yield from self.send_packet(1, payload[16:32])
+		self.assertEqual((yield from self.send_packet(2, payload[32:48])), [('ACK', 3, 0, 0)])
+
+		# ... and not ready for anything it sends regardless.
+		self.assertEqual((yield from self.send_packet(3, payload[48:64])), [('NRDY',)])
+
+		# Once there's room again, we should let the host know it can resume.
+		yield self.dut.interface.handshakes_out.ready.eq(0)
+		data, _, _ = yield from self.drain()
+		self.assertEqual(data, payload[0:48])
+
+		yield self.dut.interface.handshakes_out.ready.eq(1)
+		self.assertEqual((yield from self.handshakes()), [('ERDY', 2)])
+
+		# The host should then be able to re-send the packet we weren't ready for.
+		self.assertEqual((yield from self.send_packet(3, payload[48:64])), [('ACK', 4, 2, 0)])
+
+		# Packets for other endpoints shouldn't affect us.
+		self.assertEqual((yield from self.send_packet(0, payload[0:4], endpoint_number = 2)), [])
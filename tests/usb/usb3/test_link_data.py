@@ -84,3 +84,27 @@ class DataPacketReceiverTest(USBSSGatewareTestCase):
 		)
 
 		self.assertEqual((yield self.dut.packet_good), 1)
+
+	@ss_domain_test_case
+	def test_no_error_after_good_packet(self):
+		yield from self.provide_data(
+			# Header packet.
+			# data       ctrl
+			(0xF7FBFBFB, 0b1111),
+			(0x00000008, 0b0000),
+			(0x00088000, 0b0000),
+			(0x08000000, 0b0000),
+			(0xA8023E0F, 0b0000),
+
+			# Payload packet.
+			(0xF75C5C5C, 0b1111),
+			(0x001E0500, 0b0000),
+			(0x00000000, 0b0000),
+			(0x0EC69325, 0b0000),
+		)
+		self.assertEqual((yield self.dut.packet_good), 1)
+
+		# Once our packet's been reported good, whatever follows it shouldn't be reported as bad.
+		for _ in range(4):
+			yield from self.provide_data((0xFDFDFDFD, 0b1111))
+			self.assertEqual((yield self.dut.packet_bad), 0)
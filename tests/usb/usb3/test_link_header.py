@@ -0,0 +1,95 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.sim                      import Settle
+
+from torii_usb.test                 import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.link.header import HeaderQueueFIFO
+
+class HeaderQueueFIFOTest(USBSSGatewareTestCase):
+	FRAGMENT_UNDER_TEST = HeaderQueueFIFO
+	FRAGMENT_ARGUMENTS  = {'depth': 8}
+
+	@ss_domain_test_case
+	def test_queueing(self):
+		dut = self.dut
+
+		# Queue more headers than a link partner could hold, without consuming any...
+		for index in range(6):
+			yield dut.sink.valid.eq(1)
+			yield dut.sink.header.dw0.eq(0x1000 + index)
+			yield dut.sink.header.dw2.eq(index << 24)
+			yield Settle()
+			self.assertEqual((yield dut.sink.ready), 1)
+			yield
+
+		yield dut.sink.valid.eq(0)
+		yield from self.advance_cycles(2)
+		self.assertEqual((yield dut.level), 6)
+
+		# ... and they should come out in the order they went in.
+		yield dut.source.ready.eq(1)
+		received = []
+		while len(received) < 6:
+			yield Settle()
+			if (yield dut.source.valid):
+				received.append(((yield dut.source.header.dw0), (yield dut.source.header.dw2)))
+			yield
+
+		yield dut.source.ready.eq(0)
+		self.assertEqual(received, [(0x1000 + index, index << 24) for index in range(6)])
+
+		yield from self.advance_cycles(2)
+		self.assertEqual((yield dut.source.valid), 0)
+		self.assertEqual((yield dut.level), 0)
+
+	@ss_domain_test_case
+	def test_full(self):
+		dut = self.dut
+
+		# Once we've filled our queue, we should stop accepting headers...
+		yield dut.sink.valid.eq(1)
+		yield from self.advance_cycles(8)
+		yield dut.sink.valid.eq(0)
+		yield from self.advance_cycles(2)
+		self.assertEqual((yield dut.sink.ready), 0)
+		self.assertEqual((yield dut.level), 8)
+
+		# ... until one is consumed.
+		yield dut.source.ready.eq(1)
+		yield
+		yield dut.source.ready.eq(0)
+		yield Settle()
+		self.assertEqual((yield dut.sink.ready), 1)
+		self.assertEqual((yield dut.level), 7)
+
+	@ss_domain_test_case
+	def test_flush(self):
+		dut = self.dut
+
+		# Queue a few headers...
+		yield dut.sink.valid.eq(1)
+		yield from self.advance_cycles(4)
+		yield dut.sink.valid.eq(0)
+		yield from self.advance_cycles(2)
+		self.assertEqual((yield dut.level), 4)
+		self.assertEqual((yield dut.source.valid), 1)
+
+		# ... and then flush them, as on a reset.
+		yield dut.flush.eq(1)
+		yield
+		yield dut.flush.eq(0)
+
+		# None of them should come out afterwards.
+		yield dut.source.ready.eq(1)
+		for _ in range(8):
+			yield Settle()
+			self.assertEqual((yield dut.source.valid), 0)
+			yield
+
+		self.assertEqual((yield dut.level), 0)
+
+	def test_bad_depth(self):
+		with self.assertRaises(ValueError):
+			HeaderQueueFIFO(depth = 0)
+		with self.assertRaises(ValueError):
+			HeaderQueueFIFO(depth = -1)
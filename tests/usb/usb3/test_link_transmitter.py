@@ -0,0 +1,73 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.hdl                           import Const
+from torii.sim                           import Settle
+
+from usb_construct.types.superspeed      import LinkCommand
+
+from torii_usb.test                      import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.link.crc         import compute_usb_crc5
+from torii_usb.usb.usb3.link.transmitter import PacketTransmitter
+from torii_usb.usb.usb3.physical.coding  import EPF, SLC, get_word_for_symbols
+
+class PacketTransmitterTest(USBSSGatewareTestCase):
+	FRAGMENT_UNDER_TEST = PacketTransmitter
+
+	def initialize_signals(self):
+		yield self.dut.enable.eq(1)
+		yield self.dut.source.ready.eq(1)
+
+	def send_link_command(self, command, subtype):
+		''' Provides a link command to our transmitter, as it would arrive from our link partner. '''
+
+		command_word = subtype | (command << 7)
+		command_word |= (yield compute_usb_crc5(Const(command_word, 11))) << 11
+
+		header_data, header_ctrl = get_word_for_symbols(SLC, SLC, SLC, EPF)
+		for data, ctrl in ((header_data, header_ctrl), (command_word | (command_word << 16), 0)):
+			yield self.dut.sink.valid.eq(1)
+			yield self.dut.sink.data.eq(data)
+			yield self.dut.sink.ctrl.eq(ctrl)
+			yield
+
+		yield self.dut.sink.valid.eq(0)
+		yield from self.advance_cycles(2)
+
+	def queue_headers(self, count):
+		''' Offers our transmitter header packets until it's accepted ``count`` of them. '''
+
+		yield self.dut.queue.valid.eq(1)
+		while count:
+			yield Settle()
+			if (yield self.dut.queue.ready):
+				count -= 1
+			yield
+
+		yield self.dut.queue.valid.eq(0)
+		yield Settle()
+
+	@ss_domain_test_case
+	def test_credit_starvation(self):
+		dut = self.dut
+
+		# Complete our bringup; and receive a credit for each of our partner's buffers.
+		yield from self.send_link_command(LinkCommand.LGOOD, 7)
+		for credit in range(4):
+			yield from self.send_link_command(LinkCommand.LCRD, credit)
+
+		self.assertEqual((yield dut.bringup_complete), 1)
+		self.assertEqual((yield dut.credits_available), 4)
+
+		# Using up our last credit should count as a starvation event...
+		yield from self.queue_headers(4)
+		self.assertEqual((yield dut.credits_available), 0)
+		self.assertEqual((yield dut.queue.ready), 0)
+		self.assertEqual((yield dut.credit_starvation_count), 1)
+
+		# ... as should each time we run out again, once a buffer is freed.
+		yield from self.send_link_command(LinkCommand.LCRD, 0)
+		self.assertEqual((yield dut.credits_available), 1)
+		self.assertEqual((yield dut.credit_starvation_count), 1)
+
+		yield from self.queue_headers(1)
+		self.assertEqual((yield dut.credit_starvation_count), 2)
@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.sim                            import Settle
+
+from torii_usb.test                       import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.protocol.endpoint import SuperSpeedEndpointInterface, SuperSpeedEndpointMultiplexer
+
+class SuperSpeedEndpointMultiplexerTestCase(USBSSGatewareTestCase):
+	''' Base for our multiplexer tests; which multiplex an interface for each of our ``PRIORITIES``. '''
+
+	PRIORITIES = (0, 0, 0)
+
+	def instantiate_dut(self):
+		self.interfaces = [SuperSpeedEndpointInterface() for _ in self.PRIORITIES]
+
+		dut = SuperSpeedEndpointMultiplexer()
+		for interface, priority in zip(self.interfaces, self.PRIORITIES):
+			dut.add_interface(interface, priority = priority)
+
+		return dut
+
+	def initialize_signals(self):
+		yield self.dut.shared.tx.ready.eq(1)
+		yield self.dut.shared.tx_idle.eq(1)
+
+		for number, interface in enumerate(self.interfaces):
+			yield interface.tx_endpoint_number.eq(number + 1)
+
+	def queue_packet(self, index, words):
+		''' Has one of our interfaces start presenting a packet of the given number of words. '''
+
+		tx = self.interfaces[index].tx
+		yield tx.valid.eq(0b1111)
+		yield tx.data.eq(0)
+		yield tx.last.eq(words == 1)
+
+		self._remaining[index] = words
+
+	def transmit(self, cycles = 48):
+		''' Advances time; stepping each of our interfaces through its packet as words are accepted.
+
+		Returns the words sent, as ``(endpoint_number, word)``; and any ZLPs, as ``(endpoint_number, 'ZLP')``.
+		'''
+
+		shared = self.dut.shared
+		sent   = []
+
+		for _ in range(cycles):
+			yield Settle()
+
+			if (yield shared.tx.valid) and (yield shared.tx.ready):
+				sent.append(((yield shared.tx_endpoint_number), (yield shared.tx.data)))
+			if (yield shared.tx_zlp):
+				sent.append(((yield shared.tx_endpoint_number), 'ZLP'))
+
+			# Only the interface we've granted should ever see its data accepted.
+			accepted = []
+			for index, interface in enumerate(self.interfaces):
+				if (yield interface.tx.valid) and (yield interface.tx.ready):
+					accepted.append(index)
+			self.assertLessEqual(len(accepted), 1)
+
+			yield
+
+			for index in accepted:
+				tx = self.interfaces[index].tx
+				self._remaining[index] -= 1
+
+				if self._remaining[index] == 0:
+					yield tx.valid.eq(0)
+					yield tx.last.eq(0)
+				else:
+					yield tx.data.eq((yield tx.data) + 1)
+					yield tx.last.eq(self._remaining[index] == 1)
+
+		return sent
+
+	def setUp(self):
+		super().setUp()
+		self._remaining = [0] * len(self.PRIORITIES)
+
+class SuperSpeedEndpointMultiplexerTest(SuperSpeedEndpointMultiplexerTestCase):
+	''' :meta private: '''
+
+	@ss_domain_test_case
+	def test_round_robin(self):
+		# With every interface waiting to send, each should be granted a whole packet in turn...
+		for index in range(3):
+			yield from self.queue_packet(index, 3)
+
+		sent = yield from self.transmit()
+		self.assertEqual(sent, [(endpoint, word) for endpoint in (1, 2, 3) for word in range(3)])
+
+		# ... and later packets should carry on from where we left off.
+		yield from self.queue_packet(0, 2)
+		yield from self.queue_packet(2, 2)
+
+		sent = yield from self.transmit()
+		self.assertEqual(sent, [(endpoint, word) for endpoint in (1, 3) for word in range(2)])
+
+		yield from self.queue_packet(0, 1)
+		yield from self.queue_packet(1, 1)
+		yield from self.queue_packet(2, 1)
+
+		sent = yield from self.transmit()
+		self.assertEqual(sent, [(1, 0), (2, 0), (3, 0)])
+
+	@ss_domain_test_case
+	def test_backpressure(self):
+		shared = self.dut.shared
+
+		yield from self.queue_packet(1, 2)
+		yield from self.queue_packet(0, 2)
+
+		# A packet shouldn't be interrupted while our transmitter isn't ready for it.
+		yield shared.tx.ready.eq(0)
+		self.assertEqual((yield from self.transmit(8)), [])
+
+		yield shared.tx.ready.eq(1)
+		sent = yield from self.transmit()
+		self.assertEqual([endpoint for endpoint, _ in sent], [1, 1, 2, 2])
+
+	@ss_domain_test_case
+	def test_zlp(self):
+		shared    = self.dut.shared
+		interface = self.interfaces[2]
+
+		# Request a ZLP while our transmitter is busy with another packet...
+		yield from self.queue_packet(0, 4)
+		yield
+		yield interface.tx_sequence_number.eq(7)
+		yield from self.pulse(interface.tx_zlp, step_after = False)
+
+		# ... which should be held until it's granted; with no more accepted in the meantime.
+		yield shared.tx_idle.eq(0)
+		yield Settle()
+		self.assertEqual((yield interface.tx_idle), 0)
+		sent = yield from self.transmit(16)
+		self.assertEqual(sent, [(1, word) for word in range(4)])
+
+		# Once our transmitter's idle, it should be sent with the parameters it was requested with.
+		yield shared.tx_idle.eq(1)
+		yield interface.tx_sequence_number.eq(0)
+		yield Settle()
+
+		self.assertEqual((yield shared.tx_zlp), 1)
+		self.assertEqual((yield shared.tx_endpoint_number), 3)
+		self.assertEqual((yield shared.tx_sequence_number), 7)
+		yield
+
+		yield Settle()
+		self.assertEqual((yield shared.tx_zlp), 0)
+		self.assertEqual((yield interface.tx_idle), 1)
+
+class SuperSpeedEndpointMultiplexerPriorityTest(SuperSpeedEndpointMultiplexerTestCase):
+	''' :meta private: '''
+
+	PRIORITIES = (0, 1, 0)
+
+	@ss_domain_test_case
+	def test_priority(self):
+		# Our higher-priority interface should be served first; and then the others in turn...
+		for index in range(3):
+			yield from self.queue_packet(index, 2)
+
+		sent = yield from self.transmit()
+		self.assertEqual([endpoint for endpoint, _ in sent], [2, 2, 3, 3, 1, 1])
+
+		# ... and whenever it has more to send, it should be served as soon as the current packet ends.
+		yield from self.queue_packet(0, 4)
+		yield from self.queue_packet(2, 4)
+		yield from self.transmit(2)
+
+		yield from self.queue_packet(1, 2)
+		sent = yield from self.transmit()
+		self.assertEqual([endpoint for endpoint, _ in sent], [3, 3, 3, 2, 2, 1, 1, 1, 1])
@@ -0,0 +1,38 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.sim                               import Settle
+
+from usb_construct.types                     import USBDirection
+from usb_construct.types.superspeed          import HeaderPacketType, TransactionPacketSubtype
+
+from torii_usb.test                          import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.protocol.transaction import TransactionPacketGenerator
+
+class TransactionPacketGeneratorTest(USBSSGatewareTestCase):
+	FRAGMENT_UNDER_TEST = TransactionPacketGenerator
+
+	def generated_header(self):
+		''' Waits for our generator to emit a header packet; and returns its first two words. '''
+		header_source = self.dut.header_source
+
+		yield header_source.ready.eq(1)
+		for _ in range(8):
+			yield Settle()
+			if (yield header_source.valid):
+				return (yield header_source.header.dw0), (yield header_source.header.dw1)
+			yield
+
+		self.fail('No header packet was generated')
+
+	@ss_domain_test_case
+	def test_default_flow_control_parameters(self):
+		interface = self.dut.interface
+
+		# Producers that don't drive our parameters should get an ERDY for a single packet, on an IN endpoint.
+		yield from self.pulse(interface.send_erdy)
+		dw0, dw1 = yield from self.generated_header()
+
+		self.assertEqual(dw0 & 0x1f, HeaderPacketType.TRANSACTION)
+		self.assertEqual(dw1 & 0xf, TransactionPacketSubtype.ERDY)
+		self.assertEqual((dw1 >> 7) & 1, USBDirection.IN)
+		self.assertEqual((dw1 >> 16) & 0x1f, 1)
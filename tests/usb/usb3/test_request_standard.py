@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: BSD-3-Clause
+
+from torii.hdl                               import Elaboratable, Module
+from torii.sim                               import Settle
+
+from usb_construct.emitters.descriptors      import DeviceDescriptorCollection
+from usb_construct.types                     import USBStandardRequests
+from usb_construct.types.superspeed          import HeaderPacketType, TransactionPacketSubtype
+
+from torii_usb.test                          import USBSSGatewareTestCase, ss_domain_test_case
+from torii_usb.usb.usb3.protocol.transaction import TransactionPacketGenerator
+from torii_usb.usb.usb3.request.standard     import StandardRequestHandler
+
+class StandardRequestHandshakeFixture(Elaboratable):
+	''' Connects a :class:`StandardRequestHandler`'s handshakes to a transaction packet generator. '''
+
+	def __init__(self, descriptors):
+		self.handler   = StandardRequestHandler(descriptors)
+		self.generator = TransactionPacketGenerator()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.handler   = self.handler
+		m.submodules.generator = self.generator
+		m.d.comb += self.generator.interface.connect(self.handler.interface.handshakes_out)
+
+		return m
+
+class StandardRequestHandlerTest(USBSSGatewareTestCase):
+	''' :meta private: '''
+
+	descriptors = DeviceDescriptorCollection()
+
+	with descriptors.DeviceDescriptor() as d:
+		d.bcdUSB             = 3.20
+		d.idVendor           = 0x1234
+		d.idProduct          = 0x4567
+		d.bNumConfigurations = 1
+
+		with descriptors.ConfigurationDescriptor() as c:
+			with c.InterfaceDescriptor() as i:
+				i.bInterfaceNumber = 0
+
+	FRAGMENT_UNDER_TEST = StandardRequestHandshakeFixture
+	FRAGMENT_ARGUMENTS  = {'descriptors': descriptors}
+
+	@ss_domain_test_case
+	def test_status_ack(self):
+		interface     = self.dut.handler.interface
+		header_source = self.dut.generator.header_source
+
+		# Start a SET_ADDRESS request...
+		yield interface.setup.request.eq(USBStandardRequests.SET_ADDRESS)
+		yield interface.setup.value.eq(0x12)
+		yield from self.pulse(interface.setup.received)
+
+		# ... and complete its status stage.
+		yield from self.pulse(interface.status_requested)
+
+		yield header_source.ready.eq(1)
+		for _ in range(8):
+			yield Settle()
+			if (yield header_source.valid):
+				break
+			yield
+		else:
+			self.fail('No ACK was generated')
+
+		# Our ACK should advertise a single packet; as every control transfer stage is.
+		dw0 = yield header_source.header.dw0
+		dw1 = yield header_source.header.dw1
+		self.assertEqual(dw0 & 0x1f, HeaderPacketType.TRANSACTION)
+		self.assertEqual(dw1 & 0xf, TransactionPacketSubtype.ACK)
+		self.assertEqual((dw1 >> 16) & 0x1f, 1)
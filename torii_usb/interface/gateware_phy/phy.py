@@ -5,7 +5,7 @@
 
 ''' Pure-gateware, UTMI-compatible Full Speed PHY.'''
 
-from torii.hdl    import Cat, Elaboratable, Module, Signal
+from torii.hdl    import Cat, ClockSignal, Elaboratable, Module, Signal
 
 from .receiver    import RxPipeline
 from .transmitter import TxPipeline
@@ -22,7 +22,8 @@ class GatewarePHY(Elaboratable):
 		the need for explicit synchronization on clock domain crossings.
 	usb_io:
 		The core 48MHz clock domain in which USB clock recovery and sampling is performed.
-		Must be phase related to our ``usb`` clock domain.
+		Must be phase related to our ``usb`` clock domain. When using DDR sampling, this
+		domain instead runs at 24MHz.
 
 	Attributes
 	----------
@@ -83,14 +84,20 @@ class GatewarePHY(Elaboratable):
 		A record containing the raw I/O signals to be used to drive our I/O-based USB connection.
 		The ``d_p`` and ``d_n`` signals are mandatory; the ``pullup``, ``pulldown``,
 		and ``vbus_valid`` signals are optional.
+	ddr: bool, optional
+		If True, ``d_p`` and ``d_n`` are sampled by the I/O cells' DDR input registers; which capture
+		the same four samples per bit as a 48MHz clock, from a 24MHz ``usb_io`` clock. This requires
+		``d_p`` and ``d_n`` to be requested with ``xdr = 2``; their ``i_clk`` and ``o_clk`` are driven
+		from ``usb_io``. If not provided, DDR sampling is used iff ``d_p`` has DDR inputs.
 	'''
 
 	OP_MODE_NORMAL      = 0b00
 	OP_MODE_NONDRIVING  = 0b10
 	OP_MODE_NO_ENCODING = 0b01
 
-	def __init__(self, *, io):
-		self._io = io
+	def __init__(self, *, io, ddr = None):
+		self._io  = io
+		self._ddr = hasattr(io.d_p, 'i0') if ddr is None else ddr
 
 		#
 		# I/O port
@@ -123,8 +130,33 @@ class GatewarePHY(Elaboratable):
 		# General state signals.
 		#
 
+		# If we're DDR-sampling our I/O, clock our DDR registers from our I/O domain; and only use
+		# the first of each cycle's samples wherever we don't need both.
+		if self._ddr:
+			d_p_i, d_n_i = self._io.d_p.i0, self._io.d_n.i0
+			m.d.comb += [
+				self._io.d_p.i_clk.eq(ClockSignal('usb_io')),
+				self._io.d_n.i_clk.eq(ClockSignal('usb_io')),
+				self._io.d_p.o_clk.eq(ClockSignal('usb_io')),
+				self._io.d_n.o_clk.eq(ClockSignal('usb_io')),
+			]
+		else:
+			d_p_i, d_n_i = self._io.d_p.i, self._io.d_n.i
+
+		# DDR outputs are driven with the same value for both halves of each cycle.
+		d_p_o = Signal()
+		d_n_o = Signal()
+		for pin, value in ((self._io.d_p, d_p_o), (self._io.d_n, d_n_o)):
+			if self._ddr:
+				m.d.comb += [
+					pin.o0.eq(value),
+					pin.o1.eq(value),
+				]
+			else:
+				m.d.comb += pin.o.eq(value)
+
 		# Our line state is always taken directly from D- and D+.
-		m.d.comb += self.line_state.eq(Cat(self._io.d_n.i, self._io.d_p.i))
+		m.d.comb += self.line_state.eq(Cat(d_n_i, d_p_i))
 
 		# If we have a ``vbus_valid`` indication, use it to drive our ``vbus_valid``
 		# signal. Otherwise, we'll pretend ``vbus_valid`` is always true, for compatibility.
@@ -169,8 +201,8 @@ class GatewarePHY(Elaboratable):
 				self.tx_ready.eq(transmitter.o_data_strobe),
 
 				# USB output.
-				self._io.d_p.o.eq(transmitter.o_usbp),
-				self._io.d_n.o.eq(transmitter.o_usbn),
+				d_p_o.eq(transmitter.o_usbp),
+				d_n_o.eq(transmitter.o_usbn),
 
 				# USB tri-state control.
 				self._io.d_p.oe.eq(transmitter.o_oe),
@@ -182,8 +214,8 @@ class GatewarePHY(Elaboratable):
 		with m.Elif(in_non_encoding_mode):
 			m.d.comb += [
 				# USB output.
-				self._io.d_p.o.eq(self.tx_data),
-				self._io.d_n.o.eq(~self.tx_data),
+				d_p_o.eq(self.tx_data),
+				d_n_o.eq(~self.tx_data),
 
 				# USB tri-state control.
 				self._io.d_p.oe.eq(self.tx_valid),
@@ -198,21 +230,30 @@ class GatewarePHY(Elaboratable):
 				self._io.d_n.oe.eq(0),
 			]
 
-		# Generate our USB clock strobe, which should pulse at 12MHz.
-		counter = Signal(2)
+		# Generate our USB clock strobe, which should pulse at 12MHz; every four cycles of our 48MHz
+		# I/O clock, or every two cycles if we're DDR-sampling at 24MHz.
+		counter = Signal(1 if self._ddr else 2)
 		m.d.usb_io += counter.eq(counter + 1)
 		m.d.comb += transmitter.i_bit_strobe.eq(counter == 0)
 
 		#
 		# Receiver
 		#
-		m.submodules.receiver = receiver = RxPipeline()
+		m.submodules.receiver = receiver = RxPipeline(ddr = self._ddr)
+
+		if self._ddr:
+			receiver_usbp = Cat(self._io.d_p.i0, self._io.d_p.i1)
+			receiver_usbn = Cat(self._io.d_n.i0, self._io.d_n.i1)
+		else:
+			receiver_usbp = self._io.d_p.i
+			receiver_usbn = self._io.d_n.i
+
 		m.d.comb += [
 
 			# We'll listen for packets on D+ and D- _whenever we're not transmitting._.
 			# (If we listen while we're transmitting, we'll hear our own packets.)
-			receiver.i_usbp.eq(self._io.d_p.i & ~transmitter.o_oe),
-			receiver.i_usbn.eq(self._io.d_n.i & ~transmitter.o_oe),
+			receiver.i_usbp.eq(receiver_usbp & ~transmitter.o_oe.replicate(len(receiver_usbp))),
+			receiver.i_usbn.eq(receiver_usbn & ~transmitter.o_oe.replicate(len(receiver_usbn))),
 
 			self.rx_data.eq(receiver.o_data_payload),
 			self.rx_valid.eq(receiver.o_data_strobe & receiver.o_pkt_in_progress),
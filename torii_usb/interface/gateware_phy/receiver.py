@@ -32,7 +32,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-from torii.hdl      import Cat, Const, Elaboratable, Module, Signal
+from torii.hdl      import Cat, Const, Elaboratable, Module, Mux, Signal
 from torii.hdl.ast  import Past
 from torii.hdl.xfrm import ResetInserter
 from torii.lib.fifo import AsyncFIFOBuffered
@@ -194,6 +194,111 @@ class RxClockDataRecovery(Elaboratable):
 
 		return m
 
+class RxDDRClockDataRecovery(Elaboratable):
+	'''RX Clock Data Recovery module, for DDR-sampled inputs.
+
+	Behaves identically to :class:`RxClockDataRecovery`; but rather than sampling the USB
+	differential pair four times per bit in a 48MHz domain, it takes the two samples per
+	cycle captured by the I/O cell's DDR input registers from a 24MHz clock. Each cycle,
+	both samples are run through the same line state recovery and clock recovery logic,
+	in the order they were captured. As a bit lasts for four samples, at most one bit is
+	produced per cycle.
+
+	Clock Domain
+	------------
+	usb_io : 24MHz
+
+	Input Ports
+	-----------
+	Input ports are passed in via the constructor.
+
+	usbp_raw : Signal(2)
+		Raw USB+ samples from the FPGA's DDR input registers; the sample captured first
+		in bit 0, and the sample captured second in bit 1. No need to synchronize.
+
+	usbn_raw : Signal(2)
+		Raw USB- samples from the FPGA's DDR input registers; as for ``usbp_raw``.
+
+	Output Ports
+	------------
+	As for :class:`RxClockDataRecovery`.
+	'''
+
+	# The line states of our differential pair; matching those used by RxClockDataRecovery.
+	LINE_STATE_DJ  = 0b10
+	LINE_STATE_DK  = 0b01
+	LINE_STATE_SE0 = 0b00
+	LINE_STATE_SE1 = 0b11
+
+	def __init__(self, usbp_raw, usbn_raw):
+		self._usbp = usbp_raw
+		self._usbn = usbn_raw
+
+		self.line_state_valid = Signal()
+		self.line_state_dj = Signal()
+		self.line_state_dk = Signal()
+		self.line_state_se0 = Signal()
+		self.line_state_se1 = Signal()
+
+	@staticmethod
+	def _recover(m, line_state, in_transition, phase, dpair):
+		''' Advances our recovery state by a single sample.
+
+		Returns the resulting state, and whether a bit should be sampled, as of this sample.
+		'''
+
+		next_line_state    = Signal.like(line_state)
+		next_in_transition = Signal()
+		next_phase         = Signal.like(phase)
+		sample             = Signal()
+
+		m.d.comb += [
+			# If we're in a transition, we take on the line state we now see; otherwise, we move to
+			# a transition whenever our line state changes.
+			next_line_state.eq(Mux(in_transition, dpair, line_state)),
+			next_in_transition.eq(~in_transition & (dpair != line_state)),
+
+			# Re-align our phase on each transition, and otherwise keep tracking our clock.
+			next_phase.eq(Mux(in_transition, 0, phase + 1)),
+			sample.eq(~in_transition & (phase == 1)),
+		]
+
+		return next_line_state, next_in_transition, next_phase, sample
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Synchronize the USB signals at our I/O boundary.
+		sync_dp = synchronize(m, self._usbp, o_domain = 'usb_io')
+		sync_dn = synchronize(m, self._usbn, o_domain = 'usb_io')
+
+		# Our recovery state; as in RxClockDataRecovery, we start out in transition.
+		line_state    = Signal(2)
+		in_transition = Signal(reset = 1)
+		phase         = Signal(2)
+
+		# Run each of our samples through our recovery logic, in turn.
+		first  = self._recover(m, line_state, in_transition, phase, Cat(sync_dp[0], sync_dn[0]))
+		second = self._recover(m, *first[0:3], Cat(sync_dp[1], sync_dn[1]))
+
+		m.d.usb_io += [
+			line_state.eq(second[0]),
+			in_transition.eq(second[1]),
+			phase.eq(second[2]),
+		]
+
+		# A bit is only ever sampled outside of a transition, where our first sample leaves our line state
+		# unchanged; so whichever sample it's taken on, it's the line state after our first sample.
+		m.d.usb_io += [
+			self.line_state_valid.eq(first[3] | second[3]),
+			self.line_state_dj.eq(first[0] == self.LINE_STATE_DJ),
+			self.line_state_dk.eq(first[0] == self.LINE_STATE_DK),
+			self.line_state_se0.eq(first[0] == self.LINE_STATE_SE0),
+			self.line_state_se1.eq(first[0] == self.LINE_STATE_SE1),
+		]
+
+		return m
+
 class RxNRZIDecoder(Elaboratable):
 	'''RX NRZI decoder.
 
@@ -542,16 +647,27 @@ class RxShifter(Elaboratable):
 		return m
 
 class RxPipeline(Elaboratable):
+	'''RX pipeline; recovers packets from the USB differential pair.
+
+	Parameters
+	----------
+	ddr : bool
+		If True, ``i_usbp`` and ``i_usbn`` each carry the two samples per cycle captured by
+		DDR input registers, and our ``usb_io`` domain runs at 24MHz; see :class:`RxDDRClockDataRecovery`.
+		Otherwise, they carry single samples, and ``usb_io`` runs at 48MHz.
+	'''
+
+	def __init__(self, *, ddr = False):
+		self._ddr = ddr
 
-	def __init__(self):
 		self.reset = Signal()
 
-		# 12MHz USB alignment pulse in 48MHz clock domain
+		# 12MHz USB alignment pulse in our usb_io clock domain
 		self.o_bit_strobe = Signal()
 
 		# Reset state is J
-		self.i_usbp = Signal(reset = 1)
-		self.i_usbn = Signal(reset = 0)
+		self.i_usbp = Signal(2 if ddr else 1, reset = 0b11 if ddr else 1)
+		self.i_usbn = Signal(2 if ddr else 1, reset = 0)
 
 		self.o_data_strobe = Signal()
 		self.o_data_payload = Signal(8)
@@ -568,7 +684,10 @@ class RxPipeline(Elaboratable):
 		#
 		# Clock/Data recovery.
 		#
-		clock_data_recovery = RxClockDataRecovery(self.i_usbp, self.i_usbn)
+		if self._ddr:
+			clock_data_recovery = RxDDRClockDataRecovery(self.i_usbp, self.i_usbn)
+		else:
+			clock_data_recovery = RxClockDataRecovery(self.i_usbp, self.i_usbn)
 		m.submodules.clock_data_recovery = clock_data_recovery
 		m.d.comb += self.o_bit_strobe.eq(clock_data_recovery.line_state_valid)
 
@@ -67,6 +67,8 @@ class ULPIRegisterWindow(Elaboratable):
 
 		# Controller signals:
 		O: busy              -- indicates when the register window is busy processing a transaction
+		O: ready             -- indicates that a request made this cycle will be accepted; its address and
+								write data are captured in the same cycle, so they may change afterwards
 		I: address[6]        -- the address of the register to work with
 		O: done              -- strobe that indicates when a register request is complete
 
@@ -76,7 +78,11 @@ class ULPIRegisterWindow(Elaboratable):
 		I: write_request     -- strobe that indicates a register write
 		I: write_data[8]     -- data to be written during a register write
 
-	'''
+	Requests are accepted while idle, and as the previous transaction completes; so a controller that keeps
+	a request pending can issue back-to-back transactions. A write that follows another write has its command
+	presented directly after the previous write's STP cycle, without the bus ever returning to idle.
+
+	''' # noqa: E101
 
 	COMMAND_REG_WRITE = 0b10000000
 	COMMAND_REG_READ  = 0b11000000
@@ -95,6 +101,7 @@ class ULPIRegisterWindow(Elaboratable):
 		self.ulpi_stop     = Signal()
 
 		self.busy          = Signal()
+		self.ready         = Signal()
 		self.address       = Signal(6)
 		self.done          = Signal()
 
@@ -117,6 +124,35 @@ class ULPIRegisterWindow(Elaboratable):
 			self.done.eq(0)
 		]
 
+		def accept_request(*, bus_available = False):
+			''' Accepts any new request; capturing its arguments, and moving to handle it.
+
+			If ``bus_available`` is set, the bus is known to be ours on the next cycle; so the request's command
+			is presented immediately, rather than after waiting for the bus in one of our START states.
+			'''
+
+			m.d.comb += self.ready.eq(1)
+			m.d.usb  += [
+				current_address.eq(self.address),
+				current_write.eq(self.write_data)
+			]
+
+			def start_request(command, start_state, send_state):
+				if bus_available:
+					m.d.usb += [
+						self.ulpi_data_out.eq(command | self.address),
+						self.ulpi_out_req.eq(1)
+					]
+					m.next = send_state
+				else:
+					m.next = start_state
+
+			# Writes take priority over reads, should both be requested at once.
+			with m.If(self.write_request):
+				start_request(self.COMMAND_REG_WRITE, 'START_WRITE', 'SEND_WRITE_ADDRESS')
+			with m.Elif(self.read_request):
+				start_request(self.COMMAND_REG_READ, 'START_READ', 'SEND_READ_ADDRESS')
+
 		with m.FSM(domain = 'usb') as fsm:
 
 			# We're busy whenever we're not IDLE; indicate so.
@@ -135,16 +171,7 @@ class ULPIRegisterWindow(Elaboratable):
 
 				# Constantly latch in our arguments while IDLE.
 				# We'll stop latching these in as soon as we're busy.
-				m.d.usb += [
-					current_address.eq(self.address),
-					current_write.eq(self.write_data)
-				]
-
-				with m.If(self.read_request):
-					m.next = 'START_READ'
-
-				with m.If(self.write_request):
-					m.next = 'START_WRITE'
+				accept_request()
 
 			#
 			# Read handling.
@@ -159,7 +186,7 @@ class ULPIRegisterWindow(Elaboratable):
 
 					# Once it is, start sending our command.
 					m.d.usb += [
-						self.ulpi_data_out.eq(self.COMMAND_REG_READ | self.address),
+						self.ulpi_data_out.eq(self.COMMAND_REG_READ | current_address),
 						self.ulpi_out_req.eq(1)
 					]
 
@@ -202,6 +229,10 @@ class ULPIRegisterWindow(Elaboratable):
 					self.done.eq(1)
 				]
 
+				# The PHY still owns the bus for its turnaround cycle; so any
+				# follow-on request will need to wait for it.
+				accept_request()
+
 			#
 			# Write handling.
 			#
@@ -215,7 +246,7 @@ class ULPIRegisterWindow(Elaboratable):
 
 					# Once it is, start sending our command.
 					m.d.usb += [
-						self.ulpi_data_out.eq(self.COMMAND_REG_WRITE | self.address),
+						self.ulpi_data_out.eq(self.COMMAND_REG_WRITE | current_address),
 						self.ulpi_out_req.eq(1)
 					]
 
@@ -233,7 +264,7 @@ class ULPIRegisterWindow(Elaboratable):
 				# Hold our address until the PHY has accepted the command;
 				# and then move to presenting the PHY with the value to be written.
 				with m.Elif(self.ulpi_next):
-					m.d.usb += self.ulpi_data_out.eq(self.write_data)
+					m.d.usb += self.ulpi_data_out.eq(current_write)
 					m.next = 'HOLD_WRITE'
 
 			# Hold the write data on the bus until the device acknowledges it.
@@ -270,6 +301,10 @@ class ULPIRegisterWindow(Elaboratable):
 					]
 					m.next = 'IDLE'
 
+					# We still own the bus; so any follow-on request can present
+					# its command on the very next cycle.
+					accept_request(bus_available = True)
+
 		return m
 
 class ULPIRxEventDecoder(Elaboratable):
@@ -394,6 +429,12 @@ class ULPIControlTranslator(Elaboratable):
 
 		O: busy           -- true iff the control translator is actively performing an operation
 
+	Each register acts as a slot in a small, coalescing command queue: a register is queued for a write
+	whenever its requested value differs from the value last handed to the register window, and only its
+	most recent value is ever written. Changes that are undone before they're written cause no bus traffic
+	at all. Pending writes are issued back-to-back in the order their registers were added, so the function
+	control register, which carries speed and termination changes, waits behind at most one other write.
+
 	''' # noqa: E101
 
 	def __init__(self, *, register_window, own_register_window = False):
@@ -459,28 +500,27 @@ class ULPIControlTranslator(Elaboratable):
 
 		'''
 
+		# Track the value we've most recently handed to the register window; which the register
+		# window guarantees will eventually be written, even if it's interrupted.
 		current_register_value = Signal(8, reset = reset_value, name = f'current_register_value_{address:02x}')
 
 		# Create internal signals that request register updates.
 		write_requested = Signal(name = f'write_requested_{address:02x}')
-		write_value     = Signal(8, name = f'write_value_{address:02x}')
-		write_done      = Signal(name = f'write_done_{address:02x}')
+		write_accepted  = Signal(name = f'write_accepted_{address:02x}')
 
 		self._register_signals[address] = {
 			'write_requested': write_requested,
-			'write_value':     write_value,
-			'write_done':      write_done
+			'write_value':     value,
+			'write_accepted':  write_accepted
 		}
 
-		# If we've just finished a write, update our current register value.
-		with m.If(write_done):
-			m.d.usb += current_register_value.eq(write_value),
+		# If the register window has just taken our write, it now holds our current value.
+		with m.If(write_accepted):
+			m.d.usb += current_register_value.eq(value)
 
 		# If we have a mismatch between the requested and actual register value,
 		# request a write of the new value.
 		m.d.comb += write_requested.eq(current_register_value != value)
-		with m.If(current_register_value != value):
-			m.d.usb += write_value.eq(value)
 
 	def populate_ulpi_registers(self, m):
 		''' Creates translator objects that map our control signals to ULPI registers. '''
@@ -517,24 +557,18 @@ class ULPIControlTranslator(Elaboratable):
 			with conditional(signals['write_requested']):
 
 				# Keep track of when we'll be okay to start a write:
-				# it's when there's a write request, we're not complete.
-				# and the bus is idle. We'll use this below.
-				request_write = \
-					signals['write_requested'] & \
-					~self.register_window.done & \
-					self.bus_idle
+				# it's when there's a write request, and the bus is idle.
+				request_write = signals['write_requested'] & self.bus_idle
 
 				m.d.comb += [
 
 					# Control signals.
-					signals['write_done'].eq(self.register_window.done),
+					signals['write_accepted'].eq(request_write & self.register_window.ready),
 
 					# Register window signals.
 					self.register_window.address.eq(address),
 					self.register_window.write_data.eq(signals['write_value']),
 					self.register_window.write_request.eq(request_write),
-
-					# Status signals
 				]
 				m.d.usb += self.busy.eq(request_write | self.register_window.busy)
 
@@ -907,7 +941,9 @@ class UTMITranslator(Elaboratable, UTMIInterface):
 			self.tx_ready.eq(transmit_translator.tx_ready),
 
 			# Connect our inputs to our control translator / register window.
-			control_translator.bus_idle.eq(~transmit_translator.busy),
+			# Hold off any new register writes while a packet is waiting to be sent; so that
+			# queued register traffic can delay a transmission by no more than one write.
+			control_translator.bus_idle.eq(~transmit_translator.busy & ~self.tx_valid),
 			register_window.ulpi_data_in.eq(self.ulpi.data.i),
 			register_window.ulpi_dir.eq(self.ulpi.dir),
 			register_window.ulpi_next.eq(self.ulpi.nxt),
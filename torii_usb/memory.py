@@ -11,6 +11,8 @@ This module contains definitions of memory units that work well for USB applicat
 from torii.hdl      import Elaboratable, Memory, Module, Signal
 from torii.hdl.xfrm import DomainRenamer
 
+from .utils.cdc     import synchronize_count
+
 class TransactionalizedFIFO(Elaboratable):
 	'''
 	Transactionalized, buffer first-in-first-out queue.
@@ -210,3 +212,217 @@ class TransactionalizedFIFO(Elaboratable):
 			m = DomainRenamer(sync = self.domain)(m)
 
 		return m
+
+class AsyncTransactionalizedFIFO(Elaboratable):
+	'''
+	Transactionalized, dual-clock first-in-first-out queue.
+
+	This FIFO provides the same interface as :class:`TransactionalizedFIFO`; but its write side lives in
+	``w_domain``, and its read side in ``r_domain``. Only committed positions cross between domains; so
+	uncommitted writes are never visible to the reader, and uncommitted reads never free space for the writer.
+
+	Committed positions are crossed as Gray-coded counts; each domain publishes its committed count one step
+	per cycle, so a commit of ``n`` entries becomes visible on the other side after roughly ``n`` cycles plus
+	the synchronizer latency. :attr:``space_available`` and :attr:``full`` are valid in ``w_domain``;
+	:attr:``empty`` is valid in ``r_domain``. Both views are conservative.
+
+	Attributes
+	----------
+	read_data: Signal(width), output
+		Contains the next byte in the FIFO. Valid only when :attr:``empty`` is false.
+	read_en: Signal(), input
+		When asserted, the current :attr:``read_data`` will move to the next value. Should only be asserted
+		when :attr:``empty`` is false.
+	read_commit: Signal(), input
+		Strobe; when asserted, any reads performed since the last commit will be 'finalized'.
+	read_discard: Signal(), input
+		Strobe; when asserted; any reads since the last commit will be 'undone'.
+	empty: Signal(), output
+		Asserted when no committed data is available to read.
+
+	write_data: Signal(width), input
+		Holds the byte to be added to the FIFO when :attr:``write_en`` is asserted.
+	write_en: Signal(), input
+		When asserted, the current :attr:``write_data`` will be added to the FIFO; but will not be ready for read
+		until :attr:``write_commit`` is asserted. Should only be asserted when :attr:``full`` is false.
+	write_commit: Signal(), input
+		Strobe; when asserted, any writes performed since the last commit will be 'finalized'.
+	write_discard: Signal(), input
+		Strobe; when asserted; any writes since the last commit will be 'undone'.
+	full: Signal(), output
+		Asserted when no space is available for writes in the FIFO.
+
+	space_available: Signal(range(0, depth + 1)), output
+		Indicates the amount of space available in the FIFO, as seen from the write domain.
+
+	Parameters
+	----------
+	width: int
+		The width of each entry in the FIFO.
+	depth: int
+		The number of allowed entries in the FIFO.
+	name: str
+		The name of the relevant FIFO; to produce nicer debug output.
+		If not provided, Torii will attempt auto-detection.
+	w_domain: str
+		The name of the domain the write side of this FIFO should exist in.
+	r_domain: str
+		The name of the domain the read side of this FIFO should exist in.
+	'''
+
+	def __init__(self, *, width, depth, name = None, w_domain = 'write', r_domain = 'read'):
+		self.width    = width
+		self.depth    = depth
+		self.name     = name
+		self.w_domain = w_domain
+		self.r_domain = r_domain
+
+		#
+		# I/O port
+		#
+		self.read_data        = Signal(width)
+		self.read_en          = Signal()
+		self.read_commit      = Signal()
+		self.read_discard     = Signal()
+		self.empty            = Signal()
+
+		self.write_data       = Signal(width)
+		self.write_en         = Signal()
+		self.write_commit     = Signal()
+		self.write_discard    = Signal()
+		self.full             = Signal()
+
+		self.space_available  = Signal(range(0, depth + 1))
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Our addresses wrap around at our depth; but the counts we exchange between domains need
+		# to wrap at a power of two for Gray coding to work, and need enough range to tell 'full' from 'empty'.
+		address_range = range(0, self.depth)
+		count_width   = self.depth.bit_length()
+
+		#
+		# Core internal 'backing store'.
+		#
+		memory = Memory(width = self.width, depth = self.depth, name = self.name)
+		m.submodules.read_port  = read_port  = memory.read_port(domain = self.r_domain, transparent = False)
+		m.submodules.write_port = write_port = memory.write_port(domain = self.w_domain)
+
+		m.d.comb += [
+			self.read_data.eq(read_port.data),
+
+			write_port.data.eq(self.write_data),
+			write_port.en.eq(self.write_en & ~self.full)
+		]
+
+		#
+		# Write port.
+		#
+		committed_write_pointer = Signal(address_range)
+		current_write_pointer   = Signal(address_range)
+		m.d.comb += write_port.addr.eq(current_write_pointer)
+
+		next_write_pointer      = Signal.like(current_write_pointer)
+		with m.If(current_write_pointer == self.depth - 1):
+			m.d.comb += next_write_pointer.eq(0)
+		with m.Else():
+			m.d.comb += next_write_pointer.eq(current_write_pointer + 1)
+
+		committed_write_count   = Signal(count_width)
+		current_write_count     = Signal(count_width)
+
+		with m.If(self.write_en & ~self.full):
+			m.d[self.w_domain] += [
+				current_write_pointer.eq(next_write_pointer),
+				current_write_count.eq(current_write_count + 1),
+			]
+
+		with m.If(self.write_commit):
+			m.d[self.w_domain] += [
+				committed_write_pointer.eq(current_write_pointer),
+				committed_write_count.eq(current_write_count),
+			]
+
+		with m.If(self.write_discard):
+			m.d[self.w_domain] += [
+				current_write_pointer.eq(committed_write_pointer),
+				current_write_count.eq(committed_write_count),
+			]
+
+		# A commit can advance our count by many entries at once; which would break the Gray code crossing.
+		# Instead, we publish a count that steps towards our committed count one entry per cycle.
+		published_write_count = Signal(count_width)
+		with m.If(published_write_count != committed_write_count):
+			m.d[self.w_domain] += published_write_count.eq(published_write_count + 1)
+
+		#
+		# Read port.
+		#
+		committed_read_pointer = Signal(address_range)
+		current_read_pointer   = Signal(address_range)
+
+		next_read_pointer      = Signal.like(current_read_pointer)
+		with m.If(current_read_pointer == self.depth - 1):
+			m.d.comb += next_read_pointer.eq(0)
+		with m.Else():
+			m.d.comb += next_read_pointer.eq(current_read_pointer + 1)
+
+		committed_read_count   = Signal(count_width)
+		current_read_count     = Signal(count_width)
+
+		# As with our single-clock FIFO, our memory takes a single cycle to provide its read output;
+		# so we'll update its address 'one cycle in advance'.
+		with m.If(self.read_en & ~self.empty):
+			m.d.comb += read_port.addr.eq(next_read_pointer)
+		with m.Else():
+			m.d.comb += read_port.addr.eq(current_read_pointer)
+
+		with m.If(self.read_en & ~self.empty):
+			m.d[self.r_domain] += [
+				current_read_pointer.eq(next_read_pointer),
+				current_read_count.eq(current_read_count + 1),
+			]
+
+		with m.If(self.read_commit):
+			m.d[self.r_domain] += [
+				committed_read_pointer.eq(current_read_pointer),
+				committed_read_count.eq(current_read_count),
+			]
+
+		with m.If(self.read_discard):
+			m.d[self.r_domain] += [
+				current_read_pointer.eq(committed_read_pointer),
+				current_read_count.eq(committed_read_count),
+			]
+
+		published_read_count = Signal(count_width)
+		with m.If(published_read_count != committed_read_count):
+			m.d[self.r_domain] += published_read_count.eq(published_read_count + 1)
+
+		#
+		# Clock domain crossing.
+		#
+		write_count_for_reader = synchronize_count(
+			m, published_write_count, i_domain = self.w_domain, o_domain = self.r_domain
+		)
+		read_count_for_writer = synchronize_count(
+			m, published_read_count, i_domain = self.r_domain, o_domain = self.w_domain
+		)
+
+		#
+		# FIFO status.
+		#
+
+		# We're empty if we've read everything the writer has let us see.
+		m.d.comb += self.empty.eq(current_read_count == write_count_for_reader)
+
+		# Our space available is our depth, less anything written and not yet released by the reader.
+		entries_used = Signal(count_width)
+		m.d.comb += [
+			entries_used.eq(current_write_count - read_count_for_writer),
+			self.space_available.eq(self.depth - entries_used),
+			self.full.eq(entries_used == self.depth),
+		]
+
+		return m
@@ -235,7 +235,7 @@ def token_packet(pid, addr, endp):
 	'''
 	assert addr < 128, addr
 	assert endp < 2**4, endp
-	assert pid in (PID.OUT, PID.IN, PID.SETUP), pid
+	assert pid in (PID.OUT, PID.IN, PID.SETUP, PID.PING), pid
 	token = encode_pid(pid)
 	token += f'{addr:07b}'[::-1]  # 7 bits address
 	token += f'{endp:04b}'[::-1]  # 4 bits endpoint
@@ -252,6 +252,30 @@ class USBDeviceTest(ToriiUSBGatewareTestCase):
 		yield from self.interpacket_delay()
 		return USBPacketID.from_byte(data)
 
+	def ping_transaction(self, endpoint = 0):
+		'''
+		Performs a PING transaction; asking an OUT endpoint whether it has room for a packet.
+
+		Parameters
+		----------
+		endpoint
+			The endpoint to query.
+
+		Returns
+		-------
+			The handshake received.
+
+		'''
+
+		# Issue the PING token...
+		yield from self.send_token(USBPacketID.PING, endpoint = endpoint)
+
+		# ... and receive our handshake.
+		data = yield from self.receive_packet()
+
+		yield from self.interpacket_delay()
+		return USBPacketID.from_byte(data)
+
 	def out_transfer(self, *octets, endpoint = 0, data_pid = USBPacketID.DATA0, max_packet_size = 64):
 		'''
 		Performs an OUT transfer.
@@ -282,8 +306,15 @@ class USBDeviceTest(ToriiUSBGatewareTestCase):
 		# we'll add a ZLP.
 		send_zlp = (len(octets) % max_packet_size) == 0
 
+		# Set when the device accepts a packet with a NYET; meaning we should PING it
+		# until it has room before sending another [USB 2.0: 8.5.1].
+		should_ping = False
+
 		while to_send:
 
+			if should_ping:
+				yield from self.ping_until_ready(endpoint)
+
 			# Pull a packet out of the send queue...
 			packet = to_send[0:max_packet_size]
 
@@ -298,6 +329,8 @@ class USBDeviceTest(ToriiUSBGatewareTestCase):
 			if handshake == USBPacketID.NAK:
 				continue
 
+			should_ping = (handshake == USBPacketID.NYET)
+
 			# Otherwise, advance in the stream...
 			to_send = to_send[max_packet_size:]
 
@@ -306,12 +339,24 @@ class USBDeviceTest(ToriiUSBGatewareTestCase):
 
 		# If we're going to send a ZLP, send it.
 		if send_zlp:
+			if should_ping:
+				yield from self.ping_until_ready(endpoint)
+
 			handshake = USBPacketID.NAK
 			while handshake == USBPacketID.NAK:
 				handshake = yield from self.out_transaction(endpoint = endpoint, data_pid = data_pid)
 
 		return handshake
 
+	def ping_until_ready(self, endpoint = 0):
+		''' Issues PING transactions until the given OUT endpoint ACKs; indicating it has room for a packet. '''
+
+		naks = 0
+
+		while (yield from self.ping_transaction(endpoint = endpoint)) == USBPacketID.NAK:
+			naks += 1
+			self.assertLess(naks, self.MAX_NAKS)
+
 	def in_transaction(self, endpoint = 0, data_pid = None, handshake = USBPacketID.ACK):
 		'''
 		Performs an IN transaction.
@@ -7,14 +7,16 @@
 ''' Pre-made gateware that implements CDC-ACM serial. '''
 
 from torii.hdl                          import Elaboratable, Module, Signal
+from torii.hdl.ast                      import Operator
 from torii.lib.stream.simple            import StreamInterface
 
 from usb_construct.emitters             import DeviceDescriptorCollection
 from usb_construct.emitters.descriptors import cdc
-from usb_construct.types                import USBRequestType
+from usb_construct.types                import USBDirection, USBRequestType
 
 from ..usb2.device                      import USBDevice
 from ..usb2.endpoints.stream            import USBStreamInEndpoint, USBStreamOutEndpoint
+from ..request                          import SetupPacket
 from ..usb2.request                     import StallOnlyRequestHandler, USBRequestHandler
 
 class ACMRequestHandlers(USBRequestHandler):
@@ -61,7 +63,10 @@ class ACMRequestHandlers(USBRequestHandler):
 					with m.If(interface.status_requested | interface.data_requested):
 						m.d.comb += interface.handshakes_out.stall.eq(1)
 
-				return m
+		return m
+
+	def handler_condition(self, setup: SetupPacket) -> Operator:
+		return setup.type == USBRequestType.CLASS
 
 class USBSerialDevice(Elaboratable):
 	''' Device that acts as a CDC-ACM 'serial converter'.
@@ -74,9 +79,9 @@ class USBSerialDevice(Elaboratable):
 		When asserted, the USB-to-serial device will be presented to the host
 		and allowed to communicate.
 	rx: StreamInterface(), output stream
-		A stream carrying data received from the host.
+		A stream carrying data received from the host. Lives in ``stream_domain``.
 	tx: StreamInterface(), input stream
-		A stream carrying data to be transmitted to the host.
+		A stream carrying data to be transmitted to the host. Lives in ``stream_domain``.
 
 	Parameters
 	----------
@@ -97,6 +102,9 @@ class USBSerialDevice(Elaboratable):
 
 	max_packet_size: int in {64, 246, 512}, optional
 		The maximum packet size for communications.
+	stream_domain: str, optional
+		The name of the domain our ``rx`` and ``tx`` streams live in. If this isn't ``usb``, our data
+		endpoints' buffers cross data to and from this domain. Defaults to ``usb``.
 	'''
 
 	_STATUS_ENDPOINT_NUMBER = 3
@@ -104,7 +112,7 @@ class USBSerialDevice(Elaboratable):
 
 	def __init__(
 		self, *, bus, idVendor, idProduct, manufacturer_string = 'Torii-USB', product_string = 'USB-to-serial',
-		serial_number = None, max_packet_size = 64
+		serial_number = None, max_packet_size = 64, stream_domain = 'usb'
 	):
 
 		self._bus                 = bus
@@ -114,6 +122,7 @@ class USBSerialDevice(Elaboratable):
 		self._product_string      = product_string
 		self._serial_number       = serial_number
 		self._max_packet_size     = max_packet_size
+		self._stream_domain       = stream_domain
 
 		#
 		# I/O port
@@ -215,21 +224,23 @@ class USBSerialDevice(Elaboratable):
 			endpoint_number = self._STATUS_ENDPOINT_NUMBER,
 			max_packet_size = self._max_packet_size
 		)
-		usb.add_endpoint(serial_status_ep)
+		usb.add_endpoint(serial_status_ep, endpoint_number = self._STATUS_ENDPOINT_NUMBER, direction = USBDirection.IN)
 
 		# Create an endpoint for serial rx...
 		serial_rx_endpoint = USBStreamOutEndpoint(
 			endpoint_number = self._DATA_ENDPOINT_NUMBER,
 			max_packet_size = self._max_packet_size,
+			stream_domain   = self._stream_domain
 		)
-		usb.add_endpoint(serial_rx_endpoint)
+		usb.add_endpoint(serial_rx_endpoint, endpoint_number = self._DATA_ENDPOINT_NUMBER, direction = USBDirection.OUT)
 
 		# ... and one for serial tx.
 		serial_tx_endpoint = USBStreamInEndpoint(
 			endpoint_number = self._DATA_ENDPOINT_NUMBER,
-			max_packet_size = self._max_packet_size
+			max_packet_size = self._max_packet_size,
+			stream_domain   = self._stream_domain
 		)
-		usb.add_endpoint(serial_tx_endpoint)
+		usb.add_endpoint(serial_tx_endpoint, endpoint_number = self._DATA_ENDPOINT_NUMBER, direction = USBDirection.IN)
 
 		# Connect up our I/O.
 		m.d.comb += [
@@ -8,9 +8,269 @@
 
 import unittest
 
-from torii.hdl      import Cat
+from torii.hdl               import Cat, Elaboratable, Module, Signal
+from torii.lib.stream.simple import StreamInterface
 
-from ..usb2.request import USBRequestHandler
+from ...memory               import TransactionalizedFIFO
+from ..stream                import USBInStreamInterface, USBOutStreamBoundaryDetector, USBOutStreamInterface
+from ..usb2.request          import USBRequestHandler
+from ..usb2.transfer         import USBInTransferManager
+
+class ControlStreamTransmitter(Elaboratable):
+	''' Gateware that sends the data stage of a control request from a stream.
+
+	The data stage is broken into max-packet-size packets, and buffered so that each packet can be sent at
+	full rate, and re-sent if the host doesn't receive it. IN tokens are NAK'd until a packet is ready.
+
+	Attributes
+	----------
+	stream: StreamInterface, input stream
+		The data to send. ``first`` is ignored; and ``last`` can be used to end the data stage early, with
+		a short packet. No more than :attr:`length` bytes are consumed; and data is only consumed while
+		:attr:`active` is high.
+
+	active: Signal(), input
+		Held high while the request's data stage should be sent. Any buffered data is discarded while low.
+	length: Signal(16), input
+		The maximum number of bytes to send; usually the request's ``wLength``.
+
+	data_requested: Signal(), input
+		Strobe; indicates the host is asking us for a data packet.
+	new_token: Signal(), input
+		Strobe; indicates a new token has been received.
+	ack_received: Signal(), input
+		Strobe; indicates the host has ACK'd the last packet we sent.
+
+	tx: USBInStreamInterface, output stream
+		The packets to send.
+	nak: Signal(), output
+		Strobe; requests a NAK be sent, as we don't yet have a packet ready.
+
+	Parameters
+	----------
+	max_packet_size: int
+		The maximum packet size of the control endpoint. Defaults to 64.
+	buffer_count: int
+		The number of max-packet-size buffers to use. Defaults to 2.
+	'''
+
+	def __init__(self, *, max_packet_size = 64, buffer_count = 2):
+		self._max_packet_size = max_packet_size
+		self._buffer_count    = buffer_count
+
+		#
+		# I/O port
+		#
+		self.stream         = StreamInterface()
+
+		self.active         = Signal()
+		self.length         = Signal(16)
+
+		self.data_requested = Signal()
+		self.new_token      = Signal()
+		self.ack_received   = Signal()
+
+		self.tx             = USBInStreamInterface()
+		self.nak            = Signal()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.transfer_manager = transfer_manager = USBInTransferManager(
+			self._max_packet_size, buffer_count = self._buffer_count
+		)
+
+		# Keep track of how much of our data stage we've consumed from our stream.
+		position    = Signal.like(self.length)
+		data_left   = self.active & (position != self.length)
+		end_of_data = (position + 1 == self.length)
+
+		in_stream  = transfer_manager.transfer_stream
+		byte_taken = self.stream.valid & self.stream.ready
+
+		m.d.comb += [
+			# Feed our transfer manager from our stream; ending our transfer once we've reached our length.
+			in_stream.valid.eq(self.stream.valid & data_left),
+			in_stream.data.eq(self.stream.data),
+			in_stream.last.eq(self.stream.last | end_of_data),
+			self.stream.ready.eq(in_stream.ready & data_left),
+
+			# We'll only act while we're active; and we'll drop anything left over once we're done.
+			transfer_manager.active.eq(self.active),
+			transfer_manager.discard.eq(~self.active),
+
+			# End on a short packet, so the host knows if our data stage ends early.
+			transfer_manager.generate_zlps.eq(1),
+
+			# Our control endpoint only lets us know about IN tokens that are ready to be responded to.
+			transfer_manager.tokenizer.is_in.eq(1),
+			transfer_manager.tokenizer.ready_for_response.eq(self.data_requested),
+			transfer_manager.tokenizer.new_token.eq(self.new_token),
+			transfer_manager.handshakes_in.ack.eq(self.ack_received),
+
+			self.tx.stream_eq(transfer_manager.packet_stream),
+			self.nak.eq(transfer_manager.handshakes_out.nak),
+		]
+
+		with m.If(~self.active):
+			m.d.usb += position.eq(0)
+		with m.Elif(byte_taken):
+			m.d.usb += position.eq(position + 1)
+
+		return m
+
+class ControlStreamReceiver(Elaboratable):
+	''' Gateware that receives the data stage of a control request into a stream.
+
+	Each packet is buffered until it's known to be valid; at which point it's ACK'd, and made available on our
+	stream. If a packet doesn't fit in our buffer, it's NAK'd; so the host will re-send it once it's likely
+	there's space.
+
+	Attributes
+	----------
+	stream: StreamInterface, output stream
+		The data received. ``last`` is asserted on the last byte of the data stage; which is either the byte
+		that reaches :attr:`length`, or the last byte of a short packet.
+
+	active: Signal(), input
+		Held high while the request's data stage should be received.
+	length: Signal(16), input
+		The number of bytes to expect; usually the request's ``wLength``.
+	idle: Signal(), output
+		High when all of the data received has been consumed from :attr:`stream`.
+
+	rx: USBOutStreamInterface, input stream
+		The data packets received from the host.
+	rx_ready_for_response: Signal(), input
+		Strobe; indicates that a valid packet has been received, and it's time to respond.
+	rx_invalid: Signal(), input
+		Strobe; indicates that the packet being received was corrupted.
+
+	ack: Signal(), output
+		Strobe; requests an ACK be sent, as we've accepted a packet.
+	nak: Signal(), output
+		Strobe; requests a NAK be sent, as we didn't have room for a packet.
+
+	Parameters
+	----------
+	max_packet_size: int
+		The maximum packet size of the control endpoint. Defaults to 64.
+	buffer_size: int, optional
+		The size of our receive buffer, in bytes. Defaults to two packets.
+	'''
+
+	def __init__(self, *, max_packet_size = 64, buffer_size = None):
+		self._max_packet_size = max_packet_size
+		self._buffer_size     = buffer_size if buffer_size is not None else max_packet_size * 2
+
+		if self._buffer_size < max_packet_size:
+			raise ValueError(f'Buffer size must be at least the max packet size, {max_packet_size}')
+
+		#
+		# I/O port
+		#
+		self.stream                = StreamInterface()
+
+		self.active                = Signal()
+		self.length                = Signal(16)
+		self.idle                  = Signal()
+
+		self.rx                    = USBOutStreamInterface()
+		self.rx_ready_for_response = Signal()
+		self.rx_invalid            = Signal()
+
+		self.ack                   = Signal()
+		self.nak                   = Signal()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Add first and last to our receive stream, so we can see when each packet ends; which also strips off
+		# its CRC.
+		m.submodules.boundary_detector = boundary_detector = USBOutStreamBoundaryDetector()
+		m.d.comb += self.rx.stream_eq(boundary_detector.unprocessed_stream)
+
+		rx      = boundary_detector.processed_stream
+		rx_last = boundary_detector.last
+
+		m.submodules.fifo = fifo = TransactionalizedFIFO(
+			width = 9, depth = self._buffer_size, name = 'rx_fifo', domain = 'usb'
+		)
+
+		# Keep track of how much we've received in our current packet, and in the data stage as a whole.
+		packet_length = Signal(range(self._max_packet_size + 1))
+		received      = Signal.like(self.length)
+		overflow      = Signal()
+
+		receiving    = self.active & rx.valid & rx.next
+		short_packet = rx_last & (packet_length + 1 != self._max_packet_size)
+		end_of_data  = (received + packet_length + 1 == self.length)
+
+		m.d.comb += [
+			fifo.write_data.eq(Cat(rx.data, short_packet | end_of_data)),
+			fifo.write_en.eq(receiving & ~fifo.full),
+		]
+
+		with m.If(fifo.write_en):
+			m.d.usb += packet_length.eq(packet_length + 1)
+
+		# If we don't have room for our whole packet, we'll have to drop it, and have the host try again.
+		with m.If(receiving & fifo.full):
+			m.d.usb += overflow.eq(1)
+
+		# Once our packet's been received in full, keep it if it fit; and discard it otherwise.
+		with m.If(self.active & self.rx_ready_for_response):
+			with m.If(overflow):
+				m.d.comb += [
+					fifo.write_discard.eq(1),
+					self.nak.eq(1),
+				]
+			with m.Else():
+				m.d.comb += [
+					fifo.write_commit.eq(1),
+					self.ack.eq(1),
+				]
+				m.d.usb += received.eq(received + packet_length)
+
+			m.d.usb += [
+				packet_length.eq(0),
+				overflow.eq(0),
+			]
+
+		# Corrupted packets are discarded; the host will re-send them without us needing to respond.
+		with m.Elif(self.active & self.rx_invalid):
+			m.d.comb += fifo.write_discard.eq(1)
+			m.d.usb += [
+				packet_length.eq(0),
+				overflow.eq(0),
+			]
+
+		with m.If(~self.active):
+			m.d.comb += fifo.write_discard.eq(1)
+			m.d.usb += [
+				packet_length.eq(0),
+				received.eq(0),
+				overflow.eq(0),
+			]
+
+		# Our stream comes directly out of our FIFO. We know a ``first`` immediately follows a ``last``.
+		start_of_data = Signal(reset = 1)
+		with m.If(self.stream.valid & self.stream.ready):
+			m.d.usb += start_of_data.eq(self.stream.last)
+
+		m.d.comb += [
+			self.stream.valid.eq(~fifo.empty),
+			self.stream.data.eq(fifo.read_data[0:8]),
+			self.stream.first.eq(start_of_data),
+			self.stream.last.eq(fifo.read_data[8]),
+
+			fifo.read_en.eq(self.stream.valid & self.stream.ready),
+			fifo.read_commit.eq(1),
+
+			self.idle.eq(fifo.empty),
+		]
+
+		return m
 
 class ControlRequestHandler(USBRequestHandler):
 	''' Pure-gateware USB control request handler. '''
@@ -84,5 +344,77 @@ class ControlRequestHandler(USBRequestHandler):
 			m.d.comb += self.interface.handshakes_out.ack.eq(1)
 			m.next = 'IDLE'
 
+	def handle_stream_in_request(self, m, transmitter: ControlStreamTransmitter):
+		'''
+		Fills in the current state with a request whose data stage is read from a stream.
+
+		The data stage can span any number of packets; up to the request's ``wLength``.
+
+		Parameters
+		----------
+		transmitter
+			The :class:`ControlStreamTransmitter` we're working with. Its stream should be connected to
+			the source of our data.
+
+		'''
+		interface = self.interface
+
+		# Connect our transmitter up to our request, and let it handle our data stage...
+		m.d.comb += [
+			transmitter.active.eq(1),
+			transmitter.length.eq(interface.setup.length),
+			transmitter.data_requested.eq(interface.data_requested),
+			transmitter.new_token.eq(interface.tokenizer.new_token),
+			transmitter.ack_received.eq(interface.handshakes_in.ack),
+
+			transmitter.tx.attach(interface.tx),
+			interface.handshakes_out.nak.eq(transmitter.nak),
+		]
+
+		# ... and ACK our status stage.
+		with m.If(interface.status_requested):
+			m.d.comb += interface.handshakes_out.ack.eq(1)
+			m.next = 'IDLE'
+
+	def handle_stream_out_request(self, m, receiver: ControlStreamReceiver):
+		'''
+		Fills in the current state with a request whose data stage is written to a stream.
+
+		The data stage can span any number of packets; up to the request's ``wLength``.
+
+		Parameters
+		----------
+		receiver
+			The :class:`ControlStreamReceiver` we're working with. Its stream should be connected to
+			the sink for our data.
+
+		'''
+		interface = self.interface
+
+		# Connect our receiver up to our request, and let it handle our data stage...
+		m.d.comb += [
+			receiver.active.eq(1),
+			receiver.length.eq(interface.setup.length),
+
+			interface.rx.connect(receiver.rx),
+			receiver.rx_ready_for_response.eq(interface.rx_ready_for_response),
+			receiver.rx_invalid.eq(interface.rx_invalid),
+
+			interface.handshakes_out.ack.eq(receiver.ack),
+			interface.handshakes_out.nak.eq(receiver.nak),
+		]
+
+		# ... and once all of our data has been consumed, respond to our status stage with a ZLP [USB 8.5.3].
+		# Until then, we'll NAK; so the host knows not to consider the request complete.
+		with m.If(interface.status_requested):
+			with m.If(receiver.idle):
+				m.d.comb += self.send_zlp()
+			with m.Else():
+				m.d.comb += interface.handshakes_out.nak.eq(1)
+
+		# Once our ZLP is ACK'd, we're done.
+		with m.If(interface.handshakes_in.ack):
+			m.next = 'IDLE'
+
 if __name__ == '__main__':
 	unittest.main(warnings = 'ignore')
@@ -10,17 +10,23 @@ import os
 import unittest
 from collections.abc        import Callable, Iterable
 
-from torii.hdl              import Module, Signal
-from torii.hdl.ast          import Cat, Value, Operator
-
-from usb_construct.emitters import DeviceDescriptorCollection
-from usb_construct.types    import USBRequestRecipient, USBRequestType, USBStandardRequests
-
-from ...stream.generator    import StreamSerializer
-from ..stream               import USBInStreamInterface
-from ..usb2.descriptor      import GetDescriptorHandlerBlock, GetDescriptorHandlerDistributed
-from .                      import SetupPacket
-from .control               import ControlRequestHandler
+from torii.hdl                                    import Module, Mux, Signal
+from torii.hdl.ast                                import Cat, Value, Operator
+
+from usb_construct.emitters                       import DeviceDescriptorCollection
+from usb_construct.emitters.descriptors.microsoft import PlatformDescriptorCollection
+from usb_construct.types                          import USBRequestRecipient, USBRequestType, USBStandardRequests
+from usb_construct.types.descriptors.microsoft    import MicrosoftRequests
+
+from ...stream.generator                          import StreamSerializer
+from ..stream                                     import USBInStreamInterface
+from ..usb2.descriptor                            import (
+	DescriptorLocation, DescriptorROMLayout, DescriptorWriteInterface, GetDescriptorHandlerBlock,
+	GetDescriptorHandlerDistributed
+)
+from .                                            import SetupPacket
+from .control                                     import ControlRequestHandler
+from .windows                                     import WindowsRequestHandler
 
 class StandardRequestHandler(ControlRequestHandler):
 	''' Pure-gateware USB setup request handler. Implements the standard requests required for enumeration.
@@ -35,17 +41,44 @@ class StandardRequestHandler(ControlRequestHandler):
 		Collection of functions that determine if a given packet will be handled by this request handler.
 	avoid_blockram: int, optional
 		If True, placing data into block RAM will be avoided.
+	compact_descriptors: bool, optional
+		If True, and descriptors are placed into block RAM, they're packed and deduplicated into as small
+		a ROM as possible; and descriptor indexes need not be consecutive. See :class:`GetDescriptorHandlerBlock`.
+	windows_descriptors: PlatformDescriptorCollection, optional
+		If provided, this handler also responds to Microsoft OS 2.0 ``GET_DESCRIPTOR_SET`` vendor requests
+		with these descriptor sets; which are stored alongside our standard descriptors, and sent by the same
+		logic. This replaces a separate :class:`WindowsRequestHandler`, and its descriptor memory.
+	writable_descriptors: bool, optional
+		If True, our descriptors are kept in block RAM that fabric logic can patch through :attr:`descriptor_write`;
+		at addresses found with :meth:`descriptor_location`. Can't be combined with ``avoid_blockram`` or
+		``compact_descriptors``.
+
+	Attributes
+	----------
+	descriptor_write: DescriptorWriteInterface
+		Interface for patching our descriptors; only used if ``writable_descriptors`` is set.
 
 	'''
 
 	def __init__(
 		self, descriptors: DeviceDescriptorCollection, max_packet_size = 64, avoid_blockram = None,
-		blacklist: Iterable[Callable[[SetupPacket], Value]] = ()
+		blacklist: Iterable[Callable[[SetupPacket], Value]] = (), compact_descriptors = False,
+		windows_descriptors: PlatformDescriptorCollection | None = None, writable_descriptors = False
 	):
-		self.descriptors      = descriptors
-		self._max_packet_size = max_packet_size
-		self._avoid_blockram  = avoid_blockram
-		self._blacklist = blacklist
+		self.descriptors           = descriptors
+		self._max_packet_size      = max_packet_size
+		self._avoid_blockram       = avoid_blockram
+		self._blacklist            = blacklist
+		self._compact_descriptors  = compact_descriptors
+		self._windows_descriptors  = windows_descriptors
+		self._writable_descriptors = writable_descriptors
+
+		# Writable descriptors need to live in block RAM; so they take precedence over the environment,
+		# but not over an explicit request to avoid it.
+		if self._writable_descriptors:
+			if self._avoid_blockram:
+				raise ValueError('Writable descriptors cannot be used when avoiding block RAM')
+			self._avoid_blockram = False
 
 		# If we don't have a value for avoiding blockrams; defer to the environment.
 		if self._avoid_blockram is None:
@@ -53,6 +86,31 @@ class StandardRequestHandler(ControlRequestHandler):
 
 		super().__init__()
 
+		#
+		# I/O port
+		#
+		self.descriptor_write = DescriptorWriteInterface()
+
+	def _create_block_handler(self):
+		''' Creates the block RAM get descriptor handler we use when not avoiding block RAM. '''
+		return GetDescriptorHandlerBlock(
+			self.descriptors, compact = self._compact_descriptors, descriptor_sets = self._windows_descriptors,
+			writable = self._writable_descriptors
+		)
+
+	def descriptor_location(self, type_number, index = 0) -> DescriptorLocation:
+		''' Finds where a given descriptor is stored, for patching through :attr:`descriptor_write`.
+
+		See :meth:`DescriptorROMLayout.descriptor_location`.
+		'''
+
+		if not self._writable_descriptors:
+			raise ValueError('Descriptor locations are only available for writable descriptors')
+
+		# Writable descriptors are never compact; so this matches the layout of our block handler's memory.
+		layout = DescriptorROMLayout(self.descriptors, descriptor_sets = self._windows_descriptors)
+		return layout.descriptor_location(type_number, index)
+
 	def elaborate(self, platform):
 		m = Module()
 		interface = self.interface
@@ -66,15 +124,23 @@ class StandardRequestHandler(ControlRequestHandler):
 		# Submodules
 		#
 		if self._avoid_blockram:
-			descriptor_handler_type = GetDescriptorHandlerDistributed
+			get_descriptor_handler = GetDescriptorHandlerDistributed(
+				self.descriptors, descriptor_sets = self._windows_descriptors
+			)
 		else:
-			descriptor_handler_type = GetDescriptorHandlerBlock
+			get_descriptor_handler = self._create_block_handler()
+
+			if self._writable_descriptors:
+				m.d.comb += self.descriptor_write.connect(get_descriptor_handler.descriptor_write)
 
-		# Handler for Get Descriptor requests; responds with our various fixed descriptors.
-		m.submodules.get_descriptor = get_descriptor_handler = descriptor_handler_type(self.descriptors)
+		# Handler for Get Descriptor requests; responds with our various fixed descriptors. If we're also
+		# handling Windows descriptor set requests, they're read from the same handler, selected by vendor code.
+		m.submodules.get_descriptor = get_descriptor_handler
+		reading_descriptor_set = Signal()
 		m.d.comb += [
-			get_descriptor_handler.value.eq(setup.value),
+			get_descriptor_handler.value.eq(Mux(reading_descriptor_set, setup.request - 1, setup.value)),
 			get_descriptor_handler.length.eq(setup.length),
+			get_descriptor_handler.descriptor_set.eq(reading_descriptor_set),
 		]
 
 		# Handler for various small-constant-response requests (GET_CONFIGURATION, GET_STATUS).
@@ -90,16 +156,14 @@ class StandardRequestHandler(ControlRequestHandler):
 			# IDLE -- not handling any active request
 			with m.State('IDLE'):
 
+				# Start at the beginning of our next / fresh GET_DESCRIPTOR request.
 				m.d.usb += [
-					# Start at the beginning of our next / fresh GET_DESCRIPTOR request.
 					get_descriptor_handler.start_position.eq(0),
-
-					# Always start our responses with DATA1 pids, per [USB 2.0: 8.5.3].
-					self.interface.tx_data_pid.eq(1)
+					reading_descriptor_set.eq(0),
 				]
 
 				# If we've received a new setup packet, handle it.
-				with m.If(setup.received & self.handler_condition(setup)):
+				with m.If(setup.received & self._is_standard_request(setup)):
 
 					# Only handle setup packet if not blacklisted
 					blacklisted = Cat(f(setup) for f in self._blacklist).any()
@@ -121,6 +185,21 @@ class StandardRequestHandler(ControlRequestHandler):
 							with m.Default():
 								m.next = 'UNHANDLED'
 
+				# Windows descriptor set requests are sent just as our own descriptors are [MS-OS2.0: 6.3].
+				if self._windows_descriptors is not None:
+					with m.Elif(setup.received & WindowsRequestHandler.handler_condition(setup)):
+						is_get_descriptor_set = (
+							setup.is_in_request &
+							(setup.index == MicrosoftRequests.GET_DESCRIPTOR_SET) &
+							(setup.value == 0)
+						)
+
+						with m.If(is_get_descriptor_set):
+							m.d.usb += reading_descriptor_set.eq(1)
+							m.next = 'GET_DESCRIPTOR'
+						with m.Else():
+							m.next = 'UNHANDLED'
+
 			# GET_STATUS -- Fetch the device's status.
 			# For now, we'll always return '0'.
 			with m.State('GET_STATUS'):
@@ -166,9 +245,6 @@ class StandardRequestHandler(ControlRequestHandler):
 						# received, and move forward...
 						get_descriptor_handler.start_position.eq(next_start_position),
 
-						# ... and toggle our data PID.
-						self.interface.tx_data_pid.eq(~self.interface.tx_data_pid),
-
 						# We've got the ACK we expected.
 						expecting_ack.eq(0),
 					]
@@ -198,11 +274,18 @@ class StandardRequestHandler(ControlRequestHandler):
 
 		return m
 
-	def handler_condition(self, setup: SetupPacket) -> Operator:
+	def _is_standard_request(self, setup: SetupPacket) -> Operator:
+		''' Returns a conditional indicating whether the given setup packet is a standard request we handle. '''
 		return (
 			(setup.type == USBRequestType.STANDARD) &
 			(setup.recipient == USBRequestRecipient.DEVICE)
 		)
 
+	def handler_condition(self, setup: SetupPacket) -> Operator:
+		if self._windows_descriptors is None:
+			return self._is_standard_request(setup)
+
+		return self._is_standard_request(setup) | WindowsRequestHandler.handler_condition(setup)
+
 if __name__ == '__main__':
 	unittest.main(warnings = 'ignore')
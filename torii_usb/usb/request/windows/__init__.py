@@ -30,6 +30,10 @@ class WindowsRequestHandler(USBRequestHandler):
 	request type set to vendor-specific. It handles this and responds in accordance with the
 	`Microsoft OS 2.0 Descriptors Specification <https://docs.microsoft.com/en-us/windows-hardware/drivers/usbcon/microsoft-os-2-0-descriptors-specification>`_.
 
+	If the device also uses a :py:class:`torii_usb.usb.request.standard.StandardRequestHandler`, passing these
+	descriptors to it as ``windows_descriptors`` instead stores them in the same memory as the device's standard
+	descriptors, and sends them with the same logic; which avoids this handler's separate descriptor memory.
+
 	The main thing this handler has to deal with are the vendor requests to the device as the
 	:py:class:`usb_construct.emitters.descriptors.microsoft.PlatformDescriptorCollection` and
 	descriptor system deals with the the rest of the spec.
@@ -41,12 +45,9 @@ class WindowsRequestHandler(USBRequestHandler):
 	  we enter the :code:`GET_DESCRIPTOR_SET` state,
 	* In the :code:`GET_DESCRIPTOR_SET` state, when the data phase begins, we set our instance of the
 	  :py:class:`dragonBoot.windows.descriptorSet.GetDescriptorSetHandler` running,
-	* While the requested descriptor has not yet been delivered in full, we track data phase acks and:
-
-		* When each complete packet is acked, update state in the
-		  :py:class:`dragonBoot.windows.descriptorSet.GetDescriptorSetHandler` to keep the data flowing.
-		* Keep the transmit :code:`DATA0`/:code:`DATA1` packet ID value correct.
-
+	* While the requested descriptor has not yet been delivered in full, we track data phase acks; and when
+	  each complete packet is acked, update state in the
+	  :py:class:`dragonBoot.windows.descriptorSet.GetDescriptorSetHandler` to keep the data flowing.
 	* Once the data phase concludes and the status phase begins, we then respond to the host with an all-clear ACK
 	* If either the :py:class:`dragonBoot.windows.descriptorSet.GetDescriptorSetHandler` or the status phase
 	  concludes, we return to :code:`IDLE`.
@@ -92,12 +93,8 @@ class WindowsRequestHandler(USBRequestHandler):
 					with m.If(setup.received):
 						with m.Switch(setup.index):
 							with m.Case(MicrosoftRequests.GET_DESCRIPTOR_SET):
-								m.d.usb += [
-									# Start at the beginning of our next / fresh GET_DESCRIPTOR request.
-									descriptorSetHandler.startPosition.eq(0),
-									# Always start our responses with DATA1 pids, per [USB 2.0: 8.5.3].
-									self.interface.tx_data_pid.eq(1)
-								]
+								# Start at the beginning of our next / fresh GET_DESCRIPTOR request.
+								m.d.usb += descriptorSetHandler.startPosition.eq(0)
 								m.next = 'CHECK_GET_DESCRIPTOR_SET'
 							with m.Default():
 								m.next = 'UNHANDLED'
@@ -126,7 +123,6 @@ class WindowsRequestHandler(USBRequestHandler):
 						nextStartPosition = descriptorSetHandler.startPosition + self._maxPacketSize
 						m.d.usb += [
 							descriptorSetHandler.startPosition.eq(nextStartPosition),
-							self.interface.tx_data_pid.eq(~self.interface.tx_data_pid),
 							expectingAck.eq(0),
 						]
 
@@ -145,7 +141,8 @@ class WindowsRequestHandler(USBRequestHandler):
 
 		return m
 
-	def handler_condition(self, setup: SetupPacket):
+	@staticmethod
+	def handler_condition(setup: SetupPacket):
 		''' Defines the setup packet conditions under which the request handler will operate.
 
 		This is used to gate the handler's operation and forms part of the condition under which
@@ -6,7 +6,7 @@
 
 ''' Low-level USB transceiver gateware -- control transfer components. '''
 
-from torii.hdl              import Cat, Elaboratable, Module
+from torii.hdl              import Elaboratable, Module, Mux, Signal
 from torii.hdl.dsl          import Operator
 
 from usb_construct.emitters import DeviceDescriptorCollection
@@ -25,6 +25,11 @@ class USBControlEndpoint(Elaboratable):
 	This class is used by creating one or more *request handler* modules; which define how requests
 	are handled. These handlers can be bound using :attr:`add_request_handler`.
 
+	Data stages can span any number of packets. The endpoint keeps track of the DATA0/DATA1 sequence itself
+	[USB2.0: 8.6]; toggling our transmit PID each time the host ACKs a packet we've sent, and our expected PID
+	each time a handler ACKs a packet it's received. Received packets that repeat the previous PID are ACK'd
+	without being passed to the handlers, as they indicate the host missed our previous ACK.
+
 	For convenience, this module can also automatically be populated with a ``StandardRequestHandler``
 	via the :attr:`add_standard_request_handlers`.
 
@@ -44,6 +49,8 @@ class USBControlEndpoint(Elaboratable):
 			Debug parameter. If true, this module will operate without external components;
 			i.e. without an internal data-CRC generator, or tokenizer. In this case, tokenizer
 			and timer should be set to None; and will be ignored.
+		max_packet_size: int, optional
+			The maximum packet size of this endpoint, in bytes. Defaults to 64.
 	'''
 
 	def __init__(self, *, utmi, endpoint_number = 0, standalone = False, max_packet_size = 64):
@@ -64,6 +71,11 @@ class USBControlEndpoint(Elaboratable):
 		# List of the modules that will handle control requests.
 		self._request_handlers: list[USBRequestHandler] = []
 
+	@property
+	def max_packet_size(self) -> int:
+		''' The maximum packet size of this control endpoint, in bytes. '''
+		return self._max_packet_size
+
 	def add_request_handler(self, request_handler):
 		''' Adds a ControlRequestHandler module to this control endpoint.
 
@@ -121,17 +133,22 @@ class USBControlEndpoint(Elaboratable):
 			m.submodules.token_detector = tokenizer = USBTokenDetector(utmi = self.utmi)
 			m.d.comb += tokenizer.interface.connect(interface.tokenizer)
 
+		#
+		# Request handler logic.
+		#
+
+		# Multiplex the output of each of our request handlers.
+		m.submodules.request_mux = request_mux = USBRequestHandlerMultiplexer()
+		request_handler = request_mux.shared
+
 		#
 		# Create the stall request handler to handle otherwise-unhandled conditions for the
 		# control endpoint. This relies on the user having implemented their handling
-		# conditions properly using USBRequestHandler.handler_condition().
+		# conditions properly using USBRequestHandler.handler_condition(); which our mux
+		# evaluates once per SETUP packet.
 		#
 		def stall_condition(setup: SetupPacket) -> Operator:
-			return ~Cat(
-				handler.handler_condition(setup)
-				for handler in self._request_handlers
-				if not isinstance(handler, StallOnlyRequestHandler)
-			).any()
+			return request_mux.unhandled
 		self.add_request_handler(StallOnlyRequestHandler(stall_condition = stall_condition))
 
 		#
@@ -151,14 +168,6 @@ class USBControlEndpoint(Elaboratable):
 
 		]
 
-		#
-		# Request handler logic.
-		#
-
-		# Multiplex the output of each of our request handlers.
-		m.submodules.request_mux = request_mux = USBRequestHandlerMultiplexer()
-		request_handler = request_mux.shared
-
 		# Add each of our handlers to the endpoint; and add it to our mux.
 		for handler in self._request_handlers:
 
@@ -169,7 +178,13 @@ class USBControlEndpoint(Elaboratable):
 
 			# ... and add it.
 			m.submodules[name] = handler
-			request_mux.add_interface(handler.interface)
+
+			# Any stall-only handlers have their own conditions, and so are always connected; everything
+			# else is only connected once it's been selected by a SETUP packet.
+			if isinstance(handler, StallOnlyRequestHandler):
+				request_mux.add_interface(handler.interface)
+			else:
+				request_mux.add_interface(handler.interface, condition = handler.handler_condition)
 
 		# ... and hook it up.
 		m.d.comb += [
@@ -188,18 +203,28 @@ class USBControlEndpoint(Elaboratable):
 			request_handler.active_config.eq(interface.active_config),
 			interface.config_changed.eq(request_handler.config_changed),
 			interface.new_config.eq(request_handler.new_config),
-
-			# Fix our data PIDs to DATA1, for now, as we don't support multi-packet responses, yet.
-			# Per [USB2.0: 8.5.3], the first packet of the DATA or STATUS phase always carries a DATA1 PID.
-			interface.tx_pid_toggle.eq(request_handler.tx_data_pid)
 		]
 
+		#
+		# Data PID sequencing.
+		#
+
+		# Per [USB2.0: 8.5.3], the first packet of the DATA or STATUS phase always carries a DATA1 PID;
+		# after which our DATA stage alternates between DATA0 and DATA1 with each successful transaction.
+		data_pid      = Signal(reset = 1)
+		next_data_pid = Signal()
+
+		with m.If(setup_decoder.packet.received):
+			m.d.usb += data_pid.eq(1)
+		with m.Elif(next_data_pid):
+			m.d.usb += data_pid.eq(~data_pid)
+
 		#
 		# Core control request handler.
 		# Behavior dictated by [USB2, 8.5.3].
 		#
 		endpoint_targeted = (self.interface.tokenizer.endpoint == self._endpoint_number)
-		with m.FSM(domain = 'usb'):
+		with m.FSM(domain = 'usb') as fsm:
 
 			# SETUP -- The 'SETUP' phase of a control request. We'll wait here
 			# until the SetupDetector detects a valid setup packet for us.
@@ -234,6 +259,10 @@ class USBControlEndpoint(Elaboratable):
 					# Notify the request handler to prepare a response.
 					m.d.comb += request_handler.data_requested.eq(1)
 
+				# Once the host acknowledges a packet we've sent, move on to the next PID.
+				with m.If(endpoint_targeted & interface.tokenizer.is_in & interface.handshakes_in.ack):
+					m.d.comb += next_data_pid.eq(1)
+
 				# Once we get an OUT token, we should move on to the STATUS stage. [USB2, 8.5.3]
 				with m.If(
 					endpoint_targeted & interface.tokenizer.new_token &
@@ -248,13 +277,25 @@ class USBControlEndpoint(Elaboratable):
 				# and the most recent token pointed to our endpoint. This ensures the
 				# request handler only ever sees data events related to it; this simplifies
 				# the request handler logic significantly.
-				with m.If(endpoint_targeted & interface.tokenizer.is_out):
+				targeting_endpoint = endpoint_targeted & interface.tokenizer.is_out
+				expected_pid_match = (interface.rx_pid_toggle == data_pid)
+
+				with m.If(targeting_endpoint & expected_pid_match):
 					m.d.comb += [
 						interface.rx.connect(request_handler.rx),
 						request_handler.rx_ready_for_response.eq(interface.rx_ready_for_response),
 						request_handler.rx_invalid.eq(interface.rx_invalid),
 					]
 
+					# Once our handler accepts a packet, expect the next PID.
+					with m.If(interface.rx_ready_for_response & request_handler.handshakes_out.ack):
+						m.d.comb += next_data_pid.eq(1)
+
+				# If we see a repeat of the packet we've just accepted, the host missed our ACK. We'll ACK the
+				# packet again without accepting its data [USB2.0: 8.6.3].
+				with m.Elif(targeting_endpoint & interface.rx_ready_for_response):
+					m.d.comb += interface.handshakes_out.ack.eq(1)
+
 				# Once we get an IN token, we should move on to the STATUS stage. [USB2, 8.5.3]
 				with m.If(endpoint_targeted & interface.tokenizer.new_token & interface.tokenizer.is_in):
 					m.next = 'STATUS_IN'
@@ -290,4 +331,7 @@ class USBControlEndpoint(Elaboratable):
 				with m.If(endpoint_targeted & interface.tokenizer.ready_for_response & interface.tokenizer.is_ping):
 					m.d.comb += interface.handshakes_out.ack.eq(1)
 
+		# Our DATA stage uses our PID sequence; and our STATUS stage is always DATA1 [USB2.0: 8.5.3].
+		m.d.comb += interface.tx_pid_toggle.eq(Mux(fsm.ongoing('DATA_IN'), data_pid, 1))
+
 		return m
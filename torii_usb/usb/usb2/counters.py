@@ -0,0 +1,375 @@
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This file is part of Torii-USB.
+#
+
+''' Gateware for gathering per-endpoint link statistics, and reading them back over the control endpoint. '''
+
+from torii.hdl           import Cat, Elaboratable, Memory, Module, Mux, Signal
+
+from usb_construct.types import USBDirection, USBRequestRecipient, USBRequestType
+
+from ..request           import SetupPacket
+from .endpoint           import EndpointInterface
+from .request            import USBRequestHandler
+
+__all__ = (
+	'PerformanceCounterRequestHandler',
+	'USBPerformanceCounters',
+)
+
+class USBPerformanceCounters(Elaboratable):
+	''' Passively counts the traffic seen by each of a device's endpoint interfaces.
+
+	Each interface added gets a set of counters for the tokens addressed to it, the handshakes it issues,
+	the data bytes it moves, the packets it receives with a bad CRC, and the data packets it receives with the
+	same PID toggle as the last one it accepted (i.e. retransmissions from a host that missed our handshake).
+	The device as a whole also gets a count of SOFs, and of bus resets.
+
+	Every counter saturates at its maximum value, rather than wrapping. When :attr:`capture` is strobed, every
+	counter is copied into a snapshot in the same cycle; and if :attr:`clear` is also high, the live counters
+	restart from zero. Events occurring in the capture cycle are counted towards the next snapshot, so no events
+	are lost between reads.
+
+	The snapshot is read out a byte at a time: :attr:`snapshot_data` presents its next byte, and strobing
+	:attr:`snapshot_next` shifts the following one into place. This keeps the readout a single byte wide, however
+	many interfaces are counted. The snapshot is laid out as consecutive little-endian counters of ``counter_width``
+	bits; first the SOF and bus reset counts, followed by a block of :attr:`ENDPOINT_COUNTERS` for each interface,
+	in the order they were added.
+
+	The PID toggle check only tracks what the host sends, so it may count a single mismatch after an endpoint's
+	toggle is reset by a ``CLEAR_FEATURE(ENDPOINT_HALT)``; and is meaningless for isochronous endpoints.
+
+	Attributes
+	----------
+	sof_detected: Signal(), input
+		Strobe indicating a SOF was received.
+	bus_reset: Signal(), input
+		Strobe indicating a bus reset occurred.
+	config_changed: Signal(), input
+		Strobe indicating the device's configuration changed; which resets every endpoint's data toggle.
+
+	capture: Signal(), input
+		Strobe; copies the counters into our snapshot, and restarts its readout from its first byte.
+	clear: Signal(), input
+		If high while :attr:`capture` is strobed, the counters are cleared as they are captured.
+	snapshot_data: Signal(8), output
+		The next byte of the most recently captured snapshot.
+	snapshot_next: Signal(), input
+		Strobe; moves :attr:`snapshot_data` on to the snapshot's following byte.
+
+	Parameters
+	----------
+	counter_width: int
+		The width of each counter, in bits. Must be a multiple of 8. Defaults to 32.
+	'''
+
+	ENDPOINT_COUNTERS = ('tokens', 'acks', 'naks', 'stalls', 'nyets', 'bytes', 'crc_errors', 'toggle_mismatches')
+
+	def __init__(self, *, counter_width = 32):
+		if counter_width <= 0 or counter_width % 8:
+			raise ValueError(f'Counter width must be a positive multiple of 8, not {counter_width}')
+
+		self._counter_width = counter_width
+		self._interfaces    = []
+
+		#
+		# I/O port
+		#
+		self.sof_detected   = Signal()
+		self.bus_reset      = Signal()
+		self.config_changed = Signal()
+
+		self.capture        = Signal()
+		self.clear          = Signal()
+		self.snapshot_data  = Signal(8)
+		self.snapshot_next  = Signal()
+
+	@property
+	def snapshot_length(self):
+		''' The length of :attr:`snapshot`, in bytes. '''
+		counter_count = 2 + len(self.ENDPOINT_COUNTERS) * len(self._interfaces)
+		return counter_count * (self._counter_width // 8)
+
+	def add_interface(self, interface: EndpointInterface, *, endpoint_number, direction = None):
+		''' Adds an EndpointInterface to be observed.
+
+		Parameters
+		----------
+		interface: EndpointInterface
+			The interface to be counted. It's only read from; so it can be shared with an endpoint multiplexer.
+		endpoint_number: int
+			The endpoint number the interface responds to.
+		direction: USBDirection, optional
+			The direction the interface responds to; or None if it handles both, as a control endpoint does.
+		'''
+
+		if endpoint_number not in range(16):
+			raise ValueError(f'Endpoint number must be between 0 and 15, not {endpoint_number}')
+
+		self._interfaces.append((interface, endpoint_number, direction))
+
+	def _add_counter(self, m, event, counters):
+		''' Creates a saturating counter for the given event strobe, and records it in ``counters``. '''
+
+		counter   = Signal(self._counter_width)
+		increment = event & ~counter.all()
+
+		with m.If(self.capture & self.clear):
+			m.d.usb += counter.eq(event)
+		with m.Else():
+			m.d.usb += counter.eq(counter + increment)
+
+		counters.append(counter)
+
+	def elaborate(self, platform):
+		m = Module()
+
+		counters = []
+
+		self._add_counter(m, self.sof_detected, counters)
+		self._add_counter(m, self.bus_reset, counters)
+
+		for interface, endpoint_number, direction in self._interfaces:
+			tokenizer = interface.tokenizer
+			handshakes = interface.handshakes_out
+
+			# Figure out whether each new token targets this interface. IN tokens address IN endpoints; while
+			# everything else addresses OUT endpoints.
+			matches_direction = {
+				None:             1,
+				USBDirection.IN:  tokenizer.is_in,
+				USBDirection.OUT: ~tokenizer.is_in,
+			}[direction]
+			token_seen = tokenizer.new_token & (tokenizer.endpoint == endpoint_number) & matches_direction
+
+			# The receive stream is shared by every endpoint; so we'll attribute any data packets to us only if
+			# the most recent OUT or SETUP token was ours.
+			receiving = Signal()
+			in_setup  = Signal()
+			with m.If(tokenizer.new_token):
+				m.d.usb += [
+					receiving.eq(token_seen & (tokenizer.is_out | tokenizer.is_setup)),
+					in_setup.eq(tokenizer.is_setup),
+				]
+
+			# Keep track of the PID toggle of the last data packet we accepted. A packet arriving with the same
+			# toggle means the host missed our handshake, and is re-sending it [USB 2.0: 8.6.4]. A SETUP always
+			# re-synchronizes a control endpoint, as does a bus reset or configuration change for everything else.
+			last_toggle     = Signal()
+			received_toggle = Signal()
+			toggle_known    = Signal()
+			toggle_mismatch = Signal()
+
+			with m.If(interface.rx_complete & receiving):
+				m.d.usb += received_toggle.eq(interface.rx_pid_toggle[0])
+				m.d.comb += toggle_mismatch.eq(
+					toggle_known & ~in_setup & (interface.rx_pid_toggle[0] == last_toggle)
+				)
+
+			with m.If(self.bus_reset | self.config_changed | (token_seen & tokenizer.is_setup)):
+				m.d.usb += toggle_known.eq(0)
+			with m.Elif(receiving & ~in_setup & (handshakes.ack | handshakes.nyet)):
+				m.d.usb += [
+					last_toggle.eq(received_toggle),
+					toggle_known.eq(1),
+				]
+
+			events = {
+				'tokens':            token_seen,
+				'acks':              handshakes.ack,
+				'naks':              handshakes.nak,
+				'stalls':            handshakes.stall,
+				'nyets':             handshakes.nyet,
+				'bytes': (
+					(interface.tx.valid & interface.tx.ready) |
+					(receiving & interface.rx.valid & interface.rx.next)
+				),
+				'crc_errors':        receiving & interface.rx_invalid,
+				'toggle_mismatches': toggle_mismatch,
+			}
+
+			for name in self.ENDPOINT_COUNTERS:
+				self._add_counter(m, events[name], counters)
+
+		# Capture our counters into a snapshot that shifts out a byte at a time; so its readout never needs a
+		# multiplexer that grows with our interface count.
+		snapshot = Signal(self.snapshot_length * 8)
+		m.d.comb += self.snapshot_data.eq(snapshot[0:8])
+
+		with m.If(self.capture):
+			m.d.usb += snapshot.eq(Cat(*counters))
+		with m.Elif(self.snapshot_next):
+			m.d.usb += snapshot.eq(snapshot >> 8)
+
+		return m
+
+class PerformanceCounterRequestHandler(USBRequestHandler):
+	''' Vendor request handler that reads out a :class:`USBPerformanceCounters` block.
+
+	The handler responds to a device-recipient vendor IN request with the given request number. On receipt of
+	the SETUP packet, the counters are captured in a single cycle; and the snapshot is returned as the request's
+	data stage, truncated to the request's ``wLength``. If ``wValue`` is 0, the counters are cleared as they are
+	captured; if it is 1, they're left running. Any other value, or an OUT request, is stalled.
+
+	As the snapshot can only be shifted out once, each data packet is also copied into a packet-sized buffer as
+	it's sent; so it can be sent again if the host doesn't acknowledge it.
+
+	Parameters
+	----------
+	counters: USBPerformanceCounters
+		The counters to read out.
+	request_number: int
+		The ``bRequest`` value the handler responds to.
+	max_packet_size: int
+		The maximum packet size of the control endpoint. Defaults to 64.
+	'''
+
+	def __init__(self, counters: USBPerformanceCounters, *, request_number, max_packet_size = 64):
+		if request_number not in range(256):
+			raise ValueError(f'Request number must be between 0 and 255, not {request_number}')
+
+		self._counters        = counters
+		self._request_number  = request_number
+		self._max_packet_size = max_packet_size
+
+		super().__init__()
+
+	def elaborate(self, platform):
+		m = Module()
+		interface = self.interface
+		setup     = interface.setup
+		tx        = interface.tx
+		counters  = self._counters
+
+		snapshot_length = counters.snapshot_length
+
+		# Where the current packet starts and ends within the snapshot, and the next byte to send.
+		packet_start  = Signal(range(snapshot_length + self._max_packet_size + 1))
+		position      = Signal.like(packet_start)
+		packet_offset = Signal(range(self._max_packet_size))
+		sending       = Signal()
+		expecting_ack = Signal()
+
+		# Set while we're re-sending a packet the host didn't acknowledge, from our copy of it.
+		replaying     = Signal()
+
+		packet_buffer = Memory(width = 8, depth = self._max_packet_size, name = 'packet_buffer')
+		m.submodules.buffer_write = buffer_write = packet_buffer.write_port(domain = 'usb')
+		m.submodules.buffer_read  = buffer_read  = packet_buffer.read_port(domain = 'usb', transparent = False)
+
+		response_length = Signal.like(packet_start)
+		packet_end      = Signal.like(packet_start)
+		packet_limit    = packet_start + self._max_packet_size
+
+		m.d.comb += [
+			response_length.eq(Mux(setup.length < snapshot_length, setup.length, snapshot_length)),
+			packet_end.eq(Mux(packet_limit < response_length, packet_limit, response_length)),
+			packet_offset.eq(position - packet_start),
+		]
+
+		with m.If(self.handler_condition(setup)):
+			with m.FSM(domain = 'usb'):
+
+				# IDLE -- not handling any active request
+				with m.State('IDLE'):
+
+					# If we've received a new setup packet, capture our counters straight away; so the values we
+					# return all come from the same cycle.
+					with m.If(setup.received):
+						with m.If(setup.is_in_request & (setup.value[1:] == 0)):
+							m.d.comb += [
+								counters.capture.eq(1),
+								counters.clear.eq(~setup.value[0]),
+							]
+							m.d.usb += [
+								packet_start.eq(0),
+								sending.eq(0),
+								expecting_ack.eq(0),
+							]
+							m.next = 'SEND_COUNTERS'
+						with m.Else():
+							m.next = 'UNHANDLED'
+
+				# SEND_COUNTERS -- send our snapshot, one packet per data-phase IN token
+				with m.State('SEND_COUNTERS'):
+					m.d.comb += [
+						tx.valid.eq(sending),
+						tx.data.eq(Mux(replaying, buffer_read.data, counters.snapshot_data)),
+						tx.first.eq(position == packet_start),
+						tx.last.eq(position + 1 == packet_end),
+
+						# Keep a copy of each byte we send from our snapshot; and read our copy one byte ahead.
+						buffer_write.addr.eq(packet_offset),
+						buffer_write.data.eq(counters.snapshot_data),
+						buffer_read.addr.eq(packet_offset),
+					]
+
+					with m.If(interface.data_requested):
+						# If we've already sent everything, the host is waiting on a ZLP to end the data stage.
+						with m.If(packet_start < response_length):
+							m.d.comb += buffer_read.addr.eq(0)
+							m.d.usb  += [
+								position.eq(packet_start),
+								sending.eq(1),
+
+								# If our last packet was never acknowledged, this is the host asking for it again.
+								replaying.eq(expecting_ack),
+							]
+						with m.Else():
+							m.d.comb += self.send_zlp()
+
+						m.d.usb += expecting_ack.eq(1)
+
+					with m.If(sending & tx.ready):
+						m.d.comb += buffer_read.addr.eq(packet_offset + 1)
+						m.d.usb  += position.eq(position + 1)
+
+						with m.If(~replaying):
+							m.d.comb += [
+								buffer_write.en.eq(1),
+								counters.snapshot_next.eq(1),
+							]
+
+						with m.If(tx.last):
+							m.d.usb += sending.eq(0)
+
+					# Each time the host acknowledges a packet, move on to the next one.
+					with m.If(interface.handshakes_in.ack & expecting_ack):
+						m.d.usb += [
+							packet_start.eq(packet_limit),
+							expecting_ack.eq(0),
+						]
+
+					with m.If(interface.status_requested):
+						m.d.comb += interface.handshakes_out.ack.eq(1)
+						m.next = 'IDLE'
+
+				# UNHANDLED -- we've received a request we're not prepared to handle
+				with m.State('UNHANDLED'):
+
+					# When we next have an opportunity to stall, do so, and then return to idle.
+					with m.If(interface.data_requested | interface.status_requested):
+						m.d.comb += interface.handshakes_out.stall.eq(1)
+						m.next = 'IDLE'
+
+		return m
+
+	def handler_condition(self, setup: SetupPacket):
+		''' Defines the setup packet conditions under which the request handler will operate.
+
+		Parameters
+		----------
+		setup
+			A grouping of signals used to describe the most recent setup packet the control interface has seen.
+
+		Returns
+		-------
+		:py:class:`torii.hdl.ast.Operator`
+			A combinatorial operation defining the sum conditions under which this handler will operate.
+		'''
+		return (
+			(setup.type == USBRequestType.VENDOR) &
+			(setup.recipient == USBRequestRecipient.DEVICE) &
+			(setup.request == self._request_number)
+		)
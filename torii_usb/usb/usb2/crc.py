@@ -0,0 +1,121 @@
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This file is part of Torii-USB.
+#
+
+''' Parallel CRC generation for USB2 packets.
+
+Each CRC is held in its running form: an unreflected shift register, to which data is applied
+least-significant bit first, as it appears on the wire. Any number of data bits can be applied
+in a single step; the XOR network for each step is derived from the CRC's polynomial when the
+gateware is elaborated, rather than being written out by hand.
+'''
+
+from functools import cache
+
+from torii.hdl import Cat, Const, Value
+
+__all__ = (
+	'USB_CRC5_POLYNOMIAL',
+	'USB_CRC16_POLYNOMIAL',
+	'crc_data_term',
+	'crc_state_term',
+	'next_crc',
+	'usb_crc5',
+)
+
+#: The CRC-5 polynomial used to protect tokens; x^5 + x^2 + 1.
+USB_CRC5_POLYNOMIAL  = 0b0_0101
+#: The CRC-16 polynomial used to protect data packets; x^16 + x^15 + x^2 + 1.
+USB_CRC16_POLYNOMIAL = 0x8005
+
+@cache
+def _crc_update_terms(width: int, polynomial: int, data_width: int) -> tuple[tuple[int, int], ...]:
+	''' Computes which bits of a running CRC, and of its input data, determine each bit of its next value.
+
+	Returns
+	-------
+	tuple[tuple[int, int], ...]
+		A ``(crc_mask, data_mask)`` pair for each bit of the next CRC value; each bit of which is the XOR
+		of the current CRC bits and data bits set in its masks.
+	'''
+
+	# Track each bit of our shift register as a linear combination of our inputs, and clock in our data serially.
+	register = [(1 << bit, 0) for bit in range(width)]
+
+	for data_bit in range(data_width):
+		feedback_crc, feedback_data = register[width - 1]
+		feedback_data ^= 1 << data_bit
+
+		shifted  = [(0, 0), *register[:-1]]
+		register = [
+			(crc ^ feedback_crc, data ^ feedback_data) if (polynomial >> bit) & 1 else (crc, data)
+			for bit, (crc, data) in enumerate(shifted)
+		]
+
+	return tuple(register)
+
+def _xor_selected(value: Value, mask: int) -> list[Value]:
+	''' Returns the bits of ``value`` selected by ``mask``. '''
+	return [value[bit] for bit in range(len(value)) if (mask >> bit) & 1]
+
+def next_crc(current_crc: Value, data: Value, *, polynomial: int) -> Value:
+	''' Computes the next value of a running CRC, after applying a given set of data bits.
+
+	Parameters
+	----------
+	current_crc: Value
+		The current value of the running CRC; its width sets the width of the CRC.
+	data: Value
+		The data to apply; least significant bit first. Can be any width.
+	polynomial: int
+		The CRC's generator polynomial, without its leading term.
+
+	Returns
+	-------
+	Value
+		The running CRC's next value.
+	'''
+
+	terms = _crc_update_terms(len(current_crc), polynomial, len(data))
+	return Cat(
+		Cat(*_xor_selected(current_crc, crc_mask), *_xor_selected(data, data_mask)).xor()
+		for crc_mask, data_mask in terms
+	)
+
+def crc_state_term(current_crc: Value, data_width: int, *, polynomial: int) -> Value:
+	''' Computes the contribution of a running CRC's current value to its value after ``data_width`` data bits.
+
+	XOR'ing this with :func:`crc_data_term` for the same data gives the result of :func:`next_crc`; which
+	allows the data term to be computed, and registered, ahead of the CRC it's applied to.
+	'''
+
+	terms = _crc_update_terms(len(current_crc), polynomial, data_width)
+	return Cat(Cat(*_xor_selected(current_crc, crc_mask)).xor() for crc_mask, _ in terms)
+
+def crc_data_term(data: Value, width: int, *, polynomial: int) -> Value:
+	''' Computes the contribution of a set of data bits to the next value of a ``width``-bit running CRC.
+
+	See :func:`crc_state_term`.
+	'''
+
+	terms = _crc_update_terms(width, polynomial, len(data))
+	return Cat(Cat(*_xor_selected(data, data_mask)).xor() for _, data_mask in terms)
+
+def usb_crc5(protected_bits: Value) -> Value:
+	''' Computes the USB CRC-5 of a set of bits; e.g. the 11 protected bits of a token.
+
+	Parameters
+	----------
+	protected_bits: Value
+		The bits to be protected; in the order they appear on the wire, least significant bit first.
+
+	Returns
+	-------
+	Value
+		The 5-bit CRC, in the form it's transmitted in.
+	'''
+
+	# The CRC register starts out as all ones; and is transmitted inverted, most significant bit first.
+	register = next_crc(Const(0b1_1111, 5), protected_bits, polynomial = USB_CRC5_POLYNOMIAL)
+	return ~register[::-1]
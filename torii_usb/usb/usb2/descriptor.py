@@ -7,15 +7,50 @@
 ''' Utilities for building USB descriptors into gateware. '''
 
 import functools
+import logging
+import math
 import struct
+from typing                                       import NamedTuple
 
-from torii.hdl                                import DomainRenamer, Elaboratable, Memory, Module, Signal
+from torii.hdl                                    import (
+	Cat, DomainRenamer, Elaboratable, Memory, Module, Mux, Record, Signal
+)
+from torii.hdl.rec                                import Direction
 
-from usb_construct.emitters.descriptors       import DeviceDescriptorCollection
-from usb_construct.types.descriptors.standard import StandardDescriptorNumbers
+from usb_construct.emitters.descriptors           import DeviceDescriptorCollection
+from usb_construct.emitters.descriptors.microsoft import PlatformDescriptorCollection
+from usb_construct.types.descriptors.standard     import StandardDescriptorNumbers
 
-from ...stream.generator                      import ConstantStreamGenerator
-from ..stream                                 import USBInStreamInterface
+from ...stream.generator                          import ConstantStreamGenerator
+from ..stream                                     import USBInStreamInterface
+
+log = logging.getLogger(__name__)
+
+class DescriptorWriteInterface(Record):
+	''' Record providing an interface for patching the contents of a writable descriptor memory.
+
+	Attributes
+	----------
+	address: Signal(16), input to descriptor memory
+		The byte address to be written; typically found using :meth:`GetDescriptorHandlerBlock.descriptor_location`.
+	data: Signal(8), input to descriptor memory
+		The byte to be written.
+	write: Signal(), input to descriptor memory
+		Strobe; writes :attr:`data` to :attr:`address`.
+	'''
+	address: Signal[16, Direction.FANOUT]
+	data: Signal[8, Direction.FANOUT]
+	write: Signal[1, Direction.FANOUT]
+
+class DescriptorLocation(NamedTuple):
+	''' Where a descriptor is stored; as returned by :meth:`GetDescriptorHandlerBlock.descriptor_location`. '''
+
+	#: The address of the descriptor's table entry; which holds its length, and then its data address, both big-endian.
+	entry_address: int
+	#: The address of the descriptor's first byte.
+	data_address: int
+	#: The length of the descriptor, in bytes.
+	length: int
 
 class USBDescriptorStreamGenerator(ConstantStreamGenerator):
 	''' Specialized stream generator for generating USB descriptor constants. '''
@@ -44,18 +79,23 @@ class GetDescriptorHandlerDistributed(Elaboratable):
 	Currently does not support descriptors in multiple languages.
 
 	I/O port:
-		I: value[16]  - The value field associated with the Get Descriptor request.
-						Contains the descriptor type and index.
-		I: length[16] - The length field associated with the Get Descriptor request.
-						Determines the maximum amount allowed in a response.
+		I: value[16]      - The value field associated with the Get Descriptor request.
+							Contains the descriptor type and index.
+		I: length[16]     - The length field associated with the Get Descriptor request.
+							Determines the maximum amount allowed in a response.
+		I: descriptor_set - If high, the low byte of ``value`` instead selects a descriptor set, by its
+							vendor code less one.
 
-		I: start      - Strobe that indicates when a descriptor should be transmitted.
+		I: start          - Strobe that indicates when a descriptor should be transmitted.
 
-		*: tx         - The USBInStreamInterface that streams our descriptor data.
-		O: stall      - Pulsed if a STALL handshake should be generated, instead of a response.
+		*: tx             - The USBInStreamInterface that streams our descriptor data.
+		O: stall          - Pulsed if a STALL handshake should be generated, instead of a response.
 	'''
 
-	def __init__(self, descriptor_collection: DeviceDescriptorCollection, max_packet_length = 64):
+	def __init__(
+		self, descriptor_collection: DeviceDescriptorCollection, max_packet_length = 64,
+		descriptor_sets: PlatformDescriptorCollection | None = None
+	):
 		'''
 		Parameters
 		----------
@@ -63,16 +103,21 @@ class GetDescriptorHandlerDistributed(Elaboratable):
 			The DeviceDescriptorCollection containing the descriptors
 			to use for this device.
 
+		descriptor_sets
+			Any Microsoft OS 2.0 descriptor sets to serve alongside our descriptors.
+
 		'''
 
 		self._descriptors = descriptor_collection
 		self._max_packet_length = max_packet_length
+		self._descriptor_sets = descriptor_sets
 
 		#
 		# I/O port
 		#
 		self.value          = Signal(16)
 		self.length         = Signal(16)
+		self.descriptor_set = Signal()
 
 		self.start          = Signal()
 		self.start_position = Signal(11)
@@ -108,7 +153,7 @@ class GetDescriptorHandlerDistributed(Elaboratable):
 		for type_number, index, raw_descriptor in self._descriptors:
 			# Create the generator...
 			generator = USBDescriptorStreamGenerator(raw_descriptor)
-			descriptor_generators[(type_number, index)] = generator
+			descriptor_generators[type_number << 8 | index] = generator
 
 			m.d.comb += [
 				generator.max_length.eq(length),
@@ -119,17 +164,29 @@ class GetDescriptorHandlerDistributed(Elaboratable):
 			type_ref = type_number.name if isinstance(type_number, StandardDescriptorNumbers) else type_number
 			setattr(m.submodules, f'USBDescriptorStreamGenerator({type_ref},{index})', generator)
 
+		# Create generators for any descriptor sets, which we'll select by vendor code, less one.
+		descriptor_sets = self._descriptor_sets.descriptors if self._descriptor_sets is not None else {}
+		for vendor_code, descriptor_set in descriptor_sets.items():
+			generator = USBDescriptorStreamGenerator(descriptor_set)
+			descriptor_generators[(1 << 16) | (vendor_code - 1)] = generator
+
+			m.d.comb += [
+				generator.max_length.eq(length),
+				generator.start_position.eq(self.start_position)
+			]
+			setattr(m.submodules, f'USBDescriptorStreamGenerator(set,{vendor_code})', generator)
+
 		#
 		# Connect up each of our generators.
 		#
 
-		with m.Switch(self.value):
+		with m.Switch(Cat(self.value, self.descriptor_set)):
 
 			# Generate a conditional interconnect for each of our items.
-			for (type_number, index), generator in descriptor_generators.items():
+			for selector, generator in descriptor_generators.items():
 
-				# If the value matches the given type number...
-				with m.Case(type_number << 8 | index):
+				# If the value matches the given type number and index...
+				with m.Case(selector):
 
 					# ... connect the relevant generator to our output.
 					m.d.comb += generator.stream.attach(self.tx)
@@ -141,23 +198,21 @@ class GetDescriptorHandlerDistributed(Elaboratable):
 
 		return m
 
-class GetDescriptorHandlerBlock(Elaboratable):
-	'''
-	Gateware that handles responding to GetDescriptor requests.
-
-	Currently does not support descriptors in multiple languages.
-
-	I/O port:
-		I: value[16]      - The value field associated with the Get Descriptor request.
-							Contains the descriptor type and index.
-		I: length[16]     - The length field associated with the Get Descriptor request.
-							Determines the maximum amount allowed in a response.
-
-		I: start          - Strobe that indicates when a descriptor should be transmitted.
-		I: start_position - Specifies the starting position of the descriptor data to be transmitted.
-
-		*: tx             - The USBInStreamInterface that streams our descriptor data.
-		O: stall          - Pulsed if a STALL handshake should be generated, instead of a response.
+class DescriptorROMLayout:
+	''' Lays out a collection of descriptors in the memory used by :class:`GetDescriptorHandlerBlock`.
+
+	This only computes the memory's contents; so it can be used to inspect a layout -- e.g. to find where
+	a descriptor is stored, or how large the memory will be -- without creating any gateware.
+
+	Parameters
+	----------
+	descriptor_collection: DeviceDescriptorCollection
+		The DeviceDescriptorCollection containing the descriptors to lay out.
+	compact: bool
+		If True, descriptors are packed at byte granularity and deduplicated, and descriptor
+		indexes need not be consecutive. Defaults to False.
+	descriptor_sets: PlatformDescriptorCollection, optional
+		Any Microsoft OS 2.0 descriptor sets to store alongside our descriptors.
 	'''
 
 	ELEMENT_SIZE = 4
@@ -165,42 +220,40 @@ class GetDescriptorHandlerBlock(Elaboratable):
 	COUNT_SIZE_BITS   = 16
 	ADDRESS_SIZE_BITS = 16
 
-	def __init__(self, descriptor_collection: DeviceDescriptorCollection, max_packet_length = 64, domain = 'usb'):
-		'''
-		Parameters
-		----------
-		descriptor_collection: DeviceDescriptorCollection
-			The DeviceDescriptorCollection containing the descriptors to use for this device.
-
-		max_packet_length: int
-			Maximum packet length.
-
-		domain: string
-			The clock domain this generator should belong to. Defaults to 'usb'.
-
-		'''
-
-		self._descriptors        = descriptor_collection
-		self._max_packet_length  = max_packet_length
-		self._domain             = domain
-
-		#
-		# I/O port
-		#
-		self.value          = Signal(16)
-		self.length         = Signal(16)
+	DESCRIPTOR_SET_TYPE = 0
 
-		self.start          = Signal()
-		self.start_position = Signal(11)
+	# The block RAM geometry used for our size report; by default, that of an iCE40 EBR, which holds
+	# 4 kbit and is at most 16 bits wide.
+	BLOCK_RAM_BITS  = 4096
+	BLOCK_RAM_WIDTH = 16
 
-		self.tx             = USBInStreamInterface()
-		self.stall          = Signal()
+	def __init__(
+		self, descriptor_collection: DeviceDescriptorCollection, *, compact = False,
+		descriptor_sets: PlatformDescriptorCollection | None = None
+	):
+		self._descriptors     = descriptor_collection
+		self._compact         = compact
+		self._descriptor_sets = descriptor_sets
 
 	@classmethod
 	def _align_to_element_size(cls, n):
 		''' Returns a given number rounded up to the next 'aligned' element size. '''
 		return (n + (cls.ELEMENT_SIZE - 1)) // cls.ELEMENT_SIZE
 
+	def _descriptor_table(self):
+		''' Returns each of the descriptors we store, as a dictionary of {type_number: {index: raw_descriptor}}. '''
+
+		descriptors = {}
+		for type_number, index, raw_descriptor in self._descriptors:
+			descriptors.setdefault(type_number, {})[index] = bytes(raw_descriptor)
+
+		# Any descriptor sets are stored as a type of their own, indexed by their vendor code, less one.
+		if self._descriptor_sets is not None:
+			for vendor_code, descriptor_set in self._descriptor_sets.descriptors.items():
+				descriptors.setdefault(self.DESCRIPTOR_SET_TYPE, {})[vendor_code - 1] = bytes(descriptor_set)
+
+		return descriptors
+
 	def generate_rom_content(self):
 		'''
 		Generates the contents of the ROM used to hold descriptors.
@@ -245,15 +298,23 @@ class GetDescriptorHandlerBlock(Elaboratable):
 
 		...   Descriptor data
 
+		Compact layout
+		--------------
+
+		If the layout was created with ``compact`` set, the layout is the same, except:
+
+		Each index table has an entry for every index up to the largest used for its type, with entries
+		for unused indexes left as 0x00000000 (a length of 0). Descriptor data is packed at byte granularity,
+		so data addresses are unaligned byte addresses. Each distinct descriptor is stored once; and any
+		descriptor that appears within another, or within the overlap of two others, points into that data.
+
 		'''
 
-		# Get all descriptors and cache them in a dictionary, so that we can access them at will.
-		descriptors = {}
-		for type_number, index, raw_descriptor in self._descriptors:
-			if type_number not in descriptors:
-				descriptors[type_number] = {}
+		if self._compact:
+			return self._generate_compact_rom_content()
 
-			descriptors[type_number][index] = raw_descriptor
+		# Get all descriptors and cache them in a dictionary, so that we can access them at will.
+		descriptors = self._descriptor_table()
 
 		# For now, we only support layouts with consecutive indexes.
 		# Ensure this is the case.
@@ -353,6 +414,283 @@ class GetDescriptorHandlerBlock(Elaboratable):
 
 		return initializer, max_descriptor_size, max_type_number
 
+	@staticmethod
+	def _pack_descriptor_data(raw_descriptors):
+		''' Packs a collection of descriptors into a single byte string, storing repeated data only once.
+
+		Returns the packed data, and a dictionary mapping each descriptor to its offset in that data.
+		'''
+
+		data    = bytearray()
+		offsets = {}
+
+		# Place our longest descriptors first, so any shorter descriptor contained within them can reuse their data.
+		for raw_descriptor in sorted(set(raw_descriptors), key = len, reverse = True):
+
+			# If our descriptor already appears in our data, we can point straight at it...
+			offset = data.find(raw_descriptor)
+
+			# ... otherwise, we'll append it; overlapping as much of it as we can with the end of our existing data.
+			if offset == -1:
+				overlap = next(
+					(
+						length for length in range(min(len(raw_descriptor), len(data)) - 1, 0, -1)
+						if data.endswith(raw_descriptor[:length])
+					), 0
+				)
+				offset = len(data) - overlap
+				data += raw_descriptor[overlap:]
+
+			offsets[raw_descriptor] = offset
+
+		return bytes(data), offsets
+
+	def _generate_compact_rom_content(self):
+		''' Generates the contents of our ROM using the compact layout; see :meth:`generate_rom_content`. '''
+
+		descriptors = self._descriptor_table()
+
+		max_type_number     = max(descriptors.keys())
+		max_descriptor_size = max(len(raw) for indexes in descriptors.values() for raw in indexes.values())
+
+		# Our ROM starts with our table of type pointers, followed by each type's table of descriptor pointers...
+		table_base_addresses = {}
+		next_free_address    = (max_type_number + 1) * self.ELEMENT_SIZE
+		for type_number, indexes in sorted(descriptors.items()):
+			table_base_addresses[type_number] = next_free_address
+			next_free_address += (max(indexes.keys()) + 1) * self.ELEMENT_SIZE
+
+		# ... and then our packed descriptor data.
+		data, offsets = self._pack_descriptor_data(
+			raw for indexes in descriptors.values() for raw in indexes.values()
+		)
+		data_base_address = next_free_address
+
+		total_size = self._align_to_element_size(data_base_address + len(data)) * self.ELEMENT_SIZE
+		if total_size > (1 << self.ADDRESS_SIZE_BITS):
+			raise ValueError(
+				f'Descriptor ROM of {total_size} bytes exceeds the {self.ADDRESS_SIZE_BITS}-bit address space'
+			)
+
+		rom = bytearray(total_size)
+		rom[data_base_address:data_base_address + len(data)] = data
+
+		for type_number, indexes in descriptors.items():
+			table_base_address = table_base_addresses[type_number]
+
+			# Fill in our type pointer...
+			type_base_address = type_number * self.ELEMENT_SIZE
+			rom[type_base_address:type_base_address + self.ELEMENT_SIZE] = struct.pack(
+				'>HH', max(indexes.keys()) + 1, table_base_address
+			)
+
+			# ... and each of its descriptor pointers.
+			for index, raw_descriptor in indexes.items():
+				index_base_address = table_base_address + index * self.ELEMENT_SIZE
+				rom[index_base_address:index_base_address + self.ELEMENT_SIZE] = struct.pack(
+					'>HH', len(raw_descriptor), data_base_address + offsets[raw_descriptor]
+				)
+
+		initializer = [
+			struct.unpack('>I', rom[i:i + self.ELEMENT_SIZE])[0] for i in range(0, total_size, self.ELEMENT_SIZE)
+		]
+
+		return initializer, max_descriptor_size, max_type_number
+
+	def descriptor_location(self, type_number, index = 0) -> DescriptorLocation:
+		''' Finds where a given descriptor is stored in our memory.
+
+		Parameters
+		----------
+		type_number: int
+			The type of the descriptor to locate; or :attr:`DESCRIPTOR_SET_TYPE` for a descriptor set.
+		index: int
+			The index of the descriptor to locate; or, for a descriptor set, its vendor code less one.
+
+		Returns
+		-------
+		DescriptorLocation
+			The byte addresses of the descriptor's table entry and data, and its length.
+		'''
+
+		rom_content, _, max_type_number = self.generate_rom_content()
+
+		# Follow our table of tables to the descriptor's table entry...
+		if type_number <= max_type_number:
+			count, table_address = divmod(rom_content[type_number], 1 << self.ADDRESS_SIZE_BITS)
+		else:
+			count, table_address = 0, 0
+
+		if index >= count:
+			raise ValueError(f'No descriptor of type {type_number} with index {index} is stored')
+
+		# ... and then read it.
+		entry_address        = table_address + index * self.ELEMENT_SIZE
+		length, data_address = divmod(rom_content[entry_address // self.ELEMENT_SIZE], 1 << self.ADDRESS_SIZE_BITS)
+
+		if length == 0:
+			raise ValueError(f'No descriptor of type {type_number} with index {index} is stored')
+
+		return DescriptorLocation(entry_address, data_address, length)
+
+	def rom_size_report(self):
+		''' Reports the size of the ROM that will hold our descriptors.
+
+		Returns
+		-------
+		dict
+			A dictionary containing the total size of our descriptors (``descriptor_bytes``), the size of the ROM
+			that holds them and their tables (``rom_bytes``), and the number of block RAMs of the geometry given by
+			:attr:`BLOCK_RAM_BITS` and :attr:`BLOCK_RAM_WIDTH` that the ROM occupies (``block_rams``).
+		'''
+
+		rom_content, _, _ = self.generate_rom_content()
+		return self.size_report(rom_content)
+
+	def size_report(self, rom_content):
+		''' Builds our :meth:`rom_size_report` from already-generated ROM content. '''
+
+		rom_width = self.ELEMENT_SIZE * 8
+
+		# Each block RAM is at most BLOCK_RAM_WIDTH bits wide; so we'll need several side by side for each ROM word.
+		blocks_wide = math.ceil(rom_width / self.BLOCK_RAM_WIDTH)
+		block_depth = self.BLOCK_RAM_BITS // min(rom_width, self.BLOCK_RAM_WIDTH)
+
+		descriptor_bytes = sum(len(raw) for indexes in self._descriptor_table().values() for raw in indexes.values())
+
+		return {
+			'descriptor_bytes': descriptor_bytes,
+			'rom_bytes':        len(rom_content) * self.ELEMENT_SIZE,
+			'block_rams':       blocks_wide * math.ceil(len(rom_content) / block_depth),
+		}
+
+class GetDescriptorHandlerBlock(Elaboratable):
+	'''
+	Gateware that handles responding to GetDescriptor requests.
+
+	Currently does not support descriptors in multiple languages.
+
+	By default, each descriptor is stored 4-byte aligned, and each descriptor type must have consecutive
+	indexes. With ``compact`` set, descriptors are instead packed at byte granularity, with identical
+	descriptors -- and descriptors contained within others, such as common suffixes -- stored only once;
+	and each descriptor type's index table may have gaps, with requests for missing indexes stalled.
+
+	The size of the ROM is logged when the design is elaborated; and is available from :meth:`rom_size_report`.
+
+	Microsoft OS 2.0 descriptor sets can be stored in the same ROM, and read out through the same port, by
+	passing them as ``descriptor_sets``. They're stored under descriptor type :attr:`DESCRIPTOR_SET_TYPE`,
+	which no standard descriptor uses; and are selected by raising ``descriptor_set``.
+
+	With ``writable`` set, the descriptor memory also gets a byte-wide write port, on :attr:`descriptor_write`;
+	so fabric logic can patch descriptors -- e.g. filling in a per-unit serial number -- before the device is
+	connected. :meth:`descriptor_location` gives the addresses of each descriptor, and of its table entry; which
+	can be rewritten to shorten a descriptor, or to point it at an alternate descriptor stored elsewhere in the
+	memory. Descriptors can't be lengthened in place; so any that are to be patched should be created with
+	placeholder contents of their longest length.
+
+	I/O port:
+		I: value[16]      - The value field associated with the Get Descriptor request.
+							Contains the descriptor type and index.
+		I: length[16]     - The length field associated with the Get Descriptor request.
+							Determines the maximum amount allowed in a response.
+		I: descriptor_set - If high, the low byte of ``value`` instead selects a descriptor set, by its
+							vendor code less one.
+
+		I: start          - Strobe that indicates when a descriptor should be transmitted.
+		I: start_position - Specifies the starting position of the descriptor data to be transmitted.
+
+		*: tx             - The USBInStreamInterface that streams our descriptor data.
+		O: stall          - Pulsed if a STALL handshake should be generated, instead of a response.
+
+		*: descriptor_write - The DescriptorWriteInterface used to patch our memory, if it's writable.
+	'''
+
+	ELEMENT_SIZE = 4
+
+	COUNT_SIZE_BITS   = 16
+	ADDRESS_SIZE_BITS = 16
+
+	DESCRIPTOR_SET_TYPE = 0
+
+	def __init__(
+		self, descriptor_collection: DeviceDescriptorCollection, max_packet_length = 64, domain = 'usb',
+		compact = False, descriptor_sets: PlatformDescriptorCollection | None = None, writable = False
+	):
+		'''
+		Parameters
+		----------
+		descriptor_collection: DeviceDescriptorCollection
+			The DeviceDescriptorCollection containing the descriptors to use for this device.
+
+		max_packet_length: int
+			Maximum packet length.
+
+		domain: string
+			The clock domain this generator should belong to. Defaults to 'usb'.
+
+		compact: bool
+			If True, descriptors are packed at byte granularity and deduplicated, and descriptor
+			indexes need not be consecutive. Defaults to False.
+
+		descriptor_sets: PlatformDescriptorCollection, optional
+			Any Microsoft OS 2.0 descriptor sets to store alongside our descriptors.
+
+		writable: bool
+			If True, our descriptor memory can be patched at runtime via :attr:`descriptor_write`.
+			Can't be combined with ``compact``, which shares data between descriptors. Defaults to False.
+
+		'''
+
+		if compact and writable:
+			# We'll never be elaborated; so don't warn about it.
+			self._MustUse__silence = True
+			raise ValueError('A writable descriptor memory cannot use the compact layout, as it shares descriptor data')
+
+		self._max_packet_length  = max_packet_length
+		self._domain             = domain
+		self._compact            = compact
+		self._writable           = writable
+
+		self._layout = DescriptorROMLayout(
+			descriptor_collection, compact = compact, descriptor_sets = descriptor_sets
+		)
+
+		#
+		# I/O port
+		#
+		self.value          = Signal(16)
+		self.length         = Signal(16)
+		self.descriptor_set = Signal()
+
+		self.start          = Signal()
+		self.start_position = Signal(11)
+
+		self.tx             = USBInStreamInterface()
+		self.stall          = Signal()
+
+		self.descriptor_write = DescriptorWriteInterface()
+
+	def generate_rom_content(self):
+		''' Generates the contents of the ROM used to hold descriptors.
+
+		See :meth:`DescriptorROMLayout.generate_rom_content`.
+		'''
+		return self._layout.generate_rom_content()
+
+	def descriptor_location(self, type_number, index = 0) -> DescriptorLocation:
+		''' Finds where a given descriptor is stored in our memory; for use with :attr:`descriptor_write`.
+
+		See :meth:`DescriptorROMLayout.descriptor_location`.
+		'''
+		return self._layout.descriptor_location(type_number, index)
+
+	def rom_size_report(self):
+		''' Reports the size of the ROM that will hold our descriptors.
+
+		See :meth:`DescriptorROMLayout.rom_size_report`.
+		'''
+		return self._layout.rom_size_report()
+
 	def elaborate(self, platform) -> Module:
 		m = Module()
 
@@ -362,7 +700,7 @@ class GetDescriptorHandlerBlock(Elaboratable):
 
 		m.d.comb += [
 			index.eq(self.value.word_select(0, 8)),
-			type_number.eq(self.value.word_select(1, 8))
+			type_number.eq(Mux(self.descriptor_set, self.DESCRIPTOR_SET_TYPE, self.value.word_select(1, 8)))
 		]
 
 		#
@@ -370,13 +708,29 @@ class GetDescriptorHandlerBlock(Elaboratable):
 		#
 		rom_content, descriptor_max_length, max_type_index = self.generate_rom_content()
 
+		report = self._layout.size_report(rom_content)
+		log.info(
+			f'Descriptor ROM: {report["descriptor_bytes"]} bytes of descriptors in a {report["rom_bytes"]} byte ROM, '
+			f'using {report["block_rams"]} block RAM(s) ({"compact" if self._compact else "aligned"} layout)'
+		)
+
 		rom: Memory = Memory(width = 32, depth = len(rom_content), init = rom_content)
 		m.submodules.rom = rom
 		rom_read_port = rom.read_port(transparent = False)
 
+		# If we're writable, allow our memory to be patched a byte at a time. Our words are stored big-endian,
+		# so the first byte of each word is in its most significant lane.
+		if self._writable:
+			rom_write_port = rom.write_port(granularity = 8)
+			m.d.comb += [
+				rom_write_port.addr.eq(self.descriptor_write.address >> 2),
+				rom_write_port.data.eq(self.descriptor_write.data.replicate(4)),
+				rom_write_port.en.eq(self.descriptor_write.write << ~self.descriptor_write.address[0:2]),
+			]
+
 		# Create convenience aliases to the upper and lower half of the ROM.
 		rom_upper_half = rom_read_port.data.word_select(1, 16)
-		rom_lower_half = rom_read_port.data.word_select(0, 16)	# noqa: F841
+		rom_lower_half = rom_read_port.data.word_select(0, 16)
 
 		# All of our ROM's metadata is composed of elements formatted as (count, pointer).
 		# Grab a quick reference to the ROM's upper half, which stores the count...
@@ -405,9 +759,10 @@ class GetDescriptorHandlerBlock(Elaboratable):
 		position_in_stream = Signal(range(descriptor_max_length))
 		bytes_sent = Signal.like(length)
 
-		# Registers that store descriptor length and data base address.
+		# Registers that store descriptor length and data base address. Our base address is a byte address, as
+		# descriptors in a compact ROM needn't be aligned.
 		descriptor_length = Signal(16)
-		descriptor_data_base_address = Signal(rom_read_port.addr.width)
+		descriptor_data_base_address = Signal(rom_read_port.addr.width + 2)
 
 		# Track when we're on the first and last packet.
 		on_first_packet = position_in_stream == self.start_position
@@ -440,7 +795,10 @@ class GetDescriptorHandlerBlock(Elaboratable):
 				# ... apply our start position...
 				m.d.sync += position_in_stream.eq(self.start_position),
 
-				is_valid_type = (type_number <= max_type_index)
+				# Our descriptor sets are only available when they've been explicitly selected.
+				is_valid_type = (type_number <= max_type_index) & (
+					self.descriptor_set | (type_number != self.DESCRIPTOR_SET_TYPE)
+				)
 
 				# If we have a descriptor we're able to send, prepare to send it.
 				with m.If(is_valid_type):
@@ -468,10 +826,7 @@ class GetDescriptorHandlerBlock(Elaboratable):
 				# Otherwise, look up the type data in the ROM; and then move on to finding the descriptor itself.
 				with m.Else():
 					m.d.comb += rom_read_port.addr.eq(rom_element_pointer + index)
-					with m.If(length == 0):
-						m.next = 'SEND_ZLP'
-					with m.Else():
-						m.next = 'LOOKUP_DESCRIPTOR'
+					m.next = 'LOOKUP_DESCRIPTOR'
 
 			# LOOKUP_DESCRIPTOR -- we've now fetched from ROM the location of the descriptor in memory.
 			# We'll decode it, and then prepare to start sending the descriptor.
@@ -485,24 +840,31 @@ class GetDescriptorHandlerBlock(Elaboratable):
 
 				# ... and register the position and shape of our descriptor in memory.
 				m.d.sync += [
-					descriptor_data_base_address.eq(rom_element_pointer),
+					descriptor_data_base_address.eq(rom_lower_half),
 					descriptor_length.eq(rom_element_count),
 				]
 
-				m.next = 'SEND_DESCRIPTOR'
+				# Entries with no length are gaps in a compact index table; stall any request for them.
+				with m.If(rom_element_count == 0):
+					m.d.comb += self.stall.eq(1)
+					m.next = 'IDLE'
+				with m.Elif(length == 0):
+					m.next = 'SEND_ZLP'
+				with m.Else():
+					m.next = 'SEND_DESCRIPTOR'
 
 			# SEND_DESCRIPTOR -- we finally are actively streaming our descriptor; which we'll complete until
 			# our descriptor is fully sent.
 			with m.State('SEND_DESCRIPTOR'):
-				word_in_stream = position_in_stream >> 2
-				byte_in_stream = position_in_stream.bit_select(0, 2)
+				byte_in_rom = descriptor_data_base_address + position_in_stream
+				byte_in_word = byte_in_rom.bit_select(0, 2)
 
 				m.d.comb += [
 					self.tx.valid.eq(1),
 
 					# Always drive the stream from our current memory output...
-					rom_read_port.addr.eq(descriptor_data_base_address + word_in_stream),
-					self.tx.data.eq(rom_read_port.data.word_select((3 - byte_in_stream).as_unsigned(), 8)),
+					rom_read_port.addr.eq(byte_in_rom >> 2),
+					self.tx.data.eq(rom_read_port.data.word_select((3 - byte_in_word).as_unsigned(), 8)),
 
 					# ... and base First and Last based on our current position in the stream.
 					self.tx.first.eq(on_first_packet),
@@ -518,11 +880,7 @@ class GetDescriptorHandlerBlock(Elaboratable):
 							position_in_stream.eq(position_in_stream + 1),
 							bytes_sent.eq(bytes_sent + 1),
 						]
-						m.d.comb += rom_read_port.addr.eq(
-							descriptor_data_base_address + (position_in_stream + 1).bit_select(
-								2, position_in_stream.width - 2
-							)
-						),
+						m.d.comb += rom_read_port.addr.eq((byte_in_rom + 1) >> 2),
 
 					# Otherwise, we've finished! Return to IDLE.
 					with m.Else():
@@ -9,7 +9,7 @@ Contains the organizing hardware used to add USB Device functionality
 to your own designs; including the core :class:`USBDevice` class.
 '''
 
-from torii.hdl                 import Const, Elaboratable, Module, Signal
+from torii.hdl                 import Cat, Const, Elaboratable, Module, Signal
 
 from usb_construct.emitters    import DeviceDescriptorCollection
 
@@ -17,7 +17,8 @@ from ...interface.gateware_phy import GatewarePHY
 from ...interface.ulpi         import UTMITranslator
 from ...interface.utmi         import UTMIInterfaceMultiplexer
 from .control                  import USBControlEndpoint
-from .endpoint                 import USBEndpointMultiplexer
+from .counters                 import PerformanceCounterRequestHandler, USBPerformanceCounters
+from .endpoint                 import USBEndpointMultiplexer, USBIndexedEndpointMultiplexer
 from .packet                   import (
 	USBDataPacketCRC, USBDataPacketGenerator, USBDataPacketReceiver, USBHandshakeDetector, USBHandshakeGenerator,
 	USBInterpacketTimer, USBTokenDetector
@@ -46,6 +47,15 @@ class USBDevice(Elaboratable):
 		for non-simple connections; in which case you will need to connect the clock signal
 		yourself.
 
+	indexed_endpoint_mux: bool, Optional
+		True iff we should select between our endpoints by decoding the endpoint number of each token,
+		rather than by scanning every endpoint for activity. This scales better to devices with many
+		endpoints; but requires every endpoint to be added with its endpoint number.
+
+	pipelined_endpoint_mux: bool, Optional
+		True iff our indexed endpoint selection should be registered. Only applies if
+		``indexed_endpoint_mux`` is set.
+
 	Attributes
 	----------
 
@@ -78,11 +88,17 @@ class USBDevice(Elaboratable):
 	rx_activity_led: Signal(), output
 		Signal that can be used to drive an activity LED for RX.
 
+	performance_counters: USBPerformanceCounters
+		The device's performance counters, if :meth:`add_performance_counters` has been called; or None.
+
 	'''
 
-	def __init__(self, *, bus, handle_clocking = True):
+	def __init__(self, *, bus, handle_clocking = True, indexed_endpoint_mux = False, pipelined_endpoint_mux = False):
 		''' '''
 
+		self._indexed_endpoint_mux   = indexed_endpoint_mux
+		self._pipelined_endpoint_mux = pipelined_endpoint_mux
+
 		# If this looks more like a ULPI bus than a UTMI bus, translate it.
 		if hasattr(bus, 'dir'):
 			self.utmi       = UTMITranslator(ulpi = bus, handle_clocking = handle_clocking)
@@ -132,9 +148,10 @@ class USBDevice(Elaboratable):
 		#
 		# Internals.
 		#
-		self._endpoints = []
+		self._endpoints           = []
+		self.performance_counters = None
 
-	def add_endpoint(self, endpoint):
+	def add_endpoint(self, endpoint, *, endpoint_number = None, direction = None):
 		''' Adds an endpoint interface to the device.
 
 		Parameters
@@ -142,8 +159,18 @@ class USBDevice(Elaboratable):
 		endpoint: Elaborateable
 			The endpoint interface to be added. Can be any piece of gateware with a
 			:class:`EndpointInterface` attribute called ``interface``.
+		endpoint_number: int, optional
+			The endpoint number the endpoint responds to. Required if the device
+			uses an indexed endpoint multiplexer, or has performance counters.
+		direction: USBDirection, optional
+			The direction the endpoint responds to; or None if it handles both.
 		'''
-		self._endpoints.append(endpoint)
+		self._endpoints.append((endpoint, endpoint_number, direction))
+
+		if self.performance_counters is not None:
+			self.performance_counters.add_interface(
+				endpoint.interface, endpoint_number = endpoint_number, direction = direction
+			)
 
 	def add_control_endpoint(self):
 		''' Adds a basic control endpoint to the device.
@@ -156,7 +183,7 @@ class USBDevice(Elaboratable):
 		Returns the endpoint object for the control endpoint.
 		'''
 		control_endpoint = USBControlEndpoint(utmi = self.utmi)
-		self.add_endpoint(control_endpoint)
+		self.add_endpoint(control_endpoint, endpoint_number = 0)
 
 		return control_endpoint
 
@@ -173,10 +200,45 @@ class USBDevice(Elaboratable):
 		# Create our endpoint, and add standard descriptors to it.
 		control_endpoint = USBControlEndpoint(utmi = self.utmi)
 		control_endpoint.add_standard_request_handlers(descriptors, **kwargs)
-		self.add_endpoint(control_endpoint)
+		self.add_endpoint(control_endpoint, endpoint_number = 0)
 
 		return control_endpoint
 
+	def add_performance_counters(self, control_endpoint, *, request_number, counter_width = 32):
+		''' Adds per-endpoint performance counters to the device, readable over the given control endpoint.
+
+		Every endpoint on the device, including any added later, will be counted; so each must be added with
+		its endpoint number.
+		See :class:`USBPerformanceCounters` for the counters kept, and :class:`PerformanceCounterRequestHandler`
+		for how they're read.
+
+		Parameters
+		----------
+		control_endpoint: USBControlEndpoint
+			The control endpoint to add the vendor request handler to.
+		request_number: int
+			The vendor ``bRequest`` value used to read the counters.
+		counter_width: int
+			The width of each counter, in bits. Defaults to 32.
+
+		Returns
+		-------
+		The :class:`USBPerformanceCounters` created.
+		'''
+
+		self.performance_counters = USBPerformanceCounters(counter_width = counter_width)
+		for endpoint, endpoint_number, direction in self._endpoints:
+			self.performance_counters.add_interface(
+				endpoint.interface, endpoint_number = endpoint_number, direction = direction
+			)
+
+		control_endpoint.add_request_handler(PerformanceCounterRequestHandler(
+			self.performance_counters, request_number = request_number,
+			max_packet_size = control_endpoint.max_packet_size
+		))
+
+		return self.performance_counters
+
 	def elaborate(self, platform):
 		m = Module()
 
@@ -254,7 +316,11 @@ class USBDevice(Elaboratable):
 		#
 
 		# Create our endpoint multiplexer...
-		m.submodules.endpoint_mux = endpoint_mux = USBEndpointMultiplexer()
+		if self._indexed_endpoint_mux:
+			endpoint_mux = USBIndexedEndpointMultiplexer(pipelined = self._pipelined_endpoint_mux)
+		else:
+			endpoint_mux = USBEndpointMultiplexer()
+		m.submodules.endpoint_mux = endpoint_mux
 		endpoint_collection = endpoint_mux.shared
 
 		# Connect our timer and CRC interfaces.
@@ -276,13 +342,17 @@ class USBDevice(Elaboratable):
 			endpoint_collection.rx_complete.eq(receiver.packet_complete),
 			endpoint_collection.rx_invalid.eq(receiver.crc_mismatch),
 			endpoint_collection.rx_ready_for_response.eq(receiver.ready_for_response),
-			endpoint_collection.rx_pid_toggle.eq(receiver.active_pid[3]),
+
+			# Our data PID's upper bits identify DATA0/DATA1/DATA2/MDATA; we'll re-order them to
+			# match the encoding used for our transmit PID toggle.
+			endpoint_collection.rx_pid_toggle.eq(Cat(receiver.active_pid[3], receiver.active_pid[2])),
 
 			# Transmit interface.
 			endpoint_collection.tx.attach(transmitter.stream),
 			handshake_generator.issue_ack.eq(endpoint_collection.handshakes_out.ack),
 			handshake_generator.issue_nak.eq(endpoint_collection.handshakes_out.nak),
 			handshake_generator.issue_stall.eq(endpoint_collection.handshakes_out.stall),
+			handshake_generator.issue_nyet.eq(endpoint_collection.handshakes_out.nyet),
 			transmitter.data_pid.eq(endpoint_collection.tx_pid_toggle),
 		]
 
@@ -293,7 +363,7 @@ class USBDevice(Elaboratable):
 			m.d.usb += configuration.eq(endpoint_collection.new_config)
 
 		# Finally, add each of our endpoints to this module and our multiplexer.
-		for endpoint in self._endpoints:
+		for endpoint, endpoint_number, direction in self._endpoints:
 
 			# Create a display name for the endpoint...
 			name = endpoint.__class__.__name__
@@ -301,9 +371,17 @@ class USBDevice(Elaboratable):
 				name = f'{name}_{id(endpoint)}'
 
 			# ... and add it, both as a submodule and to our multiplexer.
-			endpoint_mux.add_interface(endpoint.interface)
+			endpoint_mux.add_interface(endpoint.interface, endpoint_number = endpoint_number, direction = direction)
 			m.submodules[name] = endpoint
 
+		if self.performance_counters is not None:
+			m.submodules.performance_counters = counters = self.performance_counters
+			m.d.comb += [
+				counters.sof_detected.eq(token_detector.interface.new_frame),
+				counters.bus_reset.eq(reset_sequencer.bus_reset),
+				counters.config_changed.eq(endpoint_collection.config_changed),
+			]
+
 		#
 		# Transmitter multiplexing.
 		#
@@ -6,12 +6,14 @@
 
 ''' Gateware for working with abstract endpoints. '''
 
-from torii.hdl     import Cat, Elaboratable, Module, Signal
-from torii.hdl.ast import Past
+from torii.hdl           import Array, Cat, Const, Elaboratable, Module, Signal
+from torii.hdl.ast       import Past
 
-from ...utils.bus  import OneHotMultiplexer
-from ..stream      import USBInStreamInterface, USBOutStreamInterface
-from .packet       import (
+from usb_construct.types import USBDirection
+
+from ...utils.bus        import OneHotMultiplexer
+from ..stream            import USBInStreamInterface, USBOutStreamInterface
+from .packet             import (
 	DataCRCInterface, HandshakeExchangeInterface, InterpacketTimerInterface, TokenDetectorInterface
 )
 
@@ -35,8 +37,9 @@ class EndpointInterface:
 		Indicates that an interpacket delay has passed after an `rx_complete` strobe.
 	rx_invalid: Signal(), input to endpoint
 		Strobe that indicates that the concluding rx-stream was invalid (CRC check failed).
-	rx_pid_toggle: Signal(), input to endpoint
+	rx_pid_toggle: Signal(2), input to endpoint
 		Value for the data PID toggle; 0 indicates we're receiving a DATA0; 1 indicates Data1.
+		2 indicates we're receiving a DATA2, while 3 indicates we're receiving an MDATA.
 
 	tx: USBInStreamInterface, output stream from endpoint
 		Transmit interface for this endpoint.
@@ -125,11 +128,20 @@ class USBEndpointMultiplexer(Elaboratable):
 		#
 		self._interfaces = []
 
-	def add_interface(self, interface: EndpointInterface):
+	def add_interface(self, interface: EndpointInterface, *, endpoint_number = None, direction = None):
 		''' Adds a EndpointInterface to the multiplexer.
 
 		Arbitration is not performed; it's expected only one endpoint will be
 		driving the transmit lines at a time.
+
+		Parameters
+		----------
+		interface: EndpointInterface
+			The interface to be added.
+		endpoint_number: int, optional
+			The endpoint number the interface responds to. Unused by this multiplexer.
+		direction: USBDirection, optional
+			The direction the interface responds to; or None if it handles both. Unused by this multiplexer.
 		'''
 		self._interfaces.append(interface)
 
@@ -185,13 +197,10 @@ class USBEndpointMultiplexer(Elaboratable):
 		# ... and tie it to our post-mux signal.
 		m.d.comb += signal_for_interface(self.shared).eq(or_value)
 
-	def elaborate(self, platform):
-		m = Module()
+	def _connect_shared_inputs(self, m):
+		''' Passes through the signals being routed -to- each of our pre-mux interfaces. '''
 		shared = self.shared
 
-		#
-		# Pass through signals being routed -to- our pre-mux interfaces.
-		#
 		for interface in self._interfaces:
 			m.d.comb += [
 
@@ -218,6 +227,15 @@ class USBEndpointMultiplexer(Elaboratable):
 				interface.active_address.eq(shared.active_address)
 			]
 
+	def elaborate(self, platform):
+		m = Module()
+		shared = self.shared
+
+		#
+		# Pass through signals being routed -to- our pre-mux interfaces.
+		#
+		self._connect_shared_inputs(m)
+
 		#
 		# Multiplex the signals being routed -from- our pre-mux interface.
 		#
@@ -238,6 +256,7 @@ class USBEndpointMultiplexer(Elaboratable):
 		self.or_join_interface_signals(m, lambda interface: interface.handshakes_out.ack)
 		self.or_join_interface_signals(m, lambda interface: interface.handshakes_out.nak)
 		self.or_join_interface_signals(m, lambda interface: interface.handshakes_out.stall)
+		self.or_join_interface_signals(m, lambda interface: interface.handshakes_out.nyet)
 
 		# ... our CRC start signals...
 		self.or_join_interface_signals(m, lambda interface: interface.data_crc.start)
@@ -256,3 +275,139 @@ class USBEndpointMultiplexer(Elaboratable):
 			conditional = m.Elif
 
 		return m
+
+class USBIndexedEndpointMultiplexer(USBEndpointMultiplexer):
+	''' Multiplexes access to the resources shared between multiple endpoint interfaces, by endpoint number.
+
+	Rather than scanning every interface for activity, this multiplexer decodes the endpoint targeted by
+	the most recent token once; and uses the result to select which interface drives the shared transmit,
+	PID and handshake signals. This keeps the multiplexer's logic depth roughly constant as endpoints are added.
+
+	Every interface must be added with the endpoint number it responds to, and optionally the direction it
+	handles; each endpoint number and direction can only be claimed by a single interface.
+
+	Attributes
+	----------
+
+	shared: EndpointInterface
+		The post-multiplexer endpoint interface.
+
+	Parameters
+	----------
+	pipelined: bool, optional
+		If True, the decoded endpoint selection is registered; shortening the path from our token detector at
+		the cost of a cycle of latency after each token. Endpoints only respond an interpacket delay after a
+		token; so this latency is never visible on the bus. Defaults to False.
+	'''
+
+	def __init__(self, *, pipelined = False):
+		super().__init__()
+
+		self._pipelined         = pipelined
+		self._endpoint_numbers  = []
+		self._directions        = []
+
+	def add_interface(self, interface: EndpointInterface, *, endpoint_number = None, direction = None):
+		''' Adds a EndpointInterface to the multiplexer.
+
+		Parameters
+		----------
+		interface: EndpointInterface
+			The interface to be added.
+		endpoint_number: int
+			The endpoint number the interface responds to.
+		direction: USBDirection, optional
+			The direction the interface responds to; or None if it handles both, as a control endpoint does.
+		'''
+
+		if endpoint_number is None:
+			raise ValueError('USBIndexedEndpointMultiplexer requires an endpoint number for each interface')
+
+		if endpoint_number not in range(16):
+			raise ValueError(f'Endpoint number must be between 0 and 15, not {endpoint_number}')
+
+		self._interfaces.append(interface)
+		self._endpoint_numbers.append(endpoint_number)
+		self._directions.append(direction)
+
+	def _build_selection_table(self):
+		''' Builds a table mapping each (direction, endpoint number) pair to the index of its interface. '''
+
+		# Any endpoint without an interface maps to one past our last interface; which selects nothing.
+		unclaimed = len(self._interfaces)
+		table     = [unclaimed] * 32
+
+		for index, (number, direction) in enumerate(zip(self._endpoint_numbers, self._directions)):
+			directions = (USBDirection.OUT, USBDirection.IN) if direction is None else (direction,)
+
+			for direction in directions:
+				entry = number | (0x10 if direction == USBDirection.IN else 0)
+
+				if table[entry] != unclaimed:
+					raise ValueError(
+						f'Endpoint {number} {direction.name} is claimed by more than one interface'
+					)
+
+				table[entry] = index
+
+		return table
+
+	def elaborate(self, platform):
+		m = Module()
+		shared = self.shared
+
+		interface_count = len(self._interfaces)
+
+		#
+		# Pass through signals being routed -to- our pre-mux interfaces.
+		#
+		self._connect_shared_inputs(m)
+
+		#
+		# Endpoint selection.
+		#
+
+		# Our IN tokens select IN endpoints; everything else (OUT, SETUP, and PING) targets OUT endpoints.
+		# Our token detector holds its endpoint and direction until the next token; so our selection
+		# remains stable for the whole transaction.
+		tokenizer       = shared.tokenizer
+		selection_table = Array(Const(i, range(interface_count + 1)) for i in self._build_selection_table())
+		selected        = Signal(range(interface_count + 1))
+
+		selection_domain = m.d.usb if self._pipelined else m.d.comb
+		selection_domain += selected.eq(selection_table[Cat(tokenizer.endpoint, tokenizer.is_in)])
+
+		def select(signals):
+			''' Selects between a list of per-interface signals; producing zero if no interface is selected. '''
+			return Array([*signals, Const(0)])[selected]
+
+		#
+		# Multiplex the signals being routed -from- our pre-mux interface.
+		#
+		self._multiplex_signals(m, when = 'address_changed', multiplex = ['address_changed', 'new_address'])
+		self._multiplex_signals(m, when = 'config_changed', multiplex = ['config_changed', 'new_config'])
+
+		# Connect up our transmit interface and PID from the selected interface...
+		m.d.comb += [
+			shared.tx.valid.eq(select(i.tx.valid for i in self._interfaces)),
+			shared.tx.first.eq(select(i.tx.first for i in self._interfaces)),
+			shared.tx.last.eq(select(i.tx.last for i in self._interfaces)),
+			shared.tx.data.eq(select(i.tx.data for i in self._interfaces)),
+			shared.tx_pid_toggle.eq(select(i.tx_pid_toggle for i in self._interfaces)),
+		]
+		for interface in self._interfaces:
+			m.d.comb += interface.tx.ready.eq(shared.tx.ready)
+
+		# ... as well as any handshakes it requests.
+		m.d.comb += [
+			shared.handshakes_out.ack.eq(select(i.handshakes_out.ack for i in self._interfaces)),
+			shared.handshakes_out.nak.eq(select(i.handshakes_out.nak for i in self._interfaces)),
+			shared.handshakes_out.stall.eq(select(i.handshakes_out.stall for i in self._interfaces)),
+			shared.handshakes_out.nyet.eq(select(i.handshakes_out.nyet for i in self._interfaces)),
+		]
+
+		# Our CRC and timer start signals aren't tied to a given token; so we'll OR them together.
+		self.or_join_interface_signals(m, lambda interface: interface.data_crc.start)
+		self.or_join_interface_signals(m, lambda interface: interface.timer.start)
+
+		return m
@@ -7,13 +7,15 @@
 '''
 Endpoint interfaces for isochronous endpoints.
 
-These interfaces provide interfaces for connecting memories or memory-like
-interfaces to hosts via isochronous pipes.
+These interfaces provide interfaces for connecting memories, memory-like
+interfaces, or streams to hosts via isochronous pipes.
 '''
 
-from torii.hdl  import Elaboratable, Module, Signal
+from torii.hdl               import Cat, Elaboratable, Module, Signal
+from torii.lib.stream.simple import StreamInterface
 
-from ..endpoint import EndpointInterface
+from ....memory              import TransactionalizedFIFO
+from ..endpoint              import EndpointInterface
 
 class USBIsochronousInEndpoint(Elaboratable):
 	''' Isochronous endpoint that presents a memory-like interface.
@@ -213,3 +215,363 @@ class USBIsochronousInEndpoint(Elaboratable):
 				m.next = 'IDLE'
 
 		return m
+
+class USBIsochronousStreamInEndpoint(Elaboratable):
+	''' Isochronous endpoint that transmits a simple data stream to a host.
+
+	Used for streaming data from sources such as ADCs or video line buffers to a host, without requiring
+	a memory in front of the endpoint. Incoming data is buffered in a FIFO; at the start of each (micro)frame,
+	the endpoint determines how much data is available and schedules up to one (micro)frame's worth of it
+	-- up to ``max_packet_size * transactions_per_microframe`` bytes -- for transmission.
+
+	Attributes
+	----------
+	interface: EndpointInterface
+		Communications link to our USB core.
+	stream: StreamInterface, input stream
+		Stream that carries the data to be transmitted. ``first`` and ``last`` are ignored. ``ready`` is
+		de-asserted whenever the internal buffer is full; sources that cannot be stalled will have any data
+		presented while ``ready`` is low dropped, and counted in :attr:``overrun_count``.
+
+	bytes_in_frame: Signal(range(0, 3073)), output
+		The number of bytes scheduled for transmission in the current (micro)frame.
+	underrun_count: Signal(16), output
+		Wrapping count of the number of times the host has requested data in a (micro)frame in which
+		none was available; in which case a ZLP will have been sent.
+	overrun_count: Signal(16), output
+		Wrapping count of the number of bytes dropped due to the internal buffer being full.
+
+	Parameters
+	----------
+	endpoint_number: int
+		The endpoint number (not address) this endpoint should respond to.
+	max_packet_size: int
+		The maximum packet size for this endpoint. Should match the wMaxPacketSize provided in the
+		USB endpoint descriptor.
+	transactions_per_microframe: int, optional
+		The number of transactions the host may perform per microframe; between one and three.
+		Should match the additional transaction opportunities provided in the USB endpoint descriptor.
+		Defaults to one.
+	buffer_size: int, optional
+		The total amount of data we'll keep in the buffer. Defaults to two full (micro)frames' worth of data.
+	'''
+
+	def __init__(self, *, endpoint_number, max_packet_size, transactions_per_microframe = 1, buffer_size = None):
+		if transactions_per_microframe not in (1, 2, 3):
+			raise ValueError(
+				f'transactions_per_microframe must be between 1 and 3, not {transactions_per_microframe}'
+			)
+
+		self._endpoint_number = endpoint_number
+		self._max_packet_size = max_packet_size
+		self._max_frame_data  = max_packet_size * transactions_per_microframe
+		self._buffer_size     = buffer_size if (buffer_size is not None) else (self._max_frame_data * 2)
+
+		#
+		# I/O Port
+		#
+		self.interface      = EndpointInterface()
+		self.stream         = StreamInterface()
+
+		self.bytes_in_frame = Signal(range(0, USBIsochronousInEndpoint._MAX_FRAME_DATA + 1))
+		self.underrun_count = Signal(16)
+		self.overrun_count  = Signal(16)
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Create our core, memory-fed endpoint, and attach it directly to our interface.
+		m.submodules.iso_ep = iso_ep = USBIsochronousInEndpoint(
+			endpoint_number = self._endpoint_number,
+			max_packet_size = self._max_packet_size
+		)
+		iso_ep.interface = self.interface
+
+		# Shortcuts.
+		interface      = self.interface
+		stream         = self.stream
+		data_requested = (
+			(interface.tokenizer.endpoint == self._endpoint_number) &
+			interface.tokenizer.is_in & interface.tokenizer.ready_for_response
+		)
+
+		# Our transmit buffer. We have no need to rewind, so we'll commit every read and write immediately.
+		m.submodules.fifo = fifo = TransactionalizedFIFO(
+			width = 8, depth = self._buffer_size, name = 'iso_tx_fifo', domain = 'usb'
+		)
+
+		m.d.comb += [
+			# Fill our FIFO directly from our input stream...
+			fifo.write_data.eq(stream.data),
+			fifo.write_en.eq(stream.valid),
+			fifo.write_commit.eq(1),
+			stream.ready.eq(~fifo.full),
+
+			# ... and empty it into our core endpoint; which moves on to its next address each time
+			# a byte of data is accepted by our transmitter.
+			iso_ep.value.eq(fifo.read_data),
+			fifo.read_en.eq(interface.tx.valid & interface.tx.ready & (iso_ep.next_address != iso_ep.address)),
+			fifo.read_commit.eq(1),
+		]
+
+		# Figure out how much data we have ready to send, limited to what we can send in one (micro)frame.
+		bytes_available = Signal(range(0, self._buffer_size + 1))
+		m.d.comb += bytes_available.eq(self._buffer_size - fifo.space_available)
+
+		with m.If(bytes_available > self._max_frame_data):
+			m.d.comb += iso_ep.bytes_in_frame.eq(self._max_frame_data)
+		with m.Else():
+			m.d.comb += iso_ep.bytes_in_frame.eq(bytes_available)
+
+		# Our core latches this value at the start of each (micro)frame; we'll do the same, for our user.
+		with m.If(interface.tokenizer.new_frame):
+			m.d.usb += self.bytes_in_frame.eq(iso_ep.bytes_in_frame)
+
+		#
+		# Statistics.
+		#
+		with m.If(data_requested & (self.bytes_in_frame == 0)):
+			m.d.usb += self.underrun_count.eq(self.underrun_count + 1)
+
+		with m.If(stream.valid & ~stream.ready):
+			m.d.usb += self.overrun_count.eq(self.overrun_count + 1)
+
+		return m
+
+class USBIsochronousOutEndpoint(Elaboratable):
+	''' Isochronous endpoint that receives data from the host, and produces a simple data stream.
+
+	Used for streaming data from a host into the device; e.g. for the transport of audio or sample data.
+	High-bandwidth endpoints, which receive up to three transactions per microframe, are supported.
+
+	Data is buffered a (micro)frame at a time; and is only made available on :attr:``stream`` once every
+	transaction in the (micro)frame has been received correctly. If any data is lost -- due to a CRC error,
+	a missing transaction in the DATA2/DATA1/DATA0/MDATA PID sequence [USB2.0: 5.9.2], or a lack of buffer
+	space -- the whole (micro)frame is discarded, and :attr:``frame_lost`` is strobed.
+
+	Attributes
+	----------
+	interface: EndpointInterface
+		Communications link to our USB core.
+	stream: StreamInterface, output stream
+		Stream that carries the data received from the host. ``first`` is asserted on the first byte of each
+		(micro)frame's data, and ``last`` on the final byte.
+
+	frame_complete: Signal(), output
+		Strobe that indicates a (micro)frame's data has been received correctly.
+	bytes_in_frame: Signal(range(0, 3073)), output
+		The number of bytes received in the most recently completed (micro)frame. Updated alongside
+		:attr:``frame_complete``.
+	frame_lost: Signal(), output
+		Strobe that indicates a (micro)frame's data has been lost, and discarded.
+	frame_short: Signal(), output
+		Strobe that indicates that a (micro)frame was received, but that one of its MDATA transactions was
+		shorter than the maximum packet size. Such (micro)frames are still passed through in their entirety.
+
+	Parameters
+	----------
+	endpoint_number: int
+		The endpoint number (not address) this endpoint should respond to.
+	max_packet_size: int
+		The maximum packet size for this endpoint. Should match the wMaxPacketSize provided in the
+		USB endpoint descriptor.
+	transactions_per_microframe: int, optional
+		The number of transactions the host may perform per microframe; between one and three.
+		Should match the additional transaction opportunities provided in the USB endpoint descriptor.
+		Defaults to one.
+	buffer_size: int, optional
+		The total amount of data we'll keep in the buffer; must be able to hold at least one full (micro)frame.
+		Defaults to two full (micro)frames' worth of data.
+	'''
+
+	_MAX_FRAME_DATA = 1024 * 3
+
+	def __init__(self, *, endpoint_number, max_packet_size, transactions_per_microframe = 1, buffer_size = None):
+		if transactions_per_microframe not in (1, 2, 3):
+			raise ValueError(
+				f'transactions_per_microframe must be between 1 and 3, not {transactions_per_microframe}'
+			)
+
+		self._endpoint_number  = endpoint_number
+		self._max_packet_size  = max_packet_size
+		self._transactions     = transactions_per_microframe
+		self._buffer_size      = (
+			buffer_size if (buffer_size is not None) else (max_packet_size * transactions_per_microframe * 2)
+		)
+
+		#
+		# I/O Port
+		#
+		self.interface      = EndpointInterface()
+		self.stream         = StreamInterface()
+
+		self.frame_complete = Signal()
+		self.bytes_in_frame = Signal(range(0, self._MAX_FRAME_DATA + 1))
+		self.frame_lost     = Signal()
+		self.frame_short    = Signal()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Shortcuts.
+		interface          = self.interface
+		rx                 = interface.rx
+		tokenizer          = interface.tokenizer
+		stream             = self.stream
+
+		targeting_us       = (tokenizer.endpoint == self._endpoint_number) & tokenizer.is_out
+
+		# Our receive buffer; each entry holds a byte alongside its first/last flags.
+		m.submodules.fifo = fifo = TransactionalizedFIFO(
+			width = 10, depth = self._buffer_size, name = 'iso_rx_fifo', domain = 'usb'
+		)
+
+		#
+		# Internal state.
+		#
+
+		# The number of transactions we've received so far in this (micro)frame, and the number of bytes
+		# received both in the current (micro)frame and the current packet.
+		transactions_received = Signal(range(0, self._transactions + 1))
+		frame_byte_count      = Signal.like(self.bytes_in_frame)
+		packet_byte_count     = Signal(range(0, self._MAX_FRAME_DATA + 1))
+
+		# Set once something has gone wrong in the current (micro)frame; we'll then ignore the remainder of it.
+		frame_failed          = Signal()
+
+		# Set if any of our MDATA transactions in this (micro)frame were short.
+		saw_short_packet      = Signal()
+
+		# As we can't know which byte is the last in a (micro)frame until its final packet is complete, we'll
+		# always hold back the most recent byte received; and only write it once we know what follows it.
+		held_byte             = Signal(8)
+		held_first            = Signal()
+		byte_held             = Signal()
+
+		# Strobe that requests we commit the (micro)frame's data, once its final byte has been written.
+		commit_pending        = Signal()
+
+		#
+		# Packet sequencing.
+		#
+		pid            = interface.rx_pid_toggle
+		is_mdata       = (pid == 3)
+		final_pid      = (pid != 3)
+
+		# A final (non-MDATA) PID indicates how many transactions should have preceded it in this (micro)frame;
+		# DATA0 follows none, DATA1 follows one, and DATA2 follows two.
+		sequence_valid = Signal()
+		with m.If(is_mdata):
+			m.d.comb += sequence_valid.eq(transactions_received < (self._transactions - 1))
+		with m.Else():
+			m.d.comb += sequence_valid.eq((pid == transactions_received) & (pid < self._transactions))
+
+		# Figure out whether we'd overflow if we accepted our next byte.
+		new_byte       = targeting_us & rx.valid & rx.next & ~frame_failed
+		byte_lost      = new_byte & byte_held & fifo.full
+
+		packet_ended   = targeting_us & interface.rx_complete & ~frame_failed
+		packet_invalid = targeting_us & interface.rx_invalid & ~frame_failed
+
+		# A packet completing with an out-of-sequence PID means we've missed a transaction.
+		sequence_lost  = packet_ended & ~sequence_valid
+
+		# If we see a new (micro)frame start before the current one is finished, we've missed its final transaction.
+		frame_unfinished = tokenizer.new_frame & (transactions_received != 0) & ~frame_failed
+
+		lose_frame     = byte_lost | packet_invalid | sequence_lost | frame_unfinished
+
+		m.d.comb += [
+			fifo.write_commit.eq(commit_pending),
+			fifo.write_discard.eq(lose_frame),
+		]
+
+		# Strobes default to un-asserted.
+		m.d.usb += [
+			commit_pending.eq(0),
+			self.frame_complete.eq(0),
+			self.frame_lost.eq(0),
+			self.frame_short.eq(0),
+		]
+
+		# Whenever we receive a new byte, write out the byte we were holding, and hold the new one.
+		with m.If(new_byte):
+			m.d.comb += [
+				fifo.write_data.eq(Cat(held_byte, 0, held_first)),
+				fifo.write_en.eq(byte_held),
+			]
+			m.d.usb += [
+				held_byte.eq(rx.data),
+				held_first.eq(frame_byte_count == 0),
+				byte_held.eq(1),
+
+				frame_byte_count.eq(frame_byte_count + 1),
+				packet_byte_count.eq(packet_byte_count + 1),
+			]
+
+		# If we've lost data, discard the (micro)frame so far, and ignore the remainder of it.
+		with m.If(lose_frame):
+			m.d.usb += [
+				self.frame_lost.eq(1),
+				frame_failed.eq(1),
+				byte_held.eq(0),
+			]
+
+		# Once a packet ends with a PID that fits our sequence, we've received a transaction.
+		with m.Elif(packet_ended):
+			m.d.usb += packet_byte_count.eq(0)
+
+			# If this is an MDATA packet, we'll need to wait for more transactions.
+			with m.If(is_mdata):
+				m.d.usb += transactions_received.eq(transactions_received + 1)
+
+				with m.If(packet_byte_count != self._max_packet_size):
+					m.d.usb += saw_short_packet.eq(1)
+
+			# Otherwise, this finishes our (micro)frame. Write our final byte, marked as last, and then commit.
+			with m.Else():
+				m.d.comb += [
+					fifo.write_data.eq(Cat(held_byte, 1, held_first)),
+					fifo.write_en.eq(byte_held),
+				]
+				m.d.usb += [
+					commit_pending.eq(1),
+
+					self.frame_complete.eq(1),
+					self.frame_short.eq(saw_short_packet),
+					self.bytes_in_frame.eq(frame_byte_count),
+				]
+
+		# Start afresh after each completed (micro)frame, after we've given up on one, and at every SOF.
+		end_of_sequence = packet_ended & final_pid & sequence_valid
+		ignored_final   = targeting_us & interface.rx_complete & frame_failed & final_pid
+		with m.If(end_of_sequence | ignored_final | tokenizer.new_frame | lose_frame):
+			m.d.usb += [
+				transactions_received.eq(0),
+				frame_byte_count.eq(0),
+				packet_byte_count.eq(0),
+				saw_short_packet.eq(0),
+				byte_held.eq(0),
+			]
+
+		# If we were ignoring a (micro)frame, we can stop once its sequence is finished, or a new one starts.
+		with m.If(ignored_final | tokenizer.new_frame):
+			m.d.usb += frame_failed.eq(0)
+
+		#
+		# Stream output.
+		#
+		m.d.comb += [
+			# Our stream data always comes directly out of the FIFO; and is valid
+			# whenever our FIFO actually has data for us to read.
+			stream.valid.eq(~fifo.empty),
+			stream.data.eq(fifo.read_data[0:8]),
+			stream.last.eq(fifo.read_data[8]),
+			stream.first.eq(fifo.read_data[9]),
+
+			# Move to the next byte in the FIFO whenever our stream is advanced.
+			fifo.read_en.eq(stream.ready),
+			fifo.read_commit.eq(1)
+		]
+
+		return m
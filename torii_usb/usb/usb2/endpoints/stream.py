@@ -11,11 +11,12 @@ The endpoint interfaces in this module provide endpoint interfaces suitable for
 connecting streams to USB endpoints.
 '''
 
-from torii.hdl               import Elaboratable, Module, Signal
+from torii.hdl               import Elaboratable, Module, Mux, Signal
 from torii.lib.stream.simple import StreamInterface
 
-from ....memory import TransactionalizedFIFO
+from ....memory import AsyncTransactionalizedFIFO, TransactionalizedFIFO
 from ...stream  import USBOutStreamBoundaryDetector
+from ..         import USBSpeed
 from ..endpoint import EndpointInterface
 from ..transfer import USBInTransferManager
 
@@ -32,8 +33,12 @@ class USBStreamInEndpoint(Elaboratable):
 	possible. When ``flush`` is asserted, packets of varying length will be sent as needed, according
 	to the data available.
 
-	This implementation is double buffered; and can store a single packets worth of data while transmitting
-	a second packet.
+	By default, this implementation is double buffered; and can store a single packets worth of data while
+	transmitting a second packet. Increasing ``buffer_count`` allows further packets to be queued, which lets
+	the endpoint absorb gaps in the input stream without NAK'ing the host.
+
+	If ``stream_domain`` is provided, :attr:``stream``, :attr:``flush`` and :attr:``discard`` live in that
+	domain; and the endpoint's packet buffer crosses data into the ``usb`` domain internally.
 
 	Attributes
 	----------
@@ -44,7 +49,8 @@ class USBStreamInEndpoint(Elaboratable):
 		Assert to cause all pending data to be transmitted as soon as possible.
 
 	discard: Signal(), input
-		Assert to cause all pending data to be discarded.
+		Assert to cause all pending data to be discarded. When ``stream_domain`` is not ``usb``, this
+		should be held for several ``usb`` domain cycles.
 
 	interface: EndpointInterface
 		Communications link to our USB device.
@@ -56,12 +62,18 @@ class USBStreamInEndpoint(Elaboratable):
 	max_packet_size: int
 		The maximum packet size for this endpoint. Should match the wMaxPacketSize provided in the
 		USB endpoint descriptor.
+	buffer_count: int, optional
+		The number of max-packet-size buffers to use. Defaults to two.
+	stream_domain: str, optional
+		The name of the domain our stream lives in. Defaults to ``usb``.
 	'''
 
-	def __init__(self, *, endpoint_number, max_packet_size):
+	def __init__(self, *, endpoint_number, max_packet_size, buffer_count = 2, stream_domain = 'usb'):
 
 		self._endpoint_number = endpoint_number
 		self._max_packet_size = max_packet_size
+		self._buffer_count    = buffer_count
+		self._stream_domain   = stream_domain
 
 		#
 		# I/O port
@@ -76,7 +88,9 @@ class USBStreamInEndpoint(Elaboratable):
 		interface = self.interface
 
 		# Create our transfer manager, which will be used to sequence packet transfers for our stream.
-		m.submodules.tx_manager = tx_manager = USBInTransferManager(self._max_packet_size)
+		m.submodules.tx_manager = tx_manager = USBInTransferManager(
+			self._max_packet_size, buffer_count = self._buffer_count, stream_domain = self._stream_domain
+		)
 
 		m.d.comb += [
 
@@ -115,8 +129,10 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 	a short data packet. If the stream's ``last`` signal is tied to zero, then a continuous stream of
 	maximum-length-packets will be sent with no inserted ZLPs.
 
-	This implementation is double buffered; and can store a single packets worth of data while transmitting
-	a second packet.
+	By default, this implementation is double buffered; and can store a single packets worth of data while
+	transmitting a second packet.
+
+	If ``stream_domain`` is provided, :attr:``stream`` lives in that domain.
 
 	Attributes
 	----------
@@ -134,11 +150,17 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 	max_packet_size: int
 		The maximum packet size for this endpoint. Should match the wMaxPacketSize provided in the
 		USB endpoint descriptor.
+	buffer_count: int, optional
+		The number of max-packet-size buffers to use. Defaults to two.
+	stream_domain: str, optional
+		The name of the domain our stream lives in. Defaults to ``usb``.
 	'''
-	def __init__(self, *, byte_width, endpoint_number, max_packet_size):
+	def __init__(self, *, byte_width, endpoint_number, max_packet_size, buffer_count = 2, stream_domain = 'usb'):
 		self._byte_width      = byte_width
 		self._endpoint_number = endpoint_number
 		self._max_packet_size = max_packet_size
+		self._buffer_count    = buffer_count
+		self._stream_domain   = stream_domain
 
 		#
 		# I/O port
@@ -152,7 +174,9 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 		# Create our core, single-byte-wide endpoint, and attach it directly to our interface.
 		m.submodules.stream_ep = stream_ep = USBStreamInEndpoint(
 			endpoint_number = self._endpoint_number,
-			max_packet_size = self._max_packet_size
+			max_packet_size = self._max_packet_size,
+			buffer_count    = self._buffer_count,
+			stream_domain   = self._stream_domain
 		)
 		stream_ep.interface = self.interface
 
@@ -175,7 +199,7 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 		# Always provide our inner transmitter with the least byte of our shift register.
 		m.d.comb += byte_stream.data.eq(data_shift[0:8])
 
-		with m.FSM(domain = 'usb'):
+		with m.FSM(domain = self._stream_domain):
 
 			# IDLE: transmitter is waiting for input
 			with m.State('IDLE'):
@@ -183,7 +207,7 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 
 				# Once we get a send request, fill in our shift register, and start shifting.
 				with m.If(word_stream.valid):
-					m.d.usb += [
+					m.d[self._stream_domain] += [
 						data_shift.eq(word_stream.data),
 						first_latched.eq(word_stream.first),
 						last_latched.eq(word_stream.last),
@@ -210,7 +234,7 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 
 					# ... if we have bytes left to send, move to the next one.
 					with m.If(bytes_to_send > 0):
-						m.d.usb += [
+						m.d[self._stream_domain] += [
 							bytes_to_send.eq(bytes_to_send - 1),
 							data_shift.eq(data_shift[8:]),
 						]
@@ -221,7 +245,7 @@ class USBMultibyteStreamInEndpoint(Elaboratable):
 
 						# If we still have data to send, move to the next byte...
 						with m.If(self.stream.valid):
-							m.d.usb += [
+							m.d[self._stream_domain] += [
 								data_shift.eq(word_stream.data),
 								first_latched.eq(word_stream.first),
 								last_latched.eq(word_stream.last),
@@ -240,6 +264,14 @@ class USBStreamOutEndpoint(Elaboratable):
 
 	This interface is suitable for a single bulk or interrupt endpoint.
 
+	If ``stream_domain`` is provided, :attr:``stream`` lives in that domain; and the endpoint's receive
+	buffer crosses data out of the ``usb`` domain internally. Packets are still committed or discarded
+	in the ``usb`` domain, so the stream only ever sees data from packets that were ACK'd.
+
+	On high-speed links, a packet that's accepted but leaves less than ``max_packet_size`` of space in the
+	buffer is answered with a NYET rather than an ACK; so the host polls us with PING until we have room
+	for its next packet, rather than repeatedly sending packets we'd have to NAK [USB 2.0: 8.5.1].
+
 	Attributes
 	----------
 	stream: StreamInterface, output stream
@@ -257,12 +289,15 @@ class USBStreamOutEndpoint(Elaboratable):
 	buffer_size: int, optional
 		The total amount of data we'll keep in the buffer; typically two max-packet-sizes or more.
 		Defaults to twice the maximum packet size.
+	stream_domain: str, optional
+		The name of the domain our stream lives in. Defaults to ``usb``.
 	'''
 
-	def __init__(self, *, endpoint_number, max_packet_size, buffer_size = None):
+	def __init__(self, *, endpoint_number, max_packet_size, buffer_size = None, stream_domain = 'usb'):
 		self._endpoint_number = endpoint_number
 		self._max_packet_size = max_packet_size
 		self._buffer_size = buffer_size if (buffer_size is not None) else (self._max_packet_size * 2 - 1)
+		self._stream_domain = stream_domain
 
 		#
 		# I/O port
@@ -310,10 +345,16 @@ class USBStreamOutEndpoint(Elaboratable):
 		rx_first = boundary_detector.first
 		rx_last  = boundary_detector.last
 
-		# Create a Rx FIFO.
-		m.submodules.fifo = fifo = TransactionalizedFIFO(
-			width = 10, depth = self._buffer_size, name = 'rx_fifo', domain = 'usb'
-		)
+		# Create a Rx FIFO; crossing into our stream's domain, if it's not our own.
+		if self._stream_domain == 'usb':
+			m.submodules.fifo = fifo = TransactionalizedFIFO(
+				width = 10, depth = self._buffer_size, name = 'rx_fifo', domain = 'usb'
+			)
+		else:
+			m.submodules.fifo = fifo = AsyncTransactionalizedFIFO(
+				width = 10, depth = self._buffer_size, name = 'rx_fifo',
+				w_domain = 'usb', r_domain = self._stream_domain
+			)
 
 		#
 		# Create some basic conditionals that will help us make decisions.
@@ -324,6 +365,7 @@ class USBStreamOutEndpoint(Elaboratable):
 
 		expected_pid_match       = (interface.rx_pid_toggle == expected_data_toggle)
 		sufficient_space         = (fifo.space_available >= self._max_packet_size)
+		high_speed               = (interface.speed == USBSpeed.HIGH)
 
 		ping_response_requested  = endpoint_number_matches & tokenizer.is_ping & tokenizer.ready_for_response
 		data_response_requested  = targeting_endpoint & tokenizer.is_out & interface.rx_ready_for_response
@@ -352,11 +394,16 @@ class USBStreamOutEndpoint(Elaboratable):
 			# We'll ACK each packet if it's received correctly; _or_ if we skipped the packet
 			# due to a PID sequence mismatch. If we get a PID sequence mismatch, we assume that
 			# we missed a previous ACK from the host; and ACK without accepting data [USB 2.0: 8.6.3].
+			# Our space available already accounts for the packet we've just received; so on high-speed
+			# links we'll NYET, rather than ACK, a packet that leaves us without room for another [USB 2.0: 8.5.1].
 			interface.handshakes_out.ack.eq(
-				(data_response_requested & data_accepted) |
+				(data_response_requested & data_accepted & (sufficient_space | ~high_speed)) |
 				(ping_response_requested & sufficient_space) |
 				(data_response_requested & should_skip)
 			),
+			interface.handshakes_out.nyet.eq(
+				data_response_requested & data_accepted & ~sufficient_space & high_speed
+			),
 
 			# We'll NAK any time we want to accept a packet, but we don't have enough room.
 			interface.handshakes_out.nak.eq(
@@ -396,8 +443,138 @@ class USBStreamOutEndpoint(Elaboratable):
 			m.d.usb += overflow.eq(0)
 			m.d.usb += rx_cnt.eq(0)
 
-		# We'll toggle our DATA PID each time we issue an ACK to the host [USB 2.0: 8.6.2].
+		# We'll toggle our DATA PID each time we accept a packet; whether we ACK or NYET it [USB 2.0: 8.6.2].
 		with m.If(data_response_requested & data_accepted):
 			m.d.usb += expected_data_toggle.eq(~expected_data_toggle)
 
 		return m
+
+class USBMultibyteStreamOutEndpoint(Elaboratable):
+	''' Endpoint interface that receives data from the host, and produces a wide data stream.
+
+	This interface is suitable for a single bulk or interrupt endpoint.
+
+	This variant produces streams with payload sizes that are a multiple of one byte; data is always
+	assembled from the host's data in little-endian byte order. Each word carries a per-byte valid
+	mask on its ``valid`` signal; every word is fully valid except, potentially, the final word of a
+	transfer -- which is marked with ``last``, and only has the bytes received from the host marked valid.
+
+	Bytes are packed at the full rate of the inner byte-wide endpoint; a new word can be accepted by the
+	application every ``byte_width`` cycles without stalling the receive buffer. If ``stream_domain`` is
+	provided, packing happens in -- and :attr:``stream`` lives in -- that domain.
+
+	Attributes
+	----------
+	stream: StreamInterface, output stream
+		Full-featured stream interface that carries the data we've received from the host.
+		Its ``valid`` signal is ``byte_width`` bits wide; with one bit per byte of ``data``.
+	interface: EndpointInterface
+		Communications link to our USB device.
+
+	Parameters
+	----------
+	byte_width: int
+		The number of bytes to be produced at once.
+	endpoint_number: int
+		The endpoint number (not address) this endpoint should respond to.
+	max_packet_size: int
+		The maximum packet size for this endpoint. If this there isn't `max_packet_size` space in
+		the endpoint buffer, this endpoint will NAK (or participate in the PING protocol.)
+	buffer_size: int, optional
+		The total amount of data we'll keep in the buffer; typically two max-packet-sizes or more.
+		Defaults to twice the maximum packet size.
+	stream_domain: str, optional
+		The name of the domain our stream lives in. Defaults to ``usb``.
+	'''
+
+	def __init__(self, *, byte_width, endpoint_number, max_packet_size, buffer_size = None, stream_domain = 'usb'):
+		self._byte_width      = byte_width
+		self._endpoint_number = endpoint_number
+		self._max_packet_size = max_packet_size
+		self._buffer_size     = buffer_size
+		self._stream_domain   = stream_domain
+
+		#
+		# I/O port
+		#
+		self.stream    = StreamInterface(data_width = byte_width * 8, valid_width = byte_width)
+		self.interface = EndpointInterface()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		# Create our core, single-byte-wide endpoint, and attach it directly to our interface.
+		m.submodules.stream_ep = stream_ep = USBStreamOutEndpoint(
+			endpoint_number = self._endpoint_number,
+			max_packet_size = self._max_packet_size,
+			buffer_size     = self._buffer_size,
+			stream_domain   = self._stream_domain
+		)
+		stream_ep.interface = self.interface
+
+		# Create semantic aliases for byte-wise and word-wise streams;
+		# so the code below reads more clearly.
+		byte_stream = stream_ep.stream
+		word_stream = self.stream
+
+		# We'll gather each of our incoming bytes into a partial word, alongside the mask of which
+		# of its bytes have been filled in so far.
+		data_gather  = Signal.like(word_stream.data)
+		valid_gather = Signal.like(word_stream.valid)
+		byte_index   = Signal(range(self._byte_width))
+
+		# Latched version of our first signal; which is only valid on the first byte of a word.
+		first_latched = Signal()
+
+		# Compute what our word would look like with the current byte added to it.
+		next_data  = Signal.like(data_gather)
+		next_valid = Signal.like(valid_gather)
+		m.d.comb += [
+			next_data.eq(data_gather),
+			next_data.word_select(byte_index, 8).eq(byte_stream.data),
+			next_valid.eq(valid_gather),
+			next_valid.bit_select(byte_index, 1).eq(1),
+		]
+
+		# A word is complete once we've filled its final byte, or once the transfer ends.
+		word_complete = (byte_index == self._byte_width - 1) | byte_stream.last
+
+		# Our output word register is free if it's empty, or if its contents are being consumed this cycle.
+		output_free = ~word_stream.valid.any() | word_stream.ready
+
+		# We can always accept a byte that doesn't complete a word; bytes that do complete a word need
+		# somewhere to go.
+		m.d.comb += byte_stream.ready.eq(~word_complete | output_free)
+		byte_accepted = byte_stream.valid & byte_stream.ready
+
+		# Once our current word has been consumed, clear it from our output.
+		with m.If(word_stream.ready):
+			m.d[self._stream_domain] += word_stream.valid.eq(0)
+
+		with m.If(byte_accepted):
+			with m.If(word_complete):
+				m.d[self._stream_domain] += [
+					# Present our newly completed word on our output...
+					word_stream.data.eq(next_data),
+					word_stream.valid.eq(next_valid),
+					word_stream.first.eq(Mux(byte_index == 0, byte_stream.first, first_latched)),
+					word_stream.last.eq(byte_stream.last),
+
+					# ... and start gathering a fresh one.
+					data_gather.eq(0),
+					valid_gather.eq(0),
+					byte_index.eq(0),
+				]
+
+			with m.Else():
+				m.d[self._stream_domain] += [
+					data_gather.eq(next_data),
+					valid_gather.eq(next_valid),
+					byte_index.eq(byte_index + 1),
+				]
+
+				# Latch our first signal on the first byte of each word.
+				with m.If(byte_index == 0):
+					m.d[self._stream_domain] += first_latched.eq(byte_stream.first)
+
+		return m
@@ -0,0 +1,329 @@
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This file is part of Torii-USB.
+#
+
+''' Gateware for building several USB devices, on separate PHYs, that share their request handling logic.
+
+Each port of a multi-port device is a complete :class:`USBDevice`, with its own packet layer, address and
+configuration; but the read-only parts of its control endpoint -- the descriptor ROM, and the decoding of
+standard requests -- are a single :class:`StandardRequestHandler`, lent to one port at a time.
+'''
+
+from collections.abc         import Iterable
+
+from torii.hdl               import Cat, Elaboratable, Module, Mux, Signal
+from torii.hdl.ast           import Operator
+from torii.hdl.xfrm          import ResetInserter
+
+from usb_construct.emitters  import DeviceDescriptorCollection
+
+from ..request               import SetupPacket
+from ..request.control       import ControlRequestHandler
+from ..request.standard      import StandardRequestHandler
+from .control                import USBControlEndpoint
+from .device                 import USBDevice
+from .request                import RequestHandlerInterface, USBRequestHandler
+
+__all__ = (
+	'SharedRequestHandler',
+	'SharedRequestHandlerPort',
+	'USBMultiPortDevice',
+)
+
+class SharedRequestHandlerPort(USBRequestHandler):
+	''' Stands in for a :class:`SharedRequestHandler` on a single port's control endpoint.
+
+	Requests that the shared handler handles are claimed on the port's behalf, and queued for the shared
+	handler. The port's data and status stages are NAK'd until its request is granted the shared handler;
+	after which everything is passed straight through, until the request completes. Created by
+	:meth:`SharedRequestHandler.add_port`.
+
+	Attributes
+	----------
+	upstream: RequestHandlerInterface
+		This port's connection to the shared handler.
+
+	bus_reset: Signal(), input
+		Strobe indicating that this port has seen a bus reset; which abandons any request it has outstanding.
+
+	pending: Signal(), output
+		High while this port has a request waiting for the shared handler.
+	granted: Signal(), input
+		High while this port holds the shared handler.
+	done: Signal(), output
+		Strobe indicating that this port's request is complete; and so it's releasing the shared handler.
+	'''
+
+	def __init__(self, handler: ControlRequestHandler):
+		super().__init__()
+
+		self._handler = handler
+
+		#
+		# I/O port
+		#
+		self.upstream  = RequestHandlerInterface()
+		self.bus_reset = Signal()
+
+		self.pending   = Signal()
+		self.granted   = Signal()
+		self.done      = Signal()
+
+	def handler_condition(self, setup: SetupPacket) -> Operator:
+		return self._handler.handler_condition(setup)
+
+	def elaborate(self, platform):
+		m = Module()
+		interface = self.interface
+		upstream  = self.upstream
+
+		# Queue up for the shared handler whenever we receive a request it handles.
+		with m.If(interface.setup.received & self.handler_condition(interface.setup)):
+			m.d.usb += self.pending.eq(1)
+		with m.Elif(self.granted | self.bus_reset):
+			m.d.usb += self.pending.eq(0)
+
+		# Our SETUP packet is held until the next one arrives; so the shared handler can read it
+		# whenever we're granted. Everything else is only passed along while we hold the handler.
+		m.d.comb += [
+			interface.setup.connect(upstream.setup),
+			interface.tokenizer.connect(upstream.tokenizer),
+			upstream.active_config.eq(interface.active_config),
+		]
+
+		with m.If(self.granted):
+			m.d.comb += [
+				upstream.data_requested.eq(interface.data_requested),
+				upstream.status_requested.eq(interface.status_requested),
+				interface.handshakes_in.connect(upstream.handshakes_in),
+
+				interface.rx.connect(upstream.rx),
+				upstream.rx_ready_for_response.eq(interface.rx_ready_for_response),
+				upstream.rx_invalid.eq(interface.rx_invalid),
+
+				upstream.tx.attach(interface.tx),
+				interface.handshakes_out.ack.eq(upstream.handshakes_out.ack),
+				interface.handshakes_out.nak.eq(upstream.handshakes_out.nak),
+				interface.handshakes_out.stall.eq(upstream.handshakes_out.stall),
+
+				interface.address_changed.eq(upstream.address_changed),
+				interface.new_address.eq(upstream.new_address),
+				interface.config_changed.eq(upstream.config_changed),
+				interface.new_config.eq(upstream.new_config),
+			]
+
+		# Until then, ask the host to try again later [USB2.0: 8.5.3.1].
+		with m.Elif(interface.data_requested | interface.status_requested):
+			m.d.comb += interface.handshakes_out.nak.eq(1)
+
+		# A request that ends with an IN status stage is complete once the host acknowledges our ZLP; so
+		# keep track of whether the handshake we're seeing follows one. Any new token means it doesn't.
+		status_sent = Signal()
+		with m.If(self.granted & interface.status_requested & interface.tx.valid):
+			m.d.usb += status_sent.eq(1)
+		with m.Elif(interface.tokenizer.new_token):
+			m.d.usb += status_sent.eq(0)
+
+		# We're done with the shared handler once our request completes, is stalled, or is abandoned.
+		m.d.comb += self.done.eq(self.granted & (
+			interface.setup.received | self.bus_reset | interface.handshakes_out.stall |
+			(interface.status_requested & interface.handshakes_out.ack) |
+			(status_sent & interface.handshakes_in.ack)
+		))
+
+		return m
+
+class SharedRequestHandler(Elaboratable):
+	''' Shares a single control request handler between the control endpoints of several ports.
+
+	Each port is given a :class:`SharedRequestHandlerPort` to add to its control endpoint. Ports are granted
+	the handler one request at a time, in turn; and the SETUP packet that started the request is replayed to
+	the handler as the grant begins. Between requests, the handler is held in reset; so a request abandoned
+	part-way through never affects the next one.
+
+	The handler sees only one port's signals at a time, so its state outside of a request -- e.g. any
+	descriptor memory -- is shared by every port.
+
+	Parameters
+	----------
+	handler: ControlRequestHandler
+		The request handler to share. It must operate in the ``usb`` domain.
+	'''
+
+	def __init__(self, handler: ControlRequestHandler):
+		self.handler = handler
+		self._ports  = []
+
+	def add_port(self) -> SharedRequestHandlerPort:
+		''' Creates a new port onto the shared handler; which should be added to a control endpoint. '''
+		port = SharedRequestHandlerPort(self.handler)
+		self._ports.append(port)
+
+		return port
+
+	def elaborate(self, platform):
+		m = Module()
+		handler = self.handler.interface
+
+		if not self._ports:
+			raise ValueError('SharedRequestHandler requires at least one port')
+
+		port_count = len(self._ports)
+
+		owner  = Signal(range(port_count))
+		scan   = Signal(range(port_count))
+		busy   = Signal()
+		replay = Signal()
+
+		# Hold our handler in reset whenever it's not lent out.
+		handler_reset = Signal()
+		m.submodules.handler = ResetInserter({'usb': handler_reset})(self.handler)
+		m.d.comb += handler_reset.eq(~busy)
+
+		#
+		# Arbitration.
+		#
+		pending = Cat(port.pending for port in self._ports)
+		done    = Cat(port.done for port in self._ports)
+
+		m.d.usb += replay.eq(0)
+
+		# While our handler is free, look at each port in turn; and lend our handler to the first one we
+		# find waiting. Each port is passed over at most once while the others are served.
+		with m.If(~busy):
+			with m.If(pending.bit_select(scan, 1)):
+				m.d.usb += [
+					owner.eq(scan),
+					busy.eq(1),
+					replay.eq(1),
+				]
+			with m.Else():
+				m.d.usb += scan.eq(Mux(scan == port_count - 1, 0, scan + 1))
+
+		# Once the owner's done, carry on looking from the port after it.
+		with m.Elif(done.bit_select(owner, 1)):
+			m.d.usb += [
+				busy.eq(0),
+				scan.eq(Mux(owner == port_count - 1, 0, owner + 1)),
+			]
+
+		for index, port in enumerate(self._ports):
+			m.d.comb += port.granted.eq(busy & (owner == index))
+
+		#
+		# Connect our handler to whichever port owns it.
+		#
+		m.d.comb += handler.setup.received.eq(replay)
+
+		with m.Switch(owner):
+			for index, port in enumerate(self._ports):
+				upstream = port.upstream
+
+				with m.Case(index):
+					m.d.comb += [
+						upstream.setup.connect(handler.setup, exclude = {'received'}),
+						upstream.tokenizer.connect(handler.tokenizer),
+						handler.active_config.eq(upstream.active_config),
+
+						handler.data_requested.eq(upstream.data_requested),
+						handler.status_requested.eq(upstream.status_requested),
+						upstream.handshakes_in.connect(handler.handshakes_in),
+
+						upstream.rx.connect(handler.rx),
+						handler.rx_ready_for_response.eq(upstream.rx_ready_for_response),
+						handler.rx_invalid.eq(upstream.rx_invalid),
+
+						handler.tx.attach(upstream.tx),
+						upstream.handshakes_out.ack.eq(handler.handshakes_out.ack),
+						upstream.handshakes_out.nak.eq(handler.handshakes_out.nak),
+						upstream.handshakes_out.stall.eq(handler.handshakes_out.stall),
+
+						upstream.address_changed.eq(handler.address_changed),
+						upstream.new_address.eq(handler.new_address),
+						upstream.config_changed.eq(handler.config_changed),
+						upstream.new_config.eq(handler.new_config),
+					]
+
+		return m
+
+class USBMultiPortDevice(Elaboratable):
+	''' A set of USB devices, one per PHY, sharing their descriptors and standard request handling.
+
+	Each port is a complete :class:`USBDevice`, with its own packet layer, address, and configuration; and its
+	own control endpoint, to which additional request handlers can be added. Standard requests from every port
+	are handled by a single :class:`StandardRequestHandler`, and so a single descriptor ROM, through a
+	:class:`SharedRequestHandler`. Requests that arrive while another port holds the handler have their data
+	and status stages NAK'd until it's free; as each request is only a handful of transactions, the delay is
+	small next to the time the host spends between them.
+
+	As every port presents the same descriptors, any serial number is shared by every port; hosts that key
+	devices by serial number may need ports with distinct serial numbers to use separate devices instead.
+
+	All ports must operate in the same ``usb`` domain. Only the first port's PHY is used to handle clocking;
+	any others must run from the same clock.
+
+	Parameters
+	----------
+	buses: Iterable
+		The PHY connection for each port; each as accepted by :class:`USBDevice`.
+	descriptors: DeviceDescriptorCollection
+		The descriptors every port presents.
+	handle_clocking: bool, optional
+		True iff the first port should attempt to connect up the ``usb`` clock domain to its PHY; see
+		:class:`USBDevice`.
+	max_packet_size: int, optional
+		The maximum packet size of each port's control endpoint. Defaults to 64.
+
+	Any additional keyword arguments are passed on to :class:`StandardRequestHandler`.
+
+	Attributes
+	----------
+	ports: list[USBDevice]
+		The device for each port. Each must be connected via its own ``connect`` signal, and can have
+		endpoints added to it as any other device.
+	control_endpoints: list[USBControlEndpoint]
+		The control endpoint of each port.
+	request_handler: StandardRequestHandler
+		The standard request handler shared by every port.
+	'''
+
+	def __init__(
+		self, *, buses: Iterable, descriptors: DeviceDescriptorCollection, handle_clocking = True,
+		max_packet_size = 64, **kwargs
+	):
+		buses = list(buses)
+		if not buses:
+			raise ValueError('A multi-port device requires at least one bus')
+
+		self.request_handler = StandardRequestHandler(descriptors, max_packet_size = max_packet_size, **kwargs)
+		self._shared_handler = SharedRequestHandler(self.request_handler)
+
+		self.ports             = []
+		self.control_endpoints = []
+		self._handler_ports    = []
+
+		for index, bus in enumerate(buses):
+			device = USBDevice(bus = bus, handle_clocking = handle_clocking and (index == 0))
+
+			control_endpoint = USBControlEndpoint(utmi = device.utmi, max_packet_size = max_packet_size)
+			handler_port     = self._shared_handler.add_port()
+			control_endpoint.add_request_handler(handler_port)
+			device.add_endpoint(control_endpoint, endpoint_number = 0)
+
+			self.ports.append(device)
+			self.control_endpoints.append(control_endpoint)
+			self._handler_ports.append(handler_port)
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.shared_handler = self._shared_handler
+
+		for index, (device, handler_port) in enumerate(zip(self.ports, self._handler_ports)):
+			m.submodules[f'port_{index}'] = device
+
+			# A bus reset abandons any request the port has waiting.
+			m.d.comb += handler_port.bus_reset.eq(device.reset_detected)
+
+		return m
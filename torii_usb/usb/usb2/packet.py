@@ -12,6 +12,7 @@ from torii.hdl.rec     import Direction, Record
 from ...interface.utmi import UTMITransmitInterface
 from ..stream          import USBInStreamInterface, USBOutStreamInterface
 from .                 import USBPacketID, USBSpeed
+from .crc              import USB_CRC16_POLYNOMIAL, crc_data_term, crc_state_term, next_crc, usb_crc5
 
 #
 # Interfaces.
@@ -224,19 +225,7 @@ class USBTokenDetector(Elaboratable):
 	@staticmethod
 	def _generate_crc_for_token(token):
 		''' Generates a 5-bit signal equivalent to the CRC check for the provided token packet. '''
-
-		def xor_bits(*indices):
-			bits = Cat(token[len(token) - 1 - i] for i in indices)
-			return bits.xor()
-
-		# Implements the CRC polynomial from the USB specification.
-		return Cat(
-			xor_bits(10, 9, 8, 5, 4, 2),
-			~xor_bits(10, 9, 8, 7, 4, 3, 1),
-			xor_bits(10, 9, 8, 7, 6, 3, 2, 0),
-			xor_bits(10, 7, 6, 4, 1),
-			xor_bits(10, 9, 6, 5, 3, 0)
-		)
+		return usb_crc5(token)
 
 	def elaborate(self, platform):
 		m = Module()
@@ -490,27 +479,45 @@ class USBDataPacketCRC(Elaboratable):
 	These are added using :attr:`add_interface`; this module supports an arbitrary
 	number of connection interfaces; see :attr:`add_interface()` for restrictions.
 
+	The CRC can be advanced by more than one byte per cycle, for use with wider datapaths. In that case, each
+	``valid`` input is a mask with a bit per byte of its ``data`` input; the bytes are applied lowest first, and
+	the valid bytes must be contiguous, starting from the lowest.
+
 	Attributes
 	----------
-	rx_data: Signal(8), input
+	rx_data: Signal(8 * bytes_per_cycle), input
 		Receive data input; can be carried directly from a UTMI interface.
-	rx_valid: Signal(), input
+	rx_valid: Signal(bytes_per_cycle), input
 		Receive validity signal; can be carried directly from a UTMI interface.
 
-	tx_data: Signal(8), input
+	tx_data: Signal(8 * bytes_per_cycle), input
 		Transmit data input; can be carried directly from a UTMI interface.
-	tx_valid: Signal(), input
+	tx_valid: Signal(bytes_per_cycle), input
 		When high, the `tx_data` input is used to update the CRC.
 
+	crc: Signal(16), output
+		The current CRC-16 value; as also provided to each interface.
+
 	Parameters
 	----------
 	initial_value: [int, Const]
 			The initial value of the CRC shift register; the USB default is used if not provided.
+	bytes_per_cycle: int
+		The number of bytes that can be applied to the CRC in a single cycle; 1, 2, or 4. Defaults to 1.
+	pipelined: bool
+		If True, the data's contribution to the CRC is computed and registered a cycle ahead of being applied;
+		which removes the data's XOR network from the CRC's feedback path, but delays each update by a cycle.
+		Defaults to False.
 	'''
 
-	def __init__(self, initial_value = 0xFFFF):
+	def __init__(self, initial_value = 0xFFFF, *, bytes_per_cycle = 1, pipelined = False):
+
+		if bytes_per_cycle not in (1, 2, 4):
+			raise ValueError(f'A data CRC can apply 1, 2, or 4 bytes per cycle, not {bytes_per_cycle}')
 
-		self._initial_value = initial_value
+		self._initial_value   = initial_value
+		self._bytes_per_cycle = bytes_per_cycle
+		self._pipelined       = pipelined
 
 		# List of interfaces to work with.
 		# This list is populated dynamically by calling .add_interface().
@@ -521,11 +528,11 @@ class USBDataPacketCRC(Elaboratable):
 		#
 		self.clear = Signal()
 
-		self.rx_data  = Signal(8)
-		self.rx_valid = Signal()
+		self.rx_data  = Signal(8 * bytes_per_cycle)
+		self.rx_valid = Signal(bytes_per_cycle)
 
-		self.tx_data  = Signal(8)
-		self.tx_valid = Signal()
+		self.tx_data  = Signal(8 * bytes_per_cycle)
+		self.tx_valid = Signal(bytes_per_cycle)
 
 		self.crc   = Signal(16, reset = initial_value)
 
@@ -546,27 +553,8 @@ class USBDataPacketCRC(Elaboratable):
 		self._interfaces.append(interface)
 
 	def _generate_next_crc(self, current_crc: Signal, data_in: Signal):
-		''' Generates the next round of a bytewise USB CRC16. '''
-		# Extracted from the USB spec's definition of the CRC16 polynomial.
-		return Cat(
-			data_in.xor()      ^ current_crc[ 8:16].xor(),
-			data_in[0:7].xor() ^ current_crc[ 9:16].xor(),
-			data_in[6:8].xor() ^ current_crc[ 8:10].xor(),
-			data_in[5:7].xor() ^ current_crc[ 9:11].xor(),
-			data_in[4:6].xor() ^ current_crc[10:12].xor(),
-			data_in[3:5].xor() ^ current_crc[11:13].xor(),
-			data_in[2:4].xor() ^ current_crc[12:14].xor(),
-			data_in[1:3].xor() ^ current_crc[13:15].xor(),
-
-			data_in[0:2].xor() ^ current_crc[14:16].xor() ^ current_crc[0],
-			data_in[0] ^ current_crc[1] ^ current_crc[15],
-			current_crc[2],
-			current_crc[3],
-			current_crc[4],
-			current_crc[5],
-			current_crc[6],
-			data_in.xor() ^ current_crc[7:16].xor(),
-		)
+		''' Generates the next round of a USB CRC16; applying each byte of ``data_in``, lowest first. '''
+		return next_crc(current_crc, data_in, polynomial = USB_CRC16_POLYNOMIAL)
 
 	def elaborate(self, platform):
 		m = Module()
@@ -581,19 +569,69 @@ class USBDataPacketCRC(Elaboratable):
 		start_signals = Cat(interface.start for interface in self._interfaces)
 		clear = start_signals.any()
 
-		# If we're clearing our CRC in progress, move our holding register back to
-		# our initial value.
-		with m.If(clear):
-			m.d.usb += crc.eq(self._initial_value)
+		# Select the data we're applying this cycle; received data takes priority.
+		data  = Signal.like(self.rx_data)
+		valid = Signal.like(self.rx_valid)
+		with m.If(self.rx_valid.any()):
+			m.d.comb += [
+				data.eq(self.rx_data),
+				valid.eq(self.rx_valid),
+			]
+		with m.Else():
+			m.d.comb += [
+				data.eq(self.tx_data),
+				valid.eq(self.tx_valid),
+			]
+
+		# Our valid bytes are contiguous; so the highest valid byte tells us how many bytes we're applying.
+		byte_counts = [
+			(count, '0' * (self._bytes_per_cycle - count) + '1' + '-' * (count - 1))
+			for count in range(1, self._bytes_per_cycle + 1)
+		]
+
+		if self._pipelined:
+			data_term  = Signal.like(crc)
+			byte_count = Signal(range(self._bytes_per_cycle + 1))
+
+			# Compute the data's contribution to our CRC a cycle ahead; discarding anything alongside a clear...
+			m.d.usb += byte_count.eq(0)
+			with m.If(~clear):
+				with m.Switch(valid):
+					for count, pattern in byte_counts:
+						with m.Case(pattern):
+							m.d.usb += [
+								data_term.eq(crc_data_term(data[0:8 * count], 16, polynomial = USB_CRC16_POLYNOMIAL)),
+								byte_count.eq(count),
+							]
 
-		# Otherwise, update the CRC whenever we have new data.
-		with m.Elif(self.rx_valid):
-			m.d.usb += crc.eq(self._generate_next_crc(crc, self.rx_data))
-		with m.Elif(self.tx_valid):
-			m.d.usb += crc.eq(self._generate_next_crc(crc, self.tx_data))
+			# ... and then apply it.
+			with m.If(clear):
+				m.d.usb += crc.eq(self._initial_value)
+			with m.Else():
+				with m.Switch(byte_count):
+					for count, _ in byte_counts:
+						with m.Case(count):
+							state_term = crc_state_term(crc, 8 * count, polynomial = USB_CRC16_POLYNOMIAL)
+							m.d.usb += crc.eq(state_term ^ data_term)
+
+		else:
+			# If we're clearing our CRC in progress, move our holding register back to
+			# our initial value.
+			with m.If(clear):
+				m.d.usb += crc.eq(self._initial_value)
+
+			# Otherwise, update the CRC whenever we have new data.
+			with m.Elif(valid.any()):
+				with m.Switch(valid):
+					for count, pattern in byte_counts:
+						with m.Case(pattern):
+							m.d.usb += crc.eq(self._generate_next_crc(crc, data[0:8 * count]))
 
 		# Convert from our intermediary 'running CRC' format into the current CRC-16...
-		m.d.comb += output_crc.eq(~crc[::-1])
+		m.d.comb += [
+			output_crc.eq(~crc[::-1]),
+			self.crc.eq(output_crc),
+		]
 
 		# ... and connect it to each of our interfaces.
 		for interface in self._interfaces:
@@ -1185,16 +1223,19 @@ class USBHandshakeGenerator(Elaboratable):
 		Pulsed to generate a NAK handshake packet.
 	issue_stall: Signal(), input
 		Pulsed to generate a STALL handshake.
+	issue_nyet: Signal(), input
+		Pulsed to generate a NYET handshake. Only valid on high-speed links.
 
 	tx: UTMITransmitInterface
 		Interface to the relevant UTMI interface.
 	'''
 
-	# Full contents of an ACK, NAK, and STALL packet.
+	# Full contents of an ACK, NAK, STALL, and NYET packet.
 	# These include the four check bits; which consist of the inverted PID.
 	_PACKET_ACK   = 0b11010010
 	_PACKET_NAK   = 0b01011010
 	_PACKET_STALL = 0b00011110
+	_PACKET_NYET  = 0b10010110
 
 	def __init__(self):
 
@@ -1204,6 +1245,7 @@ class USBHandshakeGenerator(Elaboratable):
 		self.issue_ack    = Signal()
 		self.issue_nak    = Signal()
 		self.issue_stall  = Signal()
+		self.issue_nyet   = Signal()
 
 		self.tx           = UTMITransmitInterface()
 
@@ -1216,7 +1258,7 @@ class USBHandshakeGenerator(Elaboratable):
 			with m.State('IDLE'):
 				m.d.comb += self.tx.valid.eq(0)
 
-				# Wait until we have an ACK, NAK, or STALL request;
+				# Wait until we have an ACK, NAK, STALL, or NYET request;
 				# Then set our data value to the appropriate PID,
 				# in preparation for the next cycle.
 
@@ -1232,6 +1274,10 @@ class USBHandshakeGenerator(Elaboratable):
 					m.d.usb += self.tx.data.eq(self._PACKET_STALL),
 					m.next = 'TRANSMIT'
 
+				with m.If(self.issue_nyet):
+					m.d.usb += self.tx.data.eq(self._PACKET_NYET),
+					m.next = 'TRANSMIT'
+
 			# TRANSMIT -- send the handshake.
 			with m.State('TRANSMIT'):
 				m.d.comb += self.tx.valid.eq(1)
@@ -8,7 +8,7 @@
 
 from abc           import abstractmethod
 
-from torii.hdl     import Cat, Elaboratable, Module, Signal
+from torii.hdl     import Cat, Const, Elaboratable, Module, Mux, Signal
 from torii.hdl.ast import Operator
 
 from ...utils.bus  import OneHotMultiplexer
@@ -55,6 +55,8 @@ class RequestHandlerInterface:
 		# Data tx signals.
 		*: tx                     - The transmit stream for any packets generated by the handler.
 		O: handshakes_out         - Carries handshake generation requests.
+		O: tx_data_pid            - Deprecated, and ignored. The control endpoint now tracks the data PID
+									sequence itself.
 	'''
 
 	def __init__(self):
@@ -264,10 +266,13 @@ class USBRequestHandlerMultiplexer(Elaboratable):
 	'''
 	Multiplexes multiple RequestHandlers down to a single interface.
 
-	Interfaces are added using .add_interface().
+	Interfaces are added using .add_interface(). If an interface is added along with its handler's condition,
+	that condition is evaluated once per SETUP packet, and the result registered; so the multiplexer's outputs
+	are selected by a one-hot register rather than by logic that grows deeper with each handler added.
 
 	I/O port:
-		*: shared -- The post-multiplexer RequestHandler interface.
+		*: shared    -- The post-multiplexer RequestHandler interface.
+		O: unhandled -- High when none of the conditioned interfaces claimed the most recent SETUP packet.
 	'''
 
 	def __init__(self):
@@ -275,25 +280,39 @@ class USBRequestHandlerMultiplexer(Elaboratable):
 		#
 		# I/O port
 		#
-		self.shared = RequestHandlerInterface()
+		self.shared    = RequestHandlerInterface()
+		self.unhandled = Signal(reset = 1)
 
 		#
 		# Internals
 		#
 		self._interfaces = []
+		self._conditions = []
 
-	def add_interface(self, interface: RequestHandlerInterface):
+	def add_interface(self, interface: RequestHandlerInterface, *, condition = None):
 		'''
 		Adds a RequestHandlerInterface to the multiplexer.
 
 		Arbitration is not performed; it's expected only one handler will be
 		driving requests at a time.
+
+		Parameters
+		----------
+		interface
+			The interface to be multiplexed.
+
+		condition
+			Optional; a function that accepts a SetupPacket, and returns a Torii conditional indicating
+			whether the interface handles that request -- typically its handler's ``handler_condition``.
+			If provided, the interface's outputs are only passed through while it's selected by the most
+			recent SETUP packet. If omitted, the interface's outputs are always passed through.
 		'''
 		self._interfaces.append(interface)
+		self._conditions.append(condition)
 
-	def _multiplex_signals(self, m, *, when, multiplex, sub_bus = None):
+	def _multiplex_signals(self, m, *, when, multiplex, selected, sub_bus = None):
 		'''
-		Helper that creates a simple priority-encoder multiplexer.
+		Helper that creates a simple one-hot multiplexer.
 
 		Parameters
 		----------
@@ -305,6 +324,10 @@ class USBRequestHandlerMultiplexer(Elaboratable):
 		multiplex
 			The names of the interface signals to be multiplexed.
 
+		selected
+			A list of signals, one per interface, indicating whether each interface
+			has been selected by the most recent SETUP packet.
+
 		'''
 
 		def get_signal(interface, name):
@@ -316,26 +339,17 @@ class USBRequestHandlerMultiplexer(Elaboratable):
 			else:
 				return getattr(interface, name)
 
-		# We're building an if-elif tree; so we should start with an If entry.
-		conditional = m.If
-
-		for interface in self._interfaces:
-			condition = get_signal(interface, when)
+		# As only one interface should be strobing `when` at once, we can AND each interface's signals with its
+		# strobe, and then OR them all together; which keeps our logic shallow regardless of our interface count.
+		for signal_name in multiplex:
+			target_signal = get_signal(self.shared, signal_name)
 
-			with conditional(condition):
+			driving_signal = Const(0)
+			for interface, interface_selected in zip(self._interfaces, selected):
+				strobe = get_signal(interface, when) & interface_selected
+				driving_signal = driving_signal | Mux(strobe, get_signal(interface, signal_name), 0)
 
-				# Connect up each of our signals.
-				for signal_name in multiplex:
-
-					# Get the actual signals for our input and output...
-					driving_signal = get_signal(interface,   signal_name)
-					target_signal  = get_signal(self.shared, signal_name)
-
-					# ... and connect them.
-					m.d.comb += target_signal.eq(driving_signal)
-
-			# After the first element, all other entries should be created with Elif.
-			conditional = m.Elif
+			m.d.comb += target_signal.eq(driving_signal)
 
 	def elaborate(self, platform):
 		m = Module()
@@ -359,36 +373,72 @@ class USBRequestHandlerMultiplexer(Elaboratable):
 				interface.rx_invalid.eq(shared.rx_invalid),
 			]
 
+		#
+		# Handler selection.
+		#
+
+		# Evaluate each of our handler conditions once per SETUP packet, and register the result. Each
+		# condition is then only evaluated against a freshly-registered setup packet; and everything
+		# downstream of it is driven from a one-hot register.
+		selected   = []
+		conditions = []
+		for index, condition in enumerate(self._conditions):
+			if condition is None:
+				selected.append(Const(1))
+				continue
+
+			interface_selected = Signal(name = f'handler_{index}_selected')
+			handled = condition(shared.setup)
+
+			with m.If(shared.setup.received):
+				m.d.usb += interface_selected.eq(handled)
+
+			selected.append(interface_selected)
+			conditions.append(handled)
+
+		with m.If(shared.setup.received):
+			m.d.usb += self.unhandled.eq(~Cat(conditions).any())
+
 		#
 		# Multiplex the signals being routed -from- our pre-mux interface.
 		#
-		self._multiplex_signals(m, when = 'address_changed', multiplex = ['address_changed', 'new_address'])
-		self._multiplex_signals(m, when = 'config_changed', multiplex = ['config_changed', 'new_config'])
+		self._multiplex_signals(
+			m, when = 'address_changed', multiplex = ['address_changed', 'new_address'], selected = selected
+		)
+		self._multiplex_signals(
+			m, when = 'config_changed', multiplex = ['config_changed', 'new_config'], selected = selected
+		)
 
-		# Connect up our transmit interface.
+		# Connect up our transmit interface; only allowing each handler to transmit when it's been selected.
 		m.submodules.tx_mux = tx_mux = OneHotMultiplexer(
 			interface_type = USBInStreamInterface,
 			mux_signals = ('data',),
 			or_signals = ('valid', 'first', 'last'),
 			pass_signals = ('ready',)
 		)
-		tx_mux.add_interfaces(i.tx for i in self._interfaces)
+		for interface, interface_selected in zip(self._interfaces, selected):
+			tx = USBInStreamInterface()
+			m.d.comb += [
+				tx.valid.eq(interface.tx.valid & interface_selected),
+				tx.first.eq(interface.tx.first & interface_selected),
+				tx.last.eq(interface.tx.last & interface_selected),
+				tx.data.eq(interface.tx.data),
+				interface.tx.ready.eq(tx.ready & interface_selected),
+			]
+			tx_mux.add_interface(tx)
 		m.d.comb += self.shared.tx.stream_eq(tx_mux.output)
 
-		# Pass through the relevant PID from our data source.
-		for i in self._interfaces:
-			with m.If(i.tx.valid):
-				m.d.comb += self.shared.tx_data_pid.eq(i.tx_data_pid)
-
-		# OR together all of our handshake-generation requests.
-		any_ack   = Cat(i.handshakes_out.ack   for i in self._interfaces).any()
-		any_nak   = Cat(i.handshakes_out.nak   for i in self._interfaces).any()
-		any_stall = Cat(i.handshakes_out.stall for i in self._interfaces).any()
+		# OR together all of our selected handlers' handshake-generation requests.
+		def any_handshake(name):
+			return Cat(
+				getattr(interface.handshakes_out, name) & interface_selected
+				for interface, interface_selected in zip(self._interfaces, selected)
+			).any()
 
 		m.d.comb += [
-			shared.handshakes_out.ack.eq(any_ack),
-			shared.handshakes_out.nak.eq(any_nak),
-			shared.handshakes_out.stall.eq(any_stall),
+			shared.handshakes_out.ack.eq(any_handshake('ack')),
+			shared.handshakes_out.nak.eq(any_handshake('nak')),
+			shared.handshakes_out.stall.eq(any_handshake('stall')),
 		]
 
 		return m
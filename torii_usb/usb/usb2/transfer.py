@@ -9,10 +9,11 @@ This module contains gateware designed to assist with endpoint/transfer state ma
 Its components facilitate data transfer longer than a single packet.
 '''
 
-from torii.hdl               import Array, Elaboratable, Module, Signal
+from torii.hdl               import Array, Const, Elaboratable, Module, Mux, Signal
 from torii.hdl.mem           import Memory
 from torii.lib.stream.simple import StreamInterface
 
+from ...utils.cdc            import synchronize, synchronize_count
 from ..stream                import USBInStreamInterface
 from .packet                 import HandshakeExchangeInterface, TokenDetectorInterface
 
@@ -74,11 +75,24 @@ class USBInTransferManager(Elaboratable):
 	----------
 	max_packet_size: int
 		The maximum packet size for our associated endpoint, in bytes.
+	buffer_count: int, optional
+		The number of max-packet-size buffers to use; all of which share a single memory. One buffer is
+		always being filled; the rest hold packets waiting to be sent. Defaults to two; i.e. double buffering.
+	stream_domain: str, optional
+		The name of the domain :attr:`transfer_stream`, :attr:`flush` and :attr:`discard` live in. If this
+		isn't ``usb``, our packet buffer is dual-clocked; with packets crossing into the ``usb`` domain once
+		they're complete. In this case, :attr:`discard` should be held for several ``usb`` domain cycles.
+		Defaults to ``usb``.
 	'''
 
-	def __init__(self, max_packet_size):
+	def __init__(self, max_packet_size, *, buffer_count = 2, stream_domain = 'usb'):
+
+		if buffer_count < 2:
+			raise ValueError(f'USBInTransferManager requires at least two buffers, not {buffer_count}')
 
 		self._max_packet_size = max_packet_size
+		self._buffer_count    = buffer_count
+		self._stream_domain   = stream_domain
 
 		#
 		# I/O port
@@ -94,7 +108,6 @@ class USBInTransferManager(Elaboratable):
 		# Note: we'll start with DATA1 in our register; as we'll toggle our data PID
 		# before we send.
 		self.data_pid         = Signal(2, reset = 1)
-		self.buffer_toggle    = Signal()
 
 		self.tokenizer        = TokenDetectorInterface()
 		self.handshakes_in    = HandshakeExchangeInterface(is_detector = True)
@@ -107,12 +120,15 @@ class USBInTransferManager(Elaboratable):
 	def elaborate(self, platform):
 		m = Module()
 
+		stream_domain = self._stream_domain
+		crosses_domains = (stream_domain != 'usb')
+
 		#
 		# Transceiver state.
 		#
 
 		# Handle our PID-sequence reset.
-		# Note that we store the _inverse_ of our data PID, as we'll toggle our DATA PID
+		# Note that we store the _inverse_ of our data PID, as we'll toggle our data PID
 		# before sending.
 		with m.If(self.reset_sequence):
 			m.d.usb += self.data_pid.eq(~self.start_with_data1)
@@ -128,46 +144,54 @@ class USBInTransferManager(Elaboratable):
 		# Accordingly, we'll buffer a full USB packet of data, and then transmit
 		# it once either a) our buffer is full, or 2) the transfer ends (last = 1).
 		#
-		# This implementation is double buffered; so a buffer fill can be pipelined
-		# with a transmit.
+		# This implementation is multi-buffered; so buffer fills can be pipelined
+		# with a transmit. Our buffers are stored as a ring of packet-sized slots in
+		# a single memory; with each slot having a small descriptor that tracks its fill.
+		#
+		# Our buffer is split into a write side, which lives in our stream's domain, and a read side,
+		# which lives in the USB domain. The two sides only communicate through counts of the slots
+		# committed and released; so, if the sides live in different domains, those counts can be
+		# crossed as Gray codes.
 		#
 
-		# We'll create two buffers; so we can fill one as we empty the other.
-		buffer = Array(
-			Memory(width = 8, depth = self._max_packet_size, name = f'transmit_buffer_{i}') for i in range(2)
-		)
-		buffer_write_ports = Array(buffer[i].write_port(domain = 'usb') for i in range(2))
-		buffer_read_ports  = Array(buffer[i].read_port(domain = 'usb') for i in range(2))
+		buffer_count = self._buffer_count
 
-		m.submodules.read_port_0,  m.submodules.read_port_1  = buffer_read_ports
-		m.submodules.write_port_0, m.submodules.write_port_1 = buffer_write_ports
+		# We'll create a single memory large enough to hold all of our packet slots.
+		buffer = Memory(width = 8, depth = self._max_packet_size * buffer_count, name = 'transmit_buffer')
+		m.submodules.buffer_write = buffer_write = buffer.write_port(domain = stream_domain)
+		m.submodules.buffer_read  = buffer_read  = buffer.read_port(domain = 'usb', transparent = not crosses_domains)
 
-		# Create values equivalent to the buffer numbers for our read and write buffer; which switch
-		# whenever we swap our two buffers.
-		write_buffer_number = self.buffer_toggle
-		read_buffer_number  = ~self.buffer_toggle
+		# Keep track of the slot we're currently filling, and the slot we're currently sending from.
+		write_slot    = Signal(range(buffer_count))
+		read_slot     = Signal(range(buffer_count))
 
-		# Create a shorthand that refers to the buffer to be filled; and the buffer to send from.
-		# We'll call these the Read and Write buffers.
-		buffer_write = buffer_write_ports[write_buffer_number]
-		buffer_read  = buffer_read_ports[read_buffer_number]
+		# Keep running counts of the slots that have been handed off for sending, and the slots that have
+		# since been freed. These wrap around freely; their difference is the number of packets ready to send.
+		slots_committed = Signal(buffer_count.bit_length())
+		slots_released  = Signal(buffer_count.bit_length())
 
-		# Buffer state tracking:
-		# - Our ``fill_count`` keeps track of how much data is stored in a given buffer.
+		# Packet descriptor state tracking:
+		# - Our ``fill_count`` keeps track of how much data is stored in a given slot.
 		# - Our ``stream_ended`` bit keeps track of whether the stream ended while filling up
-		#   the given buffer. This indicates that the buffer cannot be filled further; and, when
-		#   ``generate_zlps`` is enabled, is used to determine if the given buffer should end in
+		#   the given slot. This indicates that the slot cannot be filled further; and, when
+		#   ``generate_zlps`` is enabled, is used to determine if the given slot should end in
 		#   a short packet; which determines whether ZLPs are emitted.
-		buffer_fill_count   = Array(Signal(range(0, self._max_packet_size + 1)) for _ in range(2))
-		buffer_stream_ended = Array(Signal(name = f'stream_ended_in_buffer{i}') for i in range(2))
+		#
+		# Descriptors are only ever modified by the write side; once a slot has been committed, its descriptor
+		# is left untouched until the slot is released and re-acquired.
+		buffer_fill_count   = Array(Signal(range(0, self._max_packet_size + 1)) for _ in range(buffer_count))
+		buffer_stream_ended = Array(Signal(name = f'stream_ended_in_buffer{i}') for i in range(buffer_count))
 
-		# Create shortcuts to active fill_count / stream_ended signals for the buffer being written.
-		write_fill_count   = buffer_fill_count[write_buffer_number]
-		write_stream_ended = buffer_stream_ended[write_buffer_number]
+		# Create shortcuts to active fill_count / stream_ended signals for the slot being written.
+		write_fill_count   = buffer_fill_count[write_slot]
+		write_stream_ended = buffer_stream_ended[write_slot]
 
 		# Create shortcuts to the fill_count / stream_ended signals for the packet being sent.
-		read_fill_count   = buffer_fill_count[read_buffer_number]
-		read_stream_ended = buffer_stream_ended[read_buffer_number]
+		read_fill_count   = buffer_fill_count[read_slot]
+		read_stream_ended = buffer_stream_ended[read_slot]
+
+		# Keep track of whether the slot being sent still needs to be followed by a ZLP.
+		zlp_pending = Signal()
 
 		# Keep track of our current send position; which determines where we are in the packet.
 		send_position = Signal(range(0, self._max_packet_size + 1))
@@ -176,42 +200,96 @@ class USBInTransferManager(Elaboratable):
 		in_stream  = self.transfer_stream
 		out_stream = self.packet_stream
 
+		# Strobes that indicate when we're handing the slot we're filling off to be sent, and when
+		# we're freeing the slot we've just finished sending.
+		commit_slot  = Signal()
+		release_slot = Signal()
+
+		#
+		# Domain crossing.
+		#
+		if crosses_domains:
+			# Each side sees a delayed view of the other side's count. Each count only ever moves by one per
+			# cycle; so both can be safely crossed as Gray codes. These views are always conservative: the
+			# write side never sees a slot freed early, and the read side never sees a slot committed early.
+			released_for_writer  = synchronize_count(
+				m, slots_released, i_domain = 'usb', o_domain = stream_domain
+			)
+			committed_for_reader = synchronize_count(
+				m, slots_committed, i_domain = stream_domain, o_domain = 'usb'
+			)
+
+			# Our read side can't see commits or releases happening in the other domain as they happen.
+			slot_committing = Const(0)
+			slot_releasing  = Const(0)
+
+			# Discards are requested from our stream's domain; and drained in the USB domain, where our
+			# read side releases each of its ready slots in turn. Our write side considers itself discarding
+			# until the read side has finished draining.
+			discard_request = Signal()
+			m.d[stream_domain] += discard_request.eq(self.discard)
+			usb_discard  = synchronize(m, discard_request, o_domain = 'usb')
+			draining     = Signal()
+
+			write_discard = self.discard | synchronize(m, draining, o_domain = stream_domain)
+			read_discard  = usb_discard | draining
+
+		else:
+			released_for_writer  = slots_released
+			committed_for_reader = slots_committed
+
+			slot_committing = commit_slot
+			slot_releasing  = release_slot
+
+			write_discard = self.discard
+			read_discard  = self.discard
+
+		# Figure out how many packets are ready to send, from each side's point of view.
+		slots_in_use  = Signal.like(slots_committed)
+		packets_ready = Signal.like(slots_committed)
+		m.d.comb += [
+			slots_in_use.eq(slots_committed - released_for_writer),
+			packets_ready.eq(committed_for_reader - slots_released),
+		]
+
+		#
+		# Write side.
+		#
+
 		# Use our memory's two ports to capture data from our transfer stream; and two emit packets
 		# into our packet stream. Since we'll never receive to anywhere else, or transmit to anywhere else,
 		# we can just unconditionally connect these.
 		m.d.comb += [
 
 			# We'll only ever -write- data from our input stream...
-			buffer_write_ports[0].data.eq(in_stream.data),
-			buffer_write_ports[0].addr.eq(write_fill_count),
-			buffer_write_ports[1].data.eq(in_stream.data),
-			buffer_write_ports[1].addr.eq(write_fill_count),
+			buffer_write.data.eq(in_stream.data),
+			buffer_write.addr.eq((write_slot * self._max_packet_size) + write_fill_count),
 
-			# ... and we'll only ever -send- data from the Read buffer.
-			buffer_read.addr.eq(send_position),
+			# ... and we'll only ever -send- data from the Read slot.
+			buffer_read.addr.eq((read_slot * self._max_packet_size) + send_position),
 			out_stream.data.eq(buffer_read.data),
 
-			# We're ready to receive data iff we have space in the buffer we're currently filling.
+			# We're ready to receive data iff we have space in the slot we're currently filling.
 			in_stream.ready.eq((write_fill_count != self._max_packet_size) & ~write_stream_ended),
 			buffer_write.en.eq(in_stream.valid & in_stream.ready)
 		]
 
-		# Set both fill counts to zero when we discard data.
-		with m.If(self.discard):
-			m.d.usb += [
-				write_fill_count.eq(0),
-				write_stream_ended.eq(0),
-				read_fill_count.eq(0),
-				read_stream_ended.eq(0),
-			]
+		# Set our fill counts to zero when we discard data. If we share a domain with our read side, we can
+		# clear every slot at once; otherwise, we'll only clear the slot we own, and let the read side drain the rest.
+		with m.If(write_discard):
+			for slot in ([write_slot] if crosses_domains else range(buffer_count)):
+				m.d[stream_domain] += [
+					buffer_fill_count[slot].eq(0),
+					buffer_stream_ended[slot].eq(0),
+				]
 
 		# Increment our fill count whenever we accept new data.
 		with m.Elif(buffer_write.en):
-			m.d.usb += write_fill_count.eq(write_fill_count + 1)
+			m.d[stream_domain] += write_fill_count.eq(write_fill_count + 1)
 
 		# If the stream ends while we're adding data to the buffer, mark this as an ended stream.
 		with m.If(in_stream.last & buffer_write.en):
-			m.d.usb += write_stream_ended.eq(1)
+			m.d[stream_domain] += write_stream_ended.eq(1)
 
 		# If we have valid data that will end our packet, we're no longer waiting for data.
 		# We'll now wait for the host to request data from us.
@@ -224,13 +302,65 @@ class USBInTransferManager(Elaboratable):
 		packet_flush = self.flush & (write_fill_count != 0)
 
 		# Packet is ready when the following conditions are met
-		packet_ready = (last_packet_byte | packet_flush) & ~self.discard
+		packet_ready = (last_packet_byte | packet_flush) & ~write_discard
+
+		# A packet that's already been completed -- but that we couldn't yet hand off, as there were no
+		# free slots -- is also waiting to be committed; this is the case whenever we can't accept more data.
+		packet_waiting = (packet_ready | ~in_stream.ready) & ~write_discard
+
+		# We can only hand off our write slot if there's a free slot for us to continue filling;
+		# which is the case if we have a free slot, or we're freeing the slot being sent.
+		slot_available = (slots_in_use != buffer_count - 1) | slot_releasing
+		m.d.comb += commit_slot.eq(packet_waiting & slot_available)
+
+		# When we hand off our slot, we'll move on to the next one; which is free, so we can reset its descriptor.
+		next_write_slot = Mux(write_slot == buffer_count - 1, 0, write_slot + 1)
+		with m.If(commit_slot):
+			m.d[stream_domain] += [
+				write_slot.eq(next_write_slot),
+				slots_committed.eq(slots_committed + 1),
+
+				buffer_fill_count[next_write_slot].eq(0),
+				buffer_stream_ended[next_write_slot].eq(0),
+			]
+
+		#
+		# Read side.
+		#
 
 		# Shortcut for when we need to deal with an in token.
 		# Pulses high an interpacket delay after receiving an IN token.
 		in_token_received = self.active & self.tokenizer.is_in & self.tokenizer.ready_for_response
 
-		with m.FSM(domain = 'usb'):
+		with m.If(release_slot):
+			m.d.usb += [
+				read_slot.eq(Mux(read_slot == buffer_count - 1, 0, read_slot + 1)),
+				slots_released.eq(slots_released + 1),
+				zlp_pending.eq(0),
+			]
+
+		# When we discard data, we'll drop all of our ready packets. If we share a domain with our write side,
+		# we can catch up with it immediately; otherwise, we'll release each of our ready slots in turn.
+		if crosses_domains:
+			with m.If(usb_discard):
+				m.d.usb += draining.eq(1)
+			with m.Elif(packets_ready == 0):
+				m.d.usb += draining.eq(0)
+
+		else:
+			with m.If(self.discard):
+				m.d.usb += [
+					slots_released.eq(slots_committed),
+					read_slot.eq(write_slot),
+				]
+
+		with m.If(read_discard):
+			m.d.usb += zlp_pending.eq(0)
+
+		# Figure out whether we'll have another packet ready to send once we've freed our current slot.
+		more_packets_ready = (packets_ready > 1) | slot_committing
+
+		with m.FSM(domain = 'usb') as fsm:
 
 			# WAIT_FOR_DATA -- We don't yet have a full packet to transmit, so  we'll capture data
 			# to fill the our buffer. At full throughput, this state will never be reached after
@@ -241,18 +371,11 @@ class USBInTransferManager(Elaboratable):
 				m.d.comb += self.handshakes_out.nak.eq(in_token_received)
 
 				# If we've just finished a packet, we now have data we can send!
-				with m.If(packet_ready):
+				# We're now ready to take the data we've captured and _transmit_ it; so we'll
+				# toggle our data PID. (Our commit logic above hands off the slot itself.)
+				with m.If(((packets_ready != 0) | slot_committing) & ~read_discard):
 					m.next = 'WAIT_TO_SEND'
-					m.d.usb += [
-
-						# We're now ready to take the data we've captured and _transmit_ it.
-						# We'll swap our read and write buffers, and toggle our data PID.
-						self.buffer_toggle.eq(~self.buffer_toggle),
-						self.data_pid[0].eq(~self.data_pid[0]),
-
-						# Mark our current stream as no longer having ended.
-						read_stream_ended.eq(0)
-					]
+					m.d.usb += self.data_pid[0].eq(~self.data_pid[0])
 
 			# WAIT_TO_SEND -- we now have at least a buffer full of data to send; we'll
 			# need to wait for an IN token to send it.
@@ -260,7 +383,7 @@ class USBInTransferManager(Elaboratable):
 				m.d.usb += send_position.eq(0),
 
 				# If discarding data, go back to waiting for new data.
-				with m.If(self.discard):
+				with m.If(read_discard):
 					# Undo the data PID toggle.
 					m.d.usb += self.data_pid[0].eq(~self.data_pid[0])
 					m.next = "WAIT_FOR_DATA"
@@ -269,7 +392,7 @@ class USBInTransferManager(Elaboratable):
 				with m.Elif(in_token_received):
 
 					# If we have a packet to send, send it.
-					with m.If(read_fill_count):
+					with m.If((read_fill_count != 0) & ~zlp_pending):
 						m.next = 'SEND_PACKET'
 						m.d.usb += out_stream.first.eq(1)
 
@@ -280,8 +403,8 @@ class USBInTransferManager(Elaboratable):
 							out_stream.valid.eq(1),
 							out_stream.last.eq(1),
 						]
-						# ... and clear the need to follow up with one, since we've just sent a short packet.
-						m.d.usb += read_stream_ended.eq(0)
+						# ... and note that we've now sent it, since we've just sent a short packet.
+						m.d.usb += zlp_pending.eq(1)
 						m.next = 'WAIT_FOR_ACK'
 
 			with m.State('SEND_PACKET'):
@@ -308,7 +431,7 @@ class USBInTransferManager(Elaboratable):
 					]
 
 					# Move our memory pointer to its next position.
-					m.d.comb += buffer_read.addr.eq(send_position + 1),
+					m.d.comb += buffer_read.addr.eq((read_slot * self._max_packet_size) + send_position + 1),
 
 					# If we've just sent our last packet, we're now ready to wait for a
 					# response from our host.
@@ -320,46 +443,52 @@ class USBInTransferManager(Elaboratable):
 			with m.State('WAIT_FOR_ACK'):
 
 				# If discarding data, go back to waiting for new data.
-				with m.If(self.discard):
+				with m.If(read_discard):
 					m.next = "WAIT_FOR_DATA"
 
 				# If the host does ACK...
 				with m.Elif(self.handshakes_in.ack):
-					# ... clear the data we've sent from our buffer.
-					m.d.usb += read_fill_count.eq(0)
 
 					# Figure out if we'll need to follow up with a ZLP. If we have ZLP generation enabled,
 					# we'll make sure we end on a short packet. If this is max-packet-size packet _and_ our
 					# transfer ended with this packet; we'll need to inject a ZLP.
-					is_max_packet = read_fill_count == self._max_packet_size
+					is_max_packet = (read_fill_count == self._max_packet_size) & ~zlp_pending
 					follow_up_with_zlp = self.generate_zlps & is_max_packet & read_stream_ended
 
 					# If we're following up with a ZLP, move back to our 'wait to send' state.
-					# Since we've now cleared our fill count; this next go-around will emit a ZLP.
+					# Since we've now marked our ZLP as pending; this next go-around will emit a ZLP.
 					with m.If(follow_up_with_zlp):
-						m.d.usb += self.data_pid[0].eq(~self.data_pid[0]),
-						m.next = 'WAIT_TO_SEND'
-
-					# Otherwise, there's a possibility we already have a packet-worth of data waiting
-					# for us in our 'write buffer', which we've been filling in the background.
-					# If this is the case, we'll flip which buffer we're working with, toggle our data pid,
-					# and then ready ourselves for transmit.
-					with m.Elif(~in_stream.ready | packet_ready):
-						m.next = 'WAIT_TO_SEND'
 						m.d.usb += [
-							self.buffer_toggle.eq(~self.buffer_toggle),
 							self.data_pid[0].eq(~self.data_pid[0]),
-							read_stream_ended.eq(0)
+							zlp_pending.eq(1),
 						]
+						m.next = 'WAIT_TO_SEND'
 
-					# If neither of the above conditions are true; we now don't have enough data to send.
-					# We'll wait for enough data to transmit.
+					# Otherwise, we're done with this slot, and can free it.
 					with m.Else():
-						m.next = 'WAIT_FOR_DATA'
+						m.d.comb += release_slot.eq(packets_ready != 0)
+
+						# There's a possibility we already have a packet-worth of data waiting for us
+						# in our other slots, which we've been filling in the background. If this is
+						# the case, we'll move on to the next slot, toggle our data pid, and then ready
+						# ourselves for transmit.
+						with m.If(more_packets_ready):
+							m.next = 'WAIT_TO_SEND'
+							m.d.usb += self.data_pid[0].eq(~self.data_pid[0])
+
+						# If neither of the above conditions are true; we now don't have enough data to send.
+						# We'll wait for enough data to transmit.
+						with m.Else():
+							m.next = 'WAIT_FOR_DATA'
 
 				# If the host starts a new packet without ACK'ing, we'll need to retransmit (unless dicarding).
 				# We'll move back to our 'wait for token' state without clearing our buffer.
-				with m.If(self.tokenizer.new_token & ~self.discard):
+				with m.If(self.tokenizer.new_token & ~read_discard):
 					m.next = 'WAIT_TO_SEND'
 
+		# If we're draining our ready slots, release one each cycle; though never the one we're sending.
+		if crosses_domains:
+			with m.If(read_discard & ~fsm.ongoing('SEND_PACKET')):
+				m.d.comb += release_slot.eq(packets_ready != 0)
+
 		return m
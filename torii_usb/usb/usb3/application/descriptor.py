@@ -6,12 +6,17 @@
 
 ''' Utilities for building USB3 descriptors into gateware. '''
 
-from torii.hdl                          import DomainRenamer, Elaboratable, Module, Signal
+import logging
+
+from torii.hdl                          import Cat, DomainRenamer, Elaboratable, Memory, Module, Mux, Signal
 
 from usb_construct.emitters.descriptors import DeviceDescriptorCollection
 
 from ....stream.generator               import ConstantStreamGenerator
 from ...stream                          import SuperSpeedStreamInterface
+from ...usb2.descriptor                 import DescriptorROMLayout
+
+log = logging.getLogger(__name__)
 
 class GetDescriptorHandler(Elaboratable):
 	''' Gateware that handles responding to GetDescriptor requests.
@@ -132,3 +137,189 @@ class GetDescriptorHandler(Elaboratable):
 			m = DomainRenamer(sync = self._domain)(m)
 
 		return m
+
+class GetDescriptorHandlerBlock(Elaboratable):
+	''' Gateware that handles responding to GetDescriptor requests, from a single block RAM.
+
+	Rather than creating a ROM for each descriptor, every descriptor is stored in one 32-bit wide memory;
+	along with a table of each descriptor type's index table, and each descriptor's length and location.
+	Its layout is that of the USB2 :class:`~torii_usb.usb.usb2.descriptor.GetDescriptorHandlerBlock`; every
+	descriptor is word aligned, so each word of the memory is sent as a word of our stream. As with that
+	handler, each descriptor type must have consecutive indexes.
+
+	Currently does not support descriptors in multiple languages.
+
+	Attributes
+	----------
+	value: Signal(16), input
+		The value field associated with the Get Descriptor request. Contains the descriptor type and index.
+	length: Signal(16), input
+		The length field associated with the Get Descriptor request.
+		Determines the maximum amount allowed in a response.
+
+	start: Signal(), input
+		Strobe that indicates when a descriptor should be transmitted.
+
+	tx: SuperSpeedStreamInterface(), output stream
+		Stream that carries our output descriptor data.
+	tx_length: Signal(16), output
+		The actual length of the descriptor to be sent; valid whenever :attr:`tx` is.
+
+	stall: Signal(), output
+		Strobe; pulsed if a STALL handshake should be generated, instead of a response.
+
+	Parameters
+	----------
+	descriptor_collection: DeviceDescriptorCollection
+		The DeviceDescriptorCollection containing the descriptors to use for this device.
+	usb_domain: string
+		The name of the domain to use for USB data exchange. Defaults to 'ss'.
+	'''
+
+	def __init__(self, descriptor_collection: DeviceDescriptorCollection, *, usb_domain = 'ss'):
+		self._domain = usb_domain
+		self._layout = DescriptorROMLayout(descriptor_collection)
+
+		#
+		# I/O port
+		#
+		self.value     = Signal(16)
+		self.length    = Signal(16)
+
+		self.start     = Signal()
+
+		self.tx        = SuperSpeedStreamInterface()
+		self.tx_length = Signal(16)
+		self.stall     = Signal()
+
+	def rom_size_report(self):
+		''' Reports the size of the ROM that will hold our descriptors.
+
+		See :meth:`torii_usb.usb.usb2.descriptor.DescriptorROMLayout.rom_size_report`.
+		'''
+		return self._layout.rom_size_report()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		type_number = self.value[8:16]
+		index       = self.value[0:8]
+
+		#
+		# Create the ROM that stores our descriptors...
+		#
+		rom_content, descriptor_max_length, max_type_number = self._layout.generate_rom_content()
+
+		report = self._layout.size_report(rom_content)
+		log.info(
+			f'SuperSpeed descriptor ROM: {report["descriptor_bytes"]} bytes of descriptors in a '
+			f'{report["rom_bytes"]} byte ROM'
+		)
+
+		rom = Memory(width = 32, depth = len(rom_content), init = rom_content)
+		m.submodules.rom = rom
+		rom_read_port = rom.read_port(transparent = False)
+
+		# Each of our table entries is formatted as (count, pointer); with the count in the upper half of
+		# each word. Our pointers are always word aligned; so we'll drop their lower two bits to get a word address.
+		rom_element_count   = rom_read_port.data.word_select(1, 16)
+		rom_element_pointer = rom_read_port.data.bit_select(2, rom_read_port.addr.width)
+
+		# Our ROM is stored big-endian, with each descriptor's first byte in the top of its word; while our
+		# stream carries its first byte in its lowest lane.
+		rom_word = Cat(rom_read_port.data.word_select(n, 8) for n in reversed(range(4)))
+
+		# Registers that store where our descriptor is in memory, and where we are in sending it.
+		descriptor_address = Signal.like(rom_read_port.addr)
+		position_in_stream = Signal(range((descriptor_max_length + 3) // 4 + 1))
+		last_position      = Signal.like(position_in_stream)
+
+		on_last_word = (position_in_stream == last_position)
+
+		#
+		# Core transmit logic.
+		#
+		with m.FSM():
+
+			# IDLE -- we're waiting to send a descriptor; and always looking up the requested type's index table.
+			with m.State('IDLE'):
+				m.d.comb += rom_read_port.addr.eq(type_number)
+
+				with m.If(self.start):
+
+					# If we have the requested type, find where its index table lives...
+					with m.If(type_number <= max_type_number):
+						m.next = 'LOOKUP_TYPE'
+
+					# ... otherwise, stall the request immediately.
+					with m.Else():
+						m.d.comb += self.stall.eq(1)
+
+			# LOOKUP_TYPE -- our ROM now holds (count, table-pointer) for the requested type; so we can find
+			# the table entry for the requested index.
+			with m.State('LOOKUP_TYPE'):
+
+				with m.If(index >= rom_element_count):
+					m.d.comb += self.stall.eq(1)
+					m.next = 'IDLE'
+
+				with m.Else():
+					m.d.comb += rom_read_port.addr.eq(rom_element_pointer + index)
+					m.next = 'LOOKUP_DESCRIPTOR'
+
+			# LOOKUP_DESCRIPTOR -- our ROM now holds (length, data-pointer) for our descriptor; so we'll figure
+			# out how much of it we'll send, and start reading its first word.
+			with m.State('LOOKUP_DESCRIPTOR'):
+				send_length = Mux(self.length < rom_element_count, self.length, rom_element_count)
+
+				m.d.comb += rom_read_port.addr.eq(rom_element_pointer)
+				m.d.sync += [
+					descriptor_address.eq(rom_element_pointer),
+					position_in_stream.eq(0),
+					last_position.eq((send_length - 1) >> 2),
+					self.tx_length.eq(send_length),
+				]
+
+				# If the host's asked for no data, there's nothing for us to send.
+				with m.If(send_length == 0):
+					m.next = 'IDLE'
+				with m.Else():
+					m.next = 'SEND_DESCRIPTOR'
+
+			# SEND_DESCRIPTOR -- we're streaming our descriptor a word at a time, directly from our ROM.
+			with m.State('SEND_DESCRIPTOR'):
+				m.d.comb += [
+					rom_read_port.addr.eq(descriptor_address + position_in_stream),
+
+					self.tx.data.eq(rom_word),
+					self.tx.first.eq(position_in_stream == 0),
+					self.tx.last.eq(on_last_word),
+				]
+
+				# Every word is fully valid, except potentially our last.
+				with m.If(on_last_word):
+					with m.Switch(self.tx_length[0:2]):
+						with m.Case(0):
+							m.d.comb += self.tx.valid.eq(0b1111)
+						with m.Case(1):
+							m.d.comb += self.tx.valid.eq(0b0001)
+						with m.Case(2):
+							m.d.comb += self.tx.valid.eq(0b0011)
+						with m.Case(3):
+							m.d.comb += self.tx.valid.eq(0b0111)
+				with m.Else():
+					m.d.comb += self.tx.valid.eq(0b1111)
+
+				# Once a word is accepted, move on to the next; or, once we've sent our last, return to IDLE.
+				with m.If(self.tx.ready):
+					with m.If(on_last_word):
+						m.next = 'IDLE'
+					with m.Else():
+						m.d.comb += rom_read_port.addr.eq(descriptor_address + position_in_stream + 1)
+						m.d.sync += position_in_stream.eq(position_in_stream + 1)
+
+		# Convert our sync domain to the domain requested by the user, if necessary.
+		if self._domain != 'sync':
+			m = DomainRenamer(sync = self._domain)(m)
+
+		return m
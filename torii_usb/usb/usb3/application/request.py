@@ -6,7 +6,7 @@
 
 ''' Control-request interfacing and gateware for USB3. '''
 
-from torii.hdl              import Elaboratable, Fell, Module, Signal
+from torii.hdl              import Cat, Const, Elaboratable, Fell, Module, Mux, Signal
 
 from ...request             import SetupPacket
 from ...stream              import SuperSpeedStreamInterface
@@ -203,37 +203,60 @@ class SuperSpeedSetupDecoder(Elaboratable):
 class SuperSpeedRequestHandlerMultiplexer(Elaboratable):
 	''' Multiplexes multiple RequestHandlers down to a single interface.
 
-	Interfaces are added using .add_interface().
+	Interfaces are added using .add_interface(). If an interface is added along with its handler's condition,
+	that condition is evaluated once per SETUP packet, and the result registered; so the multiplexer's outputs
+	are selected by a one-hot register rather than by logic that grows deeper with each handler added.
 
 	Attributes
 	----------
 	shared: SuperSpeedRequestHandlerInterface()
 		The post-multiplexer RequestHandler interface.
+	unhandled: Signal(), output
+		High when none of the conditioned interfaces claimed the most recent SETUP packet.
 	'''
 
+	# The handshake generator signals driven by each of our interfaces.
+	HANDSHAKE_PARAMETERS = (
+		'endpoint_number', 'retry_required', 'next_sequence', 'number_of_packets', 'direction',
+		'send_ack', 'send_stall', 'send_nrdy', 'send_erdy',
+	)
+
 	def __init__(self):
 
 		#
 		# I/O port
 		#
-		self.shared = SuperSpeedRequestHandlerInterface()
+		self.shared    = SuperSpeedRequestHandlerInterface()
+		self.unhandled = Signal(reset = 1)
 
 		#
 		# Internals
 		#
 		self._interfaces = []
+		self._conditions = []
 
-	def add_interface(self, interface: SuperSpeedRequestHandlerInterface):
+	def add_interface(self, interface: SuperSpeedRequestHandlerInterface, *, condition = None):
 		''' Adds a RequestHandlerInterface to the multiplexer.
 
 		Arbitration is not performed; it's expected only one handler will be
 		driving requests at a time.
+
+		Parameters
+		----------
+		interface
+			The interface to be multiplexed.
+		condition
+			Optional; a function that accepts a SetupPacket, and returns a Torii conditional indicating
+			whether the interface handles that request. If provided, the interface's outputs are only passed
+			through while it's selected by the most recent SETUP packet. If omitted, the interface's outputs
+			are always passed through.
 		'''
 		self._interfaces.append(interface)
+		self._conditions.append(condition)
 
-	def _multiplex_signals(self, m, *, when, multiplex, sub_bus = None):
+	def _multiplex_signals(self, m, *, when, multiplex, selected, sub_bus = None):
 		'''
-		Helper that creates a simple priority-encoder multiplexer.
+		Helper that creates a simple one-hot multiplexer.
 
 		Parameters
 		----------
@@ -245,6 +268,10 @@ class SuperSpeedRequestHandlerMultiplexer(Elaboratable):
 		multiplex
 			The names of the interface signals to be multiplexed.
 
+		selected
+			A list of signals, one per interface, indicating whether each interface
+			has been selected by the most recent SETUP packet.
+
 		'''
 
 		def get_signal(interface, name):
@@ -256,26 +283,17 @@ class SuperSpeedRequestHandlerMultiplexer(Elaboratable):
 			else:
 				return getattr(interface, name)
 
-		# We're building an if-elif tree; so we should start with an If entry.
-		conditional = m.If
-
-		for interface in self._interfaces:
-			condition = get_signal(interface, when)
+		# As only one interface should be strobing `when` at once, we can AND each interface's signals with its
+		# strobe, and then OR them all together; which keeps our logic shallow regardless of our interface count.
+		for signal_name in multiplex:
+			target_signal = get_signal(self.shared, signal_name)
 
-			with conditional(condition):
+			driving_signal = Const(0)
+			for interface, interface_selected in zip(self._interfaces, selected):
+				strobe = get_signal(interface, when) & interface_selected
+				driving_signal = driving_signal | Mux(strobe, get_signal(interface, signal_name), 0)
 
-				# Connect up each of our signals.
-				for signal_name in multiplex:
-
-					# Get the actual signals for our input and output...
-					driving_signal = get_signal(interface,   signal_name)
-					target_signal  = get_signal(self.shared, signal_name)
-
-					# ... and connect them.
-					m.d.comb += target_signal.eq(driving_signal)
-
-			# After the first element, all other entries should be created with Elif.
-			conditional = m.Elif
+			m.d.comb += target_signal.eq(driving_signal)
 
 	def elaborate(self, platform):
 		m = Module()
@@ -302,40 +320,86 @@ class SuperSpeedRequestHandlerMultiplexer(Elaboratable):
 				shared.handshakes_in.connect(interface.handshakes_in),
 			]
 
+		#
+		# Handler selection.
+		#
+
+		# Evaluate each of our handler conditions once per SETUP packet, and register the result;
+		# so everything downstream of it is driven from a one-hot register.
+		selected   = []
+		conditions = []
+		for index, condition in enumerate(self._conditions):
+			if condition is None:
+				selected.append(Const(1))
+				continue
+
+			interface_selected = Signal(name = f'handler_{index}_selected')
+			handled = condition(shared.setup)
+
+			with m.If(shared.setup.received):
+				m.d.ss += interface_selected.eq(handled)
+
+			selected.append(interface_selected)
+			conditions.append(handled)
+
+		with m.If(shared.setup.received):
+			m.d.ss += self.unhandled.eq(~Cat(conditions).any())
+
 		#
 		# Multiplex the signals being routed -from- our pre-mux interface.
 		#
-		self._multiplex_signals(m, when = 'address_changed', multiplex = ['address_changed', 'new_address'])
-		self._multiplex_signals(m, when = 'config_changed', multiplex = ['config_changed', 'new_config'])
+		self._multiplex_signals(
+			m, when = 'address_changed', multiplex = ['address_changed', 'new_address'], selected = selected
+		)
+		self._multiplex_signals(
+			m, when = 'config_changed', multiplex = ['config_changed', 'new_config'], selected = selected
+		)
+
+		# As with our address and config changes, only one selected interface should be transmitting or sending
+		# a handshake at once; so we'll AND each interface's outputs with its strobe, and OR them together.
+		def one_hot(values, strobes):
+			driving_signal = Const(0)
+			for value, strobe in zip(values, strobes):
+				driving_signal = driving_signal | Mux(strobe, value, 0)
+			return driving_signal
 
 		#
 		# Multiplex each of our transmit interfaces.
 		#
-		for interface in self._interfaces:
+		transmitting = [
+			interface.tx.valid.any() & interface_selected
+			for interface, interface_selected in zip(self._interfaces, selected)
+		]
+
+		for name in ('data', 'valid', 'first', 'last'):
+			values = [getattr(interface.tx, name) for interface in self._interfaces]
+			m.d.comb += getattr(shared.tx, name).eq(one_hot(values, transmitting))
 
-			# If the transmit interface is valid, connect it up to our endpoint.
-			# The latest assignment will win; so we can treat these all as a parallel 'if's
-			# and still get an appropriate priority encoder.
-			with m.If(interface.tx.valid.any()):
-				m.d.comb += [
-					shared.tx.stream_eq(interface.tx),
-					shared.tx_sequence_number.eq(interface.tx_sequence_number),
-					shared.tx_length.eq(interface.tx_length)
-				]
+		m.d.comb += [
+			shared.tx_sequence_number.eq(one_hot([i.tx_sequence_number for i in self._interfaces], transmitting)),
+			shared.tx_length.eq(one_hot([i.tx_length for i in self._interfaces], transmitting)),
+		]
+
+		for interface, interface_transmitting in zip(self._interfaces, transmitting):
+			m.d.comb += interface.tx.ready.eq(shared.tx.ready & interface_transmitting)
 
 		#
 		# Multiplex each of our handshake-out interfaces.
 		#
-		for interface in self._interfaces:
-			any_generate_signal_asserted = (
-				interface.handshakes_out.send_ack   |
-				interface.handshakes_out.send_stall
-			)
-
-			# If the given interface is trying to send an handshake, connect it up
-			# to our shared interface.
-			with m.If(any_generate_signal_asserted):
-				m.d.comb += shared.handshakes_out.connect(interface.handshakes_out)
+		handshaking = [
+			(interface.handshakes_out.send_ack | interface.handshakes_out.send_stall) & interface_selected
+			for interface, interface_selected in zip(self._interfaces, selected)
+		]
+
+		for name in self.HANDSHAKE_PARAMETERS:
+			values = [getattr(interface.handshakes_out, name) for interface in self._interfaces]
+			m.d.comb += getattr(shared.handshakes_out, name).eq(one_hot(values, handshaking))
+
+		for interface, interface_handshaking in zip(self._interfaces, handshaking):
+			m.d.comb += [
+				interface.handshakes_out.ready.eq(shared.handshakes_out.ready & interface_handshaking),
+				interface.handshakes_out.done.eq(shared.handshakes_out.done & interface_handshaking),
+			]
 
 		return m
 
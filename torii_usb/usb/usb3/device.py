@@ -23,11 +23,28 @@ from .protocol              import USB3ProtocolLayer
 from .protocol.endpoint     import SuperSpeedEndpointMultiplexer
 
 class USBSuperSpeedDevice(Elaboratable):
-	''' Core gateware common to all Torii-USB USB3 devices. '''
-
-	def __init__(self, *, phy, sync_frequency = None):
+	''' Core gateware common to all Torii-USB USB3 devices.
+
+	Parameters
+	----------
+	phy
+		The PIPE PHY to use for this device.
+	sync_frequency: float, optional
+		The frequency of the ``sync`` domain, in Hz. Defaults to the platform's default clock frequency.
+	header_queue_depth: int, optional
+		The number of header packets to queue in each direction of the link layer; see :class:`USB3LinkLayer`.
+		Defaults to 0.
+
+	Attributes
+	----------
+	credit_starvation_count: Signal(32), output
+		The number of times the link layer has used up all of the host's header buffers.
+	'''
+
+	def __init__(self, *, phy, sync_frequency = None, header_queue_depth = 0):
 		self._phy = phy
 		self._sync_frequency = sync_frequency
+		self._header_queue_depth = header_queue_depth
 
 		# Create a collection of endpoints for this device.
 		self._endpoints = []
@@ -40,6 +57,9 @@ class USBSuperSpeedDevice(Elaboratable):
 		self.link_trained   = Signal()
 		self.link_in_reset  = Signal()
 
+		# Link statistics.
+		self.credit_starvation_count = Signal(32)
+
 		# Temporary, debug signals.
 		self.rx_data_tap         = USBRawSuperSpeedStream()
 		self.tx_data_tap         = USBRawSuperSpeedStream()
@@ -47,7 +67,7 @@ class USBSuperSpeedDevice(Elaboratable):
 		self.ep_tx_stream        = SuperSpeedStreamInterface()
 		self.ep_tx_length        = Signal(range(1024 + 1))
 
-	def add_endpoint(self, endpoint):
+	def add_endpoint(self, endpoint, *, priority = 0):
 		''' Adds an endpoint interface to the device.
 
 		Parameters
@@ -55,10 +75,14 @@ class USBSuperSpeedDevice(Elaboratable):
 		endpoint: Elaborateable
 			The endpoint interface to be added. Can be any piece of gateware with a
 			:class:`EndpointInterface` attribute called ``interface``.
+		priority: int
+			The endpoint's priority when several endpoints have packets waiting to be sent. Higher-priority
+			endpoints are always served first; endpoints of equal priority take turns a packet at a time.
+			Defaults to 0.
 		'''
-		self._endpoints.append(endpoint)
+		self._endpoints.append((endpoint, priority))
 
-	def add_standard_control_endpoint(self, descriptors: DeviceDescriptorCollection):
+	def add_standard_control_endpoint(self, descriptors: DeviceDescriptorCollection, **kwargs):
 		''' Adds a control endpoint with standard request handlers to the device.
 
 		Parameters
@@ -66,6 +90,8 @@ class USBSuperSpeedDevice(Elaboratable):
 		descriptors: DeviceDescriptorCollection
 			The descriptors to use for this device.
 
+		Any additional keyword arguments are passed on to :class:`StandardRequestHandler`.
+
 		Return value
 		------------
 		The endpoint object created.
@@ -74,7 +100,7 @@ class USBSuperSpeedDevice(Elaboratable):
 		# TODO: split out our standard request handlers
 
 		control_endpoint = USB3ControlEndpoint()
-		control_endpoint.add_standard_request_handlers(descriptors)
+		control_endpoint.add_standard_request_handlers(descriptors, **kwargs)
 		self.add_endpoint(control_endpoint)
 
 		return control_endpoint
@@ -109,10 +135,14 @@ class USBSuperSpeedDevice(Elaboratable):
 		#
 		# Link layer.
 		#
-		m.submodules.link = link = USB3LinkLayer(physical_layer = physical)
+		m.submodules.link = link = USB3LinkLayer(
+			physical_layer     = physical,
+			header_queue_depth = self._header_queue_depth
+		)
 		m.d.comb += [
 			self.link_trained.eq(link.trained),
 			self.link_in_reset.eq(link.in_reset),
+			self.credit_starvation_count.eq(link.credit_starvation_count),
 
 			link.current_address.eq(address)
 		]
@@ -148,6 +178,8 @@ class USBSuperSpeedDevice(Elaboratable):
 			protocol.endpoint_interface.tx_endpoint_number.eq(endpoint_collection.tx_endpoint_number),
 			protocol.endpoint_interface.tx_sequence_number.eq(endpoint_collection.tx_sequence_number),
 			protocol.endpoint_interface.tx_direction.eq(endpoint_collection.tx_direction),
+			protocol.endpoint_interface.tx_end_of_burst.eq(endpoint_collection.tx_end_of_burst),
+			endpoint_collection.tx_idle.eq(protocol.endpoint_interface.tx_idle),
 
 			# Handshake interface.
 			protocol.endpoint_interface.handshakes_out.connect(endpoint_collection.handshakes_out),
@@ -161,7 +193,7 @@ class USBSuperSpeedDevice(Elaboratable):
 			m.d.ss += configuration.eq(endpoint_collection.new_config)
 
 		# Finally, add each of our endpoints to this module and our multiplexer.
-		for endpoint in self._endpoints:
+		for endpoint, priority in self._endpoints:
 
 			# Create a display name for the endpoint...
 			name = endpoint.__class__.__name__
@@ -169,7 +201,7 @@ class USBSuperSpeedDevice(Elaboratable):
 				name = f'{name}_{id(endpoint)}'
 
 			# ... and add it, both as a submodule and to our multiplexer.
-			endpoint_mux.add_interface(endpoint.interface)
+			endpoint_mux.add_interface(endpoint.interface, priority = priority)
 			m.submodules[name] = endpoint
 
 		#
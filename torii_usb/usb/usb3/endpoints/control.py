@@ -9,7 +9,7 @@
 from torii.hdl              import Elaboratable, Module
 
 from usb_construct.emitters import DeviceDescriptorCollection
-from usb_construct.types    import USBDirection, USBRequestType
+from usb_construct.types    import USBDirection
 
 from ..application.request  import StallOnlyRequestHandler, SuperSpeedRequestHandlerMultiplexer, SuperSpeedSetupDecoder
 from ..protocol.endpoint    import SuperSpeedEndpointInterface
@@ -52,22 +52,26 @@ class USB3ControlEndpoint(Elaboratable):
 
 		No arbitration is performed between request handlers; so it's important
 		that request handlers not overlap in the requests they handle.
+
+		Handlers that provide a ``handler_condition(setup)`` method are selected once per SETUP
+		packet; and their outputs are ignored for any request their condition doesn't match.
 		'''
 		self._request_handlers.append(request_handler)
 
-	def add_standard_request_handlers(self, descriptors: DeviceDescriptorCollection):
+	def add_standard_request_handlers(self, descriptors: DeviceDescriptorCollection, **kwargs):
 		''' Adds a handlers for the standard USB requests.
 
-		This will handle all Standard-type requests; so any additional request handlers
-		must not handle Standard requests.
+		This will handle all Standard-type requests directed at the device; so any additional
+		request handlers must not handle those requests.
 
 		Parameters
 		----------
 		descriptors
 			The descriptor collection to add.
 
+		Any additional keyword arguments are passed on to :class:`StandardRequestHandler`.
 		'''
-		handler = StandardRequestHandler(descriptors)
+		handler = StandardRequestHandler(descriptors, **kwargs)
 		self._request_handlers.append(handler)
 
 	def elaborate(self, platform):
@@ -87,9 +91,10 @@ class USB3ControlEndpoint(Elaboratable):
 		single_handler = (len(self._request_handlers) == 1)
 		if (single_handler and isinstance(self._request_handlers[0], StandardRequestHandler)):
 
-			# Add a handler that will stall any non-standard request.
+			# Add a handler that will stall any request our standard request handler doesn't claim; which our
+			# mux works out once per SETUP packet.
 			def stall_condition(setup):
-				return setup.type != USBRequestType.STANDARD
+				return request_mux.unhandled
 
 			self.add_request_handler(StallOnlyRequestHandler(stall_condition))
 
@@ -123,7 +128,14 @@ class USB3ControlEndpoint(Elaboratable):
 
 			# ... and add it.
 			m.submodules[name] = handler
-			request_mux.add_interface(handler.interface)
+
+			# If our handler describes the requests it handles, let our mux select it once per SETUP packet;
+			# otherwise, its outputs are always connected.
+			condition = getattr(handler, 'handler_condition', None)
+			if isinstance(handler, StallOnlyRequestHandler):
+				condition = None
+
+			request_mux.add_interface(handler.interface, condition = condition)
 
 		# To simplify the request-handler interface, we'll only pass through our Rx stream
 		# when the most recently header packet targets our endpoint number.
@@ -176,6 +188,7 @@ class USB3ControlEndpoint(Elaboratable):
 			m.d.comb += [
 				handshakes_out.retry_required.eq(0),
 				handshakes_out.next_sequence.eq(1),
+				handshakes_out.number_of_packets.eq(1),
 				handshakes_out.send_ack.eq(1),
 			]
 
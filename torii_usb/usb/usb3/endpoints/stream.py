@@ -11,7 +11,7 @@ The endpoint interfaces in this module provide endpoint interfaces suitable for
 connecting streams to USB endpoints.
 '''
 
-from torii.hdl           import Array, Elaboratable, Memory, Module, Signal
+from torii.hdl           import Array, Elaboratable, Memory, Module, Mux, Signal
 
 from usb_construct.types import USBDirection
 
@@ -27,8 +27,10 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 	a short data packet. If the stream's ``last`` signal is tied to zero, then a continuous stream of
 	maximum-length-packets will be sent with no inserted ZLPs.
 
-	This implementation is double buffered; and can store a single packet's worth of data while transmitting
-	a second packet. Bursting is currently not supported.
+	The stream is buffered a packet at a time, in a ring of ``max_burst + 1`` packet buffers; so a packet
+	can be filled while up to ``max_burst`` packets are in flight to the host. Each packet is held until the
+	host acknowledges it, so it can be re-sent if the host requests a retry. With a ``max_burst`` of 1, this
+	endpoint is simply double buffered.
 
 	Attributes
 	----------
@@ -44,13 +46,20 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 	max_packet_size: int
 		The maximum packet size for this endpoint. Should match the wMaxPacketSize provided in the
 		USB endpoint descriptor.
+	max_burst: int
+		The maximum number of packets this endpoint will send in a single burst; from 1 to 16. Should be one
+		more than the bMaxBurst provided in the endpoint's SuperSpeed companion descriptor. Defaults to 1.
 	'''
 
 	SEQUENCE_NUMBER_BITS = 5
 
-	def __init__(self, *, endpoint_number, max_packet_size = 1024):
+	def __init__(self, *, endpoint_number, max_packet_size = 1024, max_burst = 1):
+		if max_burst not in range(1, 17):
+			raise ValueError(f'Maximum burst must be between 1 and 16 packets, not {max_burst}')
+
 		self._endpoint_number = endpoint_number
 		self._max_packet_size = max_packet_size
+		self._max_burst       = max_burst
 
 		#
 		# I/O port
@@ -68,25 +77,17 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 		# Parameters for later use.
 		data_width     = len(self.stream.data)
 		bytes_per_word = data_width // 8
-		buffer_depth   = self._max_packet_size // bytes_per_word
-
-		#
-		# Transceiver sequencing.
-		#
-
-		# Keep track of the sequence number used as we're transmitting.
-		sequence_number = Signal(self.SEQUENCE_NUMBER_BITS)
+		buffer_depth   = (self._max_packet_size + bytes_per_word - 1) // bytes_per_word
+		buffer_count   = self._max_burst + 1
 
-		# Create a signal equal to the next sequence number; for easy comparisons.
-		next_sequence_number = Signal.like(sequence_number)
-		m.d.comb += next_sequence_number.eq(sequence_number + 1)
+		def next_buffer(buffer_number):
+			''' Returns the number of the buffer following a given buffer in our ring. '''
+			return Mux(buffer_number == buffer_count - 1, 0, buffer_number + 1)
 
-		# Advance the sequence number after transmission, or reset it when the endpoint is reset.
-		advance_sequence = Signal()
-		with m.If(interface.ep_reset):
-			m.d.ss += sequence_number.eq(0)
-		with m.Elif(advance_sequence):
-			m.d.ss += sequence_number.eq(next_sequence_number)
+		def buffer_after(buffer_number, offset):
+			''' Returns the number of the buffer a given number of buffers after a given buffer in our ring. '''
+			position = buffer_number + offset
+			return Mux(position >= buffer_count, position - buffer_count, position)
 
 		#
 		# Transmit buffer.
@@ -99,101 +100,100 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 		# Accordingly, we'll buffer a full USB packet of data, and then transmit
 		# it once either a) our buffer is full, or 2) the transfer ends (last = 1).
 		#
-		# This implementation is double buffered; so a buffer fill can be pipelined
-		# with a transmit.
+		# Our packet buffers form a ring, which share a single memory; so we can keep filling
+		# buffers while the packets in the others are waiting to be sent or acknowledged.
 		#
-		ping_pong_toggle = Signal()
-
-		# We'll create two buffers; so we can fill one as we empty the other.
-		# Since each buffer will be used for every other transaction, we'll use a simple flag to identify
-		# which of our 'ping-pong' buffers is currently being targeted.
-		buffer = Array(
-			Memory(width = data_width, depth = buffer_depth, name = f'transmit_buffer_{i}') for i in range(2)
+		buffer = Memory(width = data_width, depth = buffer_count * buffer_depth, name = 'transmit_buffer')
+		m.submodules.buffer_write = buffer_write = buffer.write_port(domain = 'ss')
+		m.submodules.buffer_read  = buffer_read  = buffer.read_port(domain = 'ss', transparent = False)
+
+		# Keep track of the length of the packet held in each buffer. Since a ZLP is just a packet
+		# with no data, we'll queue any ZLPs we need to send in a buffer of their own.
+		buffer_length = Array(
+			Signal(range(0, self._max_packet_size + 1), name = f'buffer_length_{i}') for i in range(buffer_count)
 		)
-		buffer_write_ports = Array(buffer[i].write_port(domain = 'ss') for i in range(2))
-		buffer_read_ports  = Array(buffer[i].read_port(domain = 'ss', transparent = False) for i in range(2))
-
-		m.submodules.read_port_0,  m.submodules.read_port_1  = buffer_read_ports
-		m.submodules.write_port_0, m.submodules.write_port_1 = buffer_write_ports
-
-		# Create values equivalent to the buffer numbers for our read and write buffer; which switch
-		# whenever we swap our two buffers.
-		write_buffer_number = ping_pong_toggle
-		read_buffer_number  = ~ping_pong_toggle
-
-		# Create a shorthand that refers to the buffer to be filled; and the buffer to send from.
-		# We'll call these the Read and Write buffers.
-		buffer_write = buffer_write_ports[write_buffer_number]
-		buffer_read  = buffer_read_ports[read_buffer_number]
-
-		# Buffer state tracking:
-		# - Our ``fill_count`` keeps track of how much data is stored in a given buffer.
-		# - Our ``stream_ended`` bit keeps track of whether the stream ended while filling up
-		#   the given buffer. This indicates that the buffer cannot be filled further; and, when
-		#   ``generate_zlps`` is enabled, is used to determine if the given buffer should end in
-		#   a short packet; which determines whether ZLPs are emitted.
-		buffer_fill_count   = Array(Signal(range(0, self._max_packet_size + 1)) for _ in range(2))
-		buffer_stream_ended = Array(Signal(name = f'stream_ended_in_buffer{i}') for i in range(2))
-
-		# Create shortcuts to active fill_count / stream_ended signals for the buffer being written.
-		write_fill_count   = buffer_fill_count[write_buffer_number]
-		write_stream_ended = buffer_stream_ended[write_buffer_number]
-
-		# Create shortcuts to the fill_count / stream_ended signals for the packet being sent.
-		read_fill_count   = buffer_fill_count[read_buffer_number]
-		read_stream_ended = buffer_stream_ended[read_buffer_number]
-
-		# Keep track of our current send position; which determines where we are in the packet.
-		send_position  = Signal(range(0, self._max_packet_size + 1))
+
+		# Our packets are held in the order they're sent; starting with the oldest packet the host has yet
+		# to acknowledge, which is held in ``ack_buffer``, and has the sequence number ``ack_sequence``.
+		# Starting from that packet:
+		# - ``packets_buffered`` counts the complete packets we're holding;
+		# - ``packets_sent`` counts how many of those we've sent; and
+		# - ``packets_allowed`` counts how many the host has said it's ready to receive.
+		ack_buffer       = Signal(range(buffer_count))
+		ack_sequence     = Signal(self.SEQUENCE_NUMBER_BITS)
+		packets_buffered = Signal(range(buffer_count + 1))
+		packets_sent     = Signal(range(buffer_count + 1))
+		packets_allowed  = Signal.like(handshakes_in.number_of_packets)
+
+		# Keep track of the buffer we're filling, and how much data we've placed in it.
+		fill_buffer      = Signal(range(buffer_count))
+		fill_count       = Signal(range(0, self._max_packet_size + 1))
+
+		# Stores whether the stream ended on a full packet; in which case we'll need to queue a ZLP.
+		zlp_required     = Signal()
 
 		# Shortcut names.
 		in_stream  = self.stream
 		out_stream = self.interface.tx
 
-		# We're ready to receive data iff we have space in the buffer we're currently filling.
+		# We're ready to receive data iff we have a free buffer to fill.
+		buffer_free = (packets_buffered < buffer_count)
 		m.d.comb += [
-			in_stream.ready.eq((write_fill_count + 4 <= self._max_packet_size) & ~write_stream_ended),
+			in_stream.ready.eq(buffer_free & ~zlp_required),
 			buffer_write.en.eq(in_stream.valid.any() & in_stream.ready),
+
+			# We'll only ever -write- data from our input stream.
+			buffer_write.data.eq(in_stream.data),
+			buffer_write.addr.eq(fill_buffer * buffer_depth + (fill_count >> 2)),
 		]
 
-		# Increment our fill count whenever we accept new data;
-		# based on the number of valid bits we have.
+		# Figure out how many bytes we're accepting; based on the number of valid bits we have.
+		bytes_accepted = Signal(range(bytes_per_word + 1))
+		with m.Switch(in_stream.valid):
+			with m.Case(0b0001):
+				m.d.comb += bytes_accepted.eq(1)
+			with m.Case(0b0011):
+				m.d.comb += bytes_accepted.eq(2)
+			with m.Case(0b0111):
+				m.d.comb += bytes_accepted.eq(3)
+			with m.Case(0b1111):
+				m.d.comb += bytes_accepted.eq(4)
+
+		# Once our buffer holds a full packet, or the stream ends, the packet is complete; and we'll
+		# commit it to our ring of packets to be sent.
+		packet_committed = Signal()
+		new_fill_count   = fill_count + bytes_accepted
+		packet_complete  = (new_fill_count >= self._max_packet_size)
+
 		with m.If(buffer_write.en):
-			with m.Switch(in_stream.valid):
-				with m.Case(0b0001):
-					m.d.ss += write_fill_count.eq(write_fill_count + 1)
-				with m.Case(0b0011):
-					m.d.ss += write_fill_count.eq(write_fill_count + 2)
-				with m.Case(0b0111):
-					m.d.ss += write_fill_count.eq(write_fill_count + 3)
-				with m.Case(0b1111):
-					m.d.ss += write_fill_count.eq(write_fill_count + 4)
-
-		# If the stream ends while we're adding data to the buffer, mark this as an ended stream.
-		with m.If(in_stream.last & buffer_write.en):
-			m.d.ss += write_stream_ended.eq(1)
-
-		# Use our memory's two ports to capture data from our transfer stream; and two to emit packets
-		# into our packet stream. Since we'll never receive to anywhere else, or transmit to anywhere else,
-		# we can just unconditionally connect these.
-		m.d.comb += [
-			# We'll only ever -write- data from our input stream...
-			buffer_write_ports[0].data.eq(in_stream.data),
-			buffer_write_ports[0].addr.eq(write_fill_count >> 2),
-			buffer_write_ports[1].data.eq(in_stream.data),
-			buffer_write_ports[1].addr.eq(write_fill_count >> 2),
-
-			# ... and we'll only ever -send- data from the Read buffer; in the SEND_PACKET state.
-			buffer_read.addr.eq(send_position),
-		]
+			with m.If(packet_complete | in_stream.last):
+				m.d.comb += packet_committed.eq(1)
+				m.d.ss   += [
+					buffer_length[fill_buffer].eq(new_fill_count),
+					fill_buffer.eq(next_buffer(fill_buffer)),
+					fill_count.eq(0),
+
+					# If our transfer ended with a max-packet-size packet, we'll need to follow it with a ZLP.
+					zlp_required.eq(packet_complete & in_stream.last),
+				]
+			with m.Else():
+				m.d.ss += fill_count.eq(new_fill_count)
+
+		# Once we have a buffer free for it, queue any ZLP we need to send.
+		with m.Elif(zlp_required & buffer_free):
+			m.d.comb += packet_committed.eq(1)
+			m.d.ss   += [
+				buffer_length[fill_buffer].eq(0),
+				fill_buffer.eq(next_buffer(fill_buffer)),
+				zlp_required.eq(0),
+			]
 
 		#
-		# Transmit controller.
+		# Flow control.
 		#
 
-		# Stores whether the last packet transmitted was a ZLP. This bit of state determines how
-		# retransmission behaves.
-		last_packet_was_zlp = Signal()
+		# Stores whether the host has asked us for data we don't have; and so needs an NRDY packet.
+		nrdy_required = Signal()
 
 		# Stores whether we'll need to send an ERDY packet before we send any additional data.
 		# If we send an NRDY packet indicating that we have no data for the host, the host will
@@ -201,113 +201,210 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 		# to send an ERDY packet to have it resume polling.
 		erdy_required = Signal()
 
-		# Shortcut for when we need to deal with an in token.
-		# Note that, for USB3, an IN token is an ACK that contains a non-zero ``number_of_packets``.
-		is_to_us          = (handshakes_in.endpoint_number == self._endpoint_number)
-		is_in_token       = (handshakes_in.number_of_packets != 0)
-		ack_received      = handshakes_in.ack_received & is_to_us
-		in_token_received = ack_received & is_in_token
-
-		with m.FSM(domain = 'ss'):
-
-			# WAIT_FOR_DATA -- We don't yet have a full packet to transmit, so  we'll capture data
-			# to fill the our buffer. At full throughput, this state will never be reached after
-			# the initial post-reset fill.
-			with m.State('WAIT_FOR_DATA'):
+		# Stores whether we've ended our current burst; after which we'll wait for the host to
+		# acknowledge everything we've sent before starting another.
+		burst_ended = Signal()
+
+		# Strobes from our transmit controller.
+		packet_started = Signal()
+		nrdy_sent      = Signal()
+		erdy_sent      = Signal()
+
+		# Shortcut for when we need to deal with an ACK addressed to us. In USB3, an ACK handshake can act as
+		# an acknowledgement, an error indicator, and an IN token, all at once; so we'll handle each case.
+		is_to_us     = (handshakes_in.endpoint_number == self._endpoint_number)
+		is_in        = (handshakes_in.direction == USBDirection.IN)
+		ack_received = handshakes_in.ack_received & is_to_us & is_in
+
+		# The host acknowledges our packets by telling us the sequence number it expects next
+		# [USB3.2r1: 8.12.1.2]; which tells us how many of the packets we've sent it's received.
+		packets_acknowledged = Signal(self.SEQUENCE_NUMBER_BITS)
+		packets_released     = Signal.like(packets_acknowledged)
+		acknowledgement_ok   = (packets_acknowledged <= packets_sent)
+		m.d.comb += packets_acknowledged.eq(handshakes_in.next_sequence - ack_sequence)
+
+		with m.If(ack_received & acknowledgement_ok & ~interface.ep_reset):
+			m.d.comb += packets_released.eq(packets_acknowledged)
+
+		# We no longer need to keep any data that's been acknowledged; so free up its buffers.
+		m.d.ss += [
+			ack_buffer.eq(buffer_after(ack_buffer, packets_released)),
+			packets_buffered.eq(packets_buffered + packet_committed - packets_released),
+		]
 
-				# We can't yet send data; so we'll send an NRDY transaction packet.
-				with m.If(in_token_received):
-					m.d.comb += handshakes_out.send_nrdy.eq(1)
-					m.d.ss   += erdy_required.eq(1)
+		with m.If(nrdy_sent):
+			m.d.ss += [
+				nrdy_required.eq(0),
+				erdy_required.eq(1),
+				packets_allowed.eq(0),
+			]
+		with m.If(erdy_sent):
+			m.d.ss += erdy_required.eq(0)
 
-				# If we have valid data that will end our packet, we're no longer waiting for data.
-				# We'll now wait for the host to request data from us.
-				packet_complete = (write_fill_count + 4 >= self._max_packet_size)
-				will_end_packet = packet_complete | in_stream.last
+		# When our endpoint is reset, our sequence numbers start over.
+		with m.If(interface.ep_reset):
+			m.d.ss += [
+				ack_sequence.eq(0),
+				packets_sent.eq(0),
+				packets_allowed.eq(0),
+				burst_ended.eq(0),
+				nrdy_required.eq(0),
+				erdy_required.eq(0),
+			]
+
+		with m.Elif(ack_received):
+			packets_remaining = packets_sent - packets_released
+
+			m.d.ss += [
+				ack_sequence.eq(ack_sequence + packets_released),
+
+				# Each ACK tells us how many packets the host can accept, from the one it expects next.
+				packets_allowed.eq(handshakes_in.number_of_packets),
+			]
+
+			# If the host has asked us to retry, we'll re-send everything from the packet it expects next.
+			# We'll do the same if it's acknowledged packets we've not sent; which shouldn't happen.
+			with m.If(handshakes_in.retry_required | ~acknowledgement_ok):
+				m.d.ss += [
+					packets_sent.eq(0),
+					burst_ended.eq(0),
+				]
 
-				with m.If(in_stream.valid & will_end_packet):
+			# Otherwise, everything after the acknowledged packets is still in flight. Once everything
+			# we've sent has been acknowledged, our burst is over.
+			with m.Else():
+				m.d.ss += packets_sent.eq(packets_remaining)
+				with m.If(packets_remaining == 0):
+					m.d.ss += burst_ended.eq(0)
 
-					# If we've just finished a packet, we now have data we can send!
-					with m.If(packet_complete | in_stream.last):
-						m.d.ss += [
+			# If the host's asking for data we don't have, we'll need to tell it we're not ready.
+			with m.If(handshakes_in.number_of_packets != 0):
+				with m.If((packets_buffered == packets_released) & ~packet_committed):
+					m.d.ss += nrdy_required.eq(1)
+				with m.Else():
+					m.d.ss += erdy_required.eq(0)
 
-							# We're now ready to take the data we've captured and _transmit_ it.
-							# We'll swap our read and write buffers.
-							ping_pong_toggle.eq(~ping_pong_toggle),
+		with m.Else():
+			m.d.ss += packets_sent.eq(packets_sent + packet_started)
 
-							# Mark our current stream as no longer having ended.
-							read_stream_ended.eq(0)
-						]
+		#
+		# Transmit controller.
+		#
 
-						# If we've already sent an NRDY token, we'll need to request an IN token
-						# before the host will be willing to send us one.
-						with m.If(erdy_required | in_token_received):
-							m.next = 'REQUEST_IN_TOKEN'
+		# Figure out which packet we'll send next; and whether it'll end our burst. We'll end our burst
+		# once we've sent all the host's asked for, or all we have; or if we're sending a short packet.
+		send_buffer       = buffer_after(ack_buffer, packets_sent)
+		send_length       = buffer_length[send_buffer]
+		send_ends_burst   = (
+			(packets_sent + 1 == packets_allowed) |
+			(packets_sent + 1 == packets_buffered) |
+			(send_length < self._max_packet_size)
+		)
 
-						# Otherwise, we can wait for an IN token directly.
-						with m.Else():
-							m.next = 'WAIT_TO_SEND'
+		# We'll start sending packets whenever we have them, and the host has room for them. We'll hold off
+		# whenever we're handling an ACK, so we don't start sending a packet the host has just asked us to skip.
+		flow_changing     = ack_received | interface.ep_reset
+		can_send          = (
+			(packets_sent < packets_buffered) & (packets_sent < packets_allowed) & ~burst_ended & ~flow_changing
+		)
 
-			# REQUEST_IN_TOKEN -- we now have at least a buffer full of data to send; but
-			# we've sent a NRDY token to the host; and thus the host is no longer polling for data.
-			# We'll send an ERDY token to the host, in order to request it poll us again.
-			with m.State('REQUEST_IN_TOKEN'):
+		# Keep track of the packet currently being sent, and our position within it.
+		send_base         = Signal(range(buffer_count * buffer_depth))
+		send_position     = Signal(range(0, buffer_depth + 1))
+		send_sequence     = Signal(self.SEQUENCE_NUMBER_BITS)
+		send_length_bytes = Signal.like(send_length)
+		send_end_of_burst = Signal()
 
-				# Send our ERDY token...
-				m.d.comb += handshakes_out.send_erdy.eq(1)
+		m.d.comb += [
+			# Apply our general transfer information.
+			interface.tx_direction.eq(USBDirection.IN),
+			interface.tx_sequence_number.eq(send_sequence),
+			interface.tx_length.eq(send_length_bytes),
+			interface.tx_endpoint_number.eq(self._endpoint_number),
+			interface.tx_end_of_burst.eq(send_end_of_burst),
+
+			handshakes_out.endpoint_number.eq(self._endpoint_number),
+			handshakes_out.direction.eq(USBDirection.IN),
+		]
 
-				# ... and once that send is complete, move on to waiting for an IN token.
-				with m.If(handshakes_out.done):
-					m.next = 'WAIT_TO_SEND'
+		with m.FSM(domain = 'ss'):
 
-			# WAIT_TO_SEND -- we now have at least a buffer full of data to send; we'll
-			# need to wait for an IN token to send it.
+			# WAIT_TO_SEND -- we're waiting until we have both a packet to send, and the host is ready
+			# to receive it; and keeping the host informed of whether we have data.
 			with m.State('WAIT_TO_SEND'):
 
-				# Once we get an IN token, move to sending a packet.
-				with m.If(in_token_received):
+				# Prepare to read the first word of the next packet, in case we start sending it.
+				m.d.comb += buffer_read.addr.eq(send_buffer * buffer_depth)
+
+				# If we can send a packet, start sending it.
+				with m.If(can_send):
+					m.d.comb += packet_started.eq(1)
+					m.d.ss   += [
+						send_base.eq(send_buffer * buffer_depth),
+						send_position.eq(0),
+						send_sequence.eq(ack_sequence + packets_sent),
+						send_length_bytes.eq(send_length),
+						send_end_of_burst.eq(send_ends_burst),
+						burst_ended.eq(send_ends_burst),
+					]
 
-					# If we have a packet to send, send it.
-					with m.If(read_fill_count):
+					# Our buffer either holds data, or a ZLP.
+					with m.If(send_length != 0):
 						m.next = 'SEND_PACKET'
-						m.d.ss += [
-							last_packet_was_zlp.eq(0)
-						]
-
-					# Otherwise, we entered a transmit path without any data in the buffer.
 					with m.Else():
-						# ... send a ZLP...
-						m.d.comb += interface.tx_zlp.eq(1)
+						m.next = 'SEND_ZLP'
 
-						# ... and clear the need to follow up with one, since we've just sent a short packet.
-						m.d.ss += [
-							read_stream_ended.eq(0),
-							last_packet_was_zlp.eq(1)
-						]
+				# If the host's asked for data we don't have, let it know it'll need to wait.
+				with m.Elif(nrdy_required & ~flow_changing):
+					m.next = 'SEND_NRDY'
 
-						# We've now completed a packet send; so wait for it to be acknowledged.
-						m.next = 'WAIT_FOR_ACK'
+				# If we've previously told the host we're not ready, and we now have data, ask it to resume polling.
+				with m.Elif(erdy_required & (packets_buffered != 0) & ~flow_changing):
+					m.next = 'SEND_ERDY'
 
-			# SEND_PACKET -- we now have enough data to send _and_ have received an IN token.
-			# We can now send our data over to the host.
-			with m.State('SEND_PACKET'):
+			# SEND_NRDY -- we don't have any data for the host; we'll send an NRDY token, to indicate that the
+			# host should stop polling us until we do.
+			with m.State('SEND_NRDY'):
+				m.d.comb += handshakes_out.send_nrdy.eq(1)
 
+				with m.If(handshakes_out.done):
+					m.d.comb += nrdy_sent.eq(1)
+					m.next = 'WAIT_TO_SEND'
+
+			# SEND_ERDY -- we now have data to send; but we've sent a NRDY token to the host, and thus the host
+			# is no longer polling for data. We'll send an ERDY token to the host, in order to request it poll
+			# us again; advertising how many packets we're ready to send.
+			with m.State('SEND_ERDY'):
 				m.d.comb += [
-					# Apply our general transfer information.
-					interface.tx_direction.eq(USBDirection.IN),
-					interface.tx_sequence_number.eq(sequence_number),
-					interface.tx_length.eq(read_fill_count),
-					interface.tx_endpoint_number.eq(self._endpoint_number),
+					handshakes_out.send_erdy.eq(1),
+					handshakes_out.number_of_packets.eq(
+						Mux(packets_buffered > self._max_burst, self._max_burst, packets_buffered)
+					),
 				]
 
+				with m.If(handshakes_out.done):
+					m.d.comb += erdy_sent.eq(1)
+					m.next = 'WAIT_TO_SEND'
+
+			# SEND_ZLP -- the packet we're sending is a ZLP; so all we need to do is ask for one.
+			with m.State('SEND_ZLP'):
+				with m.If(interface.tx_idle):
+					m.d.comb += interface.tx_zlp.eq(1)
+					m.next = 'WAIT_TO_SEND'
+
+			# SEND_PACKET -- we now have enough data to send _and_ the host is ready for it.
+			# We can now send our data over to the host.
+			with m.State('SEND_PACKET'):
+				m.d.comb += buffer_read.addr.eq(send_base + send_position)
+
 				with m.If(~out_stream.valid.any() | out_stream.ready):
 					# Once we emitted a word of data for our receiver, move to the next word in our packet.
 					m.d.ss   += send_position.eq(send_position + 1)
-					m.d.comb += buffer_read.addr.eq(send_position + 1)
+					m.d.comb += buffer_read.addr.eq(send_base + send_position + 1)
 
 					# We're on our last word whenever the next word would be contain the end of our data.
 					first_word = (send_position == 0)
-					last_word  = ((send_position + 1) << 2 >= read_fill_count)
+					last_word  = ((send_position + 1) << 2 >= send_length_bytes)
 
 					m.d.ss += [
 						# Block RAM often has a large clock-to-dout delay; register the output to
@@ -326,7 +423,7 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 
 						# We can figure out how many bytes are valid by looking at the last two bits of our
 						# count; which happen to be the mod-4 remainder.
-						with m.Switch(read_fill_count[0:2]):
+						with m.Switch(send_length_bytes[0:2]):
 
 							# If we're evenly divisible by four, all four bytes are valid.
 							with m.Case(0):
@@ -344,107 +441,364 @@ class SuperSpeedStreamInEndpoint(Elaboratable):
 					with m.Else():
 						m.d.ss += out_stream.valid.eq(0b1111)
 
-					# If we've just sent our last word, we're now ready to wait for a response
-					# from our host.
+					# If we've just queued our last word, we'll finish once it's been accepted.
 					with m.If(last_word):
-						m.next = 'WAIT_FOR_ACK'
+						m.next = 'FINISH_PACKET'
+
+			# FINISH_PACKET -- we're presenting the last word of our packet; once it's been accepted,
+			# we're done with this packet, and can move on to the next one. Our packet stays buffered
+			# until it's acknowledged.
+			with m.State('FINISH_PACKET'):
+				with m.If(out_stream.ready):
+					m.d.ss += out_stream.valid.eq(0)
+					m.next = 'WAIT_TO_SEND'
 
-			# WAIT_FOR_ACK -- We've just sent a packet; but don't know if the host has
-			# received it correctly. We'll wait to see if the host ACKs.
-			with m.State('WAIT_FOR_ACK'):
+		return m
 
-				# We're done transmitting data.
-				m.d.ss   += out_stream.valid.eq(0)
+class SuperSpeedStreamOutEndpoint(Elaboratable):
+	''' Endpoint interface that receives data from the host, and produces a simple data stream.
 
-				# Reset our send-position for the next data packet.
-				m.d.ss   += send_position.eq(0)
-				m.d.comb += buffer_read.addr.eq(0)
+	This interface is suitable for a single bulk or interrupt endpoint.
 
-				# In USB3, an ACK handshake can act as an ACK, an error indicator, and/or an IN token.
-				# This helps to maximize bus bandwidth, but means we have to handle each case carefully.
-				with m.If(ack_received):
+	Each packet is buffered in full, and is only passed on to the stream once it's been received with a good
+	CRC and the expected sequence number; so packets that need to be re-sent are simply discarded. Packets are
+	held in a ring of ``max_burst + 1`` packet buffers; and each ACK tells the host how many more packets we
+	have room for. If the host sends a packet we don't have room for, we'll respond with an NRDY, and send an
+	ERDY once we do.
+
+	The stream's ``last`` marks the final word of a short packet, which ends a transfer; and ``first`` the first
+	word of the next transfer. A transfer that ends with a zero-length packet -- i.e. one that's an exact multiple
+	of ``max_packet_size`` long, or is empty -- is ended by a word with ``last`` set, but no bytes valid; which
+	must still be accepted with ``ready``.
+
+	Attributes
+	----------
+	stream: SuperSpeedStreamInterface, output stream
+		Full-featured stream interface that carries the data we've received from the host. Its ``valid``
+		has one bit per byte of ``data``; every word is fully valid, except potentially the last of a transfer.
+	interface: SuperSpeedEndpointInterface
+		Communications link to our USB device.
+
+	Parameters
+	----------
+	endpoint_number: int
+		The endpoint number (not address) this endpoint should respond to.
+	max_packet_size: int
+		The maximum packet size for this endpoint. Should match the wMaxPacketSize provided in the
+		USB endpoint descriptor.
+	max_burst: int
+		The maximum number of packets this endpoint will accept in a single burst; from 1 to 16. Should be one
+		more than the bMaxBurst provided in the endpoint's SuperSpeed companion descriptor. Defaults to 1.
+	'''
 
-					# Figure out how the sequence advertisement in our ACK relates to our current sequence number.
-					sequence_advancing = (handshakes_in.next_sequence == next_sequence_number)
+	SEQUENCE_NUMBER_BITS = 5
 
-					# Our simplest case is actually when an error occurs, which is indicated by receiving
-					# an ACK packet with Retry set to `1`. For now, we'll also treat a repeated sequence number
-					# as an indication that we need to re-try the given packet.
-					with m.If(handshakes_in.retry_required | ~sequence_advancing):
+	def __init__(self, *, endpoint_number, max_packet_size = 1024, max_burst = 1):
+		if max_burst not in range(1, 17):
+			raise ValueError(f'Maximum burst must be between 1 and 16 packets, not {max_burst}')
 
-						# In this case, we'll re-transmit the relevant data, either by sending another ZLP...
-						with m.If(last_packet_was_zlp):
-							m.d.comb += [
-								interface.tx_zlp.eq(1),
-								advance_sequence.eq(1),
-							]
+		self._endpoint_number = endpoint_number
+		self._max_packet_size = max_packet_size
+		self._max_burst       = max_burst
 
-						# ... or by moving right back into sending a data packet.
-						with m.Else():
-							m.next = 'SEND_PACKET'
+		#
+		# I/O port
+		#
+		self.stream    = SuperSpeedStreamInterface()
+		self.interface = SuperSpeedEndpointInterface()
 
-					# Otherwise, if our ACK contains the next sequence number, then this is an acknowledgement
-					# of the previous packet [USB3.2r1: 8.12.1.2].
-					with m.Else():
+	def elaborate(self, platform):
+		m = Module()
 
-						# We no longer need to keep the data that's been acknowledged; clear it.
-						m.d.ss += read_fill_count.eq(0)
-
-						# Figure out if we'll need to follow up with a ZLP. If we have ZLP generation enabled,
-						# we'll make sure we end on a short packet. If this is max-packet-size packet _and_ our
-						# transfer ended with this packet; we'll need to inject a ZLP.
-						follow_up_with_zlp = (read_fill_count == self._max_packet_size) & read_stream_ended
-
-						# If we're following up with a ZLP, we have two cases, depending on whether this ACK
-						# is also requesting another packet.
-						with m.If(follow_up_with_zlp):
-
-							# If we are requesting another packet immediately, we can said ZLP our immediately,
-							# and then continue waiting for the next ACK.
-							with m.If(is_in_token):
-
-								# ... send a ZLP...
-								m.d.comb += [
-									interface.tx_zlp.eq(1),
-									advance_sequence.eq(1),
-								]
-
-								# ... and clear the need to follow up with one, since we've just sent a short packet.
-								m.d.ss += [
-									read_stream_ended.eq(0),
-									last_packet_was_zlp.eq(1)
-								]
-
-							# Otherwise, we'll wait for an attempt to send data before we generate a ZLP.
-							with m.Else():
-								m.next = 'WAIT_TO_SEND'
-
-						# Otherwise, there's a possibility we already have a packet-worth of data waiting
-						# for us in our 'write buffer', which we've been filling in the background.
-						# If this is the case, we'll flip which buffer we're working with, and then
-						# ready ourselves for transmit.
-						packet_completing = in_stream.valid & (write_fill_count + 4 >= self._max_packet_size)
-						with m.Elif(~in_stream.ready | packet_completing):
-							m.d.comb += [
-								advance_sequence.eq(1),
-							]
-							m.d.ss += [
-								ping_pong_toggle.eq(~ping_pong_toggle),
-								read_stream_ended.eq(0),
-							]
-
-							with m.If(is_in_token):
-								m.d.ss += [
-									last_packet_was_zlp.eq(0)
-								]
-								m.next = 'SEND_PACKET'
-
-							with m.Else():
-								m.next = 'WAIT_TO_SEND'
-
-						# If neither of the above conditions are true; we now don't have enough data to send.
-						# We'll wait for enough data to transmit.
-						with m.Else():
-							m.next = 'WAIT_FOR_DATA'
+		interface      = self.interface
+		handshakes_out = interface.handshakes_out
+
+		# Parameters for later use.
+		data_width     = len(self.stream.data)
+		bytes_per_word = data_width // 8
+		buffer_depth   = (self._max_packet_size + bytes_per_word - 1) // bytes_per_word
+		buffer_count   = self._max_burst + 1
+
+		def next_buffer(buffer_number):
+			''' Returns the number of the buffer following a given buffer in our ring. '''
+			return Mux(buffer_number == buffer_count - 1, 0, buffer_number + 1)
+
+		#
+		# Receive buffer.
+		#
+		# We'll receive each packet into a buffer of its own; and only commit it to our ring
+		# of packets to be streamed once we know it's good. Our packet buffers share a single memory.
+		#
+		buffer = Memory(width = data_width, depth = buffer_count * buffer_depth, name = 'receive_buffer')
+		m.submodules.buffer_write = buffer_write = buffer.write_port(domain = 'ss')
+		m.submodules.buffer_read  = buffer_read  = buffer.read_port(domain = 'ss', transparent = False)
+
+		# Keep track of the length of the packet held in each buffer; and whether it starts a new transfer.
+		buffer_length = Array(
+			Signal(range(0, self._max_packet_size + 1), name = f'buffer_length_{i}') for i in range(buffer_count)
+		)
+		buffer_first  = Array(Signal(name = f'buffer_first_{i}') for i in range(buffer_count))
+
+		# Our packets are held in the order they were received; starting with the oldest packet, held in
+		# ``read_buffer``. ``fill_buffer`` is the buffer the next packet will be received into.
+		read_buffer      = Signal(range(buffer_count))
+		fill_buffer      = Signal(range(buffer_count))
+		packets_buffered = Signal(range(buffer_count + 1))
+
+		buffer_free      = (packets_buffered < buffer_count)
+		buffers_free     = buffer_count - packets_buffered
+
+		# Our host can send us as many packets as we have room for; up to a full burst.
+		packets_accepted = Signal(range(self._max_burst + 1))
+		m.d.comb += packets_accepted.eq(Mux(buffers_free > self._max_burst, self._max_burst, buffers_free))
+
+		packet_committed = Signal()
+		packet_released  = Signal()
+		m.d.ss += packets_buffered.eq(packets_buffered + packet_committed - packet_released)
+
+		#
+		# Packet reception.
+		#
+		rx        = interface.rx
+		rx_header = interface.rx_header
+
+		# Stores the sequence number we expect the next packet to have.
+		expected_sequence = Signal(self.SEQUENCE_NUMBER_BITS)
+
+		# Stores whether the packet being received has been dropped; as we didn't have room for it.
+		packet_dropped    = Signal()
+
+		# Stores where we are in the packet being received.
+		write_position    = Signal(range(buffer_depth + 1))
+
+		# Stores whether we're part-way through a transfer; i.e. our last packet was full length.
+		transfer_active   = Signal()
+
+		# Zero-length packets don't take up a buffer; instead, we'll remember that one is waiting to end its
+		# transfer, how many buffered packets are ahead of it, and whether it's the whole of its transfer.
+		zlp_pending       = Signal()
+		zlp_position      = Signal(range(buffer_count + 1))
+		zlp_first         = Signal()
+		is_zlp            = (rx_header.data_length == 0)
+
+		# Figure out whether the packet being received is for us.
+		is_to_us        = (rx_header.endpoint_number == self._endpoint_number)
+		is_out          = (rx_header.direction == USBDirection.OUT)
+		targeting_us    = is_to_us & is_out
+		packet_too_long = (rx_header.data_length > self._max_packet_size)
+
+		# Write each word of any packet for us into our fill buffer, as long as it's free. Since a packet
+		# is only committed once it's complete, a packet we don't keep is simply overwritten by the next.
+		receiving = rx.valid.any() & targeting_us
+		position  = Mux(rx.first, 0, write_position)
+
+		m.d.comb += [
+			buffer_write.en.eq(receiving & buffer_free & (position < buffer_depth)),
+			buffer_write.addr.eq(fill_buffer * buffer_depth + position),
+			buffer_write.data.eq(rx.data),
+		]
+
+		with m.If(receiving):
+			m.d.ss += write_position.eq(position + 1)
+
+			with m.If(~buffer_free):
+				m.d.ss += packet_dropped.eq(1)
+
+		#
+		# Handshake generation.
+		#
+
+		# Stores the handshakes we have waiting to be sent; and the parameters for our next ACK.
+		ack_required  = Signal()
+		ack_retry     = Signal()
+		ack_sequence  = Signal(self.SEQUENCE_NUMBER_BITS)
+		nrdy_required = Signal()
+
+		# Stores whether we'll need to send an ERDY packet before the host will send us more data. Once
+		# we've sent an NRDY, or told the host we have no room for more packets, it'll stop sending
+		# until we send an ERDY [USB3.2r1: 8.10.1].
+		erdy_required = Signal()
+
+		# Stores whether we've asked the host to retry a packet; in which case we'll silently discard
+		# any packets that follow it until the retried packet arrives.
+		retry_pending = Signal()
+
+		packet_complete = interface.rx_complete & targeting_us
+		packet_invalid  = interface.rx_invalid  & targeting_us
+		sequence_ok     = (rx_header.data_sequence == expected_sequence)
+
+		# Each packet streamed out brings any waiting ZLP closer to the front of our ring.
+		with m.If(packet_released & (zlp_position != 0)):
+			m.d.ss += zlp_position.eq(zlp_position - 1)
+
+		with m.If(interface.ep_reset):
+			m.d.ss += [
+				expected_sequence.eq(0),
+				transfer_active.eq(0),
+				retry_pending.eq(0),
+				erdy_required.eq(0),
+				zlp_pending.eq(0),
+			]
+
+		# Once a good packet with the sequence number we expect has been received, we'll keep it, and
+		# acknowledge it by telling the host which sequence number we expect next [USB3.2r1: 8.12.1.2].
+		with m.Elif(packet_complete & sequence_ok & ~packet_too_long):
+
+			# If we had room for our packet, keep it...
+			with m.If(~packet_dropped & ~(is_zlp & zlp_pending)):
+
+				# ... committing it to our ring of packets; or, if it was a ZLP, queueing the end of our transfer.
+				with m.If(~is_zlp):
+					m.d.comb += packet_committed.eq(1)
+					m.d.ss   += [
+						buffer_length[fill_buffer].eq(rx_header.data_length),
+						buffer_first[fill_buffer].eq(~transfer_active),
+						fill_buffer.eq(next_buffer(fill_buffer)),
+					]
+				with m.Else():
+					m.d.ss += [
+						zlp_pending.eq(1),
+						zlp_position.eq(packets_buffered - packet_released),
+						zlp_first.eq(~transfer_active),
+					]
+
+				m.d.ss += [
+					expected_sequence.eq(expected_sequence + 1),
+					transfer_active.eq(rx_header.data_length == self._max_packet_size),
+					retry_pending.eq(0),
+
+					ack_required.eq(1),
+					ack_retry.eq(0),
+					ack_sequence.eq(expected_sequence + 1),
+				]
+
+			# Otherwise, let the host know we're not ready for it. A well-behaved host won't send more packets
+			# than we've told it we have room for; but if it does, it'll wait for our ERDY before retrying them.
+			with m.Else():
+				m.d.ss += [
+					nrdy_required.eq(1),
+					erdy_required.eq(1),
+				]
+
+		# If our packet was corrupted, or wasn't the packet we expected, we'll discard it; and ask the
+		# host to re-send everything from the packet we expect.
+		with m.Elif((packet_complete | packet_invalid) & ~retry_pending & ~erdy_required):
+			m.d.ss += [
+				retry_pending.eq(1),
+
+				ack_required.eq(1),
+				ack_retry.eq(1),
+				ack_sequence.eq(expected_sequence),
+			]
+
+		# Each packet is dropped or not on its own merits.
+		with m.If(packet_complete | packet_invalid):
+			m.d.ss += packet_dropped.eq(0)
+
+		m.d.comb += [
+			handshakes_out.endpoint_number.eq(self._endpoint_number),
+			handshakes_out.direction.eq(USBDirection.OUT),
+			handshakes_out.retry_required.eq(ack_retry),
+			handshakes_out.next_sequence.eq(ack_sequence),
+			handshakes_out.number_of_packets.eq(packets_accepted),
+		]
+
+		# Our handshakes are sent one at a time; our transaction packet generator takes its parameters as it
+		# accepts each request. Since each ACK supersedes the last, we only ever need to keep one waiting.
+		request_accepted = handshakes_out.ready
+
+		with m.If(ack_required):
+			m.d.comb += handshakes_out.send_ack.eq(1)
+
+			with m.If(request_accepted & ~(packet_complete | packet_invalid)):
+				m.d.ss += ack_required.eq(0)
+
+				# If we've just told the host we don't have room for more packets, it'll wait for an ERDY.
+				with m.If(packets_accepted == 0):
+					m.d.ss += erdy_required.eq(1)
+
+		with m.Elif(nrdy_required):
+			m.d.comb += handshakes_out.send_nrdy.eq(1)
+
+			with m.If(request_accepted):
+				m.d.ss += nrdy_required.eq(0)
+
+		# Once we have room for more packets, ask the host to resume sending them.
+		with m.Elif(erdy_required & (packets_accepted != 0) & ~zlp_pending & ~interface.ep_reset):
+			m.d.comb += handshakes_out.send_erdy.eq(1)
+
+			with m.If(request_accepted):
+				m.d.ss += erdy_required.eq(0)
+
+		#
+		# Stream generation.
+		#
+		stream = self.stream
+
+		# Keep track of where we are in the packet we're streaming out.
+		read_position  = Signal(range(buffer_depth + 1))
+		read_length    = buffer_length[read_buffer]
+		read_address   = read_buffer * buffer_depth + read_position
+
+		# Our memory has a cycle of latency; so we'll always present the address of the word we'll send next.
+		m.d.comb += buffer_read.addr.eq(read_address)
+
+		# A word that ends a transfer is held until it's accepted, even if it has no valid bytes.
+		with m.If(~(stream.valid.any() | stream.last) | stream.ready):
+
+			# If a ZLP has reached the front of our ring, end its transfer with an empty word...
+			with m.If(zlp_pending & (zlp_position == 0)):
+				m.d.ss += [
+					stream.valid.eq(0),
+					stream.first.eq(zlp_first),
+					stream.last.eq(1),
+					zlp_pending.eq(0),
+				]
+
+			# ... otherwise, if we have a packet waiting, send its next word...
+			with m.Elif(packets_buffered != 0):
+				first_word = (read_position == 0)
+				last_word  = ((read_position + 1) << 2 >= read_length)
+
+				m.d.ss += [
+					stream.data.eq(buffer_read.data),
+					stream.first.eq(first_word & buffer_first[read_buffer]),
+					stream.last.eq(last_word & (read_length < self._max_packet_size)),
+				]
+
+				# Every word is fully valid, except potentially the last word of a packet.
+				with m.If(last_word):
+					with m.Switch(read_length[0:2]):
+						with m.Case(0):
+							m.d.ss += stream.valid.eq(0b1111)
+						with m.Case(1):
+							m.d.ss += stream.valid.eq(0b0001)
+						with m.Case(2):
+							m.d.ss += stream.valid.eq(0b0011)
+						with m.Case(3):
+							m.d.ss += stream.valid.eq(0b0111)
+				with m.Else():
+					m.d.ss += stream.valid.eq(0b1111)
+
+				# Move on to our next word; or, once we're done with this packet, free its buffer for another.
+				with m.If(last_word):
+					m.d.comb += [
+						packet_released.eq(1),
+						buffer_read.addr.eq(next_buffer(read_buffer) * buffer_depth),
+					]
+					m.d.ss += [
+						read_buffer.eq(next_buffer(read_buffer)),
+						read_position.eq(0),
+					]
+				with m.Else():
+					m.d.comb += buffer_read.addr.eq(read_address + 1)
+					m.d.ss   += read_position.eq(read_position + 1)
+
+			# ... otherwise, we have nothing to send.
+			with m.Else():
+				m.d.ss += [
+					stream.valid.eq(0),
+					stream.last.eq(0),
+				]
 
 		return m
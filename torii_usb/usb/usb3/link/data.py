@@ -202,8 +202,13 @@ class DataPacketReceiver(Elaboratable):
 						source.first.eq(1)
 					]
 
-					# Move to receiving data.
-					m.next = 'RECEIVE_PAYLOAD'
+					# Move to receiving data. A zero-length packet has no data; so its payload is just its CRC,
+					# which we'll check as though it followed a full data word.
+					with m.If(header.dw1[16:] == 0):
+						m.d.ss += previous_valid.eq(0b1111)
+						m.next = 'CHECK_CRC32'
+					with m.Else():
+						m.next = 'RECEIVE_PAYLOAD'
 
 				# If our data is valid and we're -not- a start of DPP, this isn't for us.
 				# Go back to watching for data.
@@ -296,7 +301,7 @@ class DataPacketReceiver(Elaboratable):
 					m.d.comb += self.packet_bad.eq(1)
 
 				# Finally, wait for our next packet.
-					m.next = 'WAIT_FOR_HPSTART'
+				m.next = 'WAIT_FOR_HPSTART'
 
 		return m
 
@@ -311,7 +316,9 @@ class DataPacketTransmitter(Elaboratable):
 		The data stream to be send as a data packet. The length of this stream should match thee
 		length parameter.
 	send_zlp: Signal(), input
-		Strobe; triggers sending of a zero-length packet.
+		Strobe; triggers sending of a zero-length packet. Only accepted while :attr:``idle`` is high.
+	idle: Signal(), output
+		High while we're waiting for a new data packet or zero-length packet to send.
 
 	sequence_number: Signal(5), input
 		The sequence number associated with the relevant data packet. Latched in once :attr:``data_sink`` goes valid.
@@ -322,6 +329,8 @@ class DataPacketTransmitter(Elaboratable):
 	direction: Signal(), input
 		The direction to indicate in the data header packet. Typically Direction.IN; but will be Direction.OUT
 		when data is sent to the host as part of a control transfer.
+	end_of_burst: Signal(), input
+		Set if the relevant data packet is the last in its burst. Latched in once :attr:``data_sink`` goes valid.
 
 	address: Signal(7), input
 		The current address of the USB device.
@@ -338,6 +347,7 @@ class DataPacketTransmitter(Elaboratable):
 		# Input stream.
 		self.data_sink       = SuperSpeedStreamInterface()
 		self.send_zlp        = Signal()
+		self.idle            = Signal()
 
 		# Data parameters.
 		self.sequence_number = Signal(5)
@@ -345,6 +355,7 @@ class DataPacketTransmitter(Elaboratable):
 		self.data_length     = Signal(range(self.MAX_PACKET_SIZE + 1))
 		self.address         = Signal(7)
 		self.direction       = Signal()
+		self.end_of_burst    = Signal()
 
 		# Output streams.
 		self.header_source   = HeaderQueue()
@@ -363,27 +374,32 @@ class DataPacketTransmitter(Elaboratable):
 		endpoint_number = Signal.like(self.endpoint_number)
 		data_length     = Signal.like(self.data_length)
 		direction       = Signal.like(self.direction)
+		end_of_burst    = Signal.like(self.end_of_burst)
 
-		# For now, we'll pass our data stream through unmodified; only buffered to improve
-		# timing.
-		#
-		# We'll keep this architecture; as later code is likely to want to more actively
-		# control when data is passed through to the transmitter.
+		# We'll pass our data stream through unmodified; only buffered to improve timing. We only accept
+		# a packet's payload once its header has been queued; so a packet that closely follows another
+		# can't have its data taken before its header exists.
+		accept_payload = Signal()
 		with m.If(~data_source.valid.any() | data_source.ready):
-			m.d.ss   += data_source.stream_eq(data_sink, omit = {'ready'})
-			m.d.comb += data_sink.ready.eq(1)
+			with m.If(accept_payload):
+				m.d.ss   += data_source.stream_eq(data_sink, omit = {'ready'})
+				m.d.comb += data_sink.ready.eq(1)
+			with m.Else():
+				m.d.ss   += data_source.valid.eq(0)
 
 		with m.FSM(domain = 'ss'):
 
 			# WAIT_FOR_DATA -- we're idly waiting for our input data stream to become valid.
 			with m.State('WAIT_FOR_DATA'):
+				m.d.comb += self.idle.eq(1)
 
 				# Constantly latch in our data parameters until we get a new data packet.
 				m.d.ss += [
 					sequence_number.eq(self.sequence_number),
 					endpoint_number.eq(self.endpoint_number),
 					data_length.eq(self.data_length),
-					direction.eq(self.direction)
+					direction.eq(self.direction),
+					end_of_burst.eq(self.end_of_burst),
 				]
 
 				# Once our data goes valid, begin sending our data.
@@ -409,6 +425,7 @@ class DataPacketTransmitter(Elaboratable):
 					header.data_sequence.eq(sequence_number),
 					header.data_length.eq(data_length),
 					header.endpoint_number.eq(endpoint_number),
+					header.end_of_burst.eq(end_of_burst),
 				]
 
 				# Once our header is accepted, move on to passing through our payload.
@@ -418,9 +435,12 @@ class DataPacketTransmitter(Elaboratable):
 			# SEND_PAYLOAD -- we're now passing our payload data to our transmitter; which will
 			# drive ready when it's time to accept data.
 			with m.State('SEND_PAYLOAD'):
+				m.d.comb += accept_payload.eq(1)
 
-				# Once our packet is complete, we'll go back to idle.
-				with m.If(~data_sink.valid.any()):
+				# Once our packet is complete, we'll go back to idle. We'll watch for its last word, rather
+				# than waiting for our stream to go idle, so another packet can follow it directly.
+				last_word_accepted = data_sink.valid.any() & data_sink.ready & data_sink.last
+				with m.If(~data_sink.valid.any() | last_word_accepted):
 					m.next = 'WAIT_FOR_DATA'
 
 			# SEND_ZLP -- we're sending a ZLP; which in our case means we'll be sending a header
@@ -440,6 +460,7 @@ class DataPacketTransmitter(Elaboratable):
 					header.data_sequence.eq(sequence_number),
 					header.data_length.eq(0),
 					header.endpoint_number.eq(endpoint_number),
+					header.end_of_burst.eq(end_of_burst),
 				]
 
 				# Once our header is accepted, we can move directly back to idle.
@@ -6,7 +6,8 @@
 
 ''' Header Packet data interfacing definitions.'''
 
-from torii.hdl               import Cat, Elaboratable, Module, Record
+from torii.hdl               import Cat, DomainRenamer, Elaboratable, Module, Record, ResetInserter, Signal
+from torii.lib.fifo          import SyncFIFOBuffered
 from torii.lib.stream.simple import StreamArbiter
 
 class HeaderPacket(Record):
@@ -140,3 +141,61 @@ class HeaderQueueDemultiplexer(Elaboratable):
 		m.d.comb += self.sink.ready.eq(sink_ready)
 
 		return m
+
+class HeaderQueueFIFO(Elaboratable):
+	''' Gateware that buffers a Header Queue; holding up to a given number of headers.
+
+	Headers are stored in a memory, rather than in registers; so deep queues can be placed in block RAM.
+
+	Attributes
+	----------
+	sink: HeaderQueue(), input queue
+		The header queue to be buffered.
+	source: HeaderQueue(), output queue
+		The buffered header queue; carrying headers in the order they were received.
+	level: Signal(range(depth + 1)), output
+		The number of headers currently buffered.
+	flush: Signal(), input
+		Strobe that discards every header currently buffered; e.g. on a USB reset, or when the link goes down.
+
+	Parameters
+	----------
+	depth: int
+		The number of headers to buffer.
+	'''
+
+	def __init__(self, *, depth):
+		if depth <= 0:
+			# We'll never be elaborated; so don't warn about it.
+			self._MustUse__silence = True
+			raise ValueError(f'Header queue depth must be positive, not {depth}')
+
+		self._depth = depth
+
+		#
+		# I/O port
+		#
+		self.sink   = HeaderQueue()
+		self.source = HeaderQueue()
+		self.level  = Signal(range(depth + 1))
+		self.flush  = Signal()
+
+	def elaborate(self, platform):
+		m = Module()
+
+		m.submodules.fifo = fifo = ResetInserter({'ss': self.flush})(DomainRenamer(sync = 'ss')(
+			SyncFIFOBuffered(width = len(self.sink.header), depth = self._depth)
+		))
+		m.d.comb += [
+			fifo.w_data.eq(self.sink.header),
+			fifo.w_en.eq(self.sink.valid),
+			self.sink.ready.eq(fifo.w_rdy),
+
+			self.source.header.eq(fifo.r_data),
+			self.source.valid.eq(fifo.r_rdy),
+			fifo.r_en.eq(self.source.ready),
+
+			self.level.eq(fifo.level),
+		]
+
+		return m
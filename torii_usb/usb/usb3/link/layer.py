@@ -11,7 +11,7 @@ from torii.hdl         import Elaboratable, Module, Signal
 from ...stream         import SuperSpeedStreamArbiter, SuperSpeedStreamInterface, USBRawSuperSpeedStream
 from ..physical.coding import IDL
 from .data             import DataHeaderPacket, DataPacketReceiver, DataPacketTransmitter
-from .header           import HeaderQueue, HeaderQueueArbiter
+from .header           import HeaderQueue, HeaderQueueArbiter, HeaderQueueFIFO
 from .idle             import IdleHandshakeHandler
 from .ltssm            import LTSSMController
 from .ordered_sets     import TSTransceiver
@@ -25,11 +25,32 @@ class USB3LinkLayer(Elaboratable):
 	Performs the lower-level data manipulations associated with transporting USB3 packets
 	from place to place.
 
+	Parameters
+	----------
+	physical_layer: USB3PhysicalLayer
+		The physical layer to transport packets over.
+	ss_clock_frequency: float
+		The frequency of the ``ss`` domain, in Hz. Defaults to 125MHz.
+	header_queue_depth: int
+		The number of header packets to queue between the link and protocol layers, in each direction; in
+		addition to the four header buffers each link partner is required to have. Queued headers are held in
+		block RAM. On transmit, this lets the protocol layer keep queueing headers while we wait on link credits;
+		on receive, it frees our link buffers -- and so returns credits to our partner -- without waiting for the
+		protocol layer. Defaults to 0; which adds no queueing.
+
+	Attributes
+	----------
+	credit_starvation_count: Signal(32), output
+		The number of times we've used up all of our partner's header buffers; see :class:`PacketTransmitter`.
 	'''
 
-	def __init__(self, *, physical_layer, ss_clock_frequency = 125e6):
-		self._physical_layer  = physical_layer
-		self._clock_frequency = ss_clock_frequency
+	def __init__(self, *, physical_layer, ss_clock_frequency = 125e6, header_queue_depth = 0):
+		if header_queue_depth < 0:
+			raise ValueError(f'Header queue depth must not be negative, not {header_queue_depth}')
+
+		self._physical_layer     = physical_layer
+		self._clock_frequency    = ss_clock_frequency
+		self._header_queue_depth = header_queue_depth
 
 		#
 		# I/O port
@@ -51,6 +72,8 @@ class USB3LinkLayer(Elaboratable):
 		self.data_sink_endpoint_number = Signal(4)
 		self.data_sink_length          = Signal(range(1024 + 1))
 		self.data_sink_direction       = Signal()
+		self.data_sink_end_of_burst    = Signal()
+		self.data_sink_idle            = Signal()
 
 		# Device state for header packets
 		self.current_address           = Signal(7)
@@ -59,6 +82,7 @@ class USB3LinkLayer(Elaboratable):
 		self.trained                   = Signal()
 		self.ready                     = Signal()
 		self.in_reset                  = Signal()
+		self.credit_starvation_count   = Signal(32)
 
 		# Test and debug signals.
 		self.disable_scrambling        = Signal()
@@ -158,6 +182,9 @@ class USB3LinkLayer(Elaboratable):
 			ltssm.disable_scrambling.eq(self.disable_scrambling),
 		]
 
+		# Any headers we've queued are stale once the link resets or goes down; so we'll discard them.
+		flush_header_queues = self.in_reset | ~ltssm.link_ready
+
 		#
 		# Packet transmission path.
 		# Accepts packets from the protocol and link layers, and transmits them.
@@ -167,6 +194,16 @@ class USB3LinkLayer(Elaboratable):
 		m.submodules.hp_mux = hp_mux = HeaderQueueArbiter()
 		hp_mux.add_producer(self.header_sink)
 
+		# If requested, queue our headers while they wait for link credits.
+		header_tx_source = hp_mux.source
+		if self._header_queue_depth:
+			m.submodules.header_tx_queue = header_tx_queue = HeaderQueueFIFO(depth = self._header_queue_depth)
+			m.d.comb += [
+				header_tx_queue.sink.header_eq(hp_mux.source),
+				header_tx_queue.flush.eq(flush_header_queues),
+			]
+			header_tx_source = header_tx_queue.source
+
 		# Core transmitter.
 		m.submodules.transmitter = transmitter = PacketTransmitter()
 		m.d.comb += [
@@ -174,11 +211,14 @@ class USB3LinkLayer(Elaboratable):
 			transmitter.enable.eq(ltssm.link_ready),
 			transmitter.usb_reset.eq(self.in_reset),
 
-			transmitter.queue.header_eq(hp_mux.source),
+			transmitter.queue.header_eq(header_tx_source),
 
 			# Link state management handling.
 			timers.link_command_received.eq(transmitter.link_command_received),
 			self.ready.eq(transmitter.bringup_complete),
+
+			# Flow control statistics.
+			self.credit_starvation_count.eq(transmitter.credit_starvation_count),
 		]
 
 		#
@@ -186,13 +226,24 @@ class USB3LinkLayer(Elaboratable):
 		# Receives header packets and forwards them up to the protocol layer.
 		#
 		m.submodules.header_rx = header_rx = HeaderPacketReceiver()
+
+		# If requested, queue received headers for the protocol layer; releasing our link buffers as they're queued.
+		header_rx_source = header_rx.queue
+		if self._header_queue_depth:
+			m.submodules.header_rx_queue = header_rx_queue = HeaderQueueFIFO(depth = self._header_queue_depth)
+			m.d.comb += [
+				header_rx_queue.sink.header_eq(header_rx.queue),
+				header_rx_queue.flush.eq(flush_header_queues),
+			]
+			header_rx_source = header_rx_queue.source
+
 		m.d.comb += [
 			header_rx.sink.tap(physical_layer.source),
 			header_rx.enable.eq(ltssm.link_ready),
 			header_rx.usb_reset.eq(self.in_reset),
 
 			# Bring our header packet interface to the protocol layer.
-			self.header_source.header_eq(header_rx.queue),
+			self.header_source.header_eq(header_rx_source),
 
 			# Keepalive handling.
 			timers.link_command_transmitted.eq(header_rx.source.valid),
@@ -250,7 +301,9 @@ class USB3LinkLayer(Elaboratable):
 			data_tx.sequence_number.eq(self.data_sink_sequence_number),
 			data_tx.endpoint_number.eq(self.data_sink_endpoint_number),
 			data_tx.data_length.eq(self.data_sink_length),
-			data_tx.direction.eq(self.data_sink_direction)
+			data_tx.direction.eq(self.data_sink_direction),
+			data_tx.end_of_burst.eq(self.data_sink_end_of_burst),
+			self.data_sink_idle.eq(data_tx.idle),
 		]
 
 		#
@@ -426,6 +426,13 @@ class PacketTransmitter(Elaboratable):
 
 	recovery_required: Signal(), output
 		Strobe; pulsed when a condition that requires link recovery occurs.
+
+	credits_available: Signal(range(buffer_count + 1)), output
+		The number of link credits we currently hold; i.e. the number of free receive buffers our link partner
+		has advertised to us.
+	credit_starvation_count: Signal(32), output
+		The number of times we've used up our last link credit; after which we can't accept any more header
+		packets until our link partner frees a buffer. Saturates at its maximum value, rather than wrapping.
 	'''
 
 	SEQUENCE_NUMBER_WIDTH = 3
@@ -462,8 +469,9 @@ class PacketTransmitter(Elaboratable):
 		self.lgo_target            = Signal(2)
 
 		# Debug information.
-		self.credits_available     = Signal(range(self._buffer_count + 1))
-		self.packets_to_send       = Signal(range(self._buffer_count + 1))
+		self.credits_available       = Signal(range(self._buffer_count + 1))
+		self.packets_to_send         = Signal(range(self._buffer_count + 1))
+		self.credit_starvation_count = Signal(32)
 
 	def elaborate(self, platform):
 		m = Module()
@@ -482,6 +490,11 @@ class PacketTransmitter(Elaboratable):
 		with m.Elif(credit_consumed & ~credit_received):
 			m.d.ss += credits_available.eq(credits_available - 1)
 
+		# Count each time we run out of credits; so our link partner's buffering can be profiled.
+		credits_exhausted = credit_consumed & ~credit_received & (credits_available == 1)
+		with m.If(credits_exhausted & ~self.credit_starvation_count.all()):
+			m.d.ss += self.credit_starvation_count.eq(self.credit_starvation_count + 1)
+
 		#
 		# Task 'queues'.
 		#
@@ -6,7 +6,7 @@
 
 ''' Endpoint abstractions for USB3. '''
 
-from torii.hdl    import Elaboratable, Module, Signal
+from torii.hdl    import Cat, Elaboratable, Module, Signal
 
 from ...stream    import SuperSpeedStreamInterface
 from ..link.data  import DataHeaderPacket
@@ -36,6 +36,8 @@ class SuperSpeedEndpointInterface:
 		an entire packet; and it must respect the transmitter's ``ready`` signal.
 	tx_zlp: Signal(), output from endpoint
 		Strobe; when pulsed, triggers sending of a zero-length packet.
+	tx_idle: Signal(), input to endpoint
+		High while a zero-length packet can be requested; :attr:`tx_zlp` is ignored while this is low.
 	tx_length: Signal(range(1024 + 1)), output from endpoint
 		The length of the packet to be transmitted; required for generating its header.
 	tx_endpoint_number: Signal(4), output from endpoint
@@ -44,6 +46,8 @@ class SuperSpeedEndpointInterface:
 		The sequence number associated with the active transmission.
 	tx_direction: Signal(), output from endpoint
 		The direction associated with the active transmission; used for control endpoints.
+	tx_end_of_burst: Signal(), output from endpoint
+		Set if the active transmission is the last packet the endpoint will send in the current burst.
 
 	active_address: Signal(7), input to endpoint
 		Contains the device's current address.
@@ -71,10 +75,12 @@ class SuperSpeedEndpointInterface:
 		# Data packet transmission.
 		self.tx                    = SuperSpeedStreamInterface()
 		self.tx_zlp                = Signal()
+		self.tx_idle               = Signal(reset = 1)
 		self.tx_length             = Signal(range(1024 + 1))
 		self.tx_endpoint_number    = Signal(4)
 		self.tx_sequence_number    = Signal(5)
 		self.tx_direction          = Signal(reset = 1)
+		self.tx_end_of_burst       = Signal()
 
 		# Handshaking / transaction packet exchange.
 		self.handshakes_out        = HandshakeGeneratorInterface()
@@ -97,6 +103,13 @@ class SuperSpeedEndpointMultiplexer(Elaboratable):
 
 	Interfaces are added using :attr:`add_interface`.
 
+	Access to our transmitter is arbitrated a packet at a time: whenever the transmitter is free, it's granted
+	to the highest-priority interface with a data packet or zero-length packet waiting; and interfaces of equal
+	priority take turns. Each grant lasts until the packet's last word has been accepted, or the zero-length
+	packet has been sent; so several endpoints can transmit concurrently, without coordinating between
+	themselves. Each interface's zero-length packet request is held until it's granted; and the interface's
+	``tx_idle`` is held low until then.
+
 	Attributes
 	----------
 
@@ -115,14 +128,21 @@ class SuperSpeedEndpointMultiplexer(Elaboratable):
 		# Internals
 		#
 		self._interfaces = []
+		self._priorities = []
 
-	def add_interface(self, interface: SuperSpeedEndpointInterface):
+	def add_interface(self, interface: SuperSpeedEndpointInterface, *, priority = 0):
 		''' Adds a EndpointInterface to the multiplexer.
 
-		Arbitration is not performed; it's expected only one endpoint will be
-		driving the transmit lines at a time.
+		Parameters
+		----------
+		interface: SuperSpeedEndpointInterface
+			The interface to be added.
+		priority: int
+			The interface's priority when arbitrating for our transmitter. Waiting packets from interfaces with
+			a higher priority are always sent first; interfaces with equal priorities take turns. Defaults to 0.
 		'''
 		self._interfaces.append(interface)
+		self._priorities.append(priority)
 
 	def _multiplex_signals(self, m, *, when, multiplex):
 		''' Helper that creates a simple priority-encoder multiplexer.
@@ -157,6 +177,114 @@ class SuperSpeedEndpointMultiplexer(Elaboratable):
 			# After the first element, all other entries should be created with Elif.
 			conditional = m.Elif
 
+	def _arbitrate_transmitter(self, m):
+		''' Adds the logic that grants each of our interfaces access to our transmitter, in turn. '''
+
+		shared          = self.shared
+		interface_count = len(self._interfaces)
+
+		# Stores which interface currently holds our transmitter; or last held it, if we're not ``busy``.
+		# We'll start out as though our last interface held it; so our first interface is favoured first.
+		owner      = Signal(range(interface_count), reset = interface_count - 1)
+		busy       = Signal()
+		next_owner = Signal.like(owner)
+
+		requests = []
+		zlps     = []
+
+		for index, interface in enumerate(self._interfaces):
+
+			# Our transmitter only accepts zero-length packets while it's idle; so we'll hold onto each
+			# interface's ZLP request, along with its parameters, until we're able to send it.
+			zlp = {
+				'pending':         Signal(name = f'zlp_pending_{index}'),
+				'endpoint_number': Signal.like(interface.tx_endpoint_number, name = f'zlp_endpoint_number_{index}'),
+				'sequence_number': Signal.like(interface.tx_sequence_number, name = f'zlp_sequence_number_{index}'),
+				'direction':       Signal.like(interface.tx_direction, name = f'zlp_direction_{index}'),
+				'end_of_burst':    Signal.like(interface.tx_end_of_burst, name = f'zlp_end_of_burst_{index}'),
+			}
+			zlps.append(zlp)
+
+			with m.If(interface.tx_zlp):
+				m.d.ss += [
+					zlp['pending'].eq(1),
+					zlp['endpoint_number'].eq(interface.tx_endpoint_number),
+					zlp['sequence_number'].eq(interface.tx_sequence_number),
+					zlp['direction'].eq(interface.tx_direction),
+					zlp['end_of_burst'].eq(interface.tx_end_of_burst),
+				]
+
+			requests.append(interface.tx.valid.any() | zlp['pending'])
+			m.d.comb += interface.tx_idle.eq(~zlp['pending'])
+
+		#
+		# Arbitration.
+		#
+
+		# Figure out which interface should be granted our transmitter next. Higher priorities always win; and,
+		# within a priority, we'll favour whichever interface follows our previous owner.
+		with m.Switch(owner):
+			for previous in range(interface_count):
+				with m.Case(previous):
+					order = sorted(
+						range(interface_count),
+						key = lambda index: (-self._priorities[index], (index - previous - 1) % interface_count)
+					)
+
+					# The latest assignment wins; so we'll assign in reverse order of preference.
+					for index in reversed(order):
+						with m.If(requests[index]):
+							m.d.comb += next_owner.eq(index)
+
+		with m.If(~busy & Cat(requests).any()):
+			m.d.ss += [
+				owner.eq(next_owner),
+				busy.eq(1),
+			]
+
+		#
+		# Connect our owner to our transmitter.
+		#
+		with m.If(busy):
+			with m.Switch(owner):
+				for index, interface in enumerate(self._interfaces):
+					zlp = zlps[index]
+
+					with m.Case(index):
+
+						# If our owner has a ZLP waiting, send it once our transmitter's idle; and release
+						# the transmitter as we do. Any ZLP was requested before our owner's next packet.
+						with m.If(zlp['pending']):
+							m.d.comb += [
+								shared.tx_zlp.eq(shared.tx_idle),
+								shared.tx_endpoint_number.eq(zlp['endpoint_number']),
+								shared.tx_sequence_number.eq(zlp['sequence_number']),
+								shared.tx_direction.eq(zlp['direction']),
+								shared.tx_end_of_burst.eq(zlp['end_of_burst']),
+							]
+
+							with m.If(shared.tx_idle):
+								m.d.ss += [
+									zlp['pending'].eq(0),
+									busy.eq(0),
+								]
+
+						# Otherwise, pass through our owner's data packet, and release the transmitter once
+						# its last word is accepted.
+						with m.Else():
+							m.d.comb += [
+								shared.tx.stream_eq(interface.tx),
+								shared.tx_endpoint_number.eq(interface.tx_endpoint_number),
+								shared.tx_sequence_number.eq(interface.tx_sequence_number),
+								shared.tx_direction.eq(interface.tx_direction),
+								shared.tx_length.eq(interface.tx_length),
+								shared.tx_end_of_burst.eq(interface.tx_end_of_burst),
+							]
+
+							last_word_accepted = shared.tx.valid.any() & shared.tx.ready & shared.tx.last
+							with m.If(~interface.tx.valid.any() | last_word_accepted):
+								m.d.ss += busy.eq(0)
+
 	def elaborate(self, platform):
 		m = Module()
 		shared = self.shared
@@ -183,37 +311,34 @@ class SuperSpeedEndpointMultiplexer(Elaboratable):
 			]
 
 		#
-		# Multiplex each of our transmit interfaces.
+		# Arbitrate access to our transmitter.
 		#
-		for interface in self._interfaces:
-
-			# If the transmit interface is valid, connect it up to our endpoint.
-			# The latest assignment will win; so we can treat these all as a parallel 'if's
-			# and still get an appropriate priority encoder.
-			with m.If(interface.tx.valid.any() | interface.tx_zlp):
-				m.d.comb += [
-					shared.tx.stream_eq(interface.tx),
-					shared.tx_zlp.eq(interface.tx_zlp),
-					shared.tx_direction.eq(interface.tx_direction),
-					shared.tx_endpoint_number.eq(interface.tx_endpoint_number),
-					shared.tx_sequence_number.eq(interface.tx_sequence_number),
-					shared.tx_length.eq(interface.tx_length)
-				]
+		if self._interfaces:
+			self._arbitrate_transmitter(m)
 
 		#
 		# Multiplex each of our handshake-out interfaces.
 		#
+
+		# Only one handshake can be requested at a time; so we'll pass through the first interface requesting one,
+		# and leave the others waiting until our generator is ready for them.
+		conditional = m.If
+
 		for interface in self._interfaces:
 			any_generate_signal_asserted = (
 				interface.handshakes_out.send_ack   |
-				interface.handshakes_out.send_stall
+				interface.handshakes_out.send_stall |
+				interface.handshakes_out.send_nrdy  |
+				interface.handshakes_out.send_erdy
 			)
 
 			# If the given interface is trying to send an handshake, connect it up
 			# to our shared interface.
-			with m.If(any_generate_signal_asserted):
+			with conditional(any_generate_signal_asserted):
 				m.d.comb += shared.handshakes_out.connect(interface.handshakes_out)
 
+			conditional = m.Elif
+
 		#
 		# Multiplex the signals being routed -from- our pre-mux interface.
 		#
@@ -29,6 +29,11 @@ class HandshakeGeneratorInterface(Record):
 		If set, an ACK will be interpreted as a request to re-send the relevant packet.
 	next_sequence: Signal(5), input to handshake generator
 		Reports the next expected data packet sequence number to the host.
+	number_of_packets: Signal(5), input to handshake generator
+		The number of packets to advertise in an ACK or ERDY; i.e. how many packets the endpoint can accept
+		from, or send to, the host in its next burst. Defaults to 1 when not driven.
+	direction: Signal(), input to handshake generator
+		The direction of the endpoint an NRDY or ERDY refers to. Defaults to IN when not driven.
 
 	send_ack: Signal(), input to handshake generator
 		Strobe; requests generation of an ACK packet.
@@ -43,21 +48,30 @@ class HandshakeGeneratorInterface(Record):
 		super().__init__([
 
 			# Parameters.
-			('endpoint_number', 7, Direction.FANIN),
-			('retry_required',  1, Direction.FANIN),
-			('next_sequence',   5, Direction.FANIN),
+			('endpoint_number',   7, Direction.FANIN),
+			('retry_required',    1, Direction.FANIN),
+			('next_sequence',     5, Direction.FANIN),
+			('number_of_packets', 5, Direction.FANIN),
+			('direction',         1, Direction.FANIN),
 
 			# Commands.
-			('send_ack',        1, Direction.FANIN),
-			('send_stall',      1, Direction.FANIN),
-			('send_nrdy',       1, Direction.FANIN),
-			('send_erdy',       1, Direction.FANIN),
+			('send_ack',          1, Direction.FANIN),
+			('send_stall',        1, Direction.FANIN),
+			('send_nrdy',         1, Direction.FANIN),
+			('send_erdy',         1, Direction.FANIN),
 
 			# Status.
-			('ready',           1, Direction.FANOUT),
-			('done',            1, Direction.FANOUT),
+			('ready',             1, Direction.FANOUT),
+			('done',              1, Direction.FANOUT),
 
-		])
+		], fields = {
+			# Handlers that don't care about bursts -- e.g. control request handlers -- always handle
+			# a single packet at a time; so that's what we'll advertise unless told otherwise.
+			'number_of_packets': Signal(5, name = 'number_of_packets', reset = 1),
+
+			# Likewise, NRDYs and ERDYs have always referred to IN endpoints; so that's our default direction.
+			'direction':         Signal(1, name = 'direction', reset = USBDirection.IN),
+		})
 
 class HandshakeReceiverInterface(Record):
 	''' Interface used by an endpoint to generate transaction packets.
@@ -206,6 +220,8 @@ class TransactionPacketGenerator(Elaboratable):
 		endpoint_number = Signal.like(interface.endpoint_number)
 		data_error      = Signal.like(interface.retry_required)
 		next_sequence   = Signal.like(interface.next_sequence)
+		packet_count    = Signal.like(interface.number_of_packets)
+		direction       = Signal.like(interface.direction)
 		device_address  = Signal.like(self.address)
 
 		def send_packet(response_type, **fields):
@@ -242,6 +258,8 @@ class TransactionPacketGenerator(Elaboratable):
 					endpoint_number.eq(interface.endpoint_number),
 					data_error.eq(interface.retry_required),
 					next_sequence.eq(interface.next_sequence),
+					packet_count.eq(interface.number_of_packets),
+					direction.eq(interface.direction),
 					device_address.eq(self.address)
 				]
 
@@ -252,7 +270,7 @@ class TransactionPacketGenerator(Elaboratable):
 				with m.If(interface.send_nrdy):
 					m.next = 'SEND_NRDY'
 				with m.If(interface.send_erdy):
-					m.next = 'SEND_NRDY'
+					m.next = 'SEND_ERDY'
 
 			# SEND_ACK -- actively send an ACK packet to our link partner; and wait for that to complete.
 			with m.State('SEND_ACK'):
@@ -262,8 +280,7 @@ class TransactionPacketGenerator(Elaboratable):
 					direction         = USBDirection.OUT,
 					retry             = data_error,
 					data_sequence     = next_sequence,
-					# TODO: eventually support bursting?
-					number_of_packets = 1,
+					number_of_packets = packet_count,
 				)
 
 			# SEND_NRDY -- actively send an NRDY packet to our link partner; and wait for that to complete.
@@ -271,17 +288,16 @@ class TransactionPacketGenerator(Elaboratable):
 				send_packet(
 					NRDYHeaderPacket,
 					subtype           = TransactionPacketSubtype.NRDY,
-					direction         = USBDirection.IN,
+					direction         = direction,
 				)
 
-			# SEND_NRDY -- actively send an NRDY packet to our link partner; and wait for that to complete.
+			# SEND_ERDY -- actively send an ERDY packet to our link partner; and wait for that to complete.
 			with m.State('SEND_ERDY'):
 				send_packet(
 					ERDYHeaderPacket,
 					subtype           = TransactionPacketSubtype.ERDY,
-					direction         = USBDirection.IN,
-					# TODO: eventually support bursting?
-					number_of_packets = 1,
+					direction         = direction,
+					number_of_packets = packet_count,
 				)
 
 			# SEND_STALL -- actively send a STALL packet to our link partner; and wait for that to complete.
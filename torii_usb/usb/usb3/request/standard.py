@@ -6,28 +6,52 @@
 
 ''' Standard, full-gateware control request handlers. '''
 
+import os
 import unittest
 
 from torii.hdl                import Elaboratable, Fell, Module, Signal
+from torii.hdl.ast            import Operator
 
 from usb_construct.emitters   import DeviceDescriptorCollection
-from usb_construct.types      import USBRequestType, USBStandardRequests
+from usb_construct.types      import USBRequestRecipient, USBRequestType, USBStandardRequests
 
 from ...stream                import SuperSpeedStreamInterface
-from ..application.descriptor import GetDescriptorHandler
+from ..application.descriptor import GetDescriptorHandler, GetDescriptorHandlerBlock
+from ...request               import SetupPacket
 from ..application.request    import SuperSpeedRequestHandlerInterface
 
 class StandardRequestHandler(Elaboratable):
-	''' Pure-gateware USB3 setup request handler. Implements the standard requests required for enumeration. '''
+	''' Pure-gateware USB3 setup request handler. Implements the standard requests required for enumeration.
 
-	def __init__(self, descriptors: DeviceDescriptorCollection):
-		self.descriptors = descriptors
+	Parameters
+	----------
+	descriptors: DeviceDescriptorCollection
+		The DeviceDescriptorCollection that contains our descriptors.
+	avoid_blockram: bool, optional
+		If True, each descriptor is given a small ROM of its own, rather than being placed into a single
+		block RAM with the others. Defaults to the ``TORII_USB_AVOID_BLOCKRAM`` environment variable.
+	'''
+
+	def __init__(self, descriptors: DeviceDescriptorCollection, avoid_blockram = None):
+		self.descriptors     = descriptors
+		self._avoid_blockram = avoid_blockram
+
+		# If we don't have a value for avoiding blockrams; defer to the environment.
+		if self._avoid_blockram is None:
+			self._avoid_blockram = os.getenv('TORII_USB_AVOID_BLOCKRAM', False)
 
 		#
 		# I/O port
 		#
 		self.interface = SuperSpeedRequestHandlerInterface()
 
+	def handler_condition(self, setup: SetupPacket) -> Operator:
+		''' Returns a conditional indicating whether the given setup packet is a standard request we handle. '''
+		return (
+			(setup.type == USBRequestType.STANDARD) &
+			(setup.recipient == USBRequestRecipient.DEVICE)
+		)
+
 	def handle_register_write_request(self, m, new_value_signal, write_strobe, stall_condition = 0):
 		''' Fills in the current state with a request handler meant to set a register.
 
@@ -119,9 +143,14 @@ class StandardRequestHandler(Elaboratable):
 		#
 
 		# Handler for Get Descriptor requests; responds with our various fixed descriptors.
-		m.submodules.get_descriptor = get_descriptor_handler = GetDescriptorHandler(
-			self.descriptors, usb_domain = 'ss', stream_type = SuperSpeedStreamInterface
-		)
+		if self._avoid_blockram:
+			get_descriptor_handler = GetDescriptorHandler(
+				self.descriptors, usb_domain = 'ss', stream_type = SuperSpeedStreamInterface
+			)
+		else:
+			get_descriptor_handler = GetDescriptorHandlerBlock(self.descriptors, usb_domain = 'ss')
+
+		m.submodules.get_descriptor = get_descriptor_handler
 
 		m.d.comb += [
 			get_descriptor_handler.value.eq(setup.value),
@@ -131,7 +160,7 @@ class StandardRequestHandler(Elaboratable):
 		#
 		# Handlers.
 		#
-		with m.If(setup.type == USBRequestType.STANDARD):
+		with m.If(self.handler_condition(setup)):
 			with m.FSM(domain = 'ss'):
 
 				# IDLE -- not handling any active request
@@ -9,19 +9,26 @@
 # Create shorthands for the most common parts of the library's usb2 gateware.
 from .usb.usb2.device                import USBDevice
 from .usb.usb2.endpoint              import EndpointInterface
-from .usb.usb2.endpoints.isochronous import USBIsochronousInEndpoint
+from .usb.usb2.endpoints.isochronous import (
+	USBIsochronousInEndpoint, USBIsochronousOutEndpoint, USBIsochronousStreamInEndpoint
+)
 from .usb.usb2.endpoints.status      import USBSignalInEndpoint
 from .usb.usb2.endpoints.stream      import (
-	USBMultibyteStreamInEndpoint, USBStreamInEndpoint, USBStreamOutEndpoint
+	USBMultibyteStreamInEndpoint, USBMultibyteStreamOutEndpoint, USBStreamInEndpoint, USBStreamOutEndpoint
 )
+from .usb.usb2.multiport             import USBMultiPortDevice
 from .usb.usb2.request               import RequestHandlerInterface
 
 __all__ = (
 	'USBDevice',
+	'USBMultiPortDevice',
 	'EndpointInterface',
 	'USBIsochronousInEndpoint',
+	'USBIsochronousOutEndpoint',
+	'USBIsochronousStreamInEndpoint',
 	'USBSignalInEndpoint',
 	'USBMultibyteStreamInEndpoint',
+	'USBMultibyteStreamOutEndpoint',
 	'USBStreamInEndpoint',
 	'USBStreamOutEndpoint',
 	'RequestHandlerInterface',
@@ -8,11 +8,12 @@
 # Create shorthands for the most common parts of the library's usb3 gateware.
 from .usb.usb3.application.request import SuperSpeedRequestHandler, SuperSpeedRequestHandlerInterface
 from .usb.usb3.device              import USBSuperSpeedDevice
-from .usb.usb3.endpoints.stream    import SuperSpeedStreamInEndpoint
+from .usb.usb3.endpoints.stream    import SuperSpeedStreamInEndpoint, SuperSpeedStreamOutEndpoint
 
 __all__ = (
 	'SuperSpeedRequestHandler',
 	'SuperSpeedRequestHandlerInterface',
 	'USBSuperSpeedDevice',
 	'SuperSpeedStreamInEndpoint',
+	'SuperSpeedStreamOutEndpoint',
 )
@@ -9,11 +9,11 @@ from warnings  import warn
 
 from torii.hdl import Signal
 
-from .cdc      import synchronize
+from .cdc      import synchronize, synchronize_count
 
 __all__ = [
 	'rising_edge_detected', 'falling_edge_detected', 'any_edge_detected',
-	'past_value_of', 'synchronize'
+	'past_value_of', 'synchronize', 'synchronize_count'
 ]
 
 def _single_edge_detector(m, signal, *, domain, edge = 'rising'):
@@ -80,6 +80,64 @@ def synchronize(m, signal, *, output = None, o_domain = 'sync', stages = 2):
 
 	return output
 
+def synchronize_count(m, count, *, output = None, i_domain, o_domain, stages = 2):
+	'''
+	Convenience function. Synchronizes a free-running binary counter across clock domains.
+
+	The count is converted to Gray code and registered in the input domain before being
+	synchronized; so every sample taken in the output domain is a value the counter actually
+	held. This is only valid if the counter changes by at most one each ``i_domain`` cycle,
+	and wraps around at a power of two.
+
+	Parameters
+	----------
+	count
+		The binary counter to be synchronized.
+
+	output
+		The signal to output the synchronized binary count to,
+		or None to have one created for you.
+
+	i_domain
+		The name of the domain the counter is driven from.
+
+	o_domain
+		The name of the domain to be synchronized to.
+
+	stages
+		The depth (in FFs) of the synchronization chain.
+		Longer incurs more delay. Must be >= 2 to avoid metastability.
+
+	Returns
+	-------
+	Signal
+		The post-synchronization count. Will be equivalent to the
+		`output` signal if provided, or a new, created signal otherwise.
+
+	'''
+
+	width = len(count)
+
+	if output is None:
+		output = Signal.like(count, name_suffix = '_synced')
+
+	# Convert our count to Gray code, and register it in its own domain; so the synchronizer
+	# never sees the glitches of the combinational conversion.
+	gray_count = Signal(width, name = f'{count.name}_gray')
+	m.d[i_domain] += gray_count.eq(count ^ (count >> 1))
+
+	synced_gray_count = Signal(width, name = f'{count.name}_gray_synced')
+	m.submodules += FFSynchronizer(gray_count, synced_gray_count, o_domain = o_domain, stages = stages)
+
+	# Finally, convert back to binary on the far side.
+	for i in reversed(range(width)):
+		if i == width - 1:
+			m.d.comb += output[i].eq(synced_gray_count[i])
+		else:
+			m.d.comb += output[i].eq(output[i + 1] ^ synced_gray_count[i])
+
+	return output
+
 def stretch_strobe_signal(m, strobe, *, to_cycles, output = None, domain = None, allow_delay = False):
 	'''
 	Stretches a given strobe to the given number of cycles.